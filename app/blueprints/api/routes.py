@@ -115,18 +115,11 @@ def approve_and_post(image_id):
                 ).first()
                 
                 if platform_connection:
-                    # Import ActivityPub client
-                    from app.services.activitypub.components.activitypub_client import ActivityPubClient
+                    from app.services.activitypub.posts.caption_publisher import publish_image_caption
                     import asyncio
                     
-                    # Create client and post caption
-                    ap_client = ActivityPubClient(platform_connection)
-                    
-                    # Use the image_post_id from the image record to update the caption
-                    success = asyncio.run(ap_client.update_media_caption(
-                        image.image_post_id, 
-                        caption
-                    ))
+                    # Publish through the same per-status path as bulk publishing
+                    success = asyncio.run(publish_image_caption(platform_connection, image, caption))
                     
                     if success:
                         image.status = ProcessingStatus.POSTED
@@ -207,6 +200,8 @@ def regenerate_caption(image_id):
                         except asyncio.TimeoutError:
                             raise Exception("Ollama initialization timeout")
                         finally:
+                            # Close the generator's HTTP client while its loop can still close connections
+                            loop.run_until_complete(caption_generator.close())
                             loop.close()
 
                     # Initialize the generator
@@ -218,13 +213,14 @@ def regenerate_caption(image_id):
                         asyncio.set_event_loop(loop)
                         try:
                             result = loop.run_until_complete(asyncio.wait_for(
-                                caption_generator.generate_caption(image.local_path),
+                                caption_generator.generate_caption(image.local_path, use_cache=False),
                                 timeout=45.0  # 45 second timeout for generation
                             ))
                             return result
                         except asyncio.TimeoutError:
                             raise Exception("Caption generation timeout")
                         finally:
+                            loop.run_until_complete(caption_generator.close())
                             loop.close()
 
                     # Generate the caption
@@ -101,18 +101,11 @@ def review_single(image_id):
                     ).first()
                     
                     if platform_connection:
-                        # Import ActivityPub client
-                        from app.services.activitypub.components.activitypub_client import ActivityPubClient
+                        from app.services.activitypub.posts.caption_publisher import publish_image_caption
                         import asyncio
                         
-                        # Create client and post caption
-                        ap_client = ActivityPubClient(platform_connection)
-                        
-                        # Use the image_post_id from the image record to update the caption
-                        success = asyncio.run(ap_client.update_media_caption(
-                            image.image_post_id, 
-                            caption
-                        ))
+                        # Publish through the same per-status path as bulk publishing
+                        success = asyncio.run(publish_image_caption(platform_connection, image, caption))
                         
                         if success:
                             image.status = ProcessingStatus.POSTED
@@ -7,6 +7,8 @@ Configuration Service
 
 Provides high-performance, cached access to system configuration with
 environment variable overrides, schema defaults, and change notifications.
+Cached values are invalidated in every process through the configuration
+invalidation channel, so they can be cached for long.
 """
 
 import os
@@ -23,6 +25,9 @@ import uuid
 from app.core.database.core.database_manager import DatabaseManager
 from models import SystemConfiguration
 from app.core.configuration.core.system_configuration_manager import SystemConfigurationManager, ConfigurationSchema
+from app.core.configuration.events.configuration_invalidation import (
+    ConfigurationInvalidationChannel, get_configuration_invalidation_channel
+)
 
 logger = logging.getLogger(__name__)
 
@@ -79,6 +84,7 @@ class ConfigurationService:
     
     Features:
     - LRU cache with configurable TTL
+    - Cluster-wide cache invalidation on changes
     - Environment variable override support
     - Schema default fallback
     - Change event notifications
@@ -86,19 +92,28 @@ class ConfigurationService:
     """
     
     def __init__(self, db_manager: DatabaseManager, cache_size: int = 1000, 
-                 default_ttl: int = 300, environment_prefix: str = "VEDFOLNIR_CONFIG_"):
+                 default_ttl: Optional[int] = None, environment_prefix: str = "VEDFOLNIR_CONFIG_",
+                 invalidation_channel: Optional[ConfigurationInvalidationChannel] = None):
         """
         Initialize configuration service
         
         Args:
             db_manager: Database manager instance
             cache_size: Maximum cache size (default: 1000)
-            default_ttl: Default cache TTL in seconds (default: 300)
+            default_ttl: Default cache TTL in seconds (default: CONFIG_CACHE_TTL when
+                invalidations are broadcast, CONFIG_LOCAL_CACHE_TTL otherwise)
             environment_prefix: Environment variable prefix
+            invalidation_channel: Channel changes are broadcast on (default: the process-wide one)
         """
         self.db_manager = db_manager
-        self.system_config_manager = SystemConfigurationManager(db_manager)
+        self.invalidation_channel = invalidation_channel or get_configuration_invalidation_channel()
+        self.system_config_manager = SystemConfigurationManager(db_manager, self.invalidation_channel)
         self.environment_prefix = environment_prefix
+        if default_ttl is None:
+            from config import ConfigInvalidationConfig
+            invalidation_config = ConfigInvalidationConfig.from_env()
+            default_ttl = (invalidation_config.cache_ttl if self.invalidation_channel.is_cluster_wide
+                           else invalidation_config.local_cache_ttl)
         self.default_ttl = default_ttl
         
         # Thread-safe cache
@@ -123,6 +138,9 @@ class ConfigurationService:
             'errors': 0
         }
         self._stats_lock = threading.RLock()
+        
+        # Drop cached values changed by any process
+        self.invalidation_channel.add_listener(self._on_invalidated)
     
     def get_config(self, key: str, default: Any = None) -> Any:
         """
@@ -169,6 +187,9 @@ class ConfigurationService:
             with self._stats_lock:
                 self._stats['cache_misses'] += 1
             
+            # Values read past an invalidation are not cached
+            generation = self.invalidation_channel.generation()
+            
             # Check environment variable override
             env_key = f"{self.environment_prefix}{key.upper()}"
             env_value = os.getenv(env_key)
@@ -198,8 +219,7 @@ class ConfigurationService:
                 )
                 
                 # Cache the value
-                with self._cache_lock:
-                    self._cache[key] = config_value
+                self._cache_value(key, config_value, generation)
                 
                 return config_value
             
@@ -224,8 +244,7 @@ class ConfigurationService:
                         )
                         
                         # Cache the value
-                        with self._cache_lock:
-                            self._cache[key] = config_value
+                        self._cache_value(key, config_value, generation)
                         
                         return config_value
             
@@ -251,8 +270,7 @@ class ConfigurationService:
                 )
                 
                 # Cache the value
-                with self._cache_lock:
-                    self._cache[key] = config_value
+                self._cache_value(key, config_value, generation)
                 
                 return config_value
             
@@ -364,10 +382,8 @@ class ConfigurationService:
             old_value: Previous value
             new_value: New value
         """
-        # Invalidate cache
-        with self._cache_lock:
-            if key in self._cache:
-                del self._cache[key]
+        # Invalidate the cached value in every process
+        self.invalidation_channel.invalidate(key)
         
         # Track restart requirement
         if self._requires_restart(key):
@@ -383,6 +399,20 @@ class ConfigurationService:
                 except Exception as e:
                     logger.error(f"Error in subscription callback {subscription_id}: {str(e)}")
     
+    def _cache_value(self, key: str, config_value: ConfigurationValue, generation: int):
+        """Cache a value unless an invalidation was applied since generation"""
+        with self._cache_lock:
+            if self.invalidation_channel.generation() == generation:
+                self._cache[key] = config_value
+    
+    def _on_invalidated(self, key: Optional[str]):
+        """Drop a cached value, or all of them, after a change in any process"""
+        with self._cache_lock:
+            if key is None:
+                self._cache.clear()
+            else:
+                self._cache.pop(key, None)
+    
     def get_cache_stats(self) -> Dict[str, Any]:
         """
         Get cache and service statistics
@@ -409,7 +439,8 @@ class ConfigurationService:
             'cache': cache_info,
             'statistics': stats,
             'hit_rate': hit_rate,
-            'total_requests': total_requests
+            'total_requests': total_requests,
+            'invalidation': self.invalidation_channel.get_stats()
         }
     
     def _convert_value(self, value: str, data_type: str) -> Any:
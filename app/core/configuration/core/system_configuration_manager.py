@@ -103,10 +103,23 @@ class SystemConfigurationManager:
     - Conflict detection and validation
     """
     
-    def __init__(self, db_manager: DatabaseManager):
+    def __init__(self, db_manager: DatabaseManager, invalidation_channel=None):
         self.db_manager = db_manager
         self._configuration_schema = self._initialize_schema()
         self._environment_prefix = "VEDFOLNIR_CONFIG_"
+        self._invalidation_channel = invalidation_channel
+    
+    @property
+    def invalidation_channel(self):
+        """Channel that invalidates cached values of changed configurations in every process"""
+        if self._invalidation_channel is None:
+            from app.core.configuration.events.configuration_invalidation import get_configuration_invalidation_channel
+            self._invalidation_channel = get_configuration_invalidation_channel()
+        return self._invalidation_channel
+    
+    @invalidation_channel.setter
+    def invalidation_channel(self, channel):
+        self._invalidation_channel = channel
     
     def _initialize_schema(self) -> Dict[str, ConfigurationSchema]:
         """Initialize the configuration schema with all supported settings"""
@@ -515,7 +528,9 @@ class SystemConfigurationManager:
                 
                 session.commit()
                 logger.info(f"Configuration {sanitize_for_log(key)} updated by admin {sanitize_for_log(str(admin_user_id))}")
-                return True
+                
+            self.invalidation_channel.invalidate(key)
+            return True
                 
         except Exception as e:
             logger.error(f"Error setting configuration {sanitize_for_log(key)}: {sanitize_for_log(str(e))}")
@@ -0,0 +1,276 @@
+# Copyright (C) 2025 iolaire mcfadden.
+# This program is free software: you can redistribute it and/or modify it under the terms of the GNU Affero General Public License as published by the Free Software Foundation, either version 3 of the License, or (at your option) any later version.
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+"""
+Configuration Invalidation Channel
+
+Cluster-wide invalidation of cached configuration values. Every change
+bumps the key's version in a Redis hash and publishes the key and its
+new version on a pub/sub channel. Each process listens on a daemon
+thread and calls its registered listeners - the configuration caches -
+for every version it has not applied yet, so a change made by one
+gunicorn or RQ worker reaches the caches of all of them within
+milliseconds, and values can be cached for hours.
+
+Pub/sub does not queue messages for a disconnected subscriber, so after
+every (re)subscribe the listener reads the version hash and applies
+whatever it missed. Caches compare generation() before and after reading
+a value, so they never store one that an invalidation overtook.
+
+Without Redis, invalidations are applied in this process only.
+"""
+
+import inspect
+import json
+import logging
+import os
+import threading
+import uuid
+import weakref
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+class ConfigurationInvalidationChannel:
+    """Versioned configuration cache invalidations shared between processes"""
+
+    CHANNEL = "vedfolnir:config:invalidations"
+    VERSIONS_KEY = "vedfolnir:config:versions"
+    # Version field of invalidations that cover every key
+    ALL_KEYS = "*"
+    # Seconds between attempts to resubscribe after losing Redis
+    RECONNECT_DELAY = 5.0
+
+    def __init__(self, redis_client=None, subscribe_client=None):
+        """
+        Args:
+            redis_client: Redis client to broadcast over, or None to only invalidate this process
+            subscribe_client: Client for the idle subscriber connection, defaults to redis_client
+        """
+        self.redis_client = redis_client
+        self.subscribe_client = subscribe_client or redis_client
+        self._versions: Dict[str, int] = {}
+        self._generation = 0
+        self._listeners: Dict[str, Callable[[], Optional[Callable[[Optional[str]], Any]]]] = {}
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.stats = {
+            'published': 0,
+            'received': 0,
+            'applied': 0,
+            'duplicates': 0,
+            'resyncs': 0,
+            'errors': 0
+        }
+
+    @classmethod
+    def from_config(cls, config) -> "ConfigurationInvalidationChannel":
+        """
+        Create a channel from a ConfigInvalidationConfig
+
+        Uses Redis when configured and reachable, otherwise process memory.
+        """
+        redis_client = subscribe_client = None
+        if config.backend == "redis":
+            try:
+                import redis
+                # Invalidations are broadcast from request threads, so they must not hang on a stalled Redis
+                redis_client = redis.Redis.from_url(config.redis_url, socket_timeout=2, socket_connect_timeout=2)
+                redis_client.ping()
+                # No socket timeout: the subscriber connection is idle between changes
+                subscribe_client = redis.Redis.from_url(config.redis_url, socket_connect_timeout=2,
+                                                        health_check_interval=30)
+            except Exception as e:
+                logger.warning(f"Redis unavailable for configuration invalidation, invalidating this process only: {e}")
+                redis_client = subscribe_client = None
+        return cls(redis_client, subscribe_client)
+
+    @property
+    def is_cluster_wide(self) -> bool:
+        """Whether invalidations reach other processes"""
+        return self.redis_client is not None
+
+    def start(self):
+        """Start listening for invalidations from other processes"""
+        if not self.redis_client or (self._thread and self._thread.is_alive()):
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._listen, name="config-invalidation", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def add_listener(self, callback: Callable[[Optional[str]], Any]) -> str:
+        """
+        Call callback(key) for every invalidation; key is None when every key is invalidated
+
+        Bound methods are held weakly, so a registered cache can still be
+        garbage collected.
+
+        Returns:
+            Listener ID for remove_listener()
+        """
+        listener_id = str(uuid.uuid4())
+        if inspect.ismethod(callback):
+            reference = weakref.WeakMethod(callback)
+        else:
+            reference = lambda: callback
+        with self._lock:
+            self._listeners[listener_id] = reference
+        return listener_id
+
+    def remove_listener(self, listener_id: str) -> bool:
+        with self._lock:
+            return self._listeners.pop(listener_id, None) is not None
+
+    def forward_to_event_bus(self, event_bus) -> str:
+        """Publish every invalidation on a ConfigurationEventBus"""
+        from app.core.configuration.events.configuration_event_bus import (
+            ConfigurationInvalidateEvent, EventType
+        )
+
+        def forward(key: Optional[str]):
+            event_bus.publish(ConfigurationInvalidateEvent(
+                event_type=EventType.CONFIGURATION_INVALIDATED if key else EventType.CACHE_CLEARED,
+                key=key or self.ALL_KEYS,
+                timestamp=datetime.now(timezone.utc),
+                reason="Configuration changed"
+            ))
+
+        return self.add_listener(forward)
+
+    def generation(self) -> int:
+        """
+        Number of invalidations applied in this process
+
+        A value read while this stays the same may be cached.
+        """
+        with self._lock:
+            return self._generation
+
+    def invalidate(self, key: Optional[str] = None) -> Optional[int]:
+        """
+        Invalidate key, or every key, in every process; never raises
+
+        Listeners in this process are called before returning.
+
+        Returns:
+            int: The key's new version, or None if it was not broadcast
+        """
+        field = key or self.ALL_KEYS
+        version = None
+        if self.redis_client:
+            try:
+                version = int(self.redis_client.hincrby(self.VERSIONS_KEY, field, 1))
+                self.redis_client.publish(self.CHANNEL, json.dumps({'key': key, 'version': version}))
+                self._count('published')
+            except Exception as e:
+                logger.warning(f"Failed to broadcast configuration invalidation: {e}")
+                self._count('errors')
+        self._apply(key, version)
+        return version
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self.stats)
+            stats['listeners'] = len(self._listeners)
+            stats['versions'] = len(self._versions)
+        stats['cluster_wide'] = self.is_cluster_wide
+        stats['listening'] = bool(self._thread and self._thread.is_alive())
+        return stats
+
+    def _apply(self, key: Optional[str], version: Optional[int]) -> bool:
+        """
+        Call the listeners unless this version of key was already applied
+
+        Unversioned invalidations, which were not broadcast, are always applied.
+        """
+        field = key or self.ALL_KEYS
+        with self._lock:
+            if version is not None:
+                if version <= self._versions.get(field, 0):
+                    self.stats['duplicates'] += 1
+                    return False
+                self._versions[field] = version
+            self._generation += 1
+            self.stats['applied'] += 1
+            listeners = list(self._listeners.items())
+
+        for listener_id, reference in listeners:
+            callback = reference()
+            if callback is None:
+                self.remove_listener(listener_id)
+                continue
+            try:
+                callback(key)
+            except Exception as e:
+                logger.error(f"Error in configuration invalidation listener: {e}")
+        return True
+
+    def _listen(self):
+        while not self._stop_event.is_set():
+            pubsub = None
+            try:
+                pubsub = self.subscribe_client.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(self.CHANNEL)
+                # Subscribed first, so nothing published from here on is missed
+                self._resync()
+                while not self._stop_event.is_set():
+                    message = pubsub.get_message(timeout=1.0)
+                    if message and message.get('type') == 'message':
+                        self._handle(message['data'])
+            except Exception as e:
+                logger.warning(f"Configuration invalidation listener lost Redis: {e}")
+                self._count('errors')
+                self._stop_event.wait(self.RECONNECT_DELAY)
+            finally:
+                if pubsub is not None:
+                    try:
+                        pubsub.close()
+                    except Exception:
+                        pass
+
+    def _handle(self, data):
+        try:
+            message = json.loads(data)
+            version = int(message['version'])
+        except (ValueError, KeyError, TypeError) as e:
+            logger.warning(f"Ignoring malformed configuration invalidation: {e}")
+            return
+        self._count('received')
+        self._apply(message.get('key'), version)
+
+    def _resync(self):
+        """Apply invalidations published while this process was not subscribed"""
+        versions = self.redis_client.hgetall(self.VERSIONS_KEY)
+        for field, version in versions.items():
+            if isinstance(field, bytes):
+                field = field.decode()
+            self._apply(None if field == self.ALL_KEYS else field, int(version))
+        self._count('resyncs')
+
+    def _count(self, name: str):
+        with self._lock:
+            self.stats[name] += 1
+
+_channel: Optional[ConfigurationInvalidationChannel] = None
+_channel_pid: Optional[int] = None
+_channel_lock = threading.Lock()
+
+def get_configuration_invalidation_channel() -> ConfigurationInvalidationChannel:
+    """Get the process-wide configuration invalidation channel, configured from the environment"""
+    global _channel, _channel_pid
+    with _channel_lock:
+        if _channel is None or _channel_pid != os.getpid():
+            from config import ConfigInvalidationConfig
+            _channel = ConfigurationInvalidationChannel.from_config(ConfigInvalidationConfig.from_env())
+            _channel.start()
+            _channel_pid = os.getpid()
+        return _channel
@@ -4,14 +4,17 @@
 import logging
 from logging import getLogger
 import os
+import threading
 import time
-from datetime import datetime, timezone
-from typing import Optional, List, Dict, Any, Tuple
-from sqlalchemy import create_engine, event, and_, or_, func, text
-from sqlalchemy.orm import sessionmaker, scoped_session
-from sqlalchemy.exc import SQLAlchemyError
+import weakref
+from datetime import datetime, timedelta, timezone
+from typing import Optional, List, Dict, Any, Tuple, Iterable, Set
+from sqlalchemy import create_engine, event, and_, or_, func, text, insert
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import sessionmaker, scoped_session, joinedload
+from sqlalchemy.exc import SQLAlchemyError, DisconnectionError, IntegrityError
 from sqlalchemy.pool import QueuePool, NullPool
-from models import Base, Post, Image, ProcessingRun, ProcessingStatus, UserRole, User, PlatformConnection
+from models import Base, Post, Image, ProcessingRun, ProcessingStatus, UserRole, User, PlatformConnection, TimelineSyncCursor, InstanceMetadata
 from config import Config
 from app.services.platform.core.platform_context import PlatformContextManager, PlatformContextError
 from app.core.security.core.security_utils import sanitize_for_log
@@ -30,9 +33,43 @@ class PlatformValidationError(Exception):
 query_logger = getLogger('sqlalchemy.query')
 query_logger.setLevel(logging.INFO)
 
+# Engines shared by every DatabaseManager in the process, by URL and pool
+# settings. Managers are created per request and per service object, so a
+# pool per manager would multiply the connections held open to MySQL.
+_shared_engines: Dict[tuple, Engine] = {}
+_engines_with_tables: Set[tuple] = set()
+_shared_engines_lock = threading.Lock()
+# Live managers, whose session state is discarded in forked children
+_live_managers: "weakref.WeakSet[DatabaseManager]" = weakref.WeakSet()
+
+def _reset_after_fork():
+    """Discard pools and session state inherited from the parent process"""
+    global _shared_engines_lock
+    _shared_engines_lock = threading.Lock()
+    for engine in list(_shared_engines.values()):
+        engine.dispose(close=False)
+    for manager in list(_live_managers):
+        manager._reset_after_fork()
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+def remove_scoped_sessions():
+    """
+    Close the current thread's scoped session of every DatabaseManager
+    
+    Called when a web request's app context is torn down and when an RQ
+    job finishes, so sessions of pooled threads do not outlive their work.
+    """
+    for manager in list(_live_managers):
+        manager.remove_scoped_session()
+
 class DatabaseManager:
     """Handles platform-aware MySQL database operations"""
     
+    # Values per IN (...) list in bulk lookups
+    BULK_QUERY_CHUNK_SIZE = 500
+    
     def __init__(self, config: Config):
         self.config = config
         db_config = config.storage.db_config
@@ -50,17 +87,16 @@ class DatabaseManager:
         # Comprehensive MySQL connection validation
         self._validate_mysql_connection_params(config.storage.database_url)
         
-        # Configure SQLAlchemy engine with thread-safe settings
-        from sqlalchemy.pool import NullPool
+        # Configure SQLAlchemy engine with a connection pool; sessions are not
+        # shared between threads and the pool is reset in forked children
         engine_kwargs = {
             'echo': False,
             'pool_pre_ping': True,
             'pool_recycle': db_config.pool_recycle,
-            'poolclass': NullPool,  # Use NullPool to avoid threading issues
-            # Remove pool-specific settings since NullPool doesn't use them
-            # 'pool_size': db_config.pool_size,
-            # 'max_overflow': db_config.max_overflow,
-            # 'pool_timeout': db_config.pool_timeout,
+            'poolclass': QueuePool,
+            'pool_size': db_config.pool_size,
+            'max_overflow': db_config.max_overflow,
+            'pool_timeout': db_config.pool_timeout,
             'connect_args': {
                 'charset': 'utf8mb4',
                 'use_unicode': True,
@@ -74,11 +110,10 @@ class DatabaseManager:
             }
         }
         
-        self.engine = create_engine(config.storage.database_url, **engine_kwargs)
-        
-        # Set up query logging
-        if db_config.query_logging:
-            self._setup_query_logging()
+        engine_key = (config.storage.database_url, db_config.pool_size, db_config.max_overflow,
+                      db_config.pool_timeout, db_config.pool_recycle, bool(db_config.query_logging))
+        self.engine = self._get_shared_engine(engine_key, engine_kwargs)
+        _live_managers.add(self)
         
         # Use regular sessionmaker with thread-safe configuration
         self.SessionFactory = sessionmaker(
@@ -88,11 +123,18 @@ class DatabaseManager:
             expire_on_commit=False  # Keep objects accessible after commit
         )
         
+        # Thread-local sessions for code that keeps one session per thread or
+        # request; remove_scoped_sessions() closes them after each web request
+        # and RQ job
+        self.scoped_session = scoped_session(self.SessionFactory)
+        
         # Initialize platform context manager
         self._context_manager = None
         
-        # Create tables on initialization
-        self.create_tables()
+        # Create tables once per engine
+        if engine_key not in _engines_with_tables:
+            self.create_tables()
+            _engines_with_tables.add(engine_key)
     
     def _validate_mysql_connection_params(self, database_url: str):
         """Validate MySQL connection parameters with comprehensive error reporting"""
@@ -138,14 +180,66 @@ class DatabaseManager:
                     f"got: {database_url[:20]}..."
                 )
     
-    def _setup_query_logging(self):
+    @classmethod
+    def _get_shared_engine(cls, engine_key: tuple, engine_kwargs: Dict[str, Any]) -> Engine:
+        """Get the process's engine for a URL and pool settings, creating it on first use"""
+        with _shared_engines_lock:
+            engine = _shared_engines.get(engine_key)
+            if engine is None:
+                engine = create_engine(engine_key[0], **engine_kwargs)
+                cls._setup_fork_safety(engine)
+                
+                # Set up query logging
+                if engine_key[-1]:
+                    cls._setup_query_logging(engine)
+                
+                _shared_engines[engine_key] = engine
+            return engine
+    
+    @staticmethod
+    def _setup_fork_safety(engine: Engine):
+        """
+        Keep pooled connections from being shared between processes
+        
+        Gunicorn and RQ fork after the engine may have opened connections.
+        The child drops the inherited pools without closing the parent's
+        sockets (see _reset_after_fork), and each connection records the
+        PID that opened it so any connection that still crosses a fork is
+        replaced on checkout.
+        """
+        @event.listens_for(engine, "connect")
+        def record_pid(dbapi_connection, connection_record):
+            connection_record.info['pid'] = os.getpid()
+        
+        @event.listens_for(engine, "checkout")
+        def check_pid(dbapi_connection, connection_record, connection_proxy):
+            pid = os.getpid()
+            if connection_record.info.get('pid') != pid:
+                connection_record.dbapi_connection = connection_proxy.dbapi_connection = None
+                raise DisconnectionError(
+                    f"Connection record belongs to pid {connection_record.info.get('pid')}, "
+                    f"attempting to check out in pid {pid}"
+                )
+    
+    def _reset_after_fork(self):
+        """Discard session state inherited from the parent process"""
+        self.scoped_session.registry.clear()
+        self._session_tracking['active_sessions'] = {}
+        self._session_tracking['session_count'] = 0
+    
+    def remove_scoped_session(self):
+        """Close the current thread's scoped session and return its connection to the pool"""
+        self.scoped_session.remove()
+    
+    @staticmethod
+    def _setup_query_logging(engine: Engine):
         """Set up MySQL-specific query logging for performance analysis"""
-        @event.listens_for(self.engine, "before_cursor_execute")
+        @event.listens_for(engine, "before_cursor_execute")
         def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
             conn.info.setdefault('query_start_time', []).append(time.time())
             query_logger.debug("MySQL Query Start: %s", statement)
         
-        @event.listens_for(self.engine, "after_cursor_execute")
+        @event.listens_for(engine, "after_cursor_execute")
         def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
             total = time.time() - conn.info['query_start_time'].pop(-1)
             query_logger.info("MySQL Query Complete: %s", statement)
@@ -1022,20 +1116,8 @@ class DatabaseManager:
             PlatformValidationError: If validation fails
             DatabaseOperationError: If database operation fails
         """
-        # Input validation
-        if not post_id or not post_id.strip():
-            raise PlatformValidationError("Post ID cannot be empty")
-        
-        if not user_id or not isinstance(user_id, int):
-            raise PlatformValidationError("User ID must be a valid integer")
-        
-        if not post_url or not post_url.strip():
-            raise PlatformValidationError("Post URL cannot be empty")
-        
-        # Validate URL format
+        self._validate_post_fields(post_id, user_id, post_url)
         post_url = post_url.strip()
-        if not post_url.startswith(('http://', 'https://')):
-            raise PlatformValidationError("Post URL must start with http:// or https://")
         
         session = self.get_session()
         try:
@@ -1099,16 +1181,118 @@ class DatabaseManager:
         finally:
             session.close()
     
+    def get_or_create_posts(self, user_id: int, posts: List[Dict[str, Any]]) -> Dict[str, Post]:
+        """
+        Get or create a page of posts with a few bulk queries (platform-aware)
+        
+        Bulk form of get_or_create_post: existing posts are fetched with one
+        IN query per chunk and the missing ones are inserted in a single
+        multi-row INSERT. Posts that fail validation, or the whole page if
+        another process inserts the same posts concurrently, are left out of
+        the result so callers can fall back to get_or_create_post.
+        
+        Args:
+            user_id: Integer user ID who owns the posts
+            posts: Dicts with post_id, post_url and optional post_content
+            
+        Returns:
+            Dict mapping post_id to its Post
+            
+        Raises:
+            PlatformValidationError: If no platform context is set
+            DatabaseOperationError: If database operation fails
+        """
+        page = {}
+        for fields in posts:
+            try:
+                self._validate_post_fields(fields.get('post_id'), user_id, fields.get('post_url'))
+            except PlatformValidationError as e:
+                logger.warning(f"Skipping post {sanitize_for_log(str(fields.get('post_id')))} in bulk save: {e}")
+                continue
+            page[fields['post_id'].strip()] = fields
+        if not page:
+            return {}
+        
+        session = self.get_session()
+        try:
+            try:
+                context = self.get_context_manager().require_context()
+            except PlatformContextError as e:
+                raise PlatformValidationError(f"Platform context required for post operations: {e}")
+            
+            result = self._query_posts_by_post_id(session, list(page))
+            new_rows = []
+            for post_id, fields in page.items():
+                if post_id not in result:
+                    post_content = fields.get('post_content')
+                    new_rows.append(self._inject_platform_data({
+                        'post_id': post_id,
+                        'user_id': user_id,
+                        'post_url': fields['post_url'].strip(),
+                        'post_content': post_content.strip() if post_content else None
+                    }))
+            
+            if new_rows:
+                session.execute(insert(Post), new_rows)
+                session.commit()
+                result.update(self._query_posts_by_post_id(session, [row['post_id'] for row in new_rows]))
+                logger.info("Created %d new post records for platform %s", len(new_rows),
+                           sanitize_for_log(str(context.platform_info.get('name', 'unknown'))))
+            
+            return result
+            
+        except PlatformValidationError:
+            session.rollback()
+            raise
+        except IntegrityError as e:
+            # Another worker saved some of these posts first
+            session.rollback()
+            logger.warning(f"Concurrent insert in get_or_create_posts, falling back to single saves: {e}")
+            return {}
+        except SQLAlchemyError as e:
+            session.rollback()
+            logger.error(f"Database error in get_or_create_posts: {e}")
+            raise DatabaseOperationError(f"Database error creating/retrieving posts: {e}")
+        finally:
+            session.close()
+    
+    def _query_posts_by_post_id(self, session, post_ids: List[str]) -> Dict[str, Post]:
+        """Fetch posts by platform post ID with one IN query per chunk"""
+        posts = {}
+        for start in range(0, len(post_ids), self.BULK_QUERY_CHUNK_SIZE):
+            query = session.query(Post).filter(Post.post_id.in_(post_ids[start:start + self.BULK_QUERY_CHUNK_SIZE]))
+            query = self._apply_platform_filter(query, Post)
+            for post in query:
+                posts[post.post_id] = post
+        return posts
+    
+    def _validate_post_fields(self, post_id: str, user_id: int, post_url: str):
+        """Validate the fields of a post before saving it"""
+        if not post_id or not post_id.strip():
+            raise PlatformValidationError("Post ID cannot be empty")
+        
+        if not user_id or not isinstance(user_id, int):
+            raise PlatformValidationError("User ID must be a valid integer")
+        
+        if not post_url or not post_url.strip():
+            raise PlatformValidationError("Post URL cannot be empty")
+        
+        # Validate URL format
+        if not post_url.strip().startswith(('http://', 'https://')):
+            raise PlatformValidationError("Post URL must start with http:// or https://")
+    
     def save_image(self, post_id: int, image_url: str, local_path: str, 
                    attachment_index: int, media_type: str = None, 
                    original_filename: str = None, image_post_id: str = None,
-                   original_post_date = None):
+                   original_post_date = None, perceptual_hash: str = None):
         """Save image record to database and return the image ID (platform-aware)"""
         session = self.get_session()
         try:
-            # Check if image already exists (with platform filtering)
+            # Check if image already exists (with platform filtering); the
+            # indexed hash finds candidates and the URL rules out collisions
             query = session.query(Image).filter_by(
                 post_id=post_id,
+                image_url_hash=Image.hash_url(image_url),
                 image_url=image_url
             )
             query = self._apply_platform_filter(query, Image)
@@ -1116,6 +1300,9 @@ class DatabaseManager:
             
             if existing:
                 logger.info(f"Image already exists: {image_url}")
+                if perceptual_hash and not existing.perceptual_hash:
+                    existing.perceptual_hash = perceptual_hash
+                    session.commit()
                 return existing.id
             
             # Get the post object from the database to ensure it's attached to this session
@@ -1134,6 +1321,7 @@ class DatabaseManager:
                 'original_filename': original_filename,
                 'image_post_id': image_post_id,
                 'original_post_date': original_post_date,
+                'perceptual_hash': perceptual_hash,
                 'status': ProcessingStatus.PENDING
             }
             image_data = self._inject_platform_data(image_data)
@@ -1171,13 +1359,13 @@ class DatabaseManager:
                 
                 # Use parameterized query to prevent SQL injection
                 base_query = """
-                    INSERT INTO images (post_id, image_url, local_path, attachment_index, 
+                    INSERT INTO images (post_id, image_url, image_url_hash, local_path, attachment_index, 
                                       media_type, original_filename, image_post_id, status, 
                                       created_at, updated_at
                 """
                 
                 values_query = """
-                    VALUES (:post_id, :image_url, :local_path, :attachment_index, 
+                    VALUES (:post_id, :image_url, :image_url_hash, :local_path, :attachment_index, 
                            :media_type, :original_filename, :image_post_id, 
                            'pending', CURRENT_TIMESTAMP, CURRENT_TIMESTAMP
                 """
@@ -1185,6 +1373,7 @@ class DatabaseManager:
                 params = {
                     'post_id': post_id,
                     'image_url': image_url,
+                    'image_url_hash': Image.hash_url(image_url),
                     'local_path': local_path,
                     'attachment_index': attachment_index,
                     'media_type': media_type or '',
@@ -1208,6 +1397,11 @@ class DatabaseManager:
                     values_query += ", :instance_url"
                     params['instance_url'] = image_data['instance_url']
                 
+                if perceptual_hash:
+                    base_query += ", perceptual_hash"
+                    values_query += ", :perceptual_hash"
+                    params['perceptual_hash'] = perceptual_hash
+                
                 full_query = base_query + ")" + values_query + ") RETURNING id"
                 
                 result = session.execute(text(full_query), params)
@@ -1425,7 +1619,8 @@ class DatabaseManager:
         """Get images approved for posting (platform-aware)"""
         session = self.get_session()
         try:
-            query = session.query(Image).filter_by(status=ProcessingStatus.APPROVED)
+            # Posting groups images by their post, so load it before the session closes
+            query = session.query(Image).options(joinedload(Image.post)).filter_by(status=ProcessingStatus.APPROVED)
             query = self._apply_platform_filter(query, Image)
             images = query.order_by(
                 Image.original_post_date.desc().nullslast(), 
@@ -1480,13 +1675,66 @@ class DatabaseManager:
         finally:
             session.close()
     
+    def mark_images_posted(self, image_ids: List[int]) -> int:
+        """Mark images as posted in a single statement, returning how many were updated"""
+        if not image_ids:
+            return 0
+        session = self.get_session()
+        try:
+            updated = session.query(Image).filter(Image.id.in_(image_ids)).update({
+                'status': ProcessingStatus.POSTED,
+                'posted_at': datetime.now(timezone.utc)
+            }, synchronize_session=False)
+            session.commit()
+            logger.info(f"Marked {updated} images as posted")
+            return updated
+        except SQLAlchemyError as e:
+            session.rollback()
+            logger.error(f"Database error in mark_images_posted: {e}")
+            raise
+        finally:
+            session.close()
+    
+    def mark_image_failed(self, post_id: int, image_url: str, attachment_index: int, error: str,
+                          media_type: str = None, image_post_id: str = None) -> Optional[int]:
+        """
+        Record an image that cannot be processed, with ERROR status and the reason
+        
+        Returns:
+            The image ID, or None if the record could not be saved
+        """
+        # Nothing was stored, so the record has no local file
+        image_id = self.save_image(post_id=post_id, image_url=image_url, local_path="",
+                                   attachment_index=attachment_index, media_type=media_type,
+                                   image_post_id=image_post_id)
+        if image_id is None:
+            return None
+        session = self.get_session()
+        try:
+            session.query(Image).filter_by(id=image_id).update(
+                {'status': ProcessingStatus.ERROR, 'processing_error': error},
+                synchronize_session=False
+            )
+            session.commit()
+            return image_id
+        except SQLAlchemyError as e:
+            session.rollback()
+            logger.error(f"Database error in mark_image_failed: {e}")
+            return None
+        finally:
+            session.close()
+    
     def is_image_processed(self, image_url: str) -> bool:
         """Check if image has been processed before (platform-aware)"""
         session = self.get_session()
         try:
             try:
-                # Try using ORM first with platform filtering
-                query = session.query(Image).filter_by(image_url=image_url)
+                # Try using ORM first with platform filtering; the indexed hash
+                # finds candidates and the URL rules out collisions
+                query = session.query(Image).filter_by(
+                    image_url_hash=Image.hash_url(image_url),
+                    image_url=image_url
+                )
                 query = self._apply_platform_filter(query, Image)
                 image = query.first()
                 
@@ -1518,8 +1766,8 @@ class DatabaseManager:
                     pass  # No platform filtering if no context
                 
                 # Use parameterized query to prevent SQL injection
-                check_query = "SELECT status FROM images WHERE image_url = :image_url"
-                params = {'image_url': image_url}
+                check_query = "SELECT status FROM images WHERE image_url_hash = :image_url_hash AND image_url = :image_url"
+                params = {'image_url_hash': Image.hash_url(image_url), 'image_url': image_url}
                 
                 # Add platform filtering safely
                 if context.platform_connection_id:
@@ -1541,6 +1789,119 @@ class DatabaseManager:
         finally:
             session.close()
     
+    def get_processed_image_urls(self, image_urls: Iterable[str]) -> Set[str]:
+        """
+        Find which of a page of image URLs have been processed (platform-aware)
+        
+        Bulk form of is_image_processed that looks the URLs up through the
+        indexed URL hash with one IN query per chunk.
+        
+        Args:
+            image_urls: Image URLs extracted from a page of posts
+            
+        Returns:
+            The image URLs with a POSTED or APPROVED image record
+        """
+        urls_by_hash = {Image.hash_url(url): url for url in set(image_urls) if url}
+        hashes = list(urls_by_hash)
+        processed = set()
+        
+        session = self.get_session()
+        try:
+            for start in range(0, len(hashes), self.BULK_QUERY_CHUNK_SIZE):
+                query = session.query(Image.image_url_hash, Image.image_url).filter(
+                    Image.image_url_hash.in_(hashes[start:start + self.BULK_QUERY_CHUNK_SIZE]),
+                    Image.status.in_([ProcessingStatus.POSTED, ProcessingStatus.APPROVED])
+                )
+                query = self._apply_platform_filter(query, Image)
+                for url_hash, image_url in query:
+                    # Compare the full URL to rule out hash collisions
+                    if urls_by_hash.get(url_hash) == image_url:
+                        processed.add(image_url)
+            return processed
+        except SQLAlchemyError as e:
+            logger.error(f"Database error in get_processed_image_urls: {e}")
+            raise
+        finally:
+            session.close()
+    
+    def get_timeline_cursor(self, platform_connection_id: int) -> TimelineSyncCursor:
+        """
+        Get where the last run stopped reading a platform connection's timeline
+        
+        Returns:
+            The stored cursor, or a new empty one if the timeline was never synced
+        """
+        session = self.get_session()
+        try:
+            cursor = session.query(TimelineSyncCursor).filter_by(
+                platform_connection_id=platform_connection_id
+            ).first()
+            return cursor or TimelineSyncCursor(platform_connection_id=platform_connection_id)
+        except SQLAlchemyError as e:
+            # Without a cursor the run reads the timeline from the top as before
+            logger.error(f"Database error in get_timeline_cursor: {e}")
+            return TimelineSyncCursor(platform_connection_id=platform_connection_id)
+        finally:
+            session.close()
+    
+    def save_timeline_cursor(self, cursor: TimelineSyncCursor) -> bool:
+        """Store a timeline cursor after a run has processed everything up to it"""
+        session = self.get_session()
+        try:
+            session.merge(cursor)
+            session.commit()
+            return True
+        except SQLAlchemyError as e:
+            session.rollback()
+            logger.error(f"Database error in save_timeline_cursor: {e}")
+            return False
+        finally:
+            session.close()
+    
+    def get_instance_metadata(self, cache_key: str) -> Optional[str]:
+        """Get a cached instance fact, or None if it is missing or has expired"""
+        session = self.get_session()
+        try:
+            entry = session.get(InstanceMetadata, cache_key)
+            if entry is None or entry.expires_at <= datetime.utcnow():
+                return None
+            return entry.value
+        except SQLAlchemyError as e:
+            logger.error(f"Database error in get_instance_metadata: {e}")
+            return None
+        finally:
+            session.close()
+    
+    def set_instance_metadata(self, cache_key: str, value: str, ttl: int) -> bool:
+        """Store an instance fact for ttl seconds"""
+        session = self.get_session()
+        try:
+            session.merge(InstanceMetadata(cache_key=cache_key, value=value,
+                                           expires_at=datetime.utcnow() + timedelta(seconds=ttl)))
+            session.commit()
+            return True
+        except SQLAlchemyError as e:
+            session.rollback()
+            logger.error(f"Database error in set_instance_metadata: {e}")
+            return False
+        finally:
+            session.close()
+    
+    def delete_instance_metadata(self, cache_key: str) -> bool:
+        """Forget a cached instance fact"""
+        session = self.get_session()
+        try:
+            session.query(InstanceMetadata).filter_by(cache_key=cache_key).delete()
+            session.commit()
+            return True
+        except SQLAlchemyError as e:
+            session.rollback()
+            logger.error(f"Database error in delete_instance_metadata: {e}")
+            return False
+        finally:
+            session.close()
+    
     def get_processing_stats(self, platform_aware: bool = True, user_id: Optional[int] = None):
         """Get processing statistics (optionally platform-aware and user-specific)"""
         session = self.get_session()
@@ -9,6 +9,7 @@ hitting rate limits on external services. It implements token bucket algorithm
 for rate limiting with support for different rate limits per endpoint.
 """
 
+import math
 import time
 from logging import getLogger
 import asyncio
@@ -39,6 +40,10 @@ class RateLimitConfig:
     # Platform-specific endpoint rate limits
     platform_endpoint_limits: Dict[str, Dict[str, Dict[str, int]]] = field(default_factory=dict)
     
+    # "memory" keeps buckets per process; "redis" shares them between processes
+    backend: str = "memory"
+    redis_url: Optional[str] = None
+    
     @classmethod
     def from_env(cls, env_prefix: str = "RATE_LIMIT"):
         """
@@ -63,7 +68,9 @@ class RateLimitConfig:
             requests_per_minute=requests_per_minute,
             requests_per_hour=requests_per_hour,
             requests_per_day=requests_per_day,
-            max_burst=max_burst
+            max_burst=max_burst,
+            backend=os.getenv(f"{env_prefix}_BACKEND", "memory").lower(),
+            redis_url=os.getenv(f"{env_prefix}_REDIS_URL", os.getenv("REDIS_URL"))
         )
         
         # Look for endpoint-specific limits
@@ -99,7 +106,7 @@ class RateLimitConfig:
                     timeframe = parts[1].lower()
                     
                     # Skip global settings and endpoint settings
-                    if platform in ("requests", "max", "endpoint"):
+                    if platform in ("requests", "max", "endpoint", "redis", "pacing"):
                         continue
                     
                     if platform not in config.platform_limits:
@@ -454,13 +461,16 @@ class RateLimiter:
                     self.platform_stats[platform_key]["throttled"] += 1
                     self.platform_stats[platform_key]["wait_time"] += wait_time
     
-    def check_rate_limit(self, endpoint: Optional[str] = None, platform: Optional[str] = None) -> Tuple[bool, float]:
+    def check_rate_limit(self, endpoint: Optional[str] = None, platform: Optional[str] = None,
+                         scope: Optional[str] = None) -> Tuple[bool, float]:
         """
         Check if a request would exceed rate limits
         
         Args:
             endpoint: Optional endpoint name for endpoint-specific limits
             platform: Optional platform name for platform-specific limits
+            scope: Optional account the request is made for, see rate_limit_scope();
+                the in-process buckets are shared by all accounts
             
         Returns:
             Tuple of (allowed, wait_time):
@@ -520,18 +530,20 @@ class RateLimiter:
         # All rate limits passed
         return True, 0.0
     
-    async def wait_if_needed(self, endpoint: Optional[str] = None, platform: Optional[str] = None) -> float:
+    async def wait_if_needed(self, endpoint: Optional[str] = None, platform: Optional[str] = None,
+                             scope: Optional[str] = None) -> float:
         """
         Wait if necessary to comply with rate limits
         
         Args:
             endpoint: Optional endpoint name for endpoint-specific limits
             platform: Optional platform name for platform-specific limits
+            scope: Optional account the request is made for, see rate_limit_scope()
             
         Returns:
             Time waited in seconds (0.0 if no wait was needed)
         """
-        allowed, wait_time = self.check_rate_limit(endpoint, platform)
+        allowed, wait_time = self.check_rate_limit(endpoint, platform, scope)
         
         if not allowed and wait_time > 0:
             platform_info = f" on platform {platform}" if platform else ""
@@ -598,13 +610,15 @@ class RateLimiter:
             self.platform_stats = {}
             self.last_reset_time = datetime.now(timezone.utc)
     
-    def update_from_response_headers(self, headers: Dict[str, str], platform: Optional[str] = None) -> None:
+    def update_from_response_headers(self, headers: Dict[str, str], platform: Optional[str] = None,
+                                     scope: Optional[str] = None) -> None:
         """
         Update rate limiter state based on response headers from the platform
         
         Args:
             headers: HTTP response headers
             platform: Platform name (pixelfed, mastodon, etc.)
+            scope: Optional account the response was for, see rate_limit_scope()
         """
         if not headers:
             return
@@ -670,6 +684,205 @@ class RateLimiter:
         except (ValueError, KeyError) as e:
             logger.debug(f"Error parsing rate limit headers: {e}")
 
+class RedisRateLimiter(RateLimiter):
+    """
+    Rate limiter whose buckets live in Redis and are shared by every process.
+    
+    Gunicorn workers, RQ workers and batch runs all draw from the same
+    buckets, so together they stay within an instance's limits instead of
+    each getting a full budget. Buckets are kept per scope (instance and
+    access token) as well as per platform and endpoint, and all buckets for
+    a request are checked and charged in one Lua script.
+    
+    A request that finds a bucket empty still takes its token, driving the
+    bucket negative, and is told how long to wait for it. Concurrent callers
+    therefore queue up behind each other rather than all retrying at once.
+    
+    X-RateLimit-Remaining/Reset headers are stored per scope too, so once
+    the server reports its budget spent every process waits for the reset.
+    
+    While Redis is unreachable the in-process buckets of RateLimiter are used
+    and Redis is tried again after REDIS_RETRY_INTERVAL seconds.
+    """
+    
+    KEY_PREFIX = "vedfolnir:ratelimit:"
+    REDIS_RETRY_INTERVAL = 30.0
+    
+    # KEYS[1] is the server-reported budget, KEYS[2..] the token buckets;
+    # ARGV[1] is the current time followed by rate and capacity per bucket
+    ACQUIRE_SCRIPT = """
+local now = tonumber(ARGV[1])
+local wait = 0
+local server = redis.call('HMGET', KEYS[1], 'remaining', 'reset')
+local remaining, reset = tonumber(server[1]), tonumber(server[2])
+if remaining and reset and reset > now then
+    if remaining <= 0 then
+        wait = reset - now
+    end
+    redis.call('HINCRBY', KEYS[1], 'remaining', -1)
+end
+for i = 2, #KEYS do
+    local rate = tonumber(ARGV[2 * i - 2])
+    local capacity = tonumber(ARGV[2 * i - 1])
+    local state = redis.call('HMGET', KEYS[i], 'tokens', 'ts')
+    local tokens = tonumber(state[1]) or capacity
+    local ts = tonumber(state[2]) or now
+    tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate) - 1
+    if tokens < 0 then
+        wait = math.max(wait, -tokens / rate)
+    end
+    redis.call('HMSET', KEYS[i], 'tokens', tostring(tokens), 'ts', tostring(now))
+    redis.call('EXPIRE', KEYS[i], math.ceil((capacity - tokens) / rate) + 60)
+end
+return tostring(wait)
+"""
+    
+    # Keeps the lowest remaining count reported for the current window; a
+    # later reset time starts a new window
+    UPDATE_SCRIPT = """
+local remaining, reset = tonumber(ARGV[1]), tonumber(ARGV[2])
+local current = redis.call('HMGET', KEYS[1], 'remaining', 'reset')
+local current_remaining, current_reset = tonumber(current[1]), tonumber(current[2])
+if current_reset and current_reset >= reset and current_remaining and current_remaining <= remaining then
+    return 0
+end
+redis.call('HMSET', KEYS[1], 'remaining', remaining, 'reset', reset)
+redis.call('EXPIREAT', KEYS[1], reset + 1)
+return 1
+"""
+    
+    WINDOW_SECONDS = {"minute": 60.0, "hour": 3600.0, "day": 86400.0}
+    
+    def __init__(self, config: RateLimitConfig, redis_client):
+        """
+        Initialize rate limiter with configuration
+        
+        Args:
+            config: Rate limit configuration
+            redis_client: Redis client shared by the buckets
+        """
+        super().__init__(config)
+        self.redis = redis_client
+        self._acquire = redis_client.register_script(self.ACQUIRE_SCRIPT)
+        self._update = redis_client.register_script(self.UPDATE_SCRIPT)
+        self._redis_retry_at = 0.0
+    
+    @classmethod
+    def from_config(cls, config: RateLimitConfig) -> "RedisRateLimiter":
+        """Create a limiter connected to config.redis_url"""
+        import redis
+        client = redis.Redis.from_url(config.redis_url or "redis://localhost:6379/0",
+                                      socket_timeout=1, socket_connect_timeout=1)
+        return cls(config, client)
+    
+    def _scope_key(self, scope: Optional[str]) -> str:
+        # The braces keep all of a scope's keys in one Redis Cluster slot
+        return f"{self.KEY_PREFIX}{{{scope or 'default'}}}"
+    
+    def _limits_for(self, endpoint: Optional[str], platform: Optional[str]):
+        """Yield (bucket name, limits) for every bucket a request is charged to"""
+        yield "global", {
+            "minute": self.config.requests_per_minute,
+            "hour": self.config.requests_per_hour,
+            "day": self.config.requests_per_day
+        }
+        platform = platform.lower() if platform else None
+        endpoint = endpoint.lower() if endpoint else None
+        if platform and platform in self.config.platform_limits:
+            yield f"platform:{platform}", self.config.platform_limits[platform]
+        if endpoint and endpoint in self.config.endpoint_limits:
+            yield f"endpoint:{endpoint}", self.config.endpoint_limits[endpoint]
+        if platform and endpoint and endpoint in self.config.platform_endpoint_limits.get(platform, {}):
+            yield f"platform_endpoint:{platform}:{endpoint}", self.config.platform_endpoint_limits[platform][endpoint]
+    
+    def _redis_available(self) -> bool:
+        return time.monotonic() >= self._redis_retry_at
+    
+    def _redis_failed(self, error: Exception) -> None:
+        if self._redis_available():
+            logger.warning(f"Redis rate limiting unavailable, using per-process limits for "
+                           f"{self.REDIS_RETRY_INTERVAL:.0f}s: {error}")
+        self._redis_retry_at = time.monotonic() + self.REDIS_RETRY_INTERVAL
+    
+    def check_rate_limit(self, endpoint: Optional[str] = None, platform: Optional[str] = None,
+                         scope: Optional[str] = None) -> Tuple[bool, float]:
+        """
+        Take a token from every bucket the request is charged to
+        
+        Unlike RateLimiter the token is taken even when the request has to
+        wait, so callers must wait the returned time before making it.
+        """
+        if not self._redis_available():
+            return super().check_rate_limit(endpoint, platform, scope)
+        
+        scope_key = self._scope_key(scope)
+        keys = [f"{scope_key}:server"]
+        args = [time.time()]
+        for name, limits in self._limits_for(endpoint, platform):
+            for window, limit in limits.items():
+                if window in self.WINDOW_SECONDS and limit > 0:
+                    keys.append(f"{scope_key}:{name}:{window}")
+                    args.extend([limit / self.WINDOW_SECONDS[window], self.config.max_burst])
+        
+        try:
+            wait_time = float(self._acquire(keys=keys, args=args))
+        except Exception as e:
+            self._redis_failed(e)
+            return super().check_rate_limit(endpoint, platform, scope)
+        
+        if wait_time > 0:
+            logger.debug(f"Rate limit reached for {scope or 'default'}, need to wait {wait_time:.2f}s")
+            return False, wait_time
+        return True, 0.0
+    
+    def update_from_response_headers(self, headers: Dict[str, str], platform: Optional[str] = None,
+                                     scope: Optional[str] = None) -> None:
+        """Log the headers and share the server-reported budget with every process"""
+        super().update_from_response_headers(headers, platform, scope)
+        if not headers or not self._redis_available():
+            return
+        
+        headers = {key.lower(): value for key, value in headers.items()}
+        try:
+            remaining = int(headers['x-ratelimit-remaining'])
+            reset = parse_rate_limit_reset(headers['x-ratelimit-reset'])
+        except (KeyError, ValueError):
+            return
+        if reset is None or reset <= time.time():
+            return
+        
+        try:
+            # Whole seconds, so the same reset time from different responses compares equal
+            self._update(keys=[f"{self._scope_key(scope)}:server"], args=[remaining, math.ceil(reset)])
+        except Exception as e:
+            self._redis_failed(e)
+
+def parse_rate_limit_reset(value: str) -> Optional[float]:
+    """Parse an X-RateLimit-Reset header, either epoch seconds or an ISO 8601 time as Mastodon sends"""
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:
+        return datetime.fromisoformat(value.replace('Z', '+00:00')).timestamp()
+    except ValueError:
+        return None
+
+def rate_limit_scope(instance_url: Optional[str], access_token: Optional[str] = None) -> str:
+    """
+    Identify the account requests are made for, for RedisRateLimiter buckets
+    
+    Instances limit each access token separately, so requests with different
+    tokens get separate buckets. Only a digest of the token is used.
+    """
+    from urllib.parse import urlparse
+    import hashlib
+    
+    host = urlparse(instance_url or "").netloc.lower() or "default"
+    if not access_token:
+        return host
+    return f"{host}:{hashlib.sha256(access_token.encode('utf-8')).hexdigest()[:16]}"
+
 # Global rate limiter instance
 _rate_limiter: Optional[RateLimiter] = None
 
@@ -688,7 +901,16 @@ def get_rate_limiter(config: Optional[RateLimitConfig] = None) -> RateLimiter:
     if _rate_limiter is None:
         if config is None:
             config = RateLimitConfig.from_env()
-        _rate_limiter = RateLimiter(config)
+        if getattr(config, 'backend', 'memory') == 'redis':
+            try:
+                _rate_limiter = RedisRateLimiter.from_config(config)
+                logger.info("Rate limiting with buckets shared through Redis")
+            except Exception as e:
+                # The redis package is missing or the URL is invalid
+                logger.warning(f"Redis rate limiting unavailable, using per-process limits: {e}")
+                _rate_limiter = RateLimiter(config)
+        else:
+            _rate_limiter = RateLimiter(config)
     
     return _rate_limiter
 
@@ -742,7 +964,8 @@ def extract_endpoint_from_url(url: str) -> Optional[str]:
     
     return None
 
-def rate_limited(func: Optional[Callable] = None, endpoint: Optional[str] = None, platform: Optional[str] = None):
+def rate_limited(func: Optional[Callable] = None, endpoint: Optional[str] = None, platform: Optional[str] = None,
+                 scope: Optional[str] = None):
     """
     Decorator for rate-limiting async functions
     
@@ -750,6 +973,7 @@ def rate_limited(func: Optional[Callable] = None, endpoint: Optional[str] = None
         func: Function to decorate
         endpoint: Optional endpoint name for endpoint-specific limits
         platform: Optional platform name for platform-specific limits
+        scope: Optional account the requests are made for, see rate_limit_scope()
         
     Returns:
         Decorated function
@@ -771,14 +995,14 @@ def rate_limited(func: Optional[Callable] = None, endpoint: Optional[str] = None
                 actual_platform = kwargs['platform']
             
             # Wait if needed to comply with rate limits
-            await rate_limiter.wait_if_needed(actual_endpoint, actual_platform)
+            await rate_limiter.wait_if_needed(actual_endpoint, actual_platform, scope)
             
             # Call the original function
             result = await f(*args, **kwargs)
             
             # Update rate limiter from response headers if available
             if hasattr(result, 'headers') and result.headers:
-                rate_limiter.update_from_response_headers(dict(result.headers), actual_platform)
+                rate_limiter.update_from_response_headers(dict(result.headers), actual_platform, scope)
             
             return result
         
@@ -7,10 +7,17 @@ Redis Session Backend
 
 Simple Redis operations backend for session management.
 Provides low-level Redis operations with connection management and error handling.
+
+Sessions are indexed in sorted sets scored by expiry time: one of all
+sessions and one per user. Finding, counting and logging out a user's
+sessions reads the user's index instead of scanning every session key.
+Entries of expired sessions are dropped from the indexes as they are
+read, and a user's index expires with the last of their sessions.
 """
 
 import os
 import json
+import time
 import redis
 from typing import Optional, Dict, Any, List
 from datetime import datetime, timezone
@@ -25,6 +32,21 @@ class RedisConnectionError(Exception):
 class RedisSessionBackend:
     """Simple Redis backend for session operations"""
     
+    # Adds a session to the global index and, when KEYS[2] is given, the
+    # user's index, which is kept until the user's last session expires.
+    # ARGV: session ID, expiry timestamp, current timestamp
+    INDEX_SCRIPT = """
+    redis.call('ZADD', KEYS[1], ARGV[2], ARGV[1])
+    redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', ARGV[3])
+    if #KEYS > 1 then
+        redis.call('ZADD', KEYS[2], ARGV[2], ARGV[1])
+        redis.call('ZREMRANGEBYSCORE', KEYS[2], '-inf', ARGV[3])
+        local last = redis.call('ZRANGE', KEYS[2], -1, -1, 'WITHSCORES')
+        redis.call('EXPIREAT', KEYS[2], math.ceil(tonumber(last[2])))
+    end
+    return 1
+    """
+    
     def __init__(self, redis_url: Optional[str] = None, 
                  host: str = 'localhost', port: int = 6379, db: int = 0,
                  password: Optional[str] = None, ssl: bool = False,
@@ -44,6 +66,8 @@ class RedisSessionBackend:
             connection_pool_size: Connection pool size
         """
         self.key_prefix = key_prefix
+        # Outside key_prefix, so scans for session keys never match an index
+        self.index_prefix = f"{key_prefix.rstrip(':')}_index:"
         
         # Create Redis connection
         try:
@@ -90,6 +114,11 @@ class RedisSessionBackend:
             
             # Test connection
             self.redis.ping()
+            self._index_sessions = self.redis.register_script(self.INDEX_SCRIPT)
+            if not self.redis.exists(self._index_built_key()):
+                # Sessions written before the indexes existed, once per deployment.
+                # The global index itself is deleted whenever it empties.
+                self.rebuild_index()
             logger.info("Redis session backend initialized successfully")
             
         except redis.RedisError as e:
@@ -132,6 +161,23 @@ class RedisSessionBackend:
         """Get Redis key for session ID"""
         return f"{self.key_prefix}{session_id}"
     
+    def _all_index_key(self) -> str:
+        return f"{self.index_prefix}all"
+    
+    def _index_built_key(self) -> str:
+        return f"{self.index_prefix}built"
+    
+    def _user_index_key(self, user_id: Any) -> str:
+        return f"{self.index_prefix}user:{user_id}"
+    
+    def _index(self, session_id: str, user_id: Any, ttl: int, client=None) -> None:
+        """Record a session's expiry in the global index and its user's index"""
+        now = time.time()
+        keys = [self._all_index_key()]
+        if user_id is not None:
+            keys.append(self._user_index_key(user_id))
+        self._index_sessions(keys=keys, args=[session_id, now + ttl, now], client=client)
+    
     def _serialize_data(self, data: Dict[str, Any]) -> str:
         """Serialize session data to JSON"""
         # Add timestamp
@@ -184,8 +230,10 @@ class RedisSessionBackend:
             key = self._get_key(session_id)
             data_str = self._serialize_data(data.copy())
             
-            result = self.redis.setex(key, ttl, data_str)
-            return bool(result)
+            pipeline = self.redis.pipeline()
+            pipeline.set(key, data_str, ex=ttl)
+            self._index(session_id, data.get('user_id'), ttl, client=pipeline)
+            return bool(pipeline.execute()[0])
             
         except redis.RedisError as e:
             logger.error(f"Redis error setting session {session_id}: {e}")
@@ -219,8 +267,13 @@ class RedisSessionBackend:
         """
         try:
             key = self._get_key(session_id)
-            result = self.redis.delete(key)
-            return result > 0
+            data = self.get(session_id)
+            pipeline = self.redis.pipeline()
+            pipeline.delete(key)
+            pipeline.zrem(self._all_index_key(), session_id)
+            if data and data.get('user_id') is not None:
+                pipeline.zrem(self._user_index_key(data['user_id']), session_id)
+            return pipeline.execute()[0] > 0
             
         except redis.RedisError as e:
             logger.error(f"Redis error deleting session {session_id}: {e}")
@@ -257,8 +310,13 @@ class RedisSessionBackend:
         """
         try:
             key = self._get_key(session_id)
-            result = self.redis.expire(key, ttl)
-            return bool(result)
+            data = self.get(session_id)
+            if data is None:
+                return False
+            pipeline = self.redis.pipeline()
+            pipeline.expire(key, ttl)
+            self._index(session_id, data.get('user_id'), ttl, client=pipeline)
+            return bool(pipeline.execute()[0])
             
         except redis.RedisError as e:
             logger.error(f"Redis error updating TTL for session {session_id}: {e}")
@@ -297,15 +355,7 @@ class RedisSessionBackend:
             List of session IDs
         """
         try:
-            pattern = f"{self.key_prefix}*"
-            keys = []
-            
-            for key in self.redis.scan_iter(match=pattern):
-                # Extract session ID from key
-                session_id = key.replace(self.key_prefix, '')
-                keys.append(session_id)
-            
-            return keys
+            return list(self.redis.zrangebyscore(self._all_index_key(), time.time(), '+inf'))
             
         except redis.RedisError as e:
             logger.error(f"Redis error getting all sessions: {e}")
@@ -322,16 +372,22 @@ class RedisSessionBackend:
             List of session IDs for the user
         """
         try:
-            pattern = f"{self.key_prefix}*"
-            user_sessions = []
-            
-            for key in self.redis.scan_iter(match=pattern):
-                data_str = self.redis.get(key)
-                if data_str:
-                    data = self._deserialize_data(data_str)
-                    if data.get('user_id') == user_id:
-                        session_id = key.replace(self.key_prefix, '')
-                        user_sessions.append(session_id)
+            index_key = self._user_index_key(user_id)
+            self.redis.zremrangebyscore(index_key, '-inf', time.time())
+            session_ids = self.redis.zrange(index_key, 0, -1)
+            if not session_ids:
+                return []
+            
+            # The index may still name sessions deleted elsewhere or reused by another user
+            user_sessions, stale = [], []
+            values = self.redis.mget([self._get_key(session_id) for session_id in session_ids])
+            for session_id, data_str in zip(session_ids, values):
+                if data_str and self._deserialize_data(data_str).get('user_id') == user_id:
+                    user_sessions.append(session_id)
+                else:
+                    stale.append(session_id)
+            if stale:
+                self.redis.zrem(index_key, *stale)
             
             return user_sessions
             
@@ -372,13 +428,9 @@ class RedisSessionBackend:
             Number of active sessions
         """
         try:
-            pattern = f"{self.key_prefix}*"
-            count = 0
-            
-            for _ in self.redis.scan_iter(match=pattern):
-                count += 1
-            
-            return count
+            index_key = self._all_index_key()
+            self.redis.zremrangebyscore(index_key, '-inf', time.time())
+            return self.redis.zcard(index_key)
             
         except redis.RedisError as e:
             logger.error(f"Redis error getting session count: {e}")
@@ -426,6 +478,11 @@ class RedisSessionBackend:
         try:
             pattern = f"{self.key_prefix}*"
             keys = list(self.redis.scan_iter(match=pattern))
+            index_keys = list(self.redis.scan_iter(match=f"{self.index_prefix}*"))
+            if index_keys:
+                self.redis.delete(*index_keys)
+                # Nothing is left to index
+                self.redis.set(self._index_built_key(), 1)
             
             if keys:
                 count = self.redis.delete(*keys)
@@ -437,3 +494,28 @@ class RedisSessionBackend:
         except redis.RedisError as e:
             logger.error(f"Redis error flushing sessions: {e}")
             return 0
+    
+    def rebuild_index(self) -> int:
+        """
+        Index every session key, scanning all of them once
+        
+        Returns:
+            Number of sessions indexed
+        """
+        try:
+            count = 0
+            for key in self.redis.scan_iter(match=f"{self.key_prefix}*"):
+                data_str = self.redis.get(key)
+                ttl = self.redis.ttl(key)
+                if not data_str or ttl < 0:
+                    continue
+                self._index(key[len(self.key_prefix):], self._deserialize_data(data_str).get('user_id'), ttl)
+                count += 1
+            self.redis.set(self._index_built_key(), 1)
+            if count:
+                logger.info(f"Indexed {count} existing Redis sessions")
+            return count
+            
+        except redis.RedisError as e:
+            logger.error(f"Redis error rebuilding session index: {e}")
+            return 0
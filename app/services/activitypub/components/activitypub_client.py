@@ -4,7 +4,7 @@
 import asyncio
 import json
 import logging
-from typing import List, Dict, Optional, Any, Tuple
+from typing import AsyncIterator, List, Dict, Optional, Any, Tuple
 from urllib.parse import urljoin, urlparse
 import httpx
 from datetime import datetime, timezone
@@ -14,12 +14,37 @@ from cryptography.hazmat.primitives import hashes, serialization
 from cryptography.hazmat.primitives.asymmetric import rsa, padding
 from app.utils.helpers import utils
 from app.utils.helpers.utils import async_retry, RetryConfig, get_retry_stats_summary, get_retry_stats_detailed
-from app.core.security.core.rate_limiter import get_rate_limiter, extract_endpoint_from_url, rate_limited
+from app.core.security.core.rate_limiter import get_rate_limiter, extract_endpoint_from_url, rate_limited, rate_limit_scope
 from app.services.activitypub.components.activitypub_platforms import PlatformAdapterFactory, PlatformAdapterError
+from app.services.activitypub.components.request_pacer import RequestPacer, get_request_pacer
+from app.services.activitypub.components.http_client_pool import get_http_client_pool
 from app.core.security.core.security_utils import sanitize_for_log
 
 logger = logging.getLogger(__name__)
 
+async def _prefetch_pages(pages: AsyncIterator[List[Dict[str, Any]]]) -> AsyncIterator[List[Dict[str, Any]]]:
+    """
+    Yield from an async page iterator while fetching the following page.
+    
+    At most one page is held ahead of the consumer, so memory stays at two
+    pages however long the timeline is. Closing the iterator early cancels
+    the pending fetch.
+    """
+    pending = asyncio.ensure_future(pages.__anext__())
+    try:
+        while True:
+            try:
+                page = await pending
+            except StopAsyncIteration:
+                return
+            pending = asyncio.ensure_future(pages.__anext__())
+            yield page
+    finally:
+        if not pending.done():
+            pending.cancel()
+        await asyncio.gather(pending, return_exceptions=True)
+        await pages.aclose()
+
 class ActivityPubClient:
     """
     Platform-agnostic client for interacting with ActivityPub servers via API.
@@ -58,6 +83,7 @@ class ActivityPubClient:
             self.platform_connection = None
         
         self.session = None
+        self._session_borrowed = False
         self.private_key = None
         self.public_key = None
         self._load_keys()
@@ -171,22 +197,38 @@ class ActivityPubClient:
             # Use default rate limiter
             self.rate_limiter = get_rate_limiter()
             logger.info("Using default rate limiting configuration for ActivityPubClient")
+        
+        # Instances limit each account separately; the Redis-backed limiter
+        # keeps buckets per instance and access token accordingly
+        self.rate_limit_scope = rate_limit_scope(getattr(self.config, 'instance_url', None),
+                                                 getattr(self.config, 'access_token', None))
+        
+        # Spread requests over the instance's rate limit window, putting
+        # caption updates ahead of timeline reads
+        rate_limit = getattr(self.config, 'rate_limit', None)
+        self.pacer = None
+        if getattr(rate_limit, 'pacing_enabled', True):
+            self.pacer = get_request_pacer(self.rate_limit_scope, getattr(rate_limit, 'pacing_reserve', 0))
     
     async def _ensure_session(self):
-        """Ensure HTTP session is initialized"""
+        """Ensure HTTP session is initialized, borrowing the instance's shared client"""
         if not self.session or self.session.is_closed:
-            self.session = httpx.AsyncClient(
-                timeout=30.0,
-                headers={
-                    'User-Agent': self.config.user_agent,
-                    'Accept': 'application/json',
-                    'Content-Type': 'application/json'
-                }
-            )
+            self._release_session()
+            self.session = get_http_client_pool().acquire(self.config.instance_url)
+            self._session_borrowed = True
+    
+    def _release_session(self) -> bool:
+        """Return a borrowed session to the pool, returning whether there was one"""
+        if self.session is not None and getattr(self, '_session_borrowed', False):
+            get_http_client_pool().release(self.session)
+            self.session = None
+            self._session_borrowed = False
+            return True
+        return False
     
     def close(self):
         """Synchronous cleanup method to prevent resource leaks"""
-        if self.session and not self.session.is_closed:
+        if not self._release_session() and self.session and not self.session.is_closed:
             # For synchronous cleanup, we can't await aclose()
             # This is a fallback to prevent resource warnings
             try:
@@ -387,18 +429,12 @@ class ActivityPubClient:
             logger.error(f"{platform_name} {error_type} for {context['endpoint']}: {str(error)}")
     
     async def __aenter__(self):
-        self.session = httpx.AsyncClient(
-            timeout=30.0,
-            headers={
-                'User-Agent': self.config.user_agent,
-                'Accept': 'application/json',
-                'Content-Type': 'application/json'
-            }
-        )
+        await self._ensure_session()
         return self
     
     async def __aexit__(self, exc_type, exc_val, exc_tb):
-        if self.session:
+        # The shared client stays open for other users of the instance
+        if not self._release_session() and self.session:
             await self.session.aclose()
             self.session = None  # Clear reference to prevent resource leak
         
@@ -409,6 +445,25 @@ class ActivityPubClient:
             except Exception as e:
                 logger.warning("Error during platform adapter cleanup: %s", str(e))
     
+    async def _send(self, method: str, url: str, priority: int, **kwargs) -> httpx.Response:
+        """Send a request once the pacer lets it through and feed its rate limit headers back"""
+        pacer = getattr(self, 'pacer', None)
+        if pacer is not None:
+            await pacer.acquire(priority)
+        # The session is shared with other clients, so this client's headers go with each request
+        kwargs['headers'] = {**self._default_headers(), **(kwargs.get('headers') or {})}
+        response = await getattr(self.session, method)(url, **kwargs)
+        if pacer is not None:
+            pacer.update_from_response(response)
+        return response
+    
+    def _default_headers(self) -> Dict[str, str]:
+        return {
+            'User-Agent': self.config.user_agent,
+            'Accept': 'application/json',
+            'Content-Type': 'application/json'
+        }
+    
     async def _get_with_retry(self, url: str, headers: dict, params: dict = None) -> httpx.Response:
         """Make a GET request with retry logic and rate limiting"""
         # Ensure session is initialized
@@ -418,11 +473,14 @@ class ActivityPubClient:
         endpoint = extract_endpoint_from_url(url)
         
         @async_retry(self.retry_config)
-        @rate_limited(endpoint=endpoint, platform=self.platform.platform_name if self.platform else None)
+        @rate_limited(endpoint=endpoint, platform=self.platform.platform_name if self.platform else None,
+                      scope=self.rate_limit_scope)
         async def _get():
             try:
-                response = await self.session.get(url, headers=headers, params=params)
-                response.raise_for_status()
+                response = await self._send('get', url, RequestPacer.BULK, headers=headers, params=params)
+                # 304 answers a conditional request and is not an error
+                if response.status_code != 304:
+                    response.raise_for_status()
                 return response
             except httpx.HTTPStatusError as e:
                 # Platform-aware error handling
@@ -446,10 +504,11 @@ class ActivityPubClient:
         endpoint = extract_endpoint_from_url(url)
         
         @async_retry(self.retry_config)
-        @rate_limited(endpoint=endpoint, platform=self.platform.platform_name if self.platform else None)
+        @rate_limited(endpoint=endpoint, platform=self.platform.platform_name if self.platform else None,
+                      scope=self.rate_limit_scope)
         async def _put():
             try:
-                response = await self.session.put(url, headers=headers, json=json)
+                response = await self._send('put', url, RequestPacer.URGENT, headers=headers, json=json)
                 response.raise_for_status()
                 return response
             except httpx.HTTPStatusError as e:
@@ -471,10 +530,11 @@ class ActivityPubClient:
         endpoint = extract_endpoint_from_url(url)
         
         @async_retry(self.retry_config)
-        @rate_limited(endpoint=endpoint, platform=self.platform.platform_name if self.platform else None)
+        @rate_limited(endpoint=endpoint, platform=self.platform.platform_name if self.platform else None,
+                      scope=self.rate_limit_scope)
         async def _post():
             try:
-                response = await self.session.post(url, headers=headers, json=json)
+                response = await self._send('post', url, RequestPacer.URGENT, headers=headers, json=json)
                 response.raise_for_status()
                 return response
             except httpx.HTTPStatusError as e:
@@ -496,10 +556,11 @@ class ActivityPubClient:
         endpoint = extract_endpoint_from_url(url)
         
         @async_retry(self.retry_config)
-        @rate_limited(endpoint=endpoint, platform=self.platform.platform_name if self.platform else None)
+        @rate_limited(endpoint=endpoint, platform=self.platform.platform_name if self.platform else None,
+                      scope=self.rate_limit_scope)
         async def _delete():
             try:
-                response = await self.session.delete(url, headers=headers)
+                response = await self._send('delete', url, RequestPacer.BULK, headers=headers)
                 response.raise_for_status()
                 return response
             except httpx.HTTPStatusError as e:
@@ -515,13 +576,17 @@ class ActivityPubClient:
         
         return await _delete()
     
-    async def get_user_posts(self, user_id: str, limit: int = 50) -> List[Dict[str, Any]]:
+    async def get_user_posts(self, user_id: str, limit: int = 50, cursor=None) -> List[Dict[str, Any]]:
         """
         Retrieve user's posts from ActivityPub platform using API.
         
         Args:
             user_id: The user ID to fetch posts for
             limit: Maximum number of posts to fetch
+            cursor: Optional TimelineSyncCursor of the platform connection. On
+                platforms that support it only statuses newer than the cursor
+                are fetched and the cursor is advanced in place; store it once
+                the returned posts have been processed.
             
         Returns:
             List of posts in ActivityPub format
@@ -531,7 +596,10 @@ class ActivityPubClient:
         """
         try:
             # Delegate to the platform-specific adapter
-            posts = await self.platform.get_user_posts(self, user_id, limit)
+            if cursor is not None and getattr(self.platform, 'SUPPORTS_TIMELINE_CURSOR', False):
+                posts = await self.platform.get_user_posts(self, user_id, limit, cursor=cursor)
+            else:
+                posts = await self.platform.get_user_posts(self, user_id, limit)
             
             logger.info(f"Retrieved {len(posts)} {self.platform.platform_name} posts for user {sanitize_for_log(user_id)}")
             return posts
@@ -543,6 +611,38 @@ class ActivityPubClient:
             logger.error(f"Failed to retrieve posts for user {sanitize_for_log(user_id)}: {e}")
             raise PlatformAdapterError(f"Failed to retrieve posts for user {sanitize_for_log(user_id)}: {e}")
     
+    async def iter_user_post_pages(self, user_id: str, limit: int = 50,
+                                   cursor=None) -> AsyncIterator[List[Dict[str, Any]]]:
+        """
+        Yield the user's posts a page at a time as they are fetched.
+        
+        The next page is requested while the caller works on the current one,
+        so the first posts are available after a single page fetch and at
+        most two pages are held in memory. Requests go through the client's
+        rate limiter like any other. Arguments are as for get_user_posts.
+        
+        Raises:
+            PlatformAdapterError: If the platform adapter fails
+        """
+        if cursor is not None and getattr(self.platform, 'SUPPORTS_TIMELINE_CURSOR', False):
+            pages = self.platform.iter_user_post_pages(self, user_id, limit, cursor=cursor)
+        else:
+            pages = self.platform.iter_user_post_pages(self, user_id, limit)
+        
+        count = 0
+        try:
+            async for posts in _prefetch_pages(pages):
+                count += len(posts)
+                yield posts
+        except PlatformAdapterError:
+            # Re-raise platform adapter errors
+            raise
+        except Exception as e:
+            logger.error(f"Failed to retrieve posts for user {sanitize_for_log(user_id)}: {e}")
+            raise PlatformAdapterError(f"Failed to retrieve posts for user {sanitize_for_log(user_id)}: {e}")
+        
+        logger.info(f"Retrieved {count} {self.platform.platform_name} posts for user {sanitize_for_log(user_id)}")
+    
     async def get_post_by_id(self, post_id: str) -> Optional[Dict[str, Any]]:
         """
         Retrieve a specific post by ID.
@@ -642,6 +742,29 @@ class ActivityPubClient:
             logger.error(f"Failed to update media caption for {sanitize_for_log(image_post_id)}: {e}")
             raise PlatformAdapterError(f"Failed to update media caption for {sanitize_for_log(image_post_id)}: {e}")
     
+    async def update_status_media_captions(self, status_id: str, captions: Dict[str, str]) -> Dict[str, bool]:
+        """
+        Update the captions of several media attachments of one status,
+        in a single request where the platform allows it.
+        
+        Args:
+            status_id: The platform's ID of the status the media belong to
+            captions: New caption per media attachment ID
+            
+        Returns:
+            Whether each media attachment was updated, by media ID
+            
+        Raises:
+            PlatformAdapterError: If the platform adapter fails
+        """
+        try:
+            return await self.platform.update_status_media_captions(self, status_id, captions)
+        except PlatformAdapterError:
+            raise
+        except Exception as e:
+            logger.error(f"Failed to update media captions of status {sanitize_for_log(status_id)}: {e}")
+            raise PlatformAdapterError(f"Failed to update media captions of status {sanitize_for_log(status_id)}: {e}")
+    
     def extract_images_from_post(self, post: Dict[str, Any]) -> List[Dict[str, Any]]:
         """
         Extract image attachments from a post.
@@ -777,8 +900,8 @@ class ActivityPubClient:
             # Test 2: Network connectivity
             try:
                 # Simple HTTP request to instance
-                async with httpx.AsyncClient(timeout=10.0) as client:
-                    response = await client.get(f"{self.config.instance_url}/api/v1/instance")
+                async with get_http_client_pool().borrow(self.config.instance_url) as client:
+                    response = await client.get(f"{self.config.instance_url}/api/v1/instance", timeout=10.0)
                     if response.status_code == 200:
                         validation_result['tests']['network_connectivity'] = True
                         instance_info = response.json()
@@ -977,6 +1100,12 @@ class ActivityPubClient:
             return self.rate_limiter.get_stats()
         return {"error": "Rate limiter not initialized"}
     
+    def get_pacing_stats(self) -> dict:
+        """Get the achieved request rate and current pacing for this client's account"""
+        if getattr(self, 'pacer', None) is not None:
+            return self.pacer.get_stats()
+        return {"error": "Request pacing disabled"}
+    
     def reset_rate_limit_stats(self) -> None:
         """Reset rate limiting statistics"""
         if hasattr(self, 'rate_limiter'):
@@ -995,6 +1124,7 @@ class ActivityPubClient:
             "instance": self.config.instance_url,
             "retry_stats": self.get_detailed_retry_stats(),
             "rate_limit_stats": self.get_rate_limit_stats(),
+            "pacing_stats": self.get_pacing_stats(),
             "platform_specific": self.get_platform_specific_retry_info()
         }
         
@@ -1009,7 +1139,8 @@ class ActivityPubClient:
             "retry_success_rate": retry_summary.get("success_rate", 0),
             "average_retry_time": report["retry_stats"].get("timing", {}).get("avg_retry_time", 0),
             "average_rate_limit_wait": report["rate_limit_stats"].get("wait_time", {}).get("average", 0),
-            "requests_per_minute": rate_limit_summary.get("requests_per_minute", 0)
+            "requests_per_minute": rate_limit_summary.get("requests_per_minute", 0),
+            "achieved_requests_per_minute": report["pacing_stats"].get("requests_per_minute", 0)
         }
         
         return report
\ No newline at end of file
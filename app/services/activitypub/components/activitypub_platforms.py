@@ -8,10 +8,14 @@ This module provides adapters for different ActivityPub platforms like Pixelfed,
 
 from logging import getLogger
 import abc
-from typing import Dict, List, Any, Optional
+import asyncio
+from typing import AsyncIterator, Dict, List, Any, Optional
 import httpx
 from urllib.parse import urlparse
 from app.core.security.core.security_utils import sanitize_for_log
+from app.services.activitypub.components.instance_metadata_cache import (
+    credentials_subject, get_instance_metadata_cache
+)
 
 logger = getLogger(__name__)
 
@@ -27,6 +31,11 @@ class PlatformDetectionError(PlatformAdapterError):
     """Raised when platform detection fails"""
     pass
 
+def _status_id_order(status_id) -> tuple:
+    """Sort key for status IDs; Mastodon and Pixelfed IDs are numeric strings"""
+    status_id = str(status_id)
+    return (len(status_id), status_id)
+
 class ActivityPubPlatform(abc.ABC):
     """
     Base abstract class for ActivityPub platform adapters.
@@ -36,6 +45,12 @@ class ActivityPubPlatform(abc.ABC):
     with different ActivityPub servers (Pixelfed, Mastodon, Pleroma, etc.).
     """
     
+    # Whether get_user_posts accepts a TimelineSyncCursor to fetch only new statuses
+    SUPPORTS_TIMELINE_CURSOR = False
+    
+    # Statuses per request when reading a timeline forward from a cursor
+    CURSOR_PAGE_SIZE = 40
+    
     def __init__(self, config):
         """
         Initialize the platform adapter with configuration.
@@ -44,6 +59,8 @@ class ActivityPubPlatform(abc.ABC):
             config: Configuration object containing platform-specific settings
         """
         self.config = config
+        # Account IDs resolved through the instance metadata cache, and what they were resolved from
+        self._account_subjects: Dict[str, str] = {}
         self._validate_config()
     
     def _build_api_url(self, endpoint: str) -> str:
@@ -110,6 +127,35 @@ class ActivityPubPlatform(abc.ABC):
             PlatformAdapterError: If the operation fails
         """
         pass
+    
+    async def update_status_media_captions(self, client, status_id: str, captions: Dict[str, str]) -> Dict[str, bool]:
+        """
+        Update the captions of several media attachments of one status.
+        
+        Platforms that can edit all attachments of a status in one request
+        override this; by default each attachment is updated on its own.
+        
+        Args:
+            client: The ActivityPubClient instance
+            status_id: The platform's ID of the status the media belong to
+            captions: New caption per media attachment ID
+            
+        Returns:
+            Whether each media attachment was updated, by media ID
+        """
+        results = {}
+        for media_id, caption in captions.items():
+            try:
+                results[media_id] = await self.update_media_caption(client, media_id, caption)
+            except Exception as e:
+                logger.error(f"Failed to update media caption for {media_id}: {e}")
+                results[media_id] = False
+        return results
+    
+    @staticmethod
+    def status_id_from_post_id(post_id: str) -> str:
+        """The platform's status ID from a stored post ID, which is usually the status URI"""
+        return str(post_id).rstrip('/').rsplit('/', 1)[-1]
         
     @abc.abstractmethod
     def extract_images_from_post(self, post: Dict[str, Any]) -> List[Dict[str, Any]]:
@@ -187,6 +233,198 @@ class ActivityPubPlatform(abc.ABC):
         """
         return {}
     
+    async def iter_user_post_pages(self, client, user_id: str, limit: int = 50,
+                                   cursor=None) -> AsyncIterator[List[Dict[str, Any]]]:
+        """
+        Yield the user's posts a page at a time.
+        
+        Platforms that page through their API override this to yield each
+        page as it arrives, so callers can start on the first page while
+        later ones are still being fetched. The default yields everything
+        get_user_posts returns as one page.
+        
+        Args:
+            client: The ActivityPubClient instance
+            user_id: The user ID to fetch posts for
+            limit: Maximum number of posts to yield in total
+            cursor: Optional TimelineSyncCursor, used if the platform supports it
+        """
+        if cursor is not None and self.SUPPORTS_TIMELINE_CURSOR:
+            posts = await self.get_user_posts(client, user_id, limit, cursor=cursor)
+        else:
+            posts = await self.get_user_posts(client, user_id, limit)
+        if posts:
+            yield posts
+    
+    async def _collect_posts(self, client, user_id: str, limit: int, cursor=None) -> List[Dict[str, Any]]:
+        """Gather every page from iter_user_post_pages into one list"""
+        posts = []
+        async for page in self.iter_user_post_pages(client, user_id, limit, cursor=cursor):
+            posts.extend(page)
+        return posts
+    
+    async def _cached_account_id(self, subject: str, lookup) -> Optional[str]:
+        """
+        Get an account ID from the instance metadata cache, awaiting lookup() only on a miss.
+        
+        Args:
+            subject: The username, acct or credentials_subject() the account is resolved from
+            lookup: Coroutine function that asks the instance, returning the account ID or None
+        """
+        # The Redis and database backends block, so they are called in a thread
+        cache = get_instance_metadata_cache()
+        account_id = await asyncio.to_thread(cache.get_account_id, self.config.instance_url, subject)
+        if account_id is None:
+            account_id = await lookup()
+            if account_id:
+                await asyncio.to_thread(cache.set_account_id, self.config.instance_url, subject, account_id)
+        if account_id:
+            self._account_subjects[str(account_id)] = subject
+        return account_id
+    
+    def _forget_account_if_not_found(self, statuses_url: str, error: Exception):
+        """Drop a cached account ID when its statuses endpoint answers 404, so the next run resolves it again"""
+        response = getattr(error, 'response', None)
+        if getattr(response, 'status_code', None) != 404:
+            return
+        for account_id, subject in list(self._account_subjects.items()):
+            if f"/accounts/{account_id}/" in statuses_url:
+                logger.info(f"Account {account_id} not found, forgetting cached account ID for {sanitize_for_log(subject)}")
+                get_instance_metadata_cache().invalidate_account_id(self.config.instance_url, subject)
+                del self._account_subjects[account_id]
+    
+    async def _iter_recent_posts(self, client, user_id: str, statuses_url: str, headers: Dict[str, str],
+                                 params: Dict[str, Any], limit: int, page_size: int,
+                                 convert_statuses, cursor=None) -> AsyncIterator[List[Dict[str, Any]]]:
+        """
+        Yield the newest posts a page at a time, walking back with max_id.
+        
+        Args:
+            client: The ActivityPubClient instance
+            user_id: The user ID, for logging
+            statuses_url: The account statuses endpoint
+            headers: Authorization headers
+            params: Filters sent with every request
+            limit: Maximum number of posts to yield in total
+            page_size: Statuses per request
+            convert_statuses: Converts a list of statuses to ActivityPub posts
+            cursor: Optional TimelineSyncCursor to record the newest status in;
+                with a cursor, a failed page request is raised instead of
+                ending the listing early
+        """
+        max_pages = (limit + page_size - 1) // page_size  # Ceiling division
+        logger.info(f"Fetching up to {limit} posts for user {user_id} (max {max_pages} pages)")
+        
+        found = 0
+        max_id = None
+        for page in range(1, max_pages + 1):
+            page_params = dict(params, limit=page_size)
+            if max_id:
+                page_params['max_id'] = max_id
+            
+            logger.info(f"Fetching page {page} of posts for user {user_id}")
+            try:
+                response = await client._get_with_retry(statuses_url, headers, params=page_params)
+                statuses = response.json()
+            except Exception as e:
+                logger.error(f"Failed to fetch page {page} for user {user_id}: {e}")
+                self._forget_account_if_not_found(statuses_url, e)
+                if cursor is not None:
+                    # The cursor already points past the statuses not read yet,
+                    # so fail the run rather than let it be saved
+                    raise
+                break
+            
+            # If no statuses returned, we've reached the end
+            if not statuses:
+                logger.info(f"No more posts found for user {user_id} after page {page-1}")
+                break
+            
+            # The next run only needs statuses newer than the newest one seen now
+            if cursor is not None and page == 1:
+                cursor.last_status_id = max((status['id'] for status in statuses), key=_status_id_order)
+            
+            # Get the ID of the last status for pagination
+            max_id = statuses[-1]['id']
+            
+            posts = convert_statuses(statuses)[:limit - found]
+            found += len(posts)
+            logger.info(f"Page {page}: Found {len(posts)} posts with media for user {user_id}")
+            if posts:
+                yield posts
+            
+            if found >= limit:
+                logger.info(f"Reached desired limit of {limit} posts for user {user_id}")
+                break
+            
+            # If we got fewer posts than the page size, we've reached the end
+            if len(statuses) < page_size:
+                logger.info(f"Reached end of posts for user {user_id} on page {page}")
+                break
+    
+    async def _iter_posts_after_cursor(self, client, statuses_url: str, headers: Dict[str, str],
+                                       params: Dict[str, Any], cursor, limit: int,
+                                       convert_statuses) -> AsyncIterator[List[Dict[str, Any]]]:
+        """
+        Yield the posts published since the cursor a page at a time, oldest first.
+        
+        Pages forward with min_id, so each request returns the statuses right
+        after the previous ones: statuses seen by earlier runs are never
+        re-read, and when more than limit posts are waiting the rest are left
+        for the next run rather than skipped. The cursor is advanced in place
+        to the last status examined. The validators of an empty "nothing
+        new" page are kept on the cursor so the next check can be answered
+        with 304 Not Modified.
+        
+        Args:
+            client: The ActivityPubClient instance
+            statuses_url: The account statuses endpoint
+            headers: Authorization headers
+            params: Filters sent with every request
+            cursor: TimelineSyncCursor with last_status_id set
+            limit: Maximum number of posts to yield in total
+            convert_statuses: Converts a list of statuses to ActivityPub posts
+        """
+        found = 0
+        while found < limit:
+            request_headers = dict(headers)
+            if cursor.etag:
+                request_headers['If-None-Match'] = cursor.etag
+            if cursor.last_modified:
+                request_headers['If-Modified-Since'] = cursor.last_modified
+            page_params = dict(params, limit=self.CURSOR_PAGE_SIZE, min_id=cursor.last_status_id)
+            
+            try:
+                response = await client._get_with_retry(statuses_url, request_headers, params=page_params)
+            except Exception as e:
+                self._forget_account_if_not_found(statuses_url, e)
+                raise
+            if response.status_code == 304:
+                logger.info(f"No new statuses since {cursor.last_status_id}")
+                break
+            
+            statuses = response.json()
+            if not statuses:
+                cursor.etag = response.headers.get('ETag')
+                cursor.last_modified = response.headers.get('Last-Modified')
+                break
+            cursor.etag = cursor.last_modified = None
+            
+            posts = []
+            for status in sorted(statuses, key=lambda status: _status_id_order(status['id'])):
+                posts.extend(convert_statuses([status]))
+                cursor.last_status_id = status['id']
+                if found + len(posts) >= limit:
+                    break
+            found += len(posts)
+            if posts:
+                yield posts
+            
+            if len(statuses) < self.CURSOR_PAGE_SIZE:
+                break
+        
+        logger.info(f"Found {found} new posts, timeline cursor now at {cursor.last_status_id}")
+    
     async def cleanup(self):
         """
         Cleanup resources used by this adapter.
@@ -205,6 +443,8 @@ class ActivityPubPlatform(abc.ABC):
 class PixelfedPlatform(ActivityPubPlatform):
     """Adapter for Pixelfed platform"""
     
+    SUPPORTS_TIMELINE_CURSOR = True
+    
     def _validate_config(self):
         """Validate Pixelfed-specific configuration"""
         super()._validate_config()
@@ -250,7 +490,7 @@ class PixelfedPlatform(ActivityPubPlatform):
             logger.warning(f"Error during Pixelfed platform detection for {instance_url}: {e}")
             return False
         
-    async def get_user_posts(self, client, user_id: str, limit: int = 50) -> List[Dict[str, Any]]:
+    async def get_user_posts(self, client, user_id: str, limit: int = 50, cursor=None) -> List[Dict[str, Any]]:
         """
         Retrieve user's posts from Pixelfed using API with pagination support
         
@@ -258,10 +498,19 @@ class PixelfedPlatform(ActivityPubPlatform):
             client: The ActivityPubClient instance
             user_id: The user ID to fetch posts for
             limit: Maximum number of posts to fetch
+            cursor: Optional TimelineSyncCursor; when it has a last status only
+                newer statuses are fetched, and it is advanced in place
             
         Returns:
             List of posts in ActivityPub format
         """
+        posts = await self._collect_posts(client, user_id, limit, cursor)
+        logger.info(f"Retrieved {len(posts)} Pixelfed posts for user {user_id}")
+        return posts
+    
+    async def iter_user_post_pages(self, client, user_id: str, limit: int = 50,
+                                   cursor=None) -> AsyncIterator[List[Dict[str, Any]]]:
+        """Yield the user's posts from Pixelfed a page at a time (see get_user_posts)"""
         try:
             # Use Pixelfed API to get user account ID first
             headers = {
@@ -269,85 +518,62 @@ class PixelfedPlatform(ActivityPubPlatform):
                 'Accept': 'application/json'
             }
             
-            # Get user account ID
-            verify_url = self._build_api_url("/api/v1/accounts/verify_credentials")
-            response = await client._get_with_retry(verify_url, headers)
-            user_data = response.json()
-            account_id = user_data['id']
-            
-            # Initialize variables for pagination
-            all_posts = []
-            page_size = 40  # Pixelfed API typically returns 40 posts per page
-            max_pages = (limit + page_size - 1) // page_size  # Ceiling division
-            next_page_url = self._build_api_url(f"/api/v1/accounts/{account_id}/statuses")
-            
-            logger.info(f"Fetching up to {limit} posts for user {user_id} (max {max_pages} pages)")
-            
-            # Fetch posts page by page
-            for page in range(1, max_pages + 1):
-                # Prepare parameters for the request
-                params = {'limit': page_size}
-                
-                # If we have a max_id from a previous page, use it for pagination
-                if page > 1 and 'max_id' in locals():
-                    params['max_id'] = max_id
-                
-                # Make the request
-                logger.info(f"Fetching page {page} of posts for user {user_id}")
-                response = await client._get_with_retry(next_page_url, headers, params=params)
-                statuses = response.json()
-                
-                # If no statuses returned, we've reached the end
-                if not statuses:
-                    logger.info(f"No more posts found for user {user_id} after page {page-1}")
-                    break
-                
-                # Get the ID of the last status for pagination
-                max_id = statuses[-1]['id']
-                
-                # Convert Pixelfed statuses to ActivityPub format
-                for status in statuses:
-                    if status.get('media_attachments'):
-                        # Convert to ActivityPub Note format
-                        attachments = []
-                        for media in status['media_attachments']:
-                            if media.get('type') == 'image':
-                                attachments.append({
-                                    "type": "Document",
-                                    "mediaType": "image/jpeg",
-                                    "url": media.get('url'),
-                                    "name": media.get('description', ''),
-                                    "id": media.get('id')  # Store Pixelfed ID
-                                })
-                        
-                        if attachments:
-                            all_posts.append({
-                                "id": status.get('url'),
-                                "type": "Note",
-                                "content": status.get('content', ''),
-                                "attributedTo": f"{self.config.instance_url}/users/{user_id}",
-                                "published": status.get('created_at'),
-                                "attachment": attachments
-                            })
-                
-                # If we've reached the desired limit, stop fetching more pages
-                if len(all_posts) >= limit:
-                    all_posts = all_posts[:limit]  # Trim to exact limit
-                    logger.info(f"Reached desired limit of {limit} posts for user {user_id}")
-                    break
-                
-                # If we got fewer posts than the page size, we've reached the end
-                if len(statuses) < page_size:
-                    logger.info(f"Reached end of posts for user {user_id} on page {page}")
-                    break
+            # Get the token's account ID, cached between runs
+            async def lookup():
+                verify_url = self._build_api_url("/api/v1/accounts/verify_credentials")
+                response = await client._get_with_retry(verify_url, headers)
+                return response.json()['id']
+            
+            account_id = await self._cached_account_id(credentials_subject(self.config.access_token), lookup)
+            statuses_url = self._build_api_url(f"/api/v1/accounts/{account_id}/statuses")
             
-            logger.info(f"Retrieved {len(all_posts)} Pixelfed posts for user {user_id}")
-            return all_posts
+            def convert(statuses):
+                return self._convert_pixelfed_statuses_to_activitypub(statuses, user_id)
+            
+            if cursor is not None and cursor.last_status_id:
+                logger.info(f"Fetching up to {limit} posts for user {user_id} after status {cursor.last_status_id}")
+                pages = self._iter_posts_after_cursor(client, statuses_url, headers, {}, cursor, limit, convert)
+            else:
+                # Pixelfed API typically returns 40 posts per page
+                pages = self._iter_recent_posts(client, user_id, statuses_url, headers, {}, limit, 40, convert, cursor)
+            
+            async for posts in pages:
+                yield posts
             
         except Exception as e:
             logger.error(f"Failed to retrieve Pixelfed posts for user {user_id}: {e}")
-            return []
-            
+            if cursor is not None:
+                # Without all of its posts the run must not save the cursor
+                raise PlatformAdapterError(f"Failed to retrieve posts for user {user_id}: {e}")
+    
+    def _convert_pixelfed_statuses_to_activitypub(self, statuses: List[Dict[str, Any]], user_id: str) -> List[Dict[str, Any]]:
+        """Convert Pixelfed statuses with image attachments to ActivityPub Notes"""
+        posts = []
+        for status in statuses:
+            if status.get('media_attachments'):
+                # Convert to ActivityPub Note format
+                attachments = []
+                for media in status['media_attachments']:
+                    if media.get('type') == 'image':
+                        attachments.append({
+                            "type": "Document",
+                            "mediaType": "image/jpeg",
+                            "url": media.get('url'),
+                            "name": media.get('description', ''),
+                            "id": media.get('id')  # Store Pixelfed ID
+                        })
+                
+                if attachments:
+                    posts.append({
+                        "id": status.get('url'),
+                        "type": "Note",
+                        "content": status.get('content', ''),
+                        "attributedTo": f"{self.config.instance_url}/users/{user_id}",
+                        "published": status.get('created_at'),
+                        "attachment": attachments
+                    })
+        return posts
+    
     async def update_media_caption(self, client, image_post_id: str, caption: str) -> bool:
         """Update a specific media attachment's caption/description using the Pixelfed API"""
         try:
@@ -482,6 +708,8 @@ class PixelfedPlatform(ActivityPubPlatform):
 class MastodonPlatform(ActivityPubPlatform):
     """Adapter for Mastodon platform"""
     
+    SUPPORTS_TIMELINE_CURSOR = True
+    
     def __init__(self, config):
         """Initialize Mastodon platform adapter"""
         super().__init__(config)
@@ -708,7 +936,7 @@ class MastodonPlatform(ActivityPubPlatform):
             logger.warning(f"Error during Mastodon platform detection for {instance_url}: {e}")
             return False
         
-    async def get_user_posts(self, client, user_id: str, limit: int = 50) -> List[Dict[str, Any]]:
+    async def get_user_posts(self, client, user_id: str, limit: int = 50, cursor=None) -> List[Dict[str, Any]]:
         """
         Retrieve user's posts from Mastodon using API with pagination support.
         
@@ -716,6 +944,8 @@ class MastodonPlatform(ActivityPubPlatform):
             client: The ActivityPubClient instance
             user_id: The user ID or username to fetch posts for
             limit: Maximum number of posts to fetch
+            cursor: Optional TimelineSyncCursor; when it has a last status only
+                newer statuses are fetched, and it is advanced in place
             
         Returns:
             List of posts in ActivityPub format
@@ -723,11 +953,18 @@ class MastodonPlatform(ActivityPubPlatform):
         Raises:
             PlatformAdapterError: If the operation fails
         """
+        posts = await self._collect_posts(client, user_id, limit, cursor)
+        logger.info(f"Retrieved {len(posts)} Mastodon posts for user {user_id}")
+        return posts
+    
+    async def iter_user_post_pages(self, client, user_id: str, limit: int = 50,
+                                   cursor=None) -> AsyncIterator[List[Dict[str, Any]]]:
+        """Yield the user's posts from Mastodon a page at a time (see get_user_posts)"""
         try:
             # Ensure we're authenticated
             if not await self.authenticate(client):
                 logger.error("Failed to authenticate with Mastodon")
-                return []
+                return
             
             # Use authenticated headers
             headers = self._get_auth_headers()
@@ -736,68 +973,28 @@ class MastodonPlatform(ActivityPubPlatform):
             account_id = await self._resolve_user_to_account_id(client, user_id, headers)
             if not account_id:
                 logger.error(f"User {user_id} not found on Mastodon instance")
-                return []
-            
-            # Initialize variables for pagination
-            all_posts = []
-            page_size = min(40, limit)  # Mastodon API typically returns up to 40 posts per page
-            max_pages = (limit + page_size - 1) // page_size  # Ceiling division
-            
-            logger.info(f"Fetching up to {limit} posts for user {user_id} (max {max_pages} pages)")
-            
-            # Fetch posts page by page
-            max_id = None
-            for page in range(1, max_pages + 1):
-                # Prepare parameters for the request
-                params = {
-                    'limit': page_size,
-                    'only_media': 'true',  # Only get posts with media attachments
-                    'exclude_replies': 'true',  # Exclude replies to focus on original posts
-                    'exclude_reblogs': 'true'   # Exclude reblogs/boosts
-                }
-                
-                # Add pagination parameter if we have a max_id from previous page
-                if max_id:
-                    params['max_id'] = max_id
-                
-                # Make the request to get user's statuses
-                statuses_url = f"{self.config.instance_url}/api/v1/accounts/{account_id}/statuses"
-                logger.info(f"Fetching page {page} of posts for user {user_id}")
-                
-                try:
-                    response = await client._get_with_retry(statuses_url, headers, params=params)
-                    statuses = response.json()
-                except Exception as e:
-                    logger.error(f"Failed to fetch page {page} for user {user_id}: {e}")
-                    break
-                
-                # If no statuses returned, we've reached the end
-                if not statuses:
-                    logger.info(f"No more posts found for user {user_id} after page {page-1}")
-                    break
-                
-                # Get the ID of the last status for pagination
-                max_id = statuses[-1]['id']
-                
-                # Process statuses and convert to ActivityPub format
-                page_posts = self._convert_mastodon_statuses_to_activitypub(statuses, user_id)
-                all_posts.extend(page_posts)
-                
-                logger.info(f"Page {page}: Found {len(page_posts)} posts with media for user {user_id}")
-                
-                # If we've reached the desired limit, stop fetching more pages
-                if len(all_posts) >= limit:
-                    all_posts = all_posts[:limit]  # Trim to exact limit
-                    logger.info(f"Reached desired limit of {limit} posts for user {user_id}")
-                    break
-                
-                # If we got fewer posts than the page size, we've reached the end
-                if len(statuses) < page_size:
-                    logger.info(f"Reached end of posts for user {user_id} on page {page}")
-                    break
+                return
             
-            logger.info(f"Retrieved {len(all_posts)} Mastodon posts for user {user_id}")
-            return all_posts
+            statuses_url = f"{self.config.instance_url}/api/v1/accounts/{account_id}/statuses"
+            filters = {
+                'only_media': 'true',  # Only get posts with media attachments
+                'exclude_replies': 'true',  # Exclude replies to focus on original posts
+                'exclude_reblogs': 'true'   # Exclude reblogs/boosts
+            }
+            
+            def convert(statuses):
+                return self._convert_mastodon_statuses_to_activitypub(statuses, user_id)
+            
+            if cursor is not None and cursor.last_status_id:
+                logger.info(f"Fetching up to {limit} posts for user {user_id} after status {cursor.last_status_id}")
+                pages = self._iter_posts_after_cursor(client, statuses_url, headers, filters, cursor, limit, convert)
+            else:
+                # Mastodon API typically returns up to 40 posts per page
+                pages = self._iter_recent_posts(client, user_id, statuses_url, headers, filters,
+                                                limit, min(40, limit), convert, cursor)
+            
+            async for posts in pages:
+                yield posts
             
         except Exception as e:
             logger.error(f"Failed to retrieve Mastodon posts for user {sanitize_for_log(user_id)}: {sanitize_for_log(str(e))}")
@@ -805,7 +1002,27 @@ class MastodonPlatform(ActivityPubPlatform):
     
     async def _resolve_user_to_account_id(self, client, user_id: str, headers: Dict[str, str]) -> Optional[str]:
         """
-        Resolve a user ID or username to a Mastodon account ID.
+        Resolve a user ID or username to a Mastodon account ID, using the
+        instance metadata cache so known users cost no requests.
+        
+        Args:
+            client: The ActivityPubClient instance
+            user_id: The user ID or username to resolve
+            headers: Authentication headers
+            
+        Returns:
+            The account ID if found, None otherwise
+        """
+        if not user_id:
+            logger.error("User ID is None or empty")
+            return None
+        return await self._cached_account_id(
+            user_id, lambda: self._lookup_account_id(client, user_id, headers)
+        )
+    
+    async def _lookup_account_id(self, client, user_id: str, headers: Dict[str, str]) -> Optional[str]:
+        """
+        Ask the instance for the Mastodon account ID of a user ID or username.
         
         Args:
             client: The ActivityPubClient instance
@@ -1006,26 +1223,40 @@ class MastodonPlatform(ActivityPubPlatform):
     
     async def update_status_media_caption(self, client, status_id: str, media_id: str, caption: str) -> bool:
         """Update a media attachment's caption using Mastodon's status edit API"""
+        if not status_id or not media_id:
+            logger.error("Both status_id and media_id are required for Mastodon media updates")
+            return False
+        results = await self.update_status_media_captions(client, status_id, {media_id: caption})
+        return results[media_id]
+    
+    async def update_status_media_captions(self, client, status_id: str, captions: Dict[str, str]) -> Dict[str, bool]:
+        """
+        Update the captions of several media attachments with one status edit.
+        
+        The edit keeps the status text and every attachment of the status,
+        including ones whose caption is not changed.
+        """
+        failed = {media_id: False for media_id in captions}
         try:
-            if not status_id or not media_id:
+            if not status_id or not captions:
                 logger.error("Both status_id and media_id are required for Mastodon media updates")
-                return False
+                return failed
             
             # Handle mock clients for testing (only if explicitly marked)
             bypass_validation = getattr(client, '_bypass_validation', None)
             if bypass_validation is True:
                 logger.debug("Mock client with bypass flag detected, simulating successful media caption update")
-                logger.info(f"Mock: Updated status {status_id} media {media_id} with caption: {caption[:50]}...")
-                return True
+                logger.info(f"Mock: Updated status {status_id} media {', '.join(captions)}")
+                return {media_id: True for media_id in captions}
             
             # Ensure we're authenticated
             if not await self.authenticate(client):
                 logger.error("Failed to authenticate with Mastodon")
-                return False
+                return failed
                 
             headers = self._get_auth_headers()
             
-            # First, get the current status to preserve the original text
+            # First, get the current status to preserve the original text and attachments
             status_url = f"{self.config.instance_url}/api/v1/statuses/{status_id}"
             try:
                 status_response = await client._get_with_retry(status_url, headers)
@@ -1039,31 +1270,38 @@ class MastodonPlatform(ActivityPubPlatform):
                 
             except Exception as e:
                 logger.error(f"Failed to get current status {status_id}: {e}")
-                return False
+                return failed
             
-            # Use Mastodon's status edit API with original text preserved
+            attached = current_status.get('media_attachments')
+            media_ids = [str(media['id']) for media in attached] if attached else [str(m) for m in captions]
+            missing = [media_id for media_id in captions if str(media_id) not in media_ids]
+            if missing:
+                logger.warning(f"Media {', '.join(map(str, missing))} no longer attached to status {status_id}")
+            
+            # Use Mastodon's status edit API with original text and attachments preserved
             data = {
                 "status": original_text,  # Required: preserve original status text
-                "media_ids": [media_id],  # Required: preserve media attachments
+                "media_ids": media_ids,  # Required: preserve every media attachment
                 "media_attributes": [
                     {
                         "id": media_id,
                         "description": caption
                     }
+                    for media_id, caption in captions.items() if media_id not in missing
                 ]
             }
             
-            logger.info(f"Updating status {status_id} media {media_id} with caption: {caption[:50]}...")
+            logger.info(f"Updating {len(data['media_attributes'])} media captions of status {status_id}")
             
             # Use the retry mechanism for the PUT request
-            response = await client._put_with_retry(status_url, headers, json=data)
+            await client._put_with_retry(status_url, headers, json=data)
             
-            logger.info(f"Successfully updated media caption for {media_id} in status {status_id}")
-            return True
+            logger.info(f"Successfully updated media captions in status {status_id}")
+            return {media_id: media_id not in missing for media_id in captions}
             
         except Exception as e:
-            logger.error(f"Failed to update media caption for {media_id} in status {status_id}: {e}")
-            return False
+            logger.error(f"Failed to update media captions in status {status_id}: {e}")
+            return failed
             
     def extract_images_from_post(self, post: Dict[str, Any]) -> List[Dict[str, Any]]:
         """
@@ -1360,6 +1598,13 @@ class PleromaPlatform(ActivityPubPlatform):
         
     async def get_user_posts(self, client, user_id: str, limit: int = 50) -> List[Dict[str, Any]]:
         """Retrieve user's posts from Pleroma using API"""
+        posts = await self._collect_posts(client, user_id, limit)
+        logger.info(f"Retrieved {len(posts)} Pleroma posts for user {user_id}")
+        return posts
+    
+    async def iter_user_post_pages(self, client, user_id: str, limit: int = 50,
+                                   cursor=None) -> AsyncIterator[List[Dict[str, Any]]]:
+        """Yield the user's posts from Pleroma a page at a time; cursors are not supported"""
         try:
             # Use Pleroma API to get user account ID first
             headers = {
@@ -1367,49 +1612,53 @@ class PleromaPlatform(ActivityPubPlatform):
                 'Accept': 'application/json'
             }
             
-            # First, search for the user to get their ID
-            search_url = f"{self.config.instance_url}/api/v1/accounts/lookup"
-            response = await client._get_with_retry(search_url, headers, params={'acct': user_id})
-            account_data = response.json()
-            account_id = account_data['id']
+            # First, look up the user's ID, cached between runs
+            async def lookup():
+                search_url = f"{self.config.instance_url}/api/v1/accounts/lookup"
+                response = await client._get_with_retry(search_url, headers, params={'acct': user_id})
+                return response.json()['id']
             
-            # Get user's posts
-            statuses_url = f"{self.config.instance_url}/api/v1/accounts/{account_id}/statuses"
-            response = await client._get_with_retry(statuses_url, headers, params={'limit': limit, 'only_media': True})
-            statuses = response.json()
-            
-            # Convert Pleroma statuses to ActivityPub format
-            posts = []
-            for status in statuses:
-                if status.get('media_attachments'):
-                    # Convert to ActivityPub Note format
-                    attachments = []
-                    for media in status['media_attachments']:
-                        if media.get('type') == 'image':
-                            attachments.append({
-                                "type": "Document",
-                                "mediaType": media.get('type'),
-                                "url": media.get('url'),
-                                "name": media.get('description', ''),
-                                "id": media.get('id')  # Store Pleroma ID
-                            })
-                    
-                    if attachments:
-                        posts.append({
-                            "id": status.get('uri'),
-                            "type": "Note",
-                            "content": status.get('content', ''),
-                            "attributedTo": f"{self.config.instance_url}/users/{user_id}",
-                            "published": status.get('created_at'),
-                            "attachment": attachments
-                        })
+            account_id = await self._cached_account_id(user_id, lookup)
             
-            logger.info(f"Retrieved {len(posts)} Pleroma posts for user {user_id}")
-            return posts
+            # Get user's posts; Pleroma caps pages at 40 statuses
+            statuses_url = f"{self.config.instance_url}/api/v1/accounts/{account_id}/statuses"
+            pages = self._iter_recent_posts(
+                client, user_id, statuses_url, headers, {'only_media': True}, limit, min(40, limit),
+                lambda statuses: self._convert_pleroma_statuses_to_activitypub(statuses, user_id)
+            )
+            async for posts in pages:
+                yield posts
             
         except Exception as e:
             logger.error(f"Failed to retrieve Pleroma posts for user {user_id}: {e}")
-            return []
+    
+    def _convert_pleroma_statuses_to_activitypub(self, statuses: List[Dict[str, Any]], user_id: str) -> List[Dict[str, Any]]:
+        """Convert Pleroma statuses with image attachments to ActivityPub Notes"""
+        posts = []
+        for status in statuses:
+            if status.get('media_attachments'):
+                # Convert to ActivityPub Note format
+                attachments = []
+                for media in status['media_attachments']:
+                    if media.get('type') == 'image':
+                        attachments.append({
+                            "type": "Document",
+                            "mediaType": media.get('type'),
+                            "url": media.get('url'),
+                            "name": media.get('description', ''),
+                            "id": media.get('id')  # Store Pleroma ID
+                        })
+                
+                if attachments:
+                    posts.append({
+                        "id": status.get('uri'),
+                        "type": "Note",
+                        "content": status.get('content', ''),
+                        "attributedTo": f"{self.config.instance_url}/users/{user_id}",
+                        "published": status.get('created_at'),
+                        "attachment": attachments
+                    })
+        return posts
             
     async def update_media_caption(self, client, image_post_id: str, caption: str) -> bool:
         """Update a specific media attachment's caption/description using the Pleroma API"""
@@ -1655,6 +1904,12 @@ class PlatformAdapterFactory:
             instance_url = config.instance_url
             logger.info(f"Auto-detecting platform type for {instance_url}")
             
+            # A platform detected from the instance's nodeinfo earlier wins over URL heuristics
+            cached = get_instance_metadata_cache().get_platform(str(instance_url))
+            if cached and cached.get('platform_type') in cls._adapters:
+                logger.info(f"Using cached platform type {cached['platform_type']} for {instance_url}")
+                return cls._adapters[cached['platform_type']](config)
+            
             # Try each platform adapter's detection method
             detection_results = []
             for name, adapter_class in cls._adapters.items():
@@ -1894,15 +2149,24 @@ async def detect_platform_type(instance_url: str) -> str:
     """
     Detect the platform type from an instance URL by checking nodeinfo endpoint
     
+    Platform types found in nodeinfo are kept in the instance metadata cache,
+    so an instance is only probed again once the entry has expired.
+    
     Returns:
         String with platform type: 'pixelfed', 'mastodon', 'pleroma', or 'unknown'
     """
     try:
+        cache = get_instance_metadata_cache()
+        cached = cache.get_platform(instance_url)
+        if cached:
+            return cached['platform_type']
+        
         # Try to access the nodeinfo endpoint
         nodeinfo_url = f"{instance_url}/.well-known/nodeinfo"
         
-        async with httpx.AsyncClient(timeout=10.0) as client:
-            response = await client.get(nodeinfo_url)
+        from app.services.activitypub.components.http_client_pool import get_http_client_pool
+        async with get_http_client_pool().borrow(instance_url) as client:
+            response = await client.get(nodeinfo_url, timeout=10.0)
             
             if response.status_code == 200:
                 nodeinfo_data = response.json()
@@ -1918,18 +2182,16 @@ async def detect_platform_type(instance_url: str) -> str:
                 
                 if nodeinfo_2_url:
                     # Get the actual nodeinfo data
-                    response = await client.get(nodeinfo_2_url)
+                    response = await client.get(nodeinfo_2_url, timeout=10.0)
                     if response.status_code == 200:
                         data = response.json()
                         software = data.get('software', {})
                         name = software.get('name', '').lower()
                         
-                        if 'pixelfed' in name:
-                            return 'pixelfed'
-                        elif 'mastodon' in name:
-                            return 'mastodon'
-                        elif 'pleroma' in name:
-                            return 'pleroma'
+                        for platform_type in ('pixelfed', 'mastodon', 'pleroma'):
+                            if platform_type in name:
+                                cache.set_platform(instance_url, platform_type, software)
+                                return platform_type
         
         # If nodeinfo doesn't work, try simple detection
         if PixelfedPlatform.detect_platform(instance_url):
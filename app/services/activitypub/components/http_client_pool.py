@@ -0,0 +1,212 @@
+# Copyright (C) 2025 iolaire mcfadden.
+# This program is free software: you can redistribute it and/or modify it under the terms of the GNU Affero General Public License as published by the Free Software Foundation, either version 3 of the License, or (at your option) any later version.
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+HTTP Client Pool
+
+One pooled httpx.AsyncClient per instance host, borrowed by every
+ActivityPubClient, platform validation and platform detection that talks
+to that instance. Users on the same instance then reuse its keep-alive
+(and, with the h2 package installed, HTTP/2) connections instead of each
+paying for new TLS handshakes.
+
+httpx clients belong to the event loop they were first used on, so the
+pool keeps one client per host and event loop. A client nobody has
+borrowed for idle_timeout seconds is closed the next time the pool is
+used, and clients of event loops that have been closed are dropped.
+Code that runs in a one-shot event loop, such as asyncio.run() in a web
+request, calls aclose() before its loop ends so the connections are
+closed rather than dropped.
+
+The pool is shared by everything in a process through get_http_client_pool().
+"""
+
+import asyncio
+import importlib.util
+import logging
+import os
+import threading
+import time
+import weakref
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from http.cookiejar import CookieJar, DefaultCookiePolicy
+from typing import Any, Dict, Optional, Tuple
+from urllib.parse import urlparse
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+@dataclass
+class _PooledClient:
+    client: httpx.AsyncClient
+    loop: Any  # weakref.ref to the event loop
+    borrowers: int = 0
+    last_used: float = field(default_factory=time.monotonic)
+    requests: int = 0
+
+class HTTPClientPool:
+    """Shared httpx clients keyed by instance host, with idle eviction and metrics"""
+
+    def __init__(self, http2: bool = True, max_connections: int = 20, max_keepalive_connections: int = 10,
+                 keepalive_expiry: float = 30.0, idle_timeout: float = 300.0, timeout: float = 30.0,
+                 transport: Optional[httpx.AsyncBaseTransport] = None):
+        """
+        Args:
+            http2: Negotiate HTTP/2 where the h2 package is installed
+            max_connections: Connection limit per instance
+            max_keepalive_connections: Idle connections kept open per instance
+            keepalive_expiry: Seconds an idle connection is kept open
+            idle_timeout: Seconds an unborrowed client is kept before it is closed
+            timeout: Default request timeout
+            transport: Transport for every client, for tests
+        """
+        if http2 and importlib.util.find_spec('h2') is None:
+            logger.info("h2 package not installed, sharing HTTP/1.1 keep-alive connections")
+            http2 = False
+        self.http2 = http2
+        self.limits = httpx.Limits(max_connections=max_connections,
+                                   max_keepalive_connections=max_keepalive_connections,
+                                   keepalive_expiry=keepalive_expiry)
+        self.idle_timeout = idle_timeout
+        self.timeout = timeout
+        self.transport = transport
+        self._clients: Dict[Tuple[int, str], _PooledClient] = {}
+        self._lock = threading.Lock()
+        self.stats = {
+            'clients_created': 0,
+            'clients_evicted': 0,
+            'borrows': 0,
+            'reuses': 0
+        }
+
+    @staticmethod
+    def host_key(instance_url: str) -> str:
+        """The pool key for an instance or request URL"""
+        parsed = urlparse(instance_url or "")
+        return f"{parsed.scheme or 'https'}://{parsed.netloc.lower()}"
+
+    def acquire(self, instance_url: str) -> httpx.AsyncClient:
+        """
+        Borrow the shared client for an instance on the running event loop
+
+        Every acquire must be matched by a release; the client itself must
+        not be closed by the borrower.
+        """
+        loop = asyncio.get_running_loop()
+        key = (id(loop), self.host_key(instance_url))
+        with self._lock:
+            idle = self._evict_stale(loop)
+            pooled = self._clients.get(key)
+            if pooled is None or pooled.client.is_closed or pooled.loop() is not loop:
+                pooled = self._clients[key] = self._create_client(key[1], loop)
+                self.stats['clients_created'] += 1
+            else:
+                self.stats['reuses'] += 1
+            pooled.borrowers += 1
+            pooled.last_used = time.monotonic()
+            self.stats['borrows'] += 1
+        for client in idle:
+            loop.create_task(client.aclose())
+        return pooled.client
+
+    def release(self, client: httpx.AsyncClient):
+        """Return a borrowed client to the pool"""
+        with self._lock:
+            for pooled in self._clients.values():
+                if pooled.client is client:
+                    pooled.borrowers = max(0, pooled.borrowers - 1)
+                    pooled.last_used = time.monotonic()
+                    return
+
+    @asynccontextmanager
+    async def borrow(self, instance_url: str):
+        """Borrow the shared client for an instance for the duration of a block"""
+        client = self.acquire(instance_url)
+        try:
+            yield client
+        finally:
+            self.release(client)
+
+    async def aclose(self):
+        """Close every client of the running event loop"""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            keys = [key for key, pooled in self._clients.items() if pooled.loop() is loop]
+            clients = [self._clients.pop(key).client for key in keys]
+        for client in clients:
+            await client.aclose()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get pool statistics with per-instance borrowers, requests and open connections"""
+        with self._lock:
+            stats = dict(self.stats)
+            instances = {}
+            for (_, host), pooled in self._clients.items():
+                entry = instances.setdefault(host, {'clients': 0, 'borrowers': 0, 'requests': 0,
+                                                    'open_connections': 0})
+                entry['clients'] += 1
+                entry['borrowers'] += pooled.borrowers
+                entry['requests'] += pooled.requests
+                entry['open_connections'] += self._open_connections(pooled.client)
+        stats['instances'] = instances
+        stats['http2'] = self.http2
+        return stats
+
+    def _create_client(self, host: str, loop) -> _PooledClient:
+        async def count_request(request):
+            pooled.requests += 1
+
+        # Every account on the instance borrows this client, so it must never
+        # keep one account's cookies and send them with another's requests
+        no_cookies = CookieJar(policy=DefaultCookiePolicy(allowed_domains=[]))
+        client = httpx.AsyncClient(http2=self.http2, limits=self.limits, timeout=self.timeout,
+                                   transport=self.transport, cookies=no_cookies,
+                                   event_hooks={'request': [count_request]})
+        pooled = _PooledClient(client, weakref.ref(loop))
+        logger.debug(f"Created shared HTTP client for {host} (http2={self.http2})")
+        return pooled
+
+    def _evict_stale(self, loop):
+        """Remove clients of closed loops and idle clients of this loop, returning the latter to close"""
+        now = time.monotonic()
+        idle = []
+        for key, pooled in list(self._clients.items()):
+            client_loop = pooled.loop()
+            if client_loop is None or client_loop.is_closed():
+                # Their connections cannot be closed any more; drop them
+                del self._clients[key]
+                self.stats['clients_evicted'] += 1
+            elif client_loop is loop and pooled.borrowers == 0 and now - pooled.last_used > self.idle_timeout:
+                del self._clients[key]
+                self.stats['clients_evicted'] += 1
+                idle.append(pooled.client)
+        return idle
+
+    @staticmethod
+    def _open_connections(client: httpx.AsyncClient) -> int:
+        # httpx does not expose its connection pool; best effort for metrics only
+        pool = getattr(getattr(client, '_transport', None), '_pool', None)
+        return len(getattr(pool, 'connections', None) or [])
+
+_pool: Optional[HTTPClientPool] = None
+_pool_pid: Optional[int] = None
+_pool_lock = threading.Lock()
+
+def get_http_client_pool() -> HTTPClientPool:
+    """Get the process-wide HTTP client pool, configured from the environment"""
+    global _pool, _pool_pid
+    with _pool_lock:
+        if _pool is None or _pool_pid != os.getpid():
+            from config import HTTPPoolConfig
+            config = HTTPPoolConfig.from_env()
+            _pool = HTTPClientPool(
+                http2=config.http2,
+                max_connections=config.max_connections,
+                max_keepalive_connections=config.max_keepalive_connections,
+                keepalive_expiry=config.keepalive_expiry,
+                idle_timeout=config.idle_timeout
+            )
+            _pool_pid = os.getpid()
+        return _pool
@@ -0,0 +1,317 @@
+# Copyright (C) 2025 iolaire mcfadden.
+# This program is free software: you can redistribute it and/or modify it under the terms of the GNU Affero General Public License as published by the Free Software Foundation, either version 3 of the License, or (at your option) any later version.
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+Instance Metadata Cache
+
+Facts about instances that almost never change: which software an instance
+runs (from its nodeinfo) and which account ID a username or access token
+belongs to. Without a cache every run spends requests rediscovering them
+before it can read a single status.
+
+Entries live in Redis so every worker shares them. When Redis is not
+configured they are kept in the database, and without a database in
+process memory. While a configured Redis is unreachable the same fallback
+is used, and Redis is tried again after REDIS_RETRY_INTERVAL seconds.
+Entries expire after a TTL, and an account ID is forgotten as soon as its
+statuses endpoint answers 404.
+
+The cache is shared by everything in a process through
+get_instance_metadata_cache().
+"""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple
+
+from app.services.activitypub.components.http_client_pool import HTTPClientPool
+
+logger = logging.getLogger(__name__)
+
+def credentials_subject(access_token: str) -> str:
+    """The account subject for "whoever this access token belongs to", without the token itself"""
+    return "token:" + hashlib.sha256((access_token or "").encode('utf-8')).hexdigest()[:16]
+
+class MemoryInstanceMetadataBackend:
+    """In-process store with per-entry expiry"""
+
+    def __init__(self):
+        self._entries: Dict[str, Tuple[float, str]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                return None
+            return value
+
+    def set(self, key: str, value: str, ttl: int):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value)
+
+    def delete(self, key: str):
+        with self._lock:
+            self._entries.pop(key, None)
+
+class RedisInstanceMetadataBackend:
+    """Redis store with TTL expiry"""
+
+    PREFIX = "vedfolnir:instance_metadata:"
+
+    def __init__(self, redis_client):
+        self.redis = redis_client
+
+    def get(self, key: str) -> Optional[str]:
+        value = self.redis.get(self.PREFIX + key)
+        return value.decode('utf-8') if isinstance(value, bytes) else value
+
+    def set(self, key: str, value: str, ttl: int):
+        self.redis.set(self.PREFIX + key, value, ex=ttl)
+
+    def delete(self, key: str):
+        self.redis.delete(self.PREFIX + key)
+
+class DatabaseInstanceMetadataBackend:
+    """Store in the instance_metadata_cache table"""
+
+    def __init__(self, db_manager):
+        self.db_manager = db_manager
+
+    def get(self, key: str) -> Optional[str]:
+        return self.db_manager.get_instance_metadata(key)
+
+    def set(self, key: str, value: str, ttl: int):
+        self.db_manager.set_instance_metadata(key, value, ttl)
+
+    def delete(self, key: str):
+        self.db_manager.delete_instance_metadata(key)
+
+class FallbackInstanceMetadataBackend:
+    """Redis store that switches to a fallback store while Redis is unreachable"""
+
+    REDIS_RETRY_INTERVAL = 30.0
+
+    def __init__(self, redis_backend: RedisInstanceMetadataBackend, fallback, redis_available: bool = True):
+        """
+        Args:
+            redis_backend: Store used while Redis answers
+            fallback: Database or memory store used while it does not
+            redis_available: False to start on the fallback, e.g. after a failed ping
+        """
+        self.redis_backend = redis_backend
+        self.fallback = fallback
+        self._redis_retry_at = 0.0 if redis_available else time.monotonic() + self.REDIS_RETRY_INTERVAL
+
+    @property
+    def active(self):
+        """The store requests currently go to"""
+        return self.redis_backend if self._redis_available() else self.fallback
+
+    def get(self, key: str) -> Optional[str]:
+        return self._call('get', key)
+
+    def set(self, key: str, value: str, ttl: int):
+        self._call('set', key, value, ttl)
+
+    def delete(self, key: str):
+        self._call('delete', key)
+
+    def _call(self, method: str, *args):
+        if self._redis_available():
+            try:
+                return getattr(self.redis_backend, method)(*args)
+            except Exception as e:
+                self._redis_failed(e)
+        return getattr(self.fallback, method)(*args)
+
+    def _redis_available(self) -> bool:
+        return time.monotonic() >= self._redis_retry_at
+
+    def _redis_failed(self, error: Exception):
+        logger.warning(f"Redis unavailable for instance metadata cache, using the "
+                       f"{InstanceMetadataCache._backend_name(self.fallback)} for "
+                       f"{self.REDIS_RETRY_INTERVAL:.0f}s: {error}")
+        self._redis_retry_at = time.monotonic() + self.REDIS_RETRY_INTERVAL
+
+class InstanceMetadataCache:
+    """Platform types and account IDs per instance, with hit statistics"""
+
+    def __init__(self, backend, platform_ttl: int = 604800, account_ttl: int = 604800):
+        self.backend = backend
+        self.platform_ttl = platform_ttl
+        self.account_ttl = account_ttl
+        self._lock = threading.Lock()
+        self.stats = {
+            'hits': 0,
+            'misses': 0,
+            'stores': 0,
+            'invalidations': 0,
+            'errors': 0
+        }
+
+    @classmethod
+    def from_config(cls, config, db_manager=None) -> "InstanceMetadataCache":
+        """
+        Create a cache from an InstanceMetadataCacheConfig
+
+        Uses Redis when configured, falling back to the database when a
+        DatabaseManager is given, otherwise process memory, while Redis is
+        unreachable.
+        """
+        if config.backend in ("redis", "database") and db_manager is not None:
+            backend = DatabaseInstanceMetadataBackend(db_manager)
+        else:
+            backend = MemoryInstanceMetadataBackend()
+        if config.backend == "redis":
+            try:
+                import redis
+                client = redis.Redis.from_url(config.redis_url, socket_timeout=2, socket_connect_timeout=2)
+            except Exception as e:
+                logger.warning(f"Redis unavailable for instance metadata cache: {e}")
+            else:
+                try:
+                    client.ping()
+                    redis_available = True
+                except Exception as e:
+                    logger.warning(f"Redis unavailable for instance metadata cache, retrying in "
+                                   f"{FallbackInstanceMetadataBackend.REDIS_RETRY_INTERVAL:.0f}s: {e}")
+                    redis_available = False
+                backend = FallbackInstanceMetadataBackend(RedisInstanceMetadataBackend(client), backend,
+                                                          redis_available)
+        logger.info(f"Instance metadata cache using {cls._backend_name(backend)} backend")
+        return cls(backend, config.platform_ttl, config.account_ttl)
+
+    @staticmethod
+    def platform_key(instance_url: str) -> str:
+        return "platform:" + HTTPClientPool.host_key(instance_url)
+
+    @staticmethod
+    def account_key(instance_url: str, subject: str) -> str:
+        return f"account:{HTTPClientPool.host_key(instance_url)}:{subject.lower()}"
+
+    def get_platform(self, instance_url: str) -> Optional[Dict[str, Any]]:
+        """Get the detected platform of an instance as {'platform_type': ..., 'nodeinfo': ...}"""
+        value = self._get(self.platform_key(instance_url))
+        return json.loads(value) if value is not None else None
+
+    def set_platform(self, instance_url: str, platform_type: str, nodeinfo: Optional[Dict[str, Any]] = None):
+        """Store the platform type detected for an instance and the nodeinfo software it came from"""
+        value = json.dumps({'platform_type': platform_type, 'nodeinfo': nodeinfo})
+        self._set(self.platform_key(instance_url), value, self.platform_ttl)
+
+    def invalidate_platform(self, instance_url: str):
+        self._delete(self.platform_key(instance_url))
+
+    def get_account_id(self, instance_url: str, subject: str) -> Optional[str]:
+        """
+        Get the account ID a username or credentials_subject() resolved to
+
+        Args:
+            instance_url: The instance the account is looked up on
+            subject: A username, acct or credentials_subject()
+        """
+        return self._get(self.account_key(instance_url, subject))
+
+    def set_account_id(self, instance_url: str, subject: str, account_id: str):
+        self._set(self.account_key(instance_url, subject), str(account_id), self.account_ttl)
+
+    def invalidate_account_id(self, instance_url: str, subject: str):
+        self._delete(self.account_key(instance_url, subject))
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get cache statistics including the hit rate"""
+        with self._lock:
+            stats = dict(self.stats)
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = (stats['hits'] / lookups) * 100 if lookups else 0.0
+        stats['backend'] = self._backend_name(self.backend)
+        return stats
+
+    def _get(self, key: str) -> Optional[str]:
+        try:
+            value = self.backend.get(key)
+        except Exception as e:
+            logger.warning(f"Instance metadata cache lookup failed: {e}")
+            self._count('errors')
+            value = None
+        self._count('hits' if value is not None else 'misses')
+        return value
+
+    def _set(self, key: str, value: str, ttl: int):
+        try:
+            self.backend.set(key, value, ttl)
+        except Exception as e:
+            logger.warning(f"Instance metadata cache store failed: {e}")
+            self._count('errors')
+            return
+        self._count('stores')
+
+    def _delete(self, key: str):
+        try:
+            self.backend.delete(key)
+        except Exception as e:
+            logger.warning(f"Instance metadata cache invalidation failed: {e}")
+            self._count('errors')
+            return
+        self._count('invalidations')
+
+    def _count(self, name: str):
+        with self._lock:
+            self.stats[name] += 1
+
+    @staticmethod
+    def _backend_name(backend) -> str:
+        if isinstance(backend, FallbackInstanceMetadataBackend):
+            backend = backend.active
+        if isinstance(backend, RedisInstanceMetadataBackend):
+            return 'redis'
+        if isinstance(backend, DatabaseInstanceMetadataBackend):
+            return 'database'
+        return 'memory'
+
+_cache: Optional[InstanceMetadataCache] = None
+_cache_pid: Optional[int] = None
+_cache_has_database = False
+_cache_lock = threading.Lock()
+
+def get_instance_metadata_cache(db_manager=None) -> InstanceMetadataCache:
+    """
+    Get the process-wide instance metadata cache, configured from the environment
+
+    Args:
+        db_manager: DatabaseManager to keep entries in when Redis is
+            unavailable; a cache kept in memory so far switches to it
+    """
+    global _cache, _cache_pid, _cache_has_database
+    with _cache_lock:
+        stale = _cache is None or _cache_pid != os.getpid()
+        if stale or (db_manager is not None and not _cache_has_database):
+            from config import InstanceMetadataCacheConfig
+            _cache = InstanceMetadataCache.from_config(InstanceMetadataCacheConfig.from_env(), db_manager)
+            _cache_pid = os.getpid()
+            _cache_has_database = db_manager is not None
+        return _cache
+
+def set_instance_metadata_cache(cache: Optional[InstanceMetadataCache]):
+    """
+    Replace the process-wide instance metadata cache
+
+    Args:
+        cache: Cache for get_instance_metadata_cache() to return, even when
+            it is later given a DatabaseManager, or None to configure a new
+            one from the environment on next use
+    """
+    global _cache, _cache_pid, _cache_has_database
+    with _cache_lock:
+        _cache = cache
+        _cache_pid = os.getpid() if cache is not None else None
+        _cache_has_database = cache is not None
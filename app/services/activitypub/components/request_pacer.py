@@ -0,0 +1,182 @@
+# Copyright (C) 2025 iolaire mcfadden.
+# This program is free software: you can redistribute it and/or modify it under the terms of the GNU Affero General Public License as published by the Free Software Foundation, either version 3 of the License, or (at your option) any later version.
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+Request Pacer
+
+Spreads requests to an instance evenly over its rate limit window, using
+the X-RateLimit-Remaining and X-RateLimit-Reset headers of every response.
+With 120 requests left and 60 seconds until the reset, requests are let
+through every half second, so the budget lasts exactly until it is
+replenished instead of being spent in a burst that ends in 429 responses
+and retry back-off.
+
+Requests are either urgent, such as caption updates, or bulk, such as
+timeline reads. A bulk request only goes when no urgent one is waiting.
+
+Until an instance has reported its limits, requests are not paced. Pacers
+are shared per account by everything in a process through
+get_request_pacer().
+"""
+
+import asyncio
+import logging
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, Mapping, Optional
+
+from app.core.security.core.rate_limiter import parse_rate_limit_reset
+
+logger = logging.getLogger(__name__)
+
+class RequestPacer:
+    """Header-driven pacing of one account's requests with two priorities"""
+
+    URGENT = 0
+    BULK = 1
+
+    # How often a bulk request held back by urgent ones checks again
+    POLL_INTERVAL = 0.01
+    # Window over which the achieved request rate is reported
+    RATE_WINDOW = 60.0
+
+    def __init__(self, reserve: int = 0):
+        """
+        Args:
+            reserve: Requests of each window left unused, for other clients
+                of the same account
+        """
+        self.reserve = max(0, reserve)
+        self._lock = threading.Lock()
+        self._remaining: Optional[int] = None
+        self._reset_at: Optional[float] = None  # time.monotonic() of the reset
+        self._last_grant = 0.0
+        self._next_at = 0.0
+        self._waiting = {self.URGENT: 0, self.BULK: 0}
+        self._grants = deque()
+        self.stats = {
+            'requests': 0,
+            'paced': 0,
+            'wait_time': 0.0
+        }
+
+    async def acquire(self, priority: int = BULK) -> float:
+        """
+        Wait for this request's turn
+
+        Returns:
+            Seconds waited
+        """
+        start = time.monotonic()
+        waited = 0.0
+        with self._lock:
+            self._waiting[priority] += 1
+        try:
+            while True:
+                with self._lock:
+                    now = time.monotonic()
+                    held_back = priority == self.BULK and self._waiting[self.URGENT] > 0
+                    if now >= self._next_at and not held_back:
+                        self._grant(now)
+                        if waited:
+                            self.stats['paced'] += 1
+                            self.stats['wait_time'] += waited
+                        return waited
+                    delay = max(self._next_at - now, self.POLL_INTERVAL if held_back else 0)
+                await asyncio.sleep(delay)
+                waited = time.monotonic() - start
+        finally:
+            with self._lock:
+                self._waiting[priority] -= 1
+
+    def update_from_response(self, response) -> None:
+        """Take the account's budget from a response's rate limit headers"""
+        self.update_from_headers(response.headers, getattr(response, 'status_code', None))
+
+    def update_from_headers(self, headers: Mapping[str, str], status_code: Optional[int] = None) -> None:
+        """
+        Take the account's budget from rate limit headers
+
+        A 429 response with only a Retry-After header counts as an empty
+        budget until then.
+        """
+        headers = {key.lower(): value for key, value in (headers or {}).items()}
+        try:
+            remaining = int(headers['x-ratelimit-remaining'])
+            reset = parse_rate_limit_reset(headers['x-ratelimit-reset'])
+        except (KeyError, ValueError):
+            remaining = reset = None
+        if reset is None and status_code == 429:
+            try:
+                remaining, reset = 0, time.time() + float(headers['retry-after'])
+            except (KeyError, ValueError):
+                return
+        if reset is None:
+            return
+
+        with self._lock:
+            now = time.monotonic()
+            reset_at = now + (reset - time.time())
+            if self._reset_at is not None and abs(reset_at - self._reset_at) < 1.0 and self._remaining is not None:
+                # Same window: responses may arrive out of order, so the
+                # lowest count is the most recent one
+                remaining = min(remaining, self._remaining)
+            self._remaining = remaining
+            self._reset_at = reset_at
+            self._next_at = self._last_grant + self._interval(now)
+        if remaining <= self.reserve:
+            logger.info(f"Rate limit budget spent, pausing requests for {max(0.0, reset_at - now):.0f}s")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get the achieved request rate and the current pacing"""
+        with self._lock:
+            now = time.monotonic()
+            self._trim_grants(now)
+            stats = dict(self.stats)
+            stats['requests_per_minute'] = len(self._grants) * 60.0 / self.RATE_WINDOW
+            stats['remaining'] = self._remaining
+            stats['reset_in'] = max(0.0, self._reset_at - now) if self._reset_at is not None else None
+            stats['interval'] = self._interval(now)
+            stats['waiting_urgent'] = self._waiting[self.URGENT]
+            stats['waiting_bulk'] = self._waiting[self.BULK]
+        return stats
+
+    def _grant(self, now: float):
+        if self._remaining is not None:
+            self._remaining -= 1
+        self._last_grant = now
+        self._next_at = now + self._interval(now)
+        self.stats['requests'] += 1
+        self._grants.append(now)
+        self._trim_grants(now)
+
+    def _interval(self, now: float) -> float:
+        """Seconds between requests that spread the remaining budget to the reset"""
+        if self._remaining is None or self._reset_at is None or now >= self._reset_at:
+            return 0.0
+        budget = self._remaining - self.reserve
+        if budget <= 0:
+            return self._reset_at - now
+        return (self._reset_at - now) / budget
+
+    def _trim_grants(self, now: float):
+        while self._grants and self._grants[0] <= now - self.RATE_WINDOW:
+            self._grants.popleft()
+
+_pacers: Dict[str, RequestPacer] = {}
+_pacers_lock = threading.Lock()
+
+def get_request_pacer(scope: str, reserve: int = 0) -> RequestPacer:
+    """Get the process-wide pacer for an account, see rate_limit_scope()"""
+    with _pacers_lock:
+        pacer = _pacers.get(scope)
+        if pacer is None:
+            pacer = _pacers[scope] = RequestPacer(reserve)
+        return pacer
+
+def get_pacing_stats() -> Dict[str, Dict[str, Any]]:
+    """Get pacing statistics for every account this process has talked to"""
+    with _pacers_lock:
+        pacers = dict(_pacers)
+    return {scope: pacer.get_stats() for scope, pacer in pacers.items()}
@@ -0,0 +1,175 @@
+# Copyright (C) 2025 iolaire mcfadden.
+# This program is free software: you can redistribute it and/or modify it under the terms of the GNU Affero General Public License as published by the Free Software Foundation, either version 3 of the License, or (at your option) any later version.
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+Caption Publisher
+
+Pushes approved captions back to the platform. Images are grouped by the
+status they belong to, so the captions of a multi-image post go out in one
+status edit on platforms that support it (Mastodon) and one media update
+per image elsewhere. Statuses are published concurrently; the client's
+rate limiter and request pacer keep the requests within the instance's
+limits. Published images are marked posted with a single database update.
+
+BatchUpdateService and the review and API approval routes publish through
+publish_status() as well, so every path gets the same per-status requests.
+"""
+
+import asyncio
+import logging
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from app.core.security.core.security_utils import sanitize_for_log
+from app.services.activitypub.components.activitypub_client import ActivityPubClient
+from app.services.activitypub.components.http_client_pool import get_http_client_pool
+from models import Image
+
+logger = logging.getLogger(__name__)
+
+class CaptionPublisher:
+    """Concurrent, per-status publishing of approved captions with throughput metrics"""
+
+    def __init__(self, db_manager=None, max_concurrency: int = 4):
+        """
+        Args:
+            db_manager: DatabaseManager to mark images published by publish() in
+            max_concurrency: Statuses updated at the same time
+        """
+        self.db = db_manager
+        self.max_concurrency = max(1, max_concurrency)
+        self._lock = threading.Lock()
+        self.stats = {
+            'runs': 0,
+            'images': 0,
+            'statuses': 0,
+            'posted': 0,
+            'failed': 0,
+            'skipped': 0,
+            'publish_time': 0.0
+        }
+
+    async def publish(self, ap_client, images: List[Image]) -> Dict[str, Any]:
+        """
+        Publish the captions of approved images of one account
+
+        Args:
+            ap_client: ActivityPubClient of the account the images belong to
+            images: Approved Image rows with their post loaded
+
+        Returns:
+            Stats of this run: images, statuses, posted, failed, skipped,
+            errors, elapsed and images_per_second
+        """
+        start = time.monotonic()
+        result = {'images': len(images), 'statuses': 0, 'posted': 0, 'failed': 0, 'skipped': 0, 'errors': []}
+
+        groups = {}
+        for image in images:
+            caption = image.final_caption or image.reviewed_caption
+            post = image.post
+            if not image.image_post_id or not caption or post is None:
+                result['skipped'] += 1
+                result['errors'].append(f"Image {image.id} has no media ID, caption or post to publish")
+                continue
+            groups.setdefault(post.post_id, []).append(image)
+        result['statuses'] = len(groups)
+
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        outcomes = await asyncio.gather(*(
+            self._publish_status(semaphore, ap_client, post_id, status_images)
+            for post_id, status_images in groups.items()
+        ))
+
+        posted_ids = []
+        for posted, errors in outcomes:
+            posted_ids.extend(posted)
+            result['errors'].extend(errors)
+        result['posted'] = len(posted_ids)
+        result['failed'] = len(images) - result['skipped'] - result['posted']
+
+        if posted_ids:
+            try:
+                await asyncio.to_thread(self.db.mark_images_posted, posted_ids)
+            except Exception as e:
+                # The captions are live; the next run re-sends the same text
+                logger.error(f"Failed to mark {len(posted_ids)} published images as posted: {e}")
+                result['errors'].append(str(e))
+
+        result['elapsed'] = time.monotonic() - start
+        result['images_per_second'] = result['posted'] / result['elapsed'] if result['elapsed'] > 0 else 0.0
+        self._record(result)
+        logger.info(f"Published {result['posted']} of {result['images']} captions across {result['statuses']} "
+                    f"statuses in {result['elapsed']:.1f}s ({result['images_per_second']:.1f} images/s)")
+        return result
+
+    async def publish_status(self, ap_client, post_id: str, captions: Dict[str, str]) -> Dict[str, bool]:
+        """
+        Publish captions to the media of one status without marking anything posted
+
+        Args:
+            ap_client: ActivityPubClient of the account the status belongs to
+            post_id: Stored post ID of the status
+            captions: New caption per media attachment ID
+
+        Returns:
+            Whether each caption was published, by media ID
+
+        Raises:
+            PlatformAdapterError: If the platform adapter fails
+        """
+        status_id = ap_client.platform.status_id_from_post_id(post_id)
+        return await ap_client.update_status_media_captions(status_id, captions)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get totals over all runs, including the achieved images per second"""
+        with self._lock:
+            stats = dict(self.stats)
+        stats['images_per_second'] = stats['posted'] / stats['publish_time'] if stats['publish_time'] else 0.0
+        return stats
+
+    async def _publish_status(self, semaphore, ap_client, post_id: str, images: List[Image]):
+        """Publish the captions of one status, returning the published image IDs and any errors"""
+        captions = {image.image_post_id: image.final_caption or image.reviewed_caption for image in images}
+        async with semaphore:
+            try:
+                results = await self.publish_status(ap_client, post_id, captions)
+            except Exception as e:
+                logger.error(f"Failed to publish captions of status {sanitize_for_log(post_id)}: {e}")
+                return [], [f"Status {post_id}: {e}"]
+
+        posted = [image.id for image in images if results.get(image.image_post_id)]
+        errors = [f"Failed to publish caption for image {image.id}" for image in images
+                  if not results.get(image.image_post_id)]
+        return posted, errors
+
+    def _record(self, result: Dict[str, Any]):
+        with self._lock:
+            self.stats['runs'] += 1
+            for name in ('images', 'statuses', 'posted', 'failed', 'skipped'):
+                self.stats[name] += result[name]
+            self.stats['publish_time'] += result['elapsed']
+
+async def publish_image_caption(platform_connection, image: Image, caption: str,
+                                publisher: Optional[CaptionPublisher] = None) -> bool:
+    """
+    Publish one reviewed caption for a request handler
+
+    The event loop's pooled clients are closed before returning, so
+    handlers that run this in their own event loop do not leave
+    connections behind.
+
+    Returns:
+        bool: True if the caption is live on the platform
+    """
+    if not image.image_post_id or image.post is None:
+        logger.warning(f"Image {image.id} has no media ID or post to publish to")
+        return False
+    publisher = publisher or CaptionPublisher()
+    try:
+        async with ActivityPubClient(platform_connection) as ap_client:
+            results = await publisher.publish_status(ap_client, image.post.post_id, {image.image_post_id: caption})
+    finally:
+        await get_http_client_pool().aclose()
+    return bool(results.get(image.image_post_id))
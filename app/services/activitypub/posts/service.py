@@ -10,6 +10,7 @@ from app.core.database.core.database_manager import DatabaseManager
 from app.services.activitypub.components.activitypub_client import ActivityPubClient
 from models import ProcessingStatus, Image
 from app.services.batch.components.batch_update_service import BatchUpdateService
+from app.services.activitypub.posts.caption_publisher import CaptionPublisher
 
 logger = logging.getLogger(__name__)
 
@@ -21,6 +22,7 @@ class PostingService:
         self.db = DatabaseManager(config)
         self.batch_service = BatchUpdateService(config)
         self.use_batch_updates = getattr(config, 'use_batch_updates', True)
+        self.publisher = CaptionPublisher(self.db, getattr(config, 'publish_concurrency', 4))
     
     async def post_approved_captions(self, limit: int = 10) -> dict:
         """Post approved captions to ActivityPub server"""
@@ -29,7 +31,7 @@ class PostingService:
             logger.info(f"Using batch update service for {limit} images")
             return await self.batch_service.batch_update_captions(limit)
         
-        # Otherwise use the legacy single-image approach
+        # Otherwise publish per status without verification
         stats = {
             'processed': 0,
             'successful': 0,
@@ -48,7 +50,18 @@ class PostingService:
             logger.info(f"Found {len(approved_images)} approved images to post")
             
             async with ActivityPubClient(self.config.activitypub) as ap_client:
+                with_media_id = [image for image in approved_images if image.image_post_id]
+                result = await self.publisher.publish(ap_client, with_media_id)
+                stats['processed'] += result['images']
+                stats['successful'] += result['posted']
+                stats['failed'] += result['failed'] + result['skipped']
+                stats['errors'].extend(result['errors'])
+                stats['images_per_second'] = result['images_per_second']
+                
+                # Images without a media ID can only be updated through their post
                 for image in approved_images:
+                    if image.image_post_id:
+                        continue
                     stats['processed'] += 1
                     
                     try:
@@ -66,9 +79,6 @@ class PostingService:
                         error_msg = f"Error posting image {image.id}: {str(e)}"
                         stats['errors'].append(error_msg)
                         logger.error(error_msg)
-                    
-                    # Small delay between posts
-                    await asyncio.sleep(1)
         
         except Exception as e:
             logger.error(f"Fatal error in post_approved_captions: {e}")
@@ -9,6 +9,7 @@ from datetime import datetime
 from config import Config
 from app.core.database.core.database_manager import DatabaseManager
 from app.services.activitypub.components.activitypub_client import ActivityPubClient
+from app.services.activitypub.posts.caption_publisher import CaptionPublisher
 from models import ProcessingStatus, Image
 from app.core.security.core.security_utils import sanitize_for_log
 from app.core.configuration.core.configuration_service import ConfigurationService
@@ -25,6 +26,8 @@ class BatchUpdateService:
         self.batch_size = getattr(config, 'batch_size', 5)  # Default batch size of 5
         self.max_concurrent_batches = getattr(config, 'max_concurrent_batches', 2)  # Default max concurrent batches
         self.verification_delay = getattr(config, 'verification_delay', 2)  # Delay before verification in seconds
+        # Publishes the captions of a post's media in as few requests as the platform allows
+        self.publisher = CaptionPublisher(self.db, self.max_concurrent_batches)
         
         # Feature flag support
         self.feature_service = feature_service
@@ -151,16 +154,18 @@ class BatchUpdateService:
             # Track if any changes were made
             changes_made = False
             
+            # Update the captions of all media with an ID through one status update
+            media_results = await self._publish_media_captions(ap_client, post_id, {
+                image.image_post_id: image.final_caption or image.reviewed_caption
+                for image in images if image.image_post_id
+            }, stats['errors'])
+            
             # Update each image in the post
             for image in images:
                 try:
                     # Check if we have an image_post_id for direct API update
                     if image.image_post_id:
-                        # Use the direct media update API
-                        caption = image.final_caption or image.reviewed_caption
-                        success = await ap_client.update_media_caption(image.image_post_id, caption)
-                        
-                        if success:
+                        if media_results.get(image.image_post_id):
                             stats['successful'] += 1
                             updated_images.append(image)
                             changes_made = True
@@ -230,14 +235,13 @@ class BatchUpdateService:
                         else:
                             logger.error(f"Failed to roll back changes to post {post_id}")
                     
-                    # For direct media updates, attempt individual rollbacks
-                    for image in [img for img in updated_images if img.image_post_id and img.original_caption]:
-                        rollback_success = await ap_client.update_media_caption(
-                            image.image_post_id, 
-                            image.original_caption
-                        )
-                        
-                        if rollback_success:
+                    # For direct media updates, restore the original captions in one status update
+                    rollback_images = [img for img in updated_images if img.image_post_id and img.original_caption]
+                    rollback_results = await self._publish_media_captions(ap_client, post_id, {
+                        image.image_post_id: image.original_caption for image in rollback_images
+                    }, [])
+                    for image in rollback_images:
+                        if rollback_results.get(image.image_post_id):
                             stats['rollbacks'] += 1
                             logger.info(f"Successfully rolled back changes to media {image.image_post_id}")
                         else:
@@ -256,6 +260,19 @@ class BatchUpdateService:
         
         return stats
     
+    async def _publish_media_captions(self, ap_client: ActivityPubClient, post_id: str,
+                                      captions: Dict[str, str], errors: List[str]) -> Dict[str, bool]:
+        """Publish captions to the media of one post, returning which were updated by media ID"""
+        if not captions:
+            return {}
+        try:
+            return await self.publisher.publish_status(ap_client, post_id, captions)
+        except Exception as e:
+            error_msg = f"Error updating media captions of post {post_id}: {str(e)}"
+            logger.error(error_msg)
+            errors.append(error_msg)
+            return {}
+    
     async def _verify_updates(self, ap_client: ActivityPubClient, post_id: str, updated_images: List[Image]) -> dict:
         """Verify that updates were applied correctly"""
         results = {
@@ -25,6 +25,7 @@ from config import Config
 from app.core.database.core.database_manager import DatabaseManager
 from models import ProcessingRun, Image, Post
 from app.services.activitypub.components.activitypub_client import ActivityPubClient
+from app.services.activitypub.components.http_client_pool import get_http_client_pool
 from app.utils.processing.ollama_caption_generator import OllamaCaptionGenerator
 
 logger = logging.getLogger(__name__)
@@ -297,9 +298,10 @@ class HealthChecker:
                 session.close()
             
             # Test basic connectivity by getting instance info
-            async with httpx.AsyncClient(timeout=10.0) as http_client:
+            async with get_http_client_pool().borrow(platform.instance_url) as http_client:
                 response = await http_client.get(
-                    f"{platform.instance_url}/api/v1/instance"
+                    f"{platform.instance_url}/api/v1/instance",
+                    timeout=10.0
                 )
                 response.raise_for_status()
                 
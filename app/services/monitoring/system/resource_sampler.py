@@ -0,0 +1,405 @@
+# Copyright (C) 2025 iolaire mcfadden.
+# This program is free software: you can redistribute it and/or modify it under the terms of the GNU Affero General Public License as published by the Free Software Foundation, either version 3 of the License, or (at your option) any later version.
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+"""
+Resource Sampler
+
+Background resource sampling for SystemMonitor. A daemon thread samples
+CPU, memory, disk, network throughput, database connections checked out
+and Redis memory every few seconds into a fixed-size ring buffer of
+arrays, and after each sample recomputes the p50/p95/max of every field
+over the last 1, 5 and 15 minutes. Health requests read the latest
+sample and those aggregates as they stand, instead of blocking on
+psutil.cpu_percent(interval=1).
+
+Metrics history is downsampled through MetricsRollupBuffer: it keeps one
+entry per metric and rollup interval and writes what it holds to Redis
+in a single pipeline every flush interval. The sampler adds one resource
+rollup per interval, summarising the samples taken during it.
+"""
+
+import json
+import logging
+import math
+import os
+import threading
+import time
+from array import array
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import psutil
+
+from app.core.security.core.security_utils import sanitize_for_log
+
+logger = logging.getLogger(__name__)
+
+MB = 1024 * 1024
+GB = 1024 * 1024 * 1024
+
+# Fields kept in the ring buffer and aggregated over each window
+SAMPLE_FIELDS = (
+    'cpu_percent',
+    'memory_percent',
+    'memory_used_mb',
+    'disk_percent',
+    'disk_used_gb',
+    'network_sent_per_sec',
+    'network_recv_per_sec',
+    'database_connections',
+    'redis_memory_mb',
+)
+
+# (label, seconds) of the windows aggregates are kept for
+WINDOWS = (('1m', 60), ('5m', 300), ('15m', 900))
+
+def summarize(values: List[float]) -> Dict[str, float]:
+    """p50, p95 and max of values, by nearest rank"""
+    if not values:
+        return {'p50': 0.0, 'p95': 0.0, 'max': 0.0}
+    ordered = sorted(values)
+    count = len(ordered)
+    return {
+        'p50': ordered[max(0, math.ceil(0.50 * count) - 1)],
+        'p95': ordered[max(0, math.ceil(0.95 * count) - 1)],
+        'max': ordered[-1],
+    }
+
+def database_connection_count(db_manager) -> int:
+    """Connections currently checked out of the database manager's pool"""
+    try:
+        return int(db_manager.engine.pool.checkedout())
+    except Exception:
+        return 0
+
+def redis_memory_mb(redis_client) -> float:
+    """Memory used by the Redis server in MB"""
+    try:
+        if redis_client:
+            info = redis_client.info('memory')
+            return info.get('used_memory', 0) / MB
+        return 0.0
+    except Exception:
+        return 0.0
+
+class SampleRingBuffer:
+    """Fixed-size ring buffer of samples, stored as one array('d') per field"""
+
+    def __init__(self, fields: Iterable[str], capacity: int):
+        if capacity < 1:
+            raise ValueError("capacity must be at least 1")
+        self.fields = tuple(fields)
+        self.capacity = capacity
+        self._timestamps = array('d', [0.0]) * capacity
+        self._columns = {name: array('d', [0.0]) * capacity for name in self.fields}
+        self._next = 0
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def append(self, timestamp: float, values: Dict[str, float]):
+        """Store a sample, overwriting the oldest once the buffer is full"""
+        position = self._next
+        self._timestamps[position] = timestamp
+        for name, column in self._columns.items():
+            column[position] = float(values.get(name, 0.0))
+        self._next = (position + 1) % self.capacity
+        self._size = min(self._size + 1, self.capacity)
+
+    def values_since(self, name: str, since: float) -> List[float]:
+        """Values of one field sampled at or after since, newest first"""
+        column = self._columns[name]
+        return [column[position] for position in self._positions_since(since)]
+
+    def summarize_since(self, since: float) -> Dict[str, Dict[str, float]]:
+        """p50/p95/max of every field over the samples taken at or after since"""
+        positions = self._positions_since(since)
+        return {
+            name: summarize([column[position] for position in positions])
+            for name, column in self._columns.items()
+        }
+
+    def _positions_since(self, since: float) -> List[int]:
+        positions = []
+        position = self._next
+        for _ in range(self._size):
+            position = (position - 1) % self.capacity
+            if self._timestamps[position] < since:
+                break
+            positions.append(position)
+        return positions
+
+class MetricsRollupBuffer:
+    """Metrics history downsampled to one entry per rollup interval and written to Redis in batches"""
+
+    def __init__(self, rollup_interval: float = 60.0, flush_interval: float = 300.0, max_pending: int = 500):
+        """
+        Args:
+            rollup_interval: Seconds covered by one history entry; later entries in an interval replace earlier ones
+            flush_interval: Seconds the oldest pending entry may wait before the batch is written
+            max_pending: Pending entries that trigger a write regardless of age
+        """
+        self.rollup_interval = rollup_interval
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self._pending: Dict[Tuple[str, int], Tuple[str, int]] = {}
+        self._oldest: Optional[float] = None
+        self._lock = threading.Lock()
+        self.stats = {
+            'added': 0,
+            'downsampled': 0,
+            'written': 0,
+            'batches': 0,
+            'errors': 0
+        }
+
+    def add(self, base_key: str, timestamp: float, data: Dict[str, Any], ttl: int):
+        """
+        Buffer a history entry for base_key
+
+        It is stored as {base_key}:history:{interval start}, the layout
+        SystemMonitor.get_historical_metrics() reads.
+        """
+        bucket = int(timestamp // self.rollup_interval * self.rollup_interval)
+        payload = json.dumps(data, default=str)
+        with self._lock:
+            if (base_key, bucket) in self._pending:
+                self.stats['downsampled'] += 1
+            self._pending[(base_key, bucket)] = (payload, int(ttl))
+            if self._oldest is None:
+                self._oldest = time.monotonic()
+            self.stats['added'] += 1
+
+    def flush(self, redis_client, force: bool = False) -> int:
+        """
+        Write the pending entries in one pipeline if due, or always when forced
+
+        Returns:
+            int: Number of entries written
+        """
+        if not redis_client:
+            return 0
+        with self._lock:
+            if not self._pending or not (force or self._flush_due()):
+                return 0
+            entries, self._pending, self._oldest = self._pending, {}, None
+        try:
+            pipeline = redis_client.pipeline(transaction=False)
+            for (base_key, bucket), (payload, ttl) in entries.items():
+                pipeline.set(f"{base_key}:history:{bucket}", payload, ex=ttl)
+            pipeline.execute()
+        except Exception as e:
+            logger.error(f"Error writing metrics rollups: {sanitize_for_log(str(e))}")
+            with self._lock:
+                self.stats['errors'] += 1
+            return 0
+        with self._lock:
+            self.stats['written'] += len(entries)
+            self.stats['batches'] += 1
+        return len(entries)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self.stats)
+            stats['pending'] = len(self._pending)
+        return stats
+
+    def _flush_due(self) -> bool:
+        if not self._pending:
+            return False
+        return (len(self._pending) >= self.max_pending or
+                time.monotonic() - self._oldest >= self.flush_interval)
+
+class ResourceSampler:
+    """Background resource sampling with windowed aggregates"""
+
+    def __init__(self, db_manager=None, redis_client=None, interval: float = 5.0,
+                 rollup_interval: float = 60.0, flush_interval: float = 300.0,
+                 resources_key: str = "vedfolnir:metrics:resources", retention_hours: int = 168):
+        """
+        Args:
+            db_manager: Database manager whose pool's checked out connections are sampled
+            redis_client: Redis client whose memory is sampled and rollups are written to
+            interval: Seconds between samples
+            rollup_interval: Seconds of samples summarised in one resource history entry
+            flush_interval: Seconds history entries are buffered before being written
+            resources_key: Metrics key resource rollups are stored under
+            retention_hours: How long resource rollups are kept
+        """
+        self.db_manager = db_manager
+        self.redis_client = redis_client
+        self.interval = interval
+        self.rollup_interval = rollup_interval
+        self.resources_key = resources_key
+        self.retention_seconds = int(retention_hours * 3600)
+        self.samples = SampleRingBuffer(SAMPLE_FIELDS, math.ceil(WINDOWS[-1][1] / interval) + 1)
+        self.rollups = MetricsRollupBuffer(rollup_interval, flush_interval)
+        self._latest: Optional[Dict[str, Any]] = None
+        self._windows: Dict[str, Dict[str, Dict[str, float]]] = {}
+        self._last_network: Optional[Tuple[float, Any]] = None
+        self._last_rollup = time.time()
+        self._lock = threading.Lock()
+        # Serialises sampling, which keeps the previous network counters
+        self._sample_lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.stats = {
+            'samples': 0,
+            'sample_errors': 0,
+            'rollups': 0
+        }
+
+    @classmethod
+    def from_config(cls, config, db_manager=None, redis_client=None) -> "ResourceSampler":
+        """Create a sampler from a ResourceSamplerConfig"""
+        return cls(db_manager, redis_client, interval=config.interval,
+                   rollup_interval=config.rollup_interval, flush_interval=config.flush_interval)
+
+    def start(self):
+        """Start the sampling thread, if not already running"""
+        if self.is_running():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="resource-sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        """Stop the sampling thread and write any pending rollups"""
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join(timeout)
+            self._thread = None
+        self.rollups.flush(self.redis_client, force=True)
+
+    def is_running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def sample(self) -> Optional[Dict[str, Any]]:
+        """
+        Take a sample now and update the window aggregates
+
+        Returns:
+            The sample, in the fields of ResourceUsage with an epoch
+            timestamp, or None if sampling failed
+        """
+        with self._sample_lock:
+            now = time.time()
+            try:
+                usage, values = self._collect(now)
+            except Exception as e:
+                logger.error(f"Error sampling resource usage: {sanitize_for_log(str(e))}")
+                with self._lock:
+                    self.stats['sample_errors'] += 1
+                return None
+
+            rollup = None
+            with self._lock:
+                self.samples.append(now, values)
+                self._latest = usage
+                self._windows = {label: self.samples.summarize_since(now - seconds) for label, seconds in WINDOWS}
+                self.stats['samples'] += 1
+                if now - self._last_rollup >= self.rollup_interval:
+                    rollup = dict(usage)
+                    rollup['timestamp'] = datetime.fromtimestamp(now, tz=timezone.utc).isoformat()
+                    rollup['rollup_seconds'] = round(now - self._last_rollup, 1)
+                    rollup['aggregates'] = self.samples.summarize_since(self._last_rollup)
+                    self._last_rollup = now
+                    self.stats['rollups'] += 1
+        if rollup:
+            self.rollups.add(self.resources_key, now, rollup, self.retention_seconds)
+        return usage
+
+    def get_latest(self) -> Optional[Dict[str, Any]]:
+        """
+        The most recent sample, sampling at once if there is none yet
+
+        A first sample taken outside the sampling thread has no earlier
+        CPU reading to compare with, so its cpu_percent is not meaningful.
+        """
+        with self._lock:
+            latest = self._latest
+        if latest is None:
+            latest = self.sample()
+        return dict(latest) if latest is not None else None
+
+    def get_windows(self) -> Dict[str, Dict[str, Dict[str, float]]]:
+        """p50/p95/max of every sampled field over the last 1, 5 and 15 minutes"""
+        with self._lock:
+            return self._windows
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self.stats)
+            stats['buffered_samples'] = len(self.samples)
+        stats['running'] = self.is_running()
+        stats['rollup_buffer'] = self.rollups.get_stats()
+        return stats
+
+    def _run(self):
+        # cpu_percent(interval=None) measures since the calling thread's
+        # previous call, so the first reading is discarded
+        psutil.cpu_percent(interval=None)
+        self._stop_event.wait(min(self.interval, 1.0))
+        while not self._stop_event.is_set():
+            self.sample()
+            self.rollups.flush(self.redis_client)
+            self._stop_event.wait(self.interval)
+
+    def _collect(self, now: float) -> Tuple[Dict[str, Any], Dict[str, float]]:
+        cpu_percent = psutil.cpu_percent(interval=None)
+        memory = psutil.virtual_memory()
+        disk = psutil.disk_usage('/')
+        network = psutil.net_io_counters()
+
+        sent_per_sec = recv_per_sec = 0.0
+        if self._last_network:
+            last_time, last_network = self._last_network
+            elapsed = now - last_time
+            if elapsed > 0:
+                sent_per_sec = max(0, network.bytes_sent - last_network.bytes_sent) / elapsed
+                recv_per_sec = max(0, network.bytes_recv - last_network.bytes_recv) / elapsed
+        self._last_network = (now, network)
+
+        usage = {
+            'cpu_percent': cpu_percent,
+            'memory_percent': memory.percent,
+            'memory_used_mb': memory.used / MB,
+            'memory_total_mb': memory.total / MB,
+            'disk_percent': disk.percent,
+            'disk_used_gb': disk.used / GB,
+            'disk_total_gb': disk.total / GB,
+            'network_io': network._asdict(),
+            'database_connections': database_connection_count(self.db_manager),
+            'redis_memory_mb': redis_memory_mb(self.redis_client),
+            'timestamp': now,
+        }
+        values = {name: usage[name] for name in SAMPLE_FIELDS if name in usage}
+        values['network_sent_per_sec'] = sent_per_sec
+        values['network_recv_per_sec'] = recv_per_sec
+        return usage, values
+
+_sampler: Optional[ResourceSampler] = None
+_sampler_pid: Optional[int] = None
+_sampler_lock = threading.Lock()
+
+def get_resource_sampler(db_manager=None, redis_client=None) -> ResourceSampler:
+    """
+    Get the process-wide resource sampler, started on first use
+
+    The database manager and Redis client of the first caller that has
+    them are the ones sampled.
+    """
+    global _sampler, _sampler_pid
+    with _sampler_lock:
+        if _sampler is None or _sampler_pid != os.getpid():
+            from config import ResourceSamplerConfig
+            _sampler = ResourceSampler.from_config(ResourceSamplerConfig.from_env(), db_manager, redis_client)
+            _sampler.start()
+            _sampler_pid = os.getpid()
+        if _sampler.db_manager is None:
+            _sampler.db_manager = db_manager
+        if _sampler.redis_client is None:
+            _sampler.redis_client = redis_client
+        return _sampler
@@ -12,16 +12,18 @@ This module provides comprehensive system monitoring capabilities including:
 - Error trend analysis
 - Queue wait time prediction
 - Redis-based metrics storage
+
+Resource figures come from the process-wide ResourceSampler, which samples
+in the background, so health requests never wait on psutil.
 """
 
 import logging
 import json
 import redis
-import psutil
 import threading
 from datetime import datetime, timedelta, timezone
 from typing import Dict, Any, List, Optional, Tuple
-from dataclasses import dataclass, asdict
+from dataclasses import dataclass, asdict, field
 from collections import defaultdict, deque
 from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy import func
@@ -32,6 +34,9 @@ from models import (
     ProcessingRun, AlertType, AlertSeverity
 )
 from app.core.security.core.security_utils import sanitize_for_log
+from app.services.monitoring.system.resource_sampler import (
+    ResourceSampler, database_connection_count, get_resource_sampler, redis_memory_mb
+)
 
 logger = logging.getLogger(__name__)
 
@@ -104,6 +109,7 @@ class ResourceUsage:
     database_connections: int
     redis_memory_mb: float
     timestamp: datetime
+    windows: Dict[str, Dict[str, Dict[str, float]]] = field(default_factory=dict)
     
     def to_dict(self) -> Dict[str, Any]:
         """Convert to dictionary for JSON serialization"""
@@ -115,7 +121,8 @@ class SystemMonitor:
     """System monitor for real-time health monitoring and metrics collection"""
     
     def __init__(self, db_manager: DatabaseManager, redis_client: Optional[redis.Redis] = None,
-                 stuck_job_timeout: int = 3600, metrics_retention_hours: int = 168):
+                 stuck_job_timeout: int = 3600, metrics_retention_hours: int = 168,
+                 resource_sampler: Optional[ResourceSampler] = None):
         """
         Initialize system monitor
         
@@ -124,6 +131,7 @@ class SystemMonitor:
             redis_client: Redis client for metrics storage
             stuck_job_timeout: Timeout in seconds for stuck job detection
             metrics_retention_hours: How long to retain metrics (default: 7 days)
+            resource_sampler: Sampler to read resource usage from (default: the process-wide one)
         """
         self.db_manager = db_manager
         self.stuck_job_timeout = stuck_job_timeout
@@ -159,6 +167,9 @@ class SystemMonitor:
         self.errors_key = f"{self.metrics_prefix}errors"
         self.resources_key = f"{self.metrics_prefix}resources"
         
+        # Background resource sampling, shared by every monitor in the process
+        self.resource_sampler = resource_sampler or get_resource_sampler(db_manager, self.redis_client)
+        
         # Thread safety
         self._lock = threading.Lock()
         
@@ -176,10 +187,9 @@ class SystemMonitor:
             SystemHealth object with current status
         """
         try:
-            # Get system resource usage
-            cpu_usage = psutil.cpu_percent(interval=1)
-            memory = psutil.virtual_memory()
-            disk = psutil.disk_usage('/')
+            # Get the latest background resource sample
+            usage = self._get_latest_sample()
+            cpu_usage = usage['cpu_percent']
             
             # Get database status
             database_status = self._check_database_status()
@@ -195,15 +205,15 @@ class SystemMonitor:
             
             # Determine overall health status
             health_status = self._determine_health_status(
-                cpu_usage, memory.percent, disk.percent,
+                cpu_usage, usage['memory_percent'], usage['disk_percent'],
                 database_status, redis_status, task_stats
             )
             
             health = SystemHealth(
                 status=health_status,
                 cpu_usage=cpu_usage,
-                memory_usage=memory.percent,
-                disk_usage=disk.percent,
+                memory_usage=usage['memory_percent'],
+                disk_usage=usage['disk_percent'],
                 database_status=database_status,
                 redis_status=redis_status,
                 active_tasks=task_stats.get('running', 0),
@@ -296,43 +306,24 @@ class SystemMonitor:
         Get detailed resource usage information
         
         Returns:
-            ResourceUsage object with detailed resource metrics
+            ResourceUsage object with the latest sample and its p50/p95/max
+            over the last 1, 5 and 15 minutes
         """
         try:
-            # CPU usage
-            cpu_percent = psutil.cpu_percent(interval=1)
-            
-            # Memory usage
-            memory = psutil.virtual_memory()
-            memory_used_mb = memory.used / (1024 * 1024)
-            memory_total_mb = memory.total / (1024 * 1024)
-            
-            # Disk usage
-            disk = psutil.disk_usage('/')
-            disk_used_gb = disk.used / (1024 * 1024 * 1024)
-            disk_total_gb = disk.total / (1024 * 1024 * 1024)
-            
-            # Network I/O
-            network_io = psutil.net_io_counters()._asdict()
-            
-            # Database connections
-            database_connections = self._get_database_connection_count()
-            
-            # Redis memory usage
-            redis_memory_mb = self._get_redis_memory_usage()
-            
+            sample = self._get_latest_sample()
             usage = ResourceUsage(
-                cpu_percent=cpu_percent,
-                memory_percent=memory.percent,
-                memory_used_mb=memory_used_mb,
-                memory_total_mb=memory_total_mb,
-                disk_percent=disk.percent,
-                disk_used_gb=disk_used_gb,
-                disk_total_gb=disk_total_gb,
-                network_io=network_io,
-                database_connections=database_connections,
-                redis_memory_mb=redis_memory_mb,
-                timestamp=datetime.now(timezone.utc)
+                cpu_percent=sample['cpu_percent'],
+                memory_percent=sample['memory_percent'],
+                memory_used_mb=sample['memory_used_mb'],
+                memory_total_mb=sample['memory_total_mb'],
+                disk_percent=sample['disk_percent'],
+                disk_used_gb=sample['disk_used_gb'],
+                disk_total_gb=sample['disk_total_gb'],
+                network_io=sample['network_io'],
+                database_connections=sample['database_connections'],
+                redis_memory_mb=sample['redis_memory_mb'],
+                timestamp=datetime.fromtimestamp(sample['timestamp'], tz=timezone.utc),
+                windows=self.resource_sampler.get_windows()
             )
             
             # Store in Redis for historical tracking
@@ -713,14 +704,11 @@ class SystemMonitor:
     def _get_resource_usage_dict(self) -> Dict[str, float]:
         """Get resource usage as dictionary"""
         try:
-            cpu_usage = psutil.cpu_percent(interval=0.1)
-            memory = psutil.virtual_memory()
-            disk = psutil.disk_usage('/')
-            
+            sample = self._get_latest_sample()
             return {
-                'cpu_percent': cpu_usage,
-                'memory_percent': memory.percent,
-                'disk_percent': disk.percent
+                'cpu_percent': sample['cpu_percent'],
+                'memory_percent': sample['memory_percent'],
+                'disk_percent': sample['disk_percent']
             }
         except Exception as e:
             logger.error(f"Error getting resource usage: {sanitize_for_log(str(e))}")
@@ -756,25 +744,20 @@ class SystemMonitor:
             logger.error(f"Error getting throughput metrics: {sanitize_for_log(str(e))}")
             return {}
     
+    def _get_latest_sample(self) -> Dict[str, Any]:
+        """Get the latest resource sample, raising if none could be taken"""
+        sample = self.resource_sampler.get_latest()
+        if sample is None:
+            raise RuntimeError("No resource sample available")
+        return sample
+    
     def _get_database_connection_count(self) -> int:
         """Get current database connection count"""
-        try:
-            # This would need to be implemented based on the specific database
-            # For now, return a placeholder
-            return 0
-        except Exception:
-            return 0
+        return database_connection_count(self.db_manager)
     
     def _get_redis_memory_usage(self) -> float:
         """Get Redis memory usage in MB"""
-        try:
-            if self.redis_client:
-                info = self.redis_client.info('memory')
-                used_memory = info.get('used_memory', 0)
-                return used_memory / (1024 * 1024)  # Convert to MB
-            return 0.0
-        except Exception:
-            return 0.0
+        return redis_memory_mb(self.redis_client)
     
     def _categorize_error(self, error_message: str) -> str:
         """Categorize error based on message content"""
@@ -826,28 +809,7 @@ class SystemMonitor:
             return
         
         try:
-            # Store current health - serialize nested dicts to JSON strings
-            health_dict = health.to_dict()
-            serialized_data = {}
-            for key, value in health_dict.items():
-                if isinstance(value, dict):
-                    serialized_data[key] = json.dumps(value)
-                else:
-                    serialized_data[key] = value
-            
-            self.redis_client.hset(
-                self.health_key,
-                mapping=serialized_data
-            )
-            
-            # Store in time series for historical data
-            timestamp_key = f"{self.health_key}:history:{int(health.timestamp.timestamp())}"
-            self.redis_client.setex(
-                timestamp_key,
-                timedelta(hours=self.metrics_retention_hours),
-                json.dumps(health.to_dict())
-            )
-            
+            self._store_metrics(self.health_key, health.to_dict(), health.timestamp)
         except Exception as e:
             logger.error(f"Error storing health metrics: {sanitize_for_log(str(e))}")
     
@@ -857,28 +819,7 @@ class SystemMonitor:
             return
         
         try:
-            # Store current metrics - serialize nested dicts to JSON strings
-            metrics_dict = metrics.to_dict()
-            serialized_data = {}
-            for key, value in metrics_dict.items():
-                if isinstance(value, dict):
-                    serialized_data[key] = json.dumps(value)
-                else:
-                    serialized_data[key] = value
-            
-            self.redis_client.hset(
-                self.performance_key,
-                mapping=serialized_data
-            )
-            
-            # Store in time series for historical data
-            timestamp_key = f"{self.performance_key}:history:{int(metrics.timestamp.timestamp())}"
-            self.redis_client.setex(
-                timestamp_key,
-                timedelta(hours=self.metrics_retention_hours),
-                json.dumps(metrics.to_dict())
-            )
-            
+            self._store_metrics(self.performance_key, metrics.to_dict(), metrics.timestamp)
         except Exception as e:
             logger.error(f"Error storing performance metrics: {sanitize_for_log(str(e))}")
     
@@ -888,28 +829,7 @@ class SystemMonitor:
             return
         
         try:
-            # Store current trends - serialize nested dicts to JSON strings
-            trends_dict = trends.to_dict()
-            serialized_data = {}
-            for key, value in trends_dict.items():
-                if isinstance(value, dict) or isinstance(value, list):
-                    serialized_data[key] = json.dumps(value)
-                else:
-                    serialized_data[key] = value
-            
-            self.redis_client.hset(
-                self.errors_key,
-                mapping=serialized_data
-            )
-            
-            # Store in time series for historical data
-            timestamp_key = f"{self.errors_key}:history:{int(trends.timestamp.timestamp())}"
-            self.redis_client.setex(
-                timestamp_key,
-                timedelta(hours=self.metrics_retention_hours),
-                json.dumps(trends.to_dict())
-            )
-            
+            self._store_metrics(self.errors_key, trends.to_dict(), trends.timestamp)
         except Exception as e:
             logger.error(f"Error storing error trends: {sanitize_for_log(str(e))}")
     
@@ -919,31 +839,33 @@ class SystemMonitor:
             return
         
         try:
-            # Store current usage - serialize nested dicts to JSON strings
-            usage_dict = usage.to_dict()
-            serialized_data = {}
-            for key, value in usage_dict.items():
-                if isinstance(value, dict):
-                    serialized_data[key] = json.dumps(value)
-                else:
-                    serialized_data[key] = value
-            
-            self.redis_client.hset(
-                self.resources_key,
-                mapping=serialized_data
-            )
-            
-            # Store in time series for historical data
-            timestamp_key = f"{self.resources_key}:history:{int(usage.timestamp.timestamp())}"
-            self.redis_client.setex(
-                timestamp_key,
-                timedelta(hours=self.metrics_retention_hours),
-                json.dumps(usage.to_dict())
-            )
-            
+            # The resource sampler stores the history, as rollups of its samples
+            self._store_metrics(self.resources_key, usage.to_dict(), usage.timestamp, history=False)
         except Exception as e:
             logger.error(f"Error storing resource metrics: {sanitize_for_log(str(e))}")
     
+    def _store_metrics(self, key: str, data: Dict[str, Any], timestamp: datetime, history: bool = True):
+        """
+        Store current metrics and buffer them as history
+        
+        History is downsampled to one entry per rollup interval and written
+        in batches by the resource sampler's rollup buffer.
+        """
+        # Serialize nested dicts and lists to JSON strings
+        serialized_data = {}
+        for name, value in data.items():
+            if isinstance(value, (dict, list)):
+                serialized_data[name] = json.dumps(value)
+            else:
+                serialized_data[name] = value
+        
+        self.redis_client.hset(key, mapping=serialized_data)
+        
+        if history:
+            rollups = self.resource_sampler.rollups
+            rollups.add(key, timestamp.timestamp(), data, self.metrics_retention_hours * 3600)
+            rollups.flush(self.redis_client)
+    
     def get_historical_metrics(self, metric_type: str, hours: int = 24) -> List[Dict[str, Any]]:
         """
         Get historical metrics from Redis
@@ -23,6 +23,7 @@ from app.core.database.core.database_manager import DatabaseManager
 from models import CaptionGenerationTask, TaskStatus
 from app.services.task.core.task_queue_manager import TaskQueueManager
 from app.services.monitoring.progress.progress_tracker import ProgressTracker
+from app.utils.processing.ollama_endpoint_pool import LatencyHistogram, get_endpoint_pools
 from app.core.security.core.security_utils import sanitize_for_log
 
 logger = logging.getLogger(__name__)
@@ -447,9 +448,43 @@ class AIServiceMonitor:
             "total_checks": self._total_checks,
             "total_failures": self._total_failures,
             "monitoring_active": self._monitoring_active,
-            "uptime_percentage": self._calculate_uptime_percentage()
+            "uptime_percentage": self._calculate_uptime_percentage(),
+            "endpoints": self.get_endpoint_metrics()
         }
     
+    def get_endpoint_metrics(self) -> List[Dict[str, Any]]:
+        """
+        Get per-endpoint routing, health and latency histograms
+        
+        Collected from every Ollama endpoint pool in this process; the same
+        URL used by several caption generators is merged into one entry.
+        
+        Returns:
+            List of endpoint statistics
+        """
+        merged: Dict[str, Dict[str, Any]] = {}
+        histograms: Dict[str, LatencyHistogram] = {}
+        for pool in get_endpoint_pools():
+            for endpoint in pool.get_stats()['endpoints']:
+                url = endpoint['url']
+                if url not in merged:
+                    merged[url] = endpoint
+                    histograms[url] = LatencyHistogram()
+                else:
+                    existing = merged[url]
+                    for key in ('outstanding', 'requests', 'failures', 'ejections'):
+                        existing[key] += endpoint[key]
+                    existing['healthy'] = existing['healthy'] and endpoint['healthy']
+                    existing['last_error'] = existing['last_error'] or endpoint['last_error']
+            
+            for endpoint in pool.endpoints:
+                histograms[endpoint.url].merge(endpoint.latency)
+        
+        for url, endpoint in merged.items():
+            endpoint['latency'] = histograms[url].to_dict()
+        
+        return list(merged.values())
+    
     def get_health_history(self, limit: int = 20) -> List[Dict[str, Any]]:
         """
         Get recent health check history
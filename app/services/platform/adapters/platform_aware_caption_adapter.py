@@ -10,13 +10,15 @@ credentials and provides progress callback integration for web-based generation.
 
 import logging
 import asyncio
-from typing import Optional, Callable, Dict, Any, Tuple
+import time
+from typing import Optional, Callable, Dict, Any, List, Tuple
 from datetime import datetime, timezone
 import os
 
 from models import PlatformConnection, GenerationResults, CaptionGenerationSettings
 from app.core.database.core.database_manager import DatabaseManager
 from app.services.activitypub.components.activitypub_client import ActivityPubClient
+from app.utils.processing.caption_review_integration import CaptionReviewIntegration
 from app.utils.processing.image_processor import ImageProcessor
 from app.utils.processing.ollama_caption_generator import OllamaCaptionGenerator
 from config import Config
@@ -41,6 +43,9 @@ if not caption_step_logger.handlers:
 class PlatformAwareCaptionAdapter:
     """Adapts existing caption generation logic for platform-aware web operations"""
     
+    # Minimum seconds between partial caption progress updates while streaming
+    PARTIAL_CAPTION_INTERVAL = 1.0
+    
     def __init__(self, platform_connection: PlatformConnection, config: Config = None):
         """
         Initialize the adapter with a platform connection
@@ -67,6 +72,12 @@ class PlatformAwareCaptionAdapter:
             'skipped_existing': 0
         }
         
+        # Posts, images and processed state looked up in bulk for the current page
+        self._page_posts = {}
+        self._page_images = {}
+        self._checked_urls = set()
+        self._processed_urls = set()
+        
     async def initialize(self) -> bool:
         """
         Initialize all components for caption generation
@@ -182,9 +193,16 @@ class PlatformAwareCaptionAdapter:
                 except Exception as e:
                     raise ValueError(f"Username not set in platform connection and could not retrieve from authentication: {e}")
             
-            posts = await self.activitypub_client.get_user_posts(username, settings.max_posts_per_run)
+            # Only fetch statuses newer than the previous run's, unless reprocessing everything
+            cursor = None
+            if not settings.reprocess_existing:
+                cursor = self.db_manager.get_timeline_cursor(self.platform_connection.id)
+            
+            posts = await self.activitypub_client.get_user_posts(username, settings.max_posts_per_run, cursor=cursor)
             
             if not posts:
+                if cursor is not None:
+                    self.db_manager.save_timeline_cursor(cursor)
                 step_msg = "No posts found with images needing captions"
                 caption_step_logger.info(f"STEP: {step_msg} - User: {sanitize_for_log(username)}")
                 logger.warning(f"No posts found for user {sanitize_for_log(username)}")
@@ -204,6 +222,10 @@ class PlatformAwareCaptionAdapter:
                     'posts_found': len(posts)
                 })
             
+            # Save the page of posts and check which of its images are already
+            # processed with a few bulk queries rather than per post and image
+            self._prefetch_page(posts, settings)
+            
             # Process each post
             total_posts = len(posts)
             for i, post in enumerate(posts):
@@ -267,6 +289,11 @@ class PlatformAwareCaptionAdapter:
                         'timestamp': datetime.now(timezone.utc).isoformat()
                     })
             
+            # Advance the timeline cursor only when every post made it through,
+            # so posts from a failed run are fetched and retried next time
+            if cursor is not None and results.errors_count == 0:
+                self.db_manager.save_timeline_cursor(cursor)
+            
             # Final progress update
             processing_time = (datetime.now(timezone.utc) - start_time).total_seconds()
             step_msg = "Caption generation completed successfully"
@@ -315,6 +342,41 @@ class PlatformAwareCaptionAdapter:
         logger.info(f"Caption generation completed: {results.captions_generated} captions generated, {results.errors_count} errors")
         return results
     
+    def _prefetch_page(self, posts: List[Dict[str, Any]], settings: CaptionGenerationSettings):
+        """
+        Save a page of posts and look up its processed images in bulk
+        
+        Anything not covered here, for example after a database error, is
+        looked up per post and per image by _process_post and _process_image.
+        """
+        self._page_posts = {}
+        self._page_images = {}
+        self._checked_urls = set()
+        self._processed_urls = set()
+        
+        for post in posts:
+            try:
+                self._page_images[post.get('id')] = self.activitypub_client.extract_images_from_post(post)
+            except Exception as e:
+                logger.debug(f"Deferring image extraction for post {sanitize_for_log(str(post.get('id')))}: {e}")
+        
+        try:
+            self._page_posts = self.db_manager.get_or_create_posts(self.platform_connection.user_id, [
+                dict(post_id=post.get('id'), post_url=post.get('id'), post_content=post.get('content', ''))
+                for post in posts
+            ])
+            if not settings.reprocess_existing:
+                image_urls = {image_info['url'] for images in self._page_images.values() for image_info in images}
+                self._processed_urls = self.db_manager.get_processed_image_urls(image_urls)
+                self._checked_urls = image_urls
+        except Exception as e:
+            logger.warning(f"Bulk post and image lookup failed, falling back to per-post queries: {sanitize_for_log(str(e))}")
+    
+    def _is_image_processed(self, image_url: str) -> bool:
+        if image_url in self._checked_urls:
+            return image_url in self._processed_urls
+        return self.db_manager.is_image_processed(image_url)
+    
     async def _process_post(self, post: Dict[str, Any], settings: CaptionGenerationSettings, progress_callback: Optional[Callable] = None, post_num: int = 1, total_posts: int = 1) -> Dict[str, Any]:
         """
         Process a single post for caption generation
@@ -338,20 +400,24 @@ class PlatformAwareCaptionAdapter:
         
         try:
             post_id = post.get('id', 'unknown')
-            user_id = post.get('attributedTo', '').split('/')[-1]
             
             logger.info(f"Processing post: {sanitize_for_log(post_id)}")
             
-            # Save post to database
-            db_post = self.db_manager.get_or_create_post(
-                post_id=post_id,
-                user_id=user_id,
-                post_url=post_id,
-                post_content=post.get('content', '')
-            )
+            # Save post to database unless it was saved with the rest of the page;
+            # posts belong to the owner of the platform connection
+            db_post = self._page_posts.get(post_id)
+            if db_post is None:
+                db_post = self.db_manager.get_or_create_post(
+                    post_id=post_id,
+                    user_id=self.platform_connection.user_id,
+                    post_url=post_id,
+                    post_content=post.get('content', '')
+                )
             
             # Extract images without alt text
-            images = self.activitypub_client.extract_images_from_post(post)
+            images = self._page_images.get(post_id)
+            if images is None:
+                images = self.activitypub_client.extract_images_from_post(post)
             
             if not images:
                 step_msg = f"Post {post_num}/{total_posts}: No images needing captions"
@@ -468,7 +534,7 @@ class PlatformAwareCaptionAdapter:
             image_url = image_info['url']
             
             # Check if image was already processed (unless reprocessing is enabled)
-            if not settings.reprocess_existing and self.db_manager.is_image_processed(image_url):
+            if not settings.reprocess_existing and self._is_image_processed(image_url):
                 logger.info(f"Image already successfully processed, skipping: {sanitize_for_log(image_url)}")
                 image_result['skipped'] = True
                 return image_result
@@ -516,6 +582,7 @@ class PlatformAwareCaptionAdapter:
                     logger.warning(f"Failed to parse post_published date '{image_info['post_published']}': {e}")
             
             # Save image record to database
+            perceptual_hash = await asyncio.to_thread(self.image_processor.get_perceptual_hash, local_path)
             image_id = self.db_manager.save_image(
                 post_id=db_post.id,
                 image_url=image_url,
@@ -524,7 +591,8 @@ class PlatformAwareCaptionAdapter:
                 media_type=image_info.get('mediaType'),
                 original_filename=local_path.split('/')[-1],
                 image_post_id=image_info.get('image_post_id'),
-                original_post_date=original_post_date
+                original_post_date=original_post_date,
+                perceptual_hash=perceptual_hash
             )
             
             if image_id is None:
@@ -532,6 +600,14 @@ class PlatformAwareCaptionAdapter:
             
             image_result['image_id'] = image_id
             
+            # A near-duplicate of an image the user already approved reuses
+            # that caption instead of another inference request
+            suggestion = None
+            if perceptual_hash and not settings.reprocess_existing:
+                suggestion = CaptionReviewIntegration(self.db_manager).find_similar_caption(
+                    perceptual_hash, self.platform_connection.user_id, exclude_image_id=image_id
+                )
+            
             # Step 3: Generate caption using AI
             step_msg = f"Post {post_num}: Generating caption for image {img_num}/{total_images}"
             caption_step_logger.info(f"STEP: {step_msg} - Using AI model")
@@ -543,7 +619,17 @@ class PlatformAwareCaptionAdapter:
                     'image_num': img_num
                 })
             
-            result = await self.caption_generator.generate_caption(local_path)
+            on_token = None
+            if progress_callback and self.caption_generator.stream:
+                on_token = self._partial_caption_callback(progress_callback, step_msg, progress_percent, post_num, img_num)
+            
+            if suggestion:
+                logger.info(f"Reusing caption of near-duplicate image {suggestion['image_id']} for {sanitize_for_log(image_url)}")
+                result = suggestion['caption']
+            elif on_token:
+                result = await self.caption_generator.generate_caption(local_path, on_token=on_token)
+            else:
+                result = await self.caption_generator.generate_caption(local_path)
             
             # Handle result format (tuple or string)
             if isinstance(result, tuple) and len(result) == 2:
@@ -606,6 +692,31 @@ class PlatformAwareCaptionAdapter:
         
         return image_result
     
+    def _partial_caption_callback(self, progress_callback: Callable, step_msg: str, progress_percent: int,
+                                  post_num: int, img_num: int) -> Callable[[str], None]:
+        """
+        Build a token callback that reports partial captions as progress
+        
+        Updates are throttled so a streaming caption does not flood the
+        progress tracker and WebSocket clients with one message per token.
+        """
+        last_update = 0.0
+        
+        def on_token(partial_caption: str):
+            nonlocal last_update
+            now = time.monotonic()
+            if now - last_update < self.PARTIAL_CAPTION_INTERVAL:
+                return
+            last_update = now
+            progress_callback(step_msg, progress_percent if progress_percent else 50, {
+                'step': 'generating_caption',
+                'post_num': post_num,
+                'image_num': img_num,
+                'partial_caption': partial_caption.strip()
+            })
+        
+        return on_token
+    
     async def _cleanup(self):
         """Clean up resources"""
         try:
@@ -617,6 +728,11 @@ class PlatformAwareCaptionAdapter:
                         await cleanup_method()
                     else:
                         cleanup_method()
+                
+                # Release pooled Ollama connections
+                close_method = getattr(self.caption_generator, 'close', None)
+                if close_method and asyncio.iscoroutinefunction(close_method):
+                    await close_method()
             
             if self.activitypub_client:
                 close_method = getattr(self.activitypub_client, 'close', None)
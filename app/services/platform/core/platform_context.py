@@ -12,6 +12,7 @@ provides platform filtering for database queries, and handles platform-specific
 configuration generation.
 """
 
+import contextvars
 import logging
 import threading
 from typing import Optional, Dict, Any, List, Tuple
@@ -23,6 +24,30 @@ from sqlalchemy import and_, or_
 from models import User, PlatformConnection, Post, Image, ProcessingRun
 from config import ActivityPubConfig, RetryConfig, RateLimitConfig
 
+class _ContextLocal:
+    """
+    Context-variable backed replacement for ``threading.local``.
+    
+    Each thread still sees its own context, but asyncio tasks are isolated
+    from each other as well and ``asyncio.to_thread`` workers inherit the
+    context of the coroutine that scheduled them.
+    """
+    
+    def __init__(self, name: str):
+        self._var = contextvars.ContextVar(name, default=None)
+    
+    @property
+    def context(self):
+        return self._var.get()
+    
+    @context.setter
+    def context(self, value):
+        self._var.set(value)
+    
+    @context.deleter
+    def context(self):
+        self._var.set(None)
+
 @dataclass
 class PlatformContext:
     """Represents the current platform context for a user"""
@@ -98,8 +123,8 @@ class PlatformContextManager:
         self.session = session
         self.logger = logging.getLogger(__name__)
         
-        # Thread-local storage for context
-        self._local = threading.local()
+        # Thread- and task-local storage for context
+        self._local = _ContextLocal(f"platform_context_{id(self)}")
         
         # Lock for thread-safe operations
         self._lock = threading.RLock()
@@ -223,6 +248,19 @@ class PlatformContextManager:
                 self.logger.error(f"Failed to set platform context: {e}")
                 raise PlatformContextError(f"Failed to set platform context: {e}")
     
+    def use_context(self, context: PlatformContext) -> None:
+        """
+        Make an already validated platform context current.
+        
+        ``set_context`` run through ``asyncio.to_thread`` only sets the
+        context in the worker thread's copy of the caller's context
+        variables; the caller passes the returned context here to keep it.
+        
+        Args:
+            context: Context returned by ``set_context``
+        """
+        self._local.context = context
+    
     def clear_context(self) -> None:
         """Clear the platform context for the current thread"""
         with self._lock:
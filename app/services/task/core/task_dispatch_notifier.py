@@ -0,0 +1,208 @@
+# Copyright (C) 2025 iolaire mcfadden.
+# This program is free software: you can redistribute it and/or modify it under the terms of the GNU Affero General Public License as published by the Free Software Foundation, either version 3 of the License, or (at your option) any later version.
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+Task Dispatch Notifier
+
+Wakes idle caption task processors when there is work for them, instead
+of every processor polling the task table once a second. TaskQueueManager
+pushes a wake-up whenever a task is enqueued or a running task finishes
+and frees a slot; processors block until one arrives and then claim from
+the database as before.
+
+Wake-ups go through a Redis list: every enqueue pushes one entry and every
+idle processor waits on BLPOP, so each wake-up reaches exactly one of the
+processors across all web workers rather than all of them at once. A wake-up
+that finds the task already claimed costs one query. Without Redis the
+wake-ups only reach processors in the same process; processors keep a slow
+fallback poll in either case.
+
+The notifier also keeps dispatch latency, the time from a task's creation
+to its claim, for the processors of this process.
+"""
+
+import asyncio
+import logging
+import os
+import statistics
+import threading
+import time
+from collections import deque
+from datetime import timezone
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+class MemoryTaskDispatchBackend:
+    """Wake-ups between threads of one process"""
+
+    def __init__(self, max_pending: int = 100):
+        self._pending = deque(maxlen=max_pending)
+        self._condition = threading.Condition()
+
+    def push(self, payload: str):
+        with self._condition:
+            self._pending.append(payload)
+            self._condition.notify()
+
+    def pop(self, timeout: float) -> Optional[str]:
+        with self._condition:
+            if not self._pending:
+                self._condition.wait(timeout)
+            return self._pending.popleft() if self._pending else None
+
+class RedisTaskDispatchBackend:
+    """Wake-ups through a Redis list shared by every worker"""
+
+    KEY = "vedfolnir:task_dispatch"
+
+    def __init__(self, redis_client, max_pending: int = 100, wait_client=None):
+        """
+        Args:
+            redis_client: Client wake-ups are pushed with, from request threads
+            max_pending: Wake-ups kept for processors that are not waiting
+            wait_client: Client for the blocking BLPOP, defaults to redis_client
+        """
+        self.redis = redis_client
+        self.wait_redis = wait_client or redis_client
+        self.max_pending = max_pending
+
+    def push(self, payload: str):
+        pipeline = self.redis.pipeline()
+        pipeline.lpush(self.KEY, payload)
+        # Wake-ups nobody waited for are only worth one more claim attempt each
+        pipeline.ltrim(self.KEY, 0, self.max_pending - 1)
+        pipeline.execute()
+
+    def pop(self, timeout: float) -> Optional[str]:
+        item = self.wait_redis.blpop([self.KEY], timeout=max(1, int(round(timeout))))
+        if item is None:
+            return None
+        value = item[1]
+        return value.decode('utf-8') if isinstance(value, bytes) else value
+
+class TaskDispatchNotifier:
+    """Wake-ups for idle task processors, with dispatch latency statistics"""
+
+    # Longest single blocking wait, so a shutdown is noticed promptly
+    MAX_BLOCK = 5.0
+
+    def __init__(self, backend, latency_samples: int = 1000):
+        self.backend = backend
+        self._latencies = deque(maxlen=latency_samples)
+        self._lock = threading.Lock()
+        self.stats = {
+            'notifications': 0,
+            'wakeups': 0,
+            'timeouts': 0,
+            'dispatched': 0,
+            'errors': 0
+        }
+
+    @classmethod
+    def from_config(cls, config) -> "TaskDispatchNotifier":
+        """
+        Create a notifier from a TaskDispatchConfig
+
+        Uses Redis when configured and reachable, otherwise process memory.
+        """
+        backend = None
+        if config.backend == "redis":
+            try:
+                import redis
+                # Pushes run on request threads, so they must not hang on a stalled Redis
+                client = redis.Redis.from_url(config.redis_url, socket_timeout=2, socket_connect_timeout=2)
+                client.ping()
+                # No socket timeout: BLPOP blocks for up to MAX_BLOCK seconds by design
+                wait_client = redis.Redis.from_url(config.redis_url, socket_connect_timeout=2)
+                backend = RedisTaskDispatchBackend(client, wait_client=wait_client)
+            except Exception as e:
+                logger.warning(f"Redis unavailable for task dispatch, waking processors in this process only: {e}")
+        if backend is None:
+            backend = MemoryTaskDispatchBackend()
+        return cls(backend)
+
+    def notify(self, task_id: Optional[str] = None):
+        """Wake one idle processor; never raises"""
+        try:
+            self.backend.push(task_id or "")
+        except Exception as e:
+            logger.warning(f"Failed to send task dispatch wake-up: {e}")
+            self._count('errors')
+            return
+        self._count('notifications')
+
+    async def wait(self, timeout: float, stop_event: Optional[asyncio.Event] = None) -> bool:
+        """
+        Wait until a processor is woken or timeout seconds have passed
+
+        Args:
+            timeout: Seconds to wait at most, the fallback poll interval
+            stop_event: Returns early once this is set
+
+        Returns:
+            bool: True if woken by a notification, False on timeout
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or (stop_event is not None and stop_event.is_set()):
+                self._count('timeouts')
+                return False
+            try:
+                payload = await asyncio.to_thread(self.backend.pop, min(remaining, self.MAX_BLOCK))
+            except Exception as e:
+                logger.warning(f"Failed to wait for task dispatch wake-up: {e}")
+                self._count('errors')
+                await asyncio.sleep(min(remaining, self.MAX_BLOCK))
+                continue
+            if payload is not None:
+                self._count('wakeups')
+                return True
+
+    def record_dispatch(self, task):
+        """Record the latency from a task's creation to its claim"""
+        created_at, started_at = task.created_at, task.started_at
+        if created_at is None or started_at is None:
+            return
+        # The database keeps naive UTC times while claims are stamped timezone-aware
+        if created_at.tzinfo is None:
+            created_at = created_at.replace(tzinfo=timezone.utc)
+        if started_at.tzinfo is None:
+            started_at = started_at.replace(tzinfo=timezone.utc)
+        with self._lock:
+            self.stats['dispatched'] += 1
+            self._latencies.append(max(0.0, (started_at - created_at).total_seconds()))
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get wake-up counts and dispatch latency percentiles in seconds"""
+        with self._lock:
+            stats = dict(self.stats)
+            latencies = sorted(self._latencies)
+        stats['backend'] = 'redis' if isinstance(self.backend, RedisTaskDispatchBackend) else 'memory'
+        if latencies:
+            stats['latency_avg'] = statistics.fmean(latencies)
+            stats['latency_p50'] = latencies[len(latencies) // 2]
+            stats['latency_p95'] = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+            stats['latency_max'] = latencies[-1]
+        else:
+            stats['latency_avg'] = stats['latency_p50'] = stats['latency_p95'] = stats['latency_max'] = 0.0
+        return stats
+
+    def _count(self, name: str):
+        with self._lock:
+            self.stats[name] += 1
+
+_notifier: Optional[TaskDispatchNotifier] = None
+_notifier_pid: Optional[int] = None
+_notifier_lock = threading.Lock()
+
+def get_task_dispatch_notifier() -> TaskDispatchNotifier:
+    """Get the process-wide task dispatch notifier, configured from the environment"""
+    global _notifier, _notifier_pid
+    with _notifier_lock:
+        if _notifier is None or _notifier_pid != os.getpid():
+            from config import TaskDispatchConfig
+            _notifier = TaskDispatchNotifier.from_config(TaskDispatchConfig.from_env())
+            _notifier_pid = os.getpid()
+        return _notifier
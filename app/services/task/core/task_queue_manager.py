@@ -15,10 +15,12 @@ from typing import Optional, List, Dict, Any
 from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.orm import Session
 from sqlalchemy import and_, or_
+from sqlalchemy.engine import Engine
 
 from app.core.database.core.database_manager import DatabaseManager
 from models import CaptionGenerationTask, TaskStatus, User, UserRole, PlatformConnection, JobPriority
 from app.core.security.core.security_utils import sanitize_for_log
+from app.services.task.core.task_dispatch_notifier import TaskDispatchNotifier, get_task_dispatch_notifier
 from app.services.feature_flags.feature_flag_service import FeatureFlagService
 from app.services.feature_flags.feature_flag_decorators import FeatureFlagMiddleware
 
@@ -27,6 +29,11 @@ logger = logging.getLogger(__name__)
 class TaskQueueManager:
     """Manages caption generation task queue with single-task-per-user enforcement"""
     
+    # Priority levels in the order claim_next_task serves them
+    CLAIM_ORDER = (JobPriority.URGENT, JobPriority.HIGH, JobPriority.NORMAL, JobPriority.LOW)
+    # Tasks taken by other workers before a claim gives up on a priority level
+    CLAIM_ATTEMPTS = 5
+    
     def __init__(self, db_manager: DatabaseManager, max_concurrent_tasks: int = 3, 
                  config_service: Optional['ConfigurationService'] = None,
                  feature_service: Optional[FeatureFlagService] = None):
@@ -43,6 +50,7 @@ class TaskQueueManager:
         self.config_service = config_service
         self.feature_service = feature_service
         self._lock = threading.Lock()
+        self._dispatch_notifier: Optional[TaskDispatchNotifier] = None
         
         # Initialize feature flag middleware
         self.feature_middleware = FeatureFlagMiddleware(feature_service) if feature_service else None
@@ -59,6 +67,17 @@ class TaskQueueManager:
             self.default_job_timeout = 3600  # 1 hour default
             self.queue_size_limit = 100  # Default queue size limit
         
+    @property
+    def dispatch_notifier(self) -> TaskDispatchNotifier:
+        """Notifier that wakes idle task processors, the process-wide one unless set"""
+        if self._dispatch_notifier is None:
+            self._dispatch_notifier = get_task_dispatch_notifier()
+        return self._dispatch_notifier
+    
+    @dispatch_notifier.setter
+    def dispatch_notifier(self, notifier: TaskDispatchNotifier):
+        self._dispatch_notifier = notifier
+    
     def enqueue_task(self, task: CaptionGenerationTask, priority_override: Optional[JobPriority] = None) -> str:
         """
         Enqueue a caption generation task
@@ -111,6 +130,7 @@ class TaskQueueManager:
                 # Add the task to the database
                 session.add(task)
                 session.commit()
+                self.dispatch_notifier.notify(task.id)
                 
                 logger.info(f"Enqueued task {sanitize_for_log(task.id)} for user {sanitize_for_log(str(task.user_id))}")
                 return task.id
@@ -236,6 +256,12 @@ class TaskQueueManager:
         Returns:
             CaptionGenerationTask or None if no tasks available
         """
+        if isinstance(getattr(self.db_manager, 'engine', None), Engine):
+            return self.claim_next_task()
+        return self._get_next_task_locked()
+    
+    def _get_next_task_locked(self) -> Optional[CaptionGenerationTask]:
+        """Get the next task under the process-local lock; only safe with a single worker process"""
         with self._lock:
             session = self.db_manager.get_session()
             try:
@@ -254,11 +280,11 @@ class TaskQueueManager:
                     CaptionGenerationTask.status == TaskStatus.QUEUED
                 ).order_by(
                     # Priority order: URGENT, HIGH, NORMAL, LOW
-                    CaptionGenerationTask.priority == JobPriority.URGENT.value,
-                    CaptionGenerationTask.priority == JobPriority.HIGH.value,
-                    CaptionGenerationTask.priority == JobPriority.NORMAL.value,
+                    (CaptionGenerationTask.priority == JobPriority.URGENT.value).desc(),
+                    (CaptionGenerationTask.priority == JobPriority.HIGH.value).desc(),
+                    (CaptionGenerationTask.priority == JobPriority.NORMAL.value).desc(),
                     # Admin users get priority within same priority level
-                    User.role == UserRole.ADMIN.value,
+                    (User.role == UserRole.ADMIN.value).desc(),
                     # Then by creation time (FIFO)
                     CaptionGenerationTask.created_at
                 ).first()
@@ -292,6 +318,98 @@ class TaskQueueManager:
             finally:
                 session.close()
     
+    def claim_next_task(self) -> Optional[CaptionGenerationTask]:
+        """
+        Atomically claim the next queued task, safe across processes and hosts
+        
+        One query through the (status, priority, created_at) index finds the
+        priority levels that have queued tasks, so an idle poll costs a single
+        query. Each of those levels is then read oldest task first. On MySQL 8, MariaDB 10.6 and PostgreSQL the
+        row is locked with FOR UPDATE SKIP LOCKED, so concurrent workers each
+        take a different task instead of queueing behind one row lock. The
+        claim itself is an UPDATE conditional on the task still being queued,
+        which also keeps databases without SKIP LOCKED from handing one task
+        to two workers: a worker that loses the race moves on to the next task.
+        
+        Unlike the single-process path, admin-owned tasks are not preferred
+        within a priority level; admins can enqueue with a priority override.
+        
+        Returns:
+            CaptionGenerationTask or None if no tasks available
+        """
+        session = self.db_manager.get_session()
+        try:
+            queued = {row.priority for row in session.query(CaptionGenerationTask.priority).filter(
+                CaptionGenerationTask.status == TaskStatus.QUEUED
+            ).distinct()}
+            if not queued:
+                return None
+            
+            running_count = session.query(CaptionGenerationTask).filter_by(
+                status=TaskStatus.RUNNING
+            ).count()
+            if running_count >= self.max_concurrent_tasks:
+                return None
+            
+            skip_locked = self._supports_skip_locked(session.get_bind())
+            for priority in (level for level in self.CLAIM_ORDER if level in queued):
+                for _ in range(self.CLAIM_ATTEMPTS):
+                    query = session.query(CaptionGenerationTask).filter(
+                        CaptionGenerationTask.status == TaskStatus.QUEUED,
+                        CaptionGenerationTask.priority == priority
+                    ).order_by(CaptionGenerationTask.created_at)
+                    if skip_locked:
+                        query = query.with_for_update(skip_locked=True)
+                    task = query.first()
+                    if task is None:
+                        break
+                    
+                    started_at = datetime.now(timezone.utc)
+                    claimed = session.query(CaptionGenerationTask).filter(
+                        CaptionGenerationTask.id == task.id,
+                        CaptionGenerationTask.status == TaskStatus.QUEUED
+                    ).update({'status': TaskStatus.RUNNING, 'started_at': started_at}, synchronize_session=False)
+                    session.commit()
+                    if not claimed:
+                        # Another worker claimed it between the read and the update
+                        continue
+                    
+                    task_copy = CaptionGenerationTask(
+                        id=task.id,
+                        user_id=task.user_id,
+                        platform_connection_id=task.platform_connection_id,
+                        status=TaskStatus.RUNNING,
+                        priority=task.priority,
+                        created_at=task.created_at,
+                        started_at=started_at
+                    )
+                    task_copy.settings = task.settings
+                    
+                    logger.info(f"Claimed next task {sanitize_for_log(task.id)} for execution")
+                    return task_copy
+            
+            return None
+            
+        except SQLAlchemyError as e:
+            session.rollback()
+            logger.error(f"Database error claiming next task: {sanitize_for_log(str(e))}")
+            return None
+        finally:
+            session.close()
+    
+    @staticmethod
+    def _supports_skip_locked(engine) -> bool:
+        """Whether the database can skip rows locked by other transactions"""
+        dialect = engine.dialect
+        version = getattr(dialect, 'server_version_info', None) or ()
+        if dialect.name == 'postgresql':
+            return True
+        if dialect.name in ('mysql', 'mariadb'):
+            if getattr(dialect, 'is_mariadb', False) or dialect.name == 'mariadb':
+                return version >= (10, 6)
+            return version >= (8, 0)
+        return False
+    
     def complete_task(self, task_id: str, success: bool, error_message: str = None) -> bool:
         """
         Mark a task as completed
@@ -319,6 +437,8 @@ class TaskQueueManager:
                 task.error_message = error_message
             
             session.commit()
+            # The finished task frees a slot for the next queued one
+            self.dispatch_notifier.notify()
             
             status_str = "completed" if success else "failed"
             logger.info(f"Marked task {sanitize_for_log(task_id)} as {status_str}")
@@ -832,6 +952,7 @@ class TaskQueueManager:
             task.scheduled_at = datetime.now(timezone.utc) + timedelta(seconds=delay_seconds)
             
             session.commit()
+            self.dispatch_notifier.notify(task_id)
             
             logger.info(f"Queued task {sanitize_for_log(task_id)} for retry (attempt {task.retry_count})")
             return True
@@ -956,6 +1077,7 @@ class TaskQueueManager:
                 
                 session.add(new_task)
                 session.commit()
+                self.dispatch_notifier.notify(new_task.id)
                 
                 logger.info(f"Admin {sanitize_for_log(str(admin_user_id))} requeued failed task {sanitize_for_log(task_id)} as {sanitize_for_log(new_task.id)}")
                 return new_task.id
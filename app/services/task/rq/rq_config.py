@@ -93,6 +93,9 @@ class RQConfig:
         self.redis_memory_threshold = float(os.getenv('REDIS_MEMORY_THRESHOLD', '0.8'))
         self.failure_threshold = int(os.getenv('RQ_FAILURE_THRESHOLD', '3'))
         
+        # Progress tracking
+        self.progress_db_write_interval = float(os.getenv('RQ_PROGRESS_DB_WRITE_INTERVAL', '5'))  # seconds
+        
         # Initialize queue configurations
         self.queue_configs = self._initialize_queue_configs()
         
@@ -24,6 +24,7 @@ from app.core.database.core.database_manager import DatabaseManager
 from app.core.security.core.security_utils import sanitize_for_log
 from models import CaptionGenerationTask, TaskStatus
 from .rq_config import RQConfig
+from .rq_progress_writer import CoalescingProgressWriter
 from .rq_retention_config import get_retention_config_manager, RQRetentionConfig
 
 logger = logging.getLogger(__name__)
@@ -66,6 +67,9 @@ class RQDataRetentionManager:
         self._monitoring_thread: Optional[threading.Thread] = None
         self._stop_monitoring = threading.Event()
         
+        # Changes progress hash TTLs together with their entries in the progress index
+        self.progress_writer = CoalescingProgressWriter(db_manager, redis_connection)
+        
         # Redis key patterns
         self.task_data_pattern = "rq:task:*"
         self.progress_data_pattern = "rq:progress:*"
@@ -186,7 +190,7 @@ class RQDataRetentionManager:
             
             # Update progress data TTLs
             for key in self.redis_connection.scan_iter(match=self.progress_data_pattern):
-                self.redis_connection.expire(key, policy.progress_data_ttl)
+                self._expire_key(key, policy.progress_data_ttl)
             
             # Update security logs TTLs
             for key in self.redis_connection.scan_iter(match=self.security_logs_pattern):
@@ -229,13 +233,22 @@ class RQDataRetentionManager:
             
             for pattern in task_patterns:
                 for key in self.redis_connection.scan_iter(match=pattern):
-                    self.redis_connection.expire(key, ttl)
+                    self._expire_key(key, ttl)
             
             logger.debug(f"Set TTL {ttl}s for task {sanitize_for_log(task_id)} with status {status.value}")
             
         except Exception as e:
             logger.error(f"Failed to set task TTL: {sanitize_for_log(str(e))}")
     
+    def _expire_key(self, key, ttl: int) -> None:
+        """Set the TTL of a key, going through the progress writer for progress hashes"""
+        key_str = key.decode() if isinstance(key, bytes) else key
+        prefix = self.progress_writer.key_prefix
+        if key_str.startswith(prefix):
+            self.progress_writer.expire(key_str[len(prefix):], ttl)
+        else:
+            self.redis_connection.expire(key, ttl)
+    
     def cleanup_expired_data(self) -> Dict[str, Any]:
         """
         Clean up expired data and enforce retention policies
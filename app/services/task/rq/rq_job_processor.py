@@ -16,7 +16,7 @@ from typing import Optional, Dict, Any
 from rq import get_current_job
 from flask import current_app
 
-from app.core.database.core.database_manager import DatabaseManager
+from app.core.database.core.database_manager import DatabaseManager, remove_scoped_sessions
 from app.core.security.core.security_utils import sanitize_for_log
 from models import CaptionGenerationTask, TaskStatus, PlatformConnection
 from app.utils.processing.web_caption_generation_service import WebCaptionGenerationService
@@ -74,6 +74,10 @@ def process_caption_task(task_id: str) -> Dict[str, Any]:
     except Exception as e:
         logger.error(f"RQ job {job_id} failed for caption task {sanitize_for_log(task_id)}: {sanitize_for_log(str(e))}")
         raise
+    finally:
+        # The worker's app context outlives the job, so release the job's
+        # thread-local sessions here rather than at app context teardown
+        remove_scoped_sessions()
 
 
 class RQJobProcessor:
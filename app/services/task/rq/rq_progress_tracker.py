@@ -7,11 +7,16 @@ RQ Progress Tracker
 
 Integrates RQ task progress with existing WebSocket system for real-time updates.
 Provides progress tracking that works both in RQ worker threads and web application context.
+
+Progress ticks are written through CoalescingProgressWriter: Redis is
+updated on every tick, the database at most every few seconds per task.
+The task's owner is looked up once per job and kept until it finishes.
 """
 
 import logging
 import threading
 import json
+import time
 from datetime import datetime, timezone
 from typing import Optional, Dict, Any, Callable
 from dataclasses import dataclass
@@ -22,6 +27,8 @@ from app.core.database.core.database_manager import DatabaseManager
 from app.core.security.core.security_utils import sanitize_for_log
 from models import CaptionGenerationTask, TaskStatus
 from app.services.monitoring.progress.progress_tracker import ProgressTracker, ProgressStatus
+from .rq_config import rq_config
+from .rq_progress_writer import CoalescingProgressWriter
 
 logger = logging.getLogger(__name__)
 
@@ -58,6 +65,23 @@ class RQProgressData:
             
         return data
     
+    def to_hash(self) -> Dict[str, str]:
+        """Convert to flat string fields for a Redis hash"""
+        data = self.to_dict()
+        data['details'] = json.dumps(data['details'])
+        return {name: str(value) for name, value in data.items()}
+    
+    @classmethod
+    def from_hash(cls, fields: Dict[Any, Any]) -> 'RQProgressData':
+        """Create from the fields of a Redis progress hash"""
+        data = {(name.decode('utf-8') if isinstance(name, bytes) else name):
+                (value.decode('utf-8') if isinstance(value, bytes) else value)
+                for name, value in fields.items()}
+        data['user_id'] = int(data['user_id'])
+        data['progress_percent'] = int(data['progress_percent'])
+        data['details'] = json.loads(data.get('details') or '{}')
+        return cls.from_dict(data)
+    
     @classmethod
     def from_dict(cls, data: Dict[str, Any]) -> 'RQProgressData':
         """Create from dictionary loaded from Redis"""
@@ -85,13 +109,16 @@ class RQProgressData:
 class RQProgressTracker:
     """RQ-specific progress tracker with WebSocket integration"""
     
-    def __init__(self, db_manager: DatabaseManager, redis_connection: redis.Redis):
+    def __init__(self, db_manager: DatabaseManager, redis_connection: redis.Redis,
+                 db_write_interval: Optional[float] = None):
         """
         Initialize RQ Progress Tracker
         
         Args:
             db_manager: Database manager instance
             redis_connection: Redis connection for progress storage
+            db_write_interval: Minimum seconds between database progress writes
+                of a task (default from RQ_PROGRESS_DB_WRITE_INTERVAL)
         """
         self.db_manager = db_manager
         self.redis_connection = redis_connection
@@ -99,8 +126,23 @@ class RQProgressTracker:
         
         # Redis keys
         self.progress_key_prefix = "rq:progress:"
+        self.progress_channel = "rq:progress_updates"
         self.progress_ttl = 7200  # 2 hours
         
+        self.writer = CoalescingProgressWriter(
+            db_manager, redis_connection,
+            key_prefix=self.progress_key_prefix,
+            channel=self.progress_channel,
+            progress_ttl=self.progress_ttl,
+            db_write_interval=(rq_config.progress_db_write_interval
+                               if db_write_interval is None else db_write_interval)
+        )
+        
+        # Owner and start time of tasks in progress, looked up once per job
+        self._task_info_cache: Dict[str, Dict[str, Any]] = {}
+        self._cache_lock = threading.Lock()
+        self._stats = {'updates': 0, 'update_seconds': 0.0}
+        
         # Thread-local storage for worker context
         self._local = threading.local()
     
@@ -148,14 +190,15 @@ class RQProgressTracker:
         if details is None:
             details = {}
         
+        start = time.perf_counter()
         try:
             # Get current RQ job info
             job = get_current_job()
             job_id = job.id if job else "unknown"
             worker_id = getattr(self._local, 'worker_id', 'unknown')
             
-            # Get task info from database
-            task_info = self._get_task_info(task_id)
+            # Get task info, from the database on the first update of the job
+            task_info = self._get_cached_task_info(task_id)
             if not task_info:
                 logger.warning(f"Task {sanitize_for_log(task_id)} not found for progress update")
                 return False
@@ -175,11 +218,12 @@ class RQProgressTracker:
                 updated_at=datetime.now(timezone.utc)
             )
             
-            # Store progress in Redis
-            self._store_progress_in_redis(progress_data)
+            # Store progress in Redis and publish it
+            self.writer.publish(task_id, progress_data.to_hash(), progress_data.to_dict())
             
-            # Update database progress
-            self._update_database_progress(task_id, current_step, progress_data.progress_percent)
+            # Update database progress, coalesced; completion is written at once
+            self.writer.persist(task_id, current_step, progress_data.progress_percent,
+                                force=progress_data.progress_percent >= 100)
             
             # Send WebSocket notification via existing progress tracker
             self._send_websocket_notification(progress_data)
@@ -190,6 +234,42 @@ class RQProgressTracker:
         except Exception as e:
             logger.error(f"Failed to update RQ progress: {sanitize_for_log(str(e))}")
             return False
+        finally:
+            with self._cache_lock:
+                self._stats['updates'] += 1
+                self._stats['update_seconds'] += time.perf_counter() - start
+    
+    def _get_cached_task_info(self, task_id: str) -> Optional[Dict[str, Any]]:
+        """Get task information, looking it up once per job"""
+        with self._cache_lock:
+            task_info = self._task_info_cache.get(task_id)
+        if task_info is None:
+            task_info = self._get_task_info(task_id)
+            if task_info:
+                with self._cache_lock:
+                    self._task_info_cache[task_id] = task_info
+        return task_info
+    
+    def _forget_task(self, task_id: str) -> None:
+        """Write a finished task's pending progress and drop its cached info"""
+        self.writer.finish(task_id)
+        with self._cache_lock:
+            self._task_info_cache.pop(task_id, None)
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Get progress bookkeeping statistics
+        
+        Returns:
+            Dict with update count and time spent, Redis and database writes,
+            coalesced database writes and cached tasks
+        """
+        with self._cache_lock:
+            stats = dict(self._stats)
+            stats['cached_tasks'] = len(self._task_info_cache)
+        stats['avg_update_ms'] = stats['update_seconds'] / stats['updates'] * 1000 if stats['updates'] else 0.0
+        stats.update(self.writer.get_stats())
+        return stats
     
     def _get_task_info(self, task_id: str) -> Optional[Dict[str, Any]]:
         """Get task information from database"""
@@ -206,37 +286,6 @@ class RQProgressTracker:
         finally:
             session.close()
     
-    def _store_progress_in_redis(self, progress_data: RQProgressData) -> None:
-        """Store progress data in Redis"""
-        try:
-            progress_key = f"{self.progress_key_prefix}{progress_data.task_id}"
-            progress_json = json.dumps(progress_data.to_dict())
-            
-            # Store with TTL
-            self.redis_connection.setex(progress_key, self.progress_ttl, progress_json)
-            
-            # Also store in a user-specific key for easy retrieval
-            user_progress_key = f"rq:user_progress:{progress_data.user_id}:{progress_data.task_id}"
-            self.redis_connection.setex(user_progress_key, self.progress_ttl, progress_json)
-            
-        except Exception as e:
-            logger.error(f"Failed to store progress in Redis: {sanitize_for_log(str(e))}")
-    
-    def _update_database_progress(self, task_id: str, current_step: str, progress_percent: int) -> None:
-        """Update progress in database for persistence"""
-        session = self.db_manager.get_session()
-        try:
-            task = session.query(CaptionGenerationTask).filter_by(id=task_id).first()
-            if task:
-                task.current_step = current_step
-                task.progress_percent = progress_percent
-                session.commit()
-        except Exception as e:
-            session.rollback()
-            logger.error(f"Failed to update database progress: {sanitize_for_log(str(e))}")
-        finally:
-            session.close()
-    
     def _send_websocket_notification(self, progress_data: RQProgressData) -> None:
         """Send WebSocket notification via existing progress tracker"""
         try:
@@ -284,11 +333,15 @@ class RQProgressTracker:
             
             # Try to get from Redis first
             progress_key = f"{self.progress_key_prefix}{task_id}"
-            progress_json = self.redis_connection.get(progress_key)
+            try:
+                progress_fields = self.redis_connection.hgetall(progress_key)
+            except redis.ResponseError:
+                # A JSON string written before progress was kept in a hash
+                progress_json = self.redis_connection.get(progress_key)
+                return RQProgressData.from_dict(json.loads(progress_json)) if progress_json else None
             
-            if progress_json:
-                progress_dict = json.loads(progress_json)
-                return RQProgressData.from_dict(progress_dict)
+            if progress_fields:
+                return RQProgressData.from_hash(progress_fields)
             
             # Fallback to database
             return self._get_progress_from_database(task_id)
@@ -357,6 +410,7 @@ class RQProgressTracker:
             
             # Clean up Redis progress data after a delay
             self._schedule_progress_cleanup(task_id)
+            self._forget_task(task_id)
             
             logger.info(f"Completed RQ progress tracking for task {sanitize_for_log(task_id)}")
             
@@ -394,6 +448,7 @@ class RQProgressTracker:
             
             # Clean up Redis progress data
             self._schedule_progress_cleanup(task_id)
+            self._forget_task(task_id)
             
             logger.info(f"Failed RQ progress tracking for task {sanitize_for_log(task_id)}: {error_message}")
             
@@ -404,16 +459,8 @@ class RQProgressTracker:
         """Schedule cleanup of progress data after delay"""
         try:
             # Set shorter TTL for cleanup
-            progress_key = f"{self.progress_key_prefix}{task_id}"
-            self.redis_connection.expire(progress_key, delay_seconds)
+            self.writer.expire(task_id, delay_seconds)
             
-            # Also clean up user-specific key
-            # We need to get user_id first
-            task_info = self._get_task_info(task_id)
-            if task_info:
-                user_progress_key = f"rq:user_progress:{task_info['user_id']}:{task_id}"
-                self.redis_connection.expire(user_progress_key, delay_seconds)
-                
         except Exception as e:
             logger.error(f"Failed to schedule progress cleanup: {sanitize_for_log(str(e))}")
     
@@ -461,37 +508,37 @@ class RQProgressTracker:
         """
         Clean up expired progress data from Redis
         
+        Walks the progress index rather than the keyspace: entries of
+        hashes that expired are dropped from it, and hashes left without a
+        TTL are deleted once their task is no longer active.
+        
         Returns:
             int: Number of progress entries cleaned up
         """
         try:
-            # Get all progress keys
-            progress_keys = self.redis_connection.keys(f"{self.progress_key_prefix}*")
-            user_progress_keys = self.redis_connection.keys("rq:user_progress:*")
+            index_key = self.writer.index_key
+            cleaned_count = self.redis_connection.zremrangebyscore(index_key, '-inf', time.time())
             
-            all_keys = progress_keys + user_progress_keys
-            cleaned_count = 0
+            task_ids = [task_id.decode('utf-8') if isinstance(task_id, bytes) else task_id
+                        for task_id in self.redis_connection.zrange(index_key, 0, -1)]
+            pipeline = self.redis_connection.pipeline(transaction=False)
+            for task_id in task_ids:
+                pipeline.ttl(f"{self.progress_key_prefix}{task_id}")
             
-            for key in all_keys:
+            for task_id, ttl in zip(task_ids, pipeline.execute()):
                 try:
-                    # Check if key has expired or task is no longer active
-                    ttl = self.redis_connection.ttl(key)
-                    if ttl == -1:  # No TTL set, check if task is still active
-                        # Extract task_id from key
-                        if key.startswith(self.progress_key_prefix):
-                            task_id = key[len(self.progress_key_prefix):]
-                        else:
-                            # User progress key format: rq:user_progress:user_id:task_id
-                            task_id = key.split(':')[-1]
-                        
-                        # Check if task is still active
+                    if ttl == -2:  # Deleted without going through the tracker
+                        self.redis_connection.zrem(index_key, task_id)
+                        cleaned_count += 1
+                    elif ttl == -1:  # No TTL set, check if task is still active
                         task_info = self._get_task_info(task_id)
                         if not task_info or task_info['status'] not in [TaskStatus.QUEUED, TaskStatus.RUNNING]:
-                            self.redis_connection.delete(key)
+                            self.redis_connection.delete(f"{self.progress_key_prefix}{task_id}")
+                            self.redis_connection.zrem(index_key, task_id)
                             cleaned_count += 1
                             
                 except Exception as key_error:
-                    logger.debug(f"Error checking key {key}: {sanitize_for_log(str(key_error))}")
+                    logger.debug(f"Error checking progress of task {sanitize_for_log(task_id)}: {sanitize_for_log(str(key_error))}")
             
             if cleaned_count > 0:
                 logger.info(f"Cleaned up {cleaned_count} expired progress entries")
@@ -500,4 +547,4 @@ class RQProgressTracker:
             
         except Exception as e:
             logger.error(f"Failed to cleanup expired progress: {sanitize_for_log(str(e))}")
-            return 0
\ No newline at end of file
+            return 0
@@ -0,0 +1,152 @@
+# Copyright (C) 2025 iolaire mcfadden.
+# This program is free software: you can redistribute it and/or modify it under the terms of the GNU Affero General Public License as published by the Free Software Foundation, either version 3 of the License, or (at your option) any later version.
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+"""
+Coalescing Progress Writer
+
+Write-behind storage for RQ task progress. Every progress tick goes to
+Redis at once, as one pipelined hash write plus a pub/sub message, so
+progress pages stay live. The database copy, which only serves as a
+fallback once the Redis entry has expired, is written at most once per
+task every db_write_interval seconds: ticks in between replace the
+pending values, and the latest of them is written by the next tick past
+the interval or by finish() when the task completes or fails.
+
+Tasks with a progress hash are indexed in a sorted set scored by the
+hash's expiry time, so cleanup finds them without scanning the keyspace.
+"""
+
+import json
+import logging
+import threading
+import time
+from typing import Any, Dict, Tuple
+
+from app.core.security.core.security_utils import sanitize_for_log
+from models import CaptionGenerationTask
+
+logger = logging.getLogger(__name__)
+
+class CoalescingProgressWriter:
+    """Immediate Redis progress updates with coalesced database writes"""
+
+    def __init__(self, db_manager, redis_connection, key_prefix: str = "rq:progress:",
+                 channel: str = "rq:progress_updates", index_key: str = "rq:progress_index",
+                 progress_ttl: int = 7200, db_write_interval: float = 5.0):
+        """
+        Args:
+            db_manager: DatabaseManager holding the caption_generation_tasks table
+            redis_connection: Redis connection for the live progress hashes
+            key_prefix: Prefix of the per-task progress hash
+            channel: Pub/sub channel every update is published on
+            index_key: Sorted set of task IDs with a progress hash, scored by expiry time
+            progress_ttl: Seconds a progress hash is kept after its last update
+            db_write_interval: Minimum seconds between database writes of one task
+        """
+        self.db_manager = db_manager
+        self.redis_connection = redis_connection
+        self.key_prefix = key_prefix
+        self.channel = channel
+        self.index_key = index_key
+        self.progress_ttl = progress_ttl
+        self.db_write_interval = db_write_interval
+        self._pending: Dict[str, Tuple[str, int]] = {}
+        self._last_write: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        self.stats = {
+            'redis_writes': 0,
+            'redis_errors': 0,
+            'db_writes': 0,
+            'db_writes_coalesced': 0,
+            'db_errors': 0
+        }
+
+    def publish(self, task_id: str, fields: Dict[str, str], message: Dict[str, Any]) -> bool:
+        """
+        Store a task's progress hash and publish the update, in one round trip
+
+        Args:
+            task_id: The task the progress belongs to
+            fields: Hash fields, as from RQProgressData.to_hash()
+            message: JSON-serialisable update for pub/sub subscribers
+        """
+        key = f"{self.key_prefix}{task_id}"
+        try:
+            pipeline = self.redis_connection.pipeline(transaction=False)
+            pipeline.hset(key, mapping=fields)
+            pipeline.expire(key, self.progress_ttl)
+            pipeline.zadd(self.index_key, {task_id: time.time() + self.progress_ttl})
+            pipeline.publish(self.channel, json.dumps(message))
+            pipeline.execute()
+        except Exception as e:
+            logger.error(f"Failed to store progress in Redis: {sanitize_for_log(str(e))}")
+            self._count('redis_errors')
+            return False
+        self._count('redis_writes')
+        return True
+
+    def expire(self, task_id: str, seconds: int) -> None:
+        """Shorten the life of a task's progress hash, keeping the index in step"""
+        pipeline = self.redis_connection.pipeline(transaction=False)
+        pipeline.expire(f"{self.key_prefix}{task_id}", seconds)
+        pipeline.zadd(self.index_key, {task_id: time.time() + seconds})
+        pipeline.execute()
+    
+    def persist(self, task_id: str, current_step: str, progress_percent: int, force: bool = False) -> bool:
+        """
+        Write a task's progress to the database unless it was written recently
+
+        The first update of a task and forced updates are written at once;
+        others within db_write_interval of the last write are kept pending.
+
+        Returns:
+            bool: True if the database was written
+        """
+        now = time.monotonic()
+        with self._lock:
+            self._pending[task_id] = (current_step, progress_percent)
+            last_write = self._last_write.get(task_id)
+            if not force and last_write is not None and now - last_write < self.db_write_interval:
+                self.stats['db_writes_coalesced'] += 1
+                return False
+            current_step, progress_percent = self._pending.pop(task_id)
+            self._last_write[task_id] = now
+        return self._write(task_id, current_step, progress_percent)
+
+    def finish(self, task_id: str) -> bool:
+        """Write a task's pending progress, if any, and forget the task"""
+        with self._lock:
+            pending = self._pending.pop(task_id, None)
+            self._last_write.pop(task_id, None)
+        if pending is None:
+            return False
+        return self._write(task_id, *pending)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self.stats)
+            stats['pending'] = len(self._pending)
+        return stats
+
+    def _write(self, task_id: str, current_step: str, progress_percent: int) -> bool:
+        session = self.db_manager.get_session()
+        try:
+            session.query(CaptionGenerationTask).filter_by(id=task_id).update(
+                {'current_step': current_step, 'progress_percent': progress_percent},
+                synchronize_session=False
+            )
+            session.commit()
+        except Exception as e:
+            session.rollback()
+            logger.error(f"Failed to update database progress: {sanitize_for_log(str(e))}")
+            self._count('db_errors')
+            return False
+        finally:
+            session.close()
+        self._count('db_writes')
+        return True
+
+    def _count(self, name: str):
+        with self._lock:
+            self.stats[name] += 1
@@ -0,0 +1,145 @@
+# Copyright (C) 2025 iolaire mcfadden.
+# This program is free software: you can redistribute it and/or modify it under the terms of the GNU Affero General Public License as published by the Free Software Foundation, either version 3 of the License, or (at your option) any later version.
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+Adaptive Concurrency Limiter
+
+Latency-driven concurrency limit for calls to a backend with unknown
+capacity, such as an Ollama server whose OLLAMA_NUM_PARALLEL setting is not
+visible to clients. The limit grows by one after each round of fast
+completions and shrinks when latency rises well above the best latency seen
+so far (requests are queueing on the server) or when calls fail.
+"""
+
+import asyncio
+import logging
+import time
+from contextlib import asynccontextmanager
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+class AdaptiveConcurrencyLimiter:
+    """Additive-increase / multiplicative-decrease concurrency limit based on latency"""
+
+    def __init__(self, max_limit: int, min_limit: int = 1, initial_limit: Optional[int] = None,
+                 latency_tolerance: float = 2.0, decrease_factor: float = 0.75,
+                 smoothing: float = 0.3):
+        """
+        Args:
+            max_limit: Upper bound for concurrent calls
+            min_limit: Lower bound for concurrent calls
+            initial_limit: Starting limit, defaults to min_limit
+            latency_tolerance: Smoothed latency above baseline * tolerance counts as overload
+            decrease_factor: Factor applied to the limit on overload or failure
+            smoothing: Weight of the newest sample in the smoothed latency
+        """
+        self.max_limit = max(1, max_limit)
+        self.min_limit = max(1, min(min_limit, self.max_limit))
+        self.limit = max(self.min_limit, min(initial_limit or self.min_limit, self.max_limit))
+        self.latency_tolerance = latency_tolerance
+        self.decrease_factor = decrease_factor
+        self.smoothing = smoothing
+
+        self.in_flight = 0
+        self.baseline_latency: Optional[float] = None
+        self.smoothed_latency: Optional[float] = None
+        self._good_samples = 0
+        self._cooldown = 0
+        self._condition: Optional[asyncio.Condition] = None
+        self.stats = {
+            'increases': 0,
+            'decreases': 0,
+            'max_limit_reached': self.limit
+        }
+
+    def _get_condition(self) -> asyncio.Condition:
+        if self._condition is None:
+            self._condition = asyncio.Condition()
+        return self._condition
+
+    async def acquire(self):
+        """Wait for a free slot under the current limit"""
+        condition = self._get_condition()
+        async with condition:
+            await condition.wait_for(lambda: self.in_flight < self.limit)
+            self.in_flight += 1
+
+    async def release(self, latency: Optional[float] = None, success: bool = True):
+        """
+        Release a slot and adjust the limit from the observed call
+
+        Args:
+            latency: Call duration in seconds, None to release without a sample
+            success: False if the call failed, which counts as overload
+        """
+        condition = self._get_condition()
+        async with condition:
+            self.in_flight -= 1
+            if not success:
+                self._decrease("call failed")
+            elif latency is not None:
+                self._record_latency(latency)
+            condition.notify_all()
+
+    @asynccontextmanager
+    async def slot(self):
+        """Hold a slot for the duration of the block, timing it as a latency sample"""
+        await self.acquire()
+        start_time = time.monotonic()
+        success = False
+        try:
+            yield
+            success = True
+        finally:
+            await self.release(time.monotonic() - start_time, success)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get the current limit and latency estimates"""
+        return {
+            'limit': self.limit,
+            'in_flight': self.in_flight,
+            'baseline_latency': self.baseline_latency,
+            'smoothed_latency': self.smoothed_latency,
+            **self.stats
+        }
+
+    def _record_latency(self, latency: float):
+        if self.baseline_latency is None or latency < self.baseline_latency:
+            self.baseline_latency = latency
+        if self.smoothed_latency is None:
+            self.smoothed_latency = latency
+        else:
+            self.smoothed_latency += self.smoothing * (latency - self.smoothed_latency)
+
+        if self._cooldown > 0:
+            # Samples from calls started before the last decrease say
+            # nothing about the new limit
+            self._cooldown -= 1
+            return
+
+        if self.smoothed_latency > self.baseline_latency * self.latency_tolerance:
+            self._decrease(f"latency {self.smoothed_latency:.2f}s over baseline {self.baseline_latency:.2f}s")
+            return
+
+        self._good_samples += 1
+        if self._good_samples >= self.limit and self.limit < self.max_limit:
+            self.limit += 1
+            self._good_samples = 0
+            self.stats['increases'] += 1
+            self.stats['max_limit_reached'] = max(self.stats['max_limit_reached'], self.limit)
+            logger.debug(f"Increased concurrency limit to {self.limit}")
+
+    def _decrease(self, reason: str):
+        self._good_samples = 0
+        if self._cooldown > 0:
+            return
+        new_limit = max(self.min_limit, int(self.limit * self.decrease_factor))
+        self._cooldown = self.in_flight
+        if new_limit < self.limit:
+            self.limit = new_limit
+            self.stats['decreases'] += 1
+            logger.debug(f"Decreased concurrency limit to {self.limit}: {reason}")
+        # Let the smoothed latency follow the new limit instead of
+        # triggering further decreases from the old backlog
+        self.smoothed_latency = self.baseline_latency
@@ -0,0 +1,208 @@
+# Copyright (C) 2025 iolaire mcfadden.
+# This program is free software: you can redistribute it and/or modify it under the terms of the GNU Affero General Public License as published by the Free Software Foundation, either version 3 of the License, or (at your option) any later version.
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+Caption Cache
+
+Content-addressed cache of generated captions. The same image is often
+reposted under different URLs, accounts and platforms; keying on a hash of
+the optimized image bytes together with the model, prompt and formatter
+version lets those reposts reuse a caption instead of another Ollama run.
+
+Entries live in Redis so every worker shares them, with an in-process LRU
+used when Redis is not configured or not reachable. Either way an entry
+expires ttl seconds after it was last used.
+"""
+
+import hashlib
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+CachedCaption = Tuple[str, Optional[Dict[str, Any]]]
+
+def caption_cache_key(image_bytes: bytes, model_name: str, prompt: str, formatter_version: Any) -> str:
+    """Build the cache key for an image and the settings that shape its caption"""
+    digest = hashlib.sha256()
+    digest.update(hashlib.sha256(image_bytes).digest())
+    for part in (model_name, prompt, str(formatter_version)):
+        digest.update(b"\0")
+        digest.update(part.encode('utf-8'))
+    return digest.hexdigest()
+
+class MemoryCaptionCacheBackend:
+    """In-process LRU store with per-entry expiry"""
+
+    def __init__(self, max_entries: int, ttl: int):
+        self.max_entries = max(1, max_entries)
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: str) -> int:
+        """Store a value, returning the number of entries evicted"""
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            evicted = 0
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                evicted += 1
+            return evicted
+
+    def size(self) -> int:
+        return len(self._entries)
+
+class RedisCaptionCacheBackend:
+    """
+    Redis store with TTL expiry and LRU eviction via a sorted set of access times
+
+    Every access renews the entry's TTL, so a member whose access time is
+    more than ttl ago belongs to an expired entry and is purged on the
+    next store.
+    """
+
+    PREFIX = "vedfolnir:caption_cache:"
+    LRU_KEY = PREFIX + "lru"
+
+    def __init__(self, redis_client, max_entries: int, ttl: int):
+        self.redis = redis_client
+        self.max_entries = max(1, max_entries)
+        self.ttl = ttl
+
+    def get(self, key: str) -> Optional[str]:
+        value = self.redis.get(self.PREFIX + key)
+        if value is None:
+            self.redis.zrem(self.LRU_KEY, key)
+            return None
+        pipe = self.redis.pipeline()
+        pipe.expire(self.PREFIX + key, self.ttl)
+        pipe.zadd(self.LRU_KEY, {key: time.time()})
+        pipe.execute()
+        return value.decode('utf-8') if isinstance(value, bytes) else value
+
+    def set(self, key: str, value: str) -> int:
+        """Store a value, returning the number of entries evicted"""
+        now = time.time()
+        pipe = self.redis.pipeline()
+        pipe.setex(self.PREFIX + key, self.ttl, value)
+        pipe.zadd(self.LRU_KEY, {key: now})
+        pipe.zremrangebyscore(self.LRU_KEY, '-inf', now - self.ttl)
+        pipe.zcard(self.LRU_KEY)
+        size = pipe.execute()[-1]
+
+        overflow = size - self.max_entries
+        if overflow <= 0:
+            return 0
+        oldest = [member.decode('utf-8') if isinstance(member, bytes) else member
+                  for member, _ in self.redis.zpopmin(self.LRU_KEY, overflow)]
+        if oldest:
+            self.redis.delete(*(self.PREFIX + member for member in oldest))
+        return len(oldest)
+
+    def size(self) -> int:
+        return self.redis.zcard(self.LRU_KEY)
+
+class CaptionCache:
+    """Caption cache with hit-rate statistics"""
+
+    def __init__(self, backend):
+        self.backend = backend
+        self._lock = threading.Lock()
+        self.stats = {
+            'hits': 0,
+            'misses': 0,
+            'stores': 0,
+            'evictions': 0,
+            'errors': 0
+        }
+
+    @classmethod
+    def from_config(cls, config) -> "CaptionCache":
+        """
+        Create a cache from a CaptionCacheConfig
+
+        Uses Redis when configured and reachable, otherwise an in-process LRU.
+        """
+        if config.backend == "redis":
+            try:
+                import redis
+                client = redis.Redis.from_url(config.redis_url, socket_timeout=2, socket_connect_timeout=2)
+                client.ping()
+                logger.info("Caption cache using Redis backend")
+                return cls(RedisCaptionCacheBackend(client, config.max_entries, config.ttl))
+            except Exception as e:
+                logger.warning(f"Redis unavailable for caption cache, using in-memory cache: {e}")
+        return cls(MemoryCaptionCacheBackend(config.max_entries, config.ttl))
+
+    def get(self, key: str) -> Optional[CachedCaption]:
+        """Look up a cached (caption, quality_metrics) pair"""
+        try:
+            value = self.backend.get(key)
+        except Exception as e:
+            logger.warning(f"Caption cache lookup failed: {e}")
+            self._count('errors')
+            value = None
+
+        entry = None
+        if value is not None:
+            try:
+                entry = json.loads(value)
+                caption = entry['caption']
+            except (ValueError, TypeError, KeyError) as e:
+                logger.warning(f"Ignoring corrupt caption cache entry: {e}")
+                entry = None
+
+        if entry is None:
+            self._count('misses')
+            return None
+
+        self._count('hits')
+        return caption, entry.get('quality_metrics')
+
+    def set(self, key: str, caption: str, quality_metrics: Optional[Dict[str, Any]] = None):
+        """Store a generated caption and its quality metrics"""
+        value = json.dumps({'caption': caption, 'quality_metrics': quality_metrics}, default=str)
+        try:
+            evicted = self.backend.set(key, value)
+        except Exception as e:
+            logger.warning(f"Caption cache store failed: {e}")
+            self._count('errors')
+            return
+        self._count('stores')
+        self._count('evictions', evicted)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get cache statistics including the hit rate"""
+        with self._lock:
+            stats = dict(self.stats)
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = (stats['hits'] / lookups) * 100 if lookups else 0.0
+        stats['backend'] = 'redis' if isinstance(self.backend, RedisCaptionCacheBackend) else 'memory'
+        try:
+            stats['entries'] = self.backend.size()
+        except Exception:
+            stats['entries'] = None
+        return stats
+
+    def _count(self, name: str, amount: int = 1):
+        with self._lock:
+            self.stats[name] += amount
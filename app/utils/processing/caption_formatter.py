@@ -26,6 +26,9 @@ class CaptionFormatter:
     - Format captions for optimal accessibility
     """
     
+    # Bump when formatting output changes so cached captions are not reused
+    VERSION = 1
+    
     def __init__(self, caption_config=None):
         """Initialize the caption formatter"""
         logger.info("Initializing caption formatter")
@@ -0,0 +1,376 @@
+# Copyright (C) 2025 iolaire mcfadden.
+# This program is free software: you can redistribute it and/or modify it under the terms of the GNU Affero General Public License as published by the Free Software Foundation, either version 3 of the License, or (at your option) any later version.
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+Caption Pipeline
+
+Staged asyncio pipeline used by the batch bot to process images:
+
+    download (N workers) -> caption (M workers) -> database write (K workers)
+
+Each stage has its own concurrency limit and the stages are connected by
+bounded queues, so a slow Ollama server applies backpressure to downloads
+instead of letting them pile up on disk. Database calls are synchronous
+SQLAlchemy operations and are run in worker threads behind a shared
+semaphore; the platform context is carried into those threads because
+asyncio.to_thread copies the caller's context variables.
+
+Images that are near-duplicates of one the user already approved skip the
+caption stage and reuse its caption.
+"""
+
+import asyncio
+import logging
+import os
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set
+
+from app.utils.logging.logger import log_error
+
+logger = logging.getLogger(__name__)
+
+@dataclass
+class ImageJob:
+    """A single image moving through the pipeline"""
+    image_info: Dict[str, Any]
+    post_id: int  # Database ID of the Post row the image belongs to
+    image_id: Optional[int] = None
+    local_path: Optional[str] = None
+    caption: Optional[str] = None
+    quality_metrics: Optional[Dict[str, Any]] = None
+    reused: bool = False  # Caption copied from a near-duplicate image rather than generated
+
+    @property
+    def image_url(self) -> str:
+        return self.image_info.get('url', 'unknown')
+
+class CaptionPipeline:
+    """Bounded, staged download/caption/database pipeline for images"""
+
+    STAGES = ('download', 'caption', 'database')
+
+    def __init__(self, db, image_processor, caption_generator, config,
+                 stats: Optional[Dict[str, int]] = None, reprocess_all: bool = False,
+                 caption_limiter: Optional[asyncio.Semaphore] = None,
+                 db_limiter: Optional[asyncio.Semaphore] = None,
+                 find_similar_caption: Optional[Callable[..., Optional[Dict[str, Any]]]] = None):
+        """
+        Args:
+            db: DatabaseManager with platform context already set
+            image_processor: ImageProcessor used for downloads
+            caption_generator: OllamaCaptionGenerator used for captions
+            config: PipelineConfig with per-stage concurrency limits
+            stats: Optional counters dict shared with the caller; every image
+                that fails at any stage is counted in 'errors'
+            reprocess_all: Process images even if already posted/approved
+            caption_limiter: Optional semaphore shared with other pipelines to
+                cap Ollama requests across concurrent platform runs
+            db_limiter: Optional semaphore shared with other pipelines to
+                cap concurrent database operations
+            find_similar_caption: Optional synchronous callable taking a
+                perceptual hash and exclude_image_id, returning a suggestion
+                from CaptionReviewIntegration.find_similar_caption for the
+                run's user; matching images skip the caption stage
+        """
+        self.db = db
+        self.image_processor = image_processor
+        self.caption_generator = caption_generator
+        self.config = config
+        self.reprocess_all = reprocess_all
+        self.find_similar_caption = find_similar_caption
+        self.stats = stats if stats is not None else {
+            'images_processed': 0,
+            'captions_generated': 0,
+            'errors': 0,
+            'skipped_existing': 0,
+            'captions_reused': 0,
+            'images_failed_permanently': 0
+        }
+
+        queue_size = max(1, config.queue_size)
+        self._download_queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self._caption_queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self._write_queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self._caption_semaphore = caption_limiter or asyncio.Semaphore(max(1, config.caption_concurrency))
+        self._db_semaphore = db_limiter or asyncio.Semaphore(max(1, config.db_concurrency))
+        self._workers: List[asyncio.Task] = []
+
+        # Results of check_processed(), consulted before the per-image query
+        self._checked_urls: Set[str] = set()
+        self._processed_urls: Set[str] = set()
+
+        # Busy time per stage, used to see which stage limits throughput
+        self.stage_timings = {stage: {'count': 0, 'total_time': 0.0} for stage in self.STAGES}
+
+    async def __aenter__(self):
+        self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            await self.join()
+        else:
+            await self.cancel()
+
+    def start(self):
+        """Start the worker tasks for every stage"""
+        if self._workers:
+            return
+
+        stage_workers = (
+            (self._download_worker, self.config.download_concurrency),
+            (self._caption_worker, self.config.caption_concurrency),
+            (self._write_worker, self.config.db_concurrency),
+        )
+        for worker, count in stage_workers:
+            for _ in range(max(1, count)):
+                self._workers.append(asyncio.create_task(worker()))
+
+        logger.debug(f"Started caption pipeline with {len(self._workers)} workers "
+                     f"(download={self.config.download_concurrency}, "
+                     f"caption={self.config.caption_concurrency}, "
+                     f"database={self.config.db_concurrency})")
+
+    async def submit(self, image_info: Dict[str, Any], post_id: int):
+        """
+        Queue an image for processing.
+
+        Blocks while the download queue is full, which propagates
+        backpressure from the caption stage up to the post loop.
+        """
+        if not self._workers:
+            self.start()
+        await self._download_queue.put(ImageJob(image_info=image_info, post_id=post_id))
+
+    async def check_processed(self, image_urls: Iterable[str]):
+        """
+        Look up which of a page of images are already processed in bulk
+
+        Images checked here skip the per-image is_image_processed query
+        when they reach the download stage.
+        """
+        image_urls = set(image_urls) - self._checked_urls
+        if self.reprocess_all or not image_urls:
+            return
+        processed = await self.run_db(self.db.get_processed_image_urls, image_urls)
+        self._checked_urls.update(image_urls)
+        self._processed_urls.update(processed)
+
+    async def join(self):
+        """Wait until every submitted image has left the pipeline, then stop workers"""
+        # Each stage hands a job on before marking it done, so joining the
+        # queues in order guarantees nothing is still in flight.
+        await self._download_queue.join()
+        await self._caption_queue.join()
+        await self._write_queue.join()
+        await self.cancel()
+
+    async def cancel(self):
+        """Stop all workers without draining the queues"""
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    async def run_db(self, func: Callable, *args, **kwargs):
+        """Run a synchronous database call in a thread under the database concurrency limit"""
+        async with self._db_semaphore:
+            return await asyncio.to_thread(func, *args, **kwargs)
+
+    def get_stage_stats(self) -> Dict[str, Dict[str, float]]:
+        """Get job counts and average busy time for each stage"""
+        result = {}
+        for stage, timing in self.stage_timings.items():
+            count = timing['count']
+            result[stage] = {
+                'count': count,
+                'total_time': timing['total_time'],
+                'avg_time': timing['total_time'] / count if count else 0.0
+            }
+        return result
+
+    def _record_timing(self, stage: str, start_time: float):
+        self.stage_timings[stage]['count'] += 1
+        self.stage_timings[stage]['total_time'] += time.monotonic() - start_time
+
+    async def _download_worker(self):
+        while True:
+            job = await self._download_queue.get()
+            try:
+                if await self._download(job):
+                    # Images with a reused caption go straight to the database stage
+                    await (self._write_queue if job.caption else self._caption_queue).put(job)
+                else:
+                    self.stats['images_processed'] += 1
+            except Exception as e:
+                log_error(logger, "Processing", "Error processing image", "ImageProcessor",
+                          details={"image_url": job.image_url}, exception=e)
+                self.stats['errors'] += 1
+                self.stats['images_processed'] += 1
+            finally:
+                self._download_queue.task_done()
+
+    async def _caption_worker(self):
+        while True:
+            job = await self._caption_queue.get()
+            try:
+                if await self._generate_caption(job):
+                    await self._write_queue.put(job)
+                else:
+                    self.stats['images_processed'] += 1
+            except Exception as e:
+                log_error(logger, "Processing", "Error processing image", "ImageProcessor",
+                          details={"image_url": job.image_url}, exception=e)
+                self.stats['errors'] += 1
+                self.stats['images_processed'] += 1
+            finally:
+                self._caption_queue.task_done()
+
+    async def _write_worker(self):
+        while True:
+            job = await self._write_queue.get()
+            try:
+                await self._write_caption(job)
+            except Exception as e:
+                log_error(logger, "Processing", "Error processing image", "ImageProcessor",
+                          details={"image_url": job.image_url}, exception=e)
+                self.stats['errors'] += 1
+            finally:
+                self.stats['images_processed'] += 1
+                self._write_queue.task_done()
+
+    async def _download(self, job: ImageJob) -> bool:
+        """Skip already processed images, download the rest and save the image record"""
+        image_url = job.image_info['url']
+
+        # Check if image was already processed (has POSTED or APPROVED status)
+        if not self.reprocess_all and await self._is_processed(image_url):
+            logger.info(f"Image already successfully processed (POSTED or APPROVED), skipping: {image_url}")
+            self.stats['skipped_existing'] += 1
+            return False
+
+        logger.info(f"Processing image: {image_url}")
+
+        start_time = time.monotonic()
+        local_path = await self.image_processor.download_and_store_image(
+            image_url,
+            job.image_info.get('mediaType')
+        )
+        self._record_timing('download', start_time)
+
+        if not local_path:
+            log_error(logger, "Download", "Failed to download/store image", "ImageProcessor",
+                      details={"image_url": image_url})
+            self.stats['errors'] += 1
+            reason = self.image_processor.pop_permanent_failure(image_url)
+            if reason:
+                # Retrying cannot fix it, so record it rather than hold the run back
+                await self.run_db(
+                    self.db.mark_image_failed,
+                    post_id=job.post_id,
+                    image_url=image_url,
+                    attachment_index=job.image_info['attachment_index'],
+                    error=reason,
+                    media_type=job.image_info.get('mediaType'),
+                    image_post_id=job.image_info.get('image_post_id')
+                )
+                self.stats['images_failed_permanently'] += 1
+            return False
+
+        job.local_path = local_path
+        logger.info(f"ID from image_info: {job.image_info.get('image_post_id')}")
+
+        # Parse the original post date if available
+        original_post_date = None
+        if job.image_info.get('post_published'):
+            try:
+                from dateutil import parser
+                original_post_date = parser.parse(job.image_info['post_published'])
+            except Exception as e:
+                logger.warning(f"Failed to parse post_published date '{job.image_info['post_published']}': {e}")
+
+        perceptual_hash = await asyncio.to_thread(self.image_processor.get_perceptual_hash, local_path)
+        job.image_id = await self.run_db(
+            self.db.save_image,
+            post_id=job.post_id,
+            image_url=image_url,
+            local_path=local_path,
+            attachment_index=job.image_info['attachment_index'],
+            media_type=job.image_info.get('mediaType'),
+            original_filename=os.path.basename(local_path),
+            image_post_id=job.image_info.get('image_post_id'),
+            original_post_date=original_post_date,
+            perceptual_hash=perceptual_hash
+        )
+
+        if job.image_id is None:
+            log_error(logger, "Database", f"Failed to save image record: {image_url}", "ImageProcessor")
+            self.stats['errors'] += 1
+            return False
+
+        if self.find_similar_caption and perceptual_hash:
+            suggestion = await self.run_db(self.find_similar_caption, perceptual_hash,
+                                           exclude_image_id=job.image_id)
+            if suggestion:
+                logger.info(f"Reusing caption of near-duplicate image {suggestion['image_id']} for {image_url}")
+                job.caption = suggestion['caption']
+                job.reused = True
+                self.stats['captions_reused'] += 1
+
+        return True
+
+    async def _is_processed(self, image_url: str) -> bool:
+        if image_url in self._checked_urls:
+            return image_url in self._processed_urls
+        return await self.run_db(self.db.is_image_processed, image_url)
+
+    async def _generate_caption(self, job: ImageJob) -> bool:
+        """Generate a caption for a downloaded image"""
+        async with self._caption_semaphore:
+            start_time = time.monotonic()
+            result = await self.caption_generator.generate_caption(job.local_path)
+            self._record_timing('caption', start_time)
+
+        # generate_caption returns a tuple of (caption, quality_metrics)
+        if isinstance(result, tuple) and len(result) == 2:
+            job.caption, job.quality_metrics = result
+        else:
+            job.caption = result
+            job.quality_metrics = None
+
+        if not job.caption:
+            log_error(logger, "Caption", "Failed to generate caption for image", "CaptionGenerator",
+                      details={"image_url": job.image_url, "local_path": job.local_path})
+            self.stats['errors'] += 1
+            return False
+
+        return True
+
+    async def _write_caption(self, job: ImageJob):
+        """Store the generated caption and quality metrics"""
+        quality_metrics = job.quality_metrics
+        if quality_metrics:
+            logger.info(f"Caption quality score: {quality_metrics['overall_score']}/100 ({quality_metrics['quality_level']})")
+            if quality_metrics['needs_review']:
+                logger.warning(f"Caption flagged for special review: {quality_metrics['feedback']}")
+
+        start_time = time.monotonic()
+        success = await self.run_db(
+            self.db.update_image_caption,
+            image_id=job.image_id,
+            generated_caption=job.caption,
+            quality_metrics=quality_metrics
+        )
+        self._record_timing('database', start_time)
+
+        if success:
+            if job.reused:
+                logger.info(f"Stored reused caption for {job.image_url}: {job.caption}")
+            else:
+                self.stats['captions_generated'] += 1
+                logger.info(f"Generated caption for {job.image_url}: {job.caption}")
+        else:
+            log_error(logger, "Database", f"Failed to update caption for image {job.image_id}", "ImageProcessor",
+                      details={"image_id": job.image_id, "image_url": job.image_url})
+            self.stats['errors'] += 1
@@ -9,6 +9,10 @@ including batch grouping, bulk operations, and enhanced review workflows.
 """
 
 import logging
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
 from datetime import datetime, timezone, timedelta
 from typing import List, Dict, Any, Optional, Tuple
 from sqlalchemy import and_, or_, desc, asc
@@ -16,14 +20,38 @@ from sqlalchemy.orm import joinedload
 from sqlalchemy.exc import SQLAlchemyError
 
 from app.core.database.core.database_manager import DatabaseManager
-from models import Image, Post, ProcessingStatus, CaptionGenerationTask, TaskStatus
+from models import Image, Post, ProcessingStatus, CaptionGenerationTask, TaskStatus, PlatformConnection
 from app.core.security.core.security_utils import sanitize_for_log
+from app.utils.processing.perceptual_hash import PerceptualHashIndex, hash_from_hex, DEFAULT_MAX_DISTANCE
 
 logger = logging.getLogger(__name__)
 
+@dataclass
+class _UserHashIndex:
+    """Perceptual hashes of one user's stored images"""
+    index: PerceptualHashIndex
+    built_at: float
+    max_id: int = 0
+    # Held while the index is extended, so loading one user's hashes does
+    # not hold up lookups for other users
+    lock: threading.Lock = field(default_factory=threading.Lock)
+
 class CaptionReviewIntegration:
     """Integration service for caption generation and review workflows"""
     
+    # Perceptual hash indexes of the most recently looked up users, shared
+    # by all instances and extended with newly stored images before each
+    # similarity lookup
+    _hash_indexes: "OrderedDict[int, _UserHashIndex]" = OrderedDict()
+    _hash_index_lock = threading.Lock()
+    
+    # Users whose hash index is kept in memory
+    MAX_INDEXED_USERS = 32
+    # Seconds before a user's index is rebuilt, dropping deleted images
+    HASH_INDEX_TTL = 600
+    # Similar image IDs per candidate query
+    CANDIDATE_QUERY_SIZE = 500
+    
     def __init__(self, db_manager: DatabaseManager):
         self.db_manager = db_manager
     
@@ -65,6 +93,8 @@ class CaptionReviewIntegration:
                 Image.status == ProcessingStatus.PENDING
             ).order_by(Image.created_at.desc()).all()
             
+            suggestions = self._similar_caption_suggestions(session, images, user_id)
+            
             # Create batch metadata
             batch_info = {
                 'batch_id': task_id,
@@ -73,7 +103,7 @@ class CaptionReviewIntegration:
                 'total_images': len(images),
                 'platform_connection_id': task.platform_connection_id,
                 'user_id': user_id,
-                'images': [self._image_to_dict(img) for img in images]
+                'images': [self._image_to_dict(img, suggestions.get(img.id)) for img in images]
             }
             
             logger.info(f"Created review batch from task {sanitize_for_log(task_id)} with {len(images)} images")
@@ -214,9 +244,10 @@ class CaptionReviewIntegration:
             # Apply pagination
             offset = (page - 1) * per_page
             images = query.offset(offset).limit(per_page).all()
+            suggestions = self._similar_caption_suggestions(session, images, user_id)
             
             return {
-                'images': [self._image_to_dict(img) for img in images],
+                'images': [self._image_to_dict(img, suggestions.get(img.id)) for img in images],
                 'total': total,
                 'page': page,
                 'per_page': per_page,
@@ -514,7 +545,160 @@ class CaptionReviewIntegration:
         finally:
             session.close()
     
-    def _image_to_dict(self, image: Image) -> Dict[str, Any]:
+    def get_similar_caption_suggestion(self, image_id: int, user_id: int) -> Optional[Dict[str, Any]]:
+        """
+        Get a suggested caption from a near-duplicate image
+        
+        Args:
+            image_id: The image needing a caption
+            user_id: The user ID for authorization
+            
+        Returns:
+            Dict with the similar image's ID, caption and hash distance, or
+            None if no approved near-duplicate exists
+        """
+        session = self.db_manager.get_session()
+        try:
+            image = session.query(Image).join(
+                PlatformConnection, Image.platform_connection_id == PlatformConnection.id
+            ).filter(
+                Image.id == image_id,
+                PlatformConnection.user_id == user_id
+            ).first()
+            
+            if not image:
+                return None
+            
+            return self._similar_caption_suggestions(session, [image], user_id).get(image.id)
+            
+        finally:
+            session.close()
+    
+    def find_similar_caption(self, perceptual_hash: Optional[str], user_id: int,
+                             exclude_image_id: Optional[int] = None) -> Optional[Dict[str, Any]]:
+        """
+        Find the caption of an approved or posted near-duplicate of a new image
+        
+        Caption generation uses this to reuse the caption of an image the
+        user already reviewed instead of running inference again.
+        
+        Args:
+            perceptual_hash: Hex perceptual hash of the new image
+            user_id: The user the image belongs to
+            exclude_image_id: The new image's own ID, if it is already stored
+            
+        Returns:
+            Dict with the similar image's ID, caption and hash distance, or
+            None if no approved near-duplicate exists
+        """
+        if not perceptual_hash:
+            return None
+        
+        session = self.db_manager.get_session()
+        try:
+            return self._similar_captions(session, {exclude_image_id: perceptual_hash}, user_id).get(exclude_image_id)
+        finally:
+            session.close()
+    
+    def _similar_caption_suggestions(self, session, images: List[Image], user_id: int) -> Dict[int, Dict[str, Any]]:
+        """Find captions of approved or posted near-duplicates of the given images by image ID"""
+        return self._similar_captions(session, {
+            image.id: image.perceptual_hash
+            for image in images if isinstance(image.perceptual_hash, str) and image.perceptual_hash
+        }, user_id)
+    
+    def _similar_captions(self, session, hashes: Dict[Any, str], user_id: int) -> Dict[Any, Dict[str, Any]]:
+        """
+        Find captions of approved or posted near-duplicates of perceptual hashes
+        
+        Only images belonging to the same user are considered, so captions
+        never leak between accounts.
+        
+        Args:
+            hashes: Hex perceptual hash by image ID; an image never matches itself
+            
+        Returns:
+            Dict mapping image ID to its suggestion
+        """
+        try:
+            if not hashes:
+                return {}
+            
+            index = self._user_hash_index(session, user_id)
+            
+            matches = {}
+            for image_id, perceptual_hash in hashes.items():
+                similar = [
+                    (candidate_id, distance)
+                    for candidate_id, distance in index.search(hash_from_hex(perceptual_hash), DEFAULT_MAX_DISTANCE)
+                    if candidate_id != image_id
+                ]
+                if similar:
+                    matches[image_id] = similar
+            
+            candidate_ids = sorted({candidate_id for similar in matches.values() for candidate_id, _ in similar})
+            captions = {}
+            for start in range(0, len(candidate_ids), self.CANDIDATE_QUERY_SIZE):
+                candidates = session.query(Image).join(
+                    PlatformConnection, Image.platform_connection_id == PlatformConnection.id
+                ).filter(
+                    Image.id.in_(candidate_ids[start:start + self.CANDIDATE_QUERY_SIZE]),
+                    PlatformConnection.user_id == user_id,
+                    Image.status.in_([ProcessingStatus.APPROVED, ProcessingStatus.POSTED])
+                ).all()
+                captions.update({
+                    candidate.id: candidate.final_caption or candidate.reviewed_caption or candidate.generated_caption
+                    for candidate in candidates
+                })
+            
+            suggestions = {}
+            for image_id, similar in matches.items():
+                for candidate_id, distance in similar:
+                    if captions.get(candidate_id):
+                        suggestions[image_id] = {
+                            'image_id': candidate_id,
+                            'caption': captions[candidate_id],
+                            'distance': distance
+                        }
+                        break
+            return suggestions
+            
+        except Exception as e:
+            logger.warning(f"Error finding similar image captions: {sanitize_for_log(str(e))}")
+            return {}
+    
+    @classmethod
+    def _user_hash_index(cls, session, user_id: int) -> PerceptualHashIndex:
+        """Get the hash index of a user's images, adding images stored since the last lookup"""
+        with cls._hash_index_lock:
+            now = time.monotonic()
+            entry = cls._hash_indexes.pop(user_id, None)
+            if entry is None or now - entry.built_at > cls.HASH_INDEX_TTL:
+                entry = _UserHashIndex(PerceptualHashIndex(), now)
+            cls._hash_indexes[user_id] = entry
+            while len(cls._hash_indexes) > cls.MAX_INDEXED_USERS:
+                cls._hash_indexes.popitem(last=False)
+        
+        with entry.lock:
+            rows = session.query(Image.id, Image.perceptual_hash).join(
+                PlatformConnection, Image.platform_connection_id == PlatformConnection.id
+            ).filter(
+                PlatformConnection.user_id == user_id,
+                Image.id > entry.max_id,
+                Image.perceptual_hash.isnot(None)
+            ).order_by(Image.id).all()
+            
+            for image_id, perceptual_hash in rows:
+                try:
+                    entry.index.add(hash_from_hex(perceptual_hash), image_id)
+                except ValueError:
+                    logger.warning(f"Ignoring invalid perceptual hash for image {image_id}")
+            
+            if rows:
+                entry.max_id = rows[-1][0]
+            return entry.index
+    
+    def _image_to_dict(self, image: Image, suggestion: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
         """Convert Image object to dictionary for JSON serialization"""
         return {
             'id': image.id,
@@ -539,7 +723,8 @@ class CaptionReviewIntegration:
                 'id': image.platform_connection.id,
                 'name': image.platform_connection.name,
                 'platform_type': image.platform_connection.platform_type
-            } if image.platform_connection else None
+            } if image.platform_connection else None,
+            'suggested_caption': suggestion
         }
     
     def get_job_quality_metrics(self, batch_id: str, user_id: int) -> Optional[Dict[str, Any]]:
@@ -9,9 +9,10 @@ import io
 from typing import Optional, Tuple, List
 from PIL import Image, UnidentifiedImageError
 import httpx
-import aiofiles
 from urllib.parse import urlparse
 from config import Config
+from app.utils.processing.perceptual_hash import dhash, hash_to_hex
+from app.utils.processing.image_transcoder import get_image_transcoder, TranscoderError
 
 # Check if pillow-heif is available for HEIC/HEIF support
 try:
@@ -34,6 +35,101 @@ except ImportError:
 
 logger = logging.getLogger(__name__)
 
+MAX_FILE_SIZE = 20 * 1024 * 1024
+# Client errors that may succeed when the download is tried again
+RETRYABLE_STATUS_CODES = {408, 425, 429}
+MIN_DIMENSION = 50
+MAX_DIMENSION = 10000
+OPTIMIZED_MAX_SIZE = (1024, 1024)
+JPEG_QUALITY = 85
+
+# Formats that are always stored as JPEG for compatibility
+CONVERT_TO_JPEG_EXTENSIONS = ('.heic', '.heif', '.avif')
+
+class ImageValidationError(ValueError):
+    """Raised when image data is not an acceptable image"""
+
+def transcode_image(data: bytes, filepath: str) -> Tuple[str, str]:
+    """
+    Validate, resize and re-encode image data with a single decode
+    
+    The size and dimension limits are checked from the header before any
+    pixels are decoded, large JPEGs are decoded directly at a reduced scale
+    with Image.draft(), and the result is written to a temporary file that
+    is renamed into place. HEIC/HEIF/AVIF and opaque PNG images are stored
+    as JPEG next to filepath; a previous file at filepath is then removed.
+    
+    Args:
+        data: Raw image bytes
+        filepath: Destination path, whose extension selects the output format
+        
+    Returns:
+        Tuple of (stored_path, perceptual_hash)
+        
+    Raises:
+        ImageValidationError: If the data is not a valid image within limits
+    """
+    if not data:
+        raise ImageValidationError("Image file is empty")
+    if len(data) > MAX_FILE_SIZE:
+        raise ImageValidationError(
+            f"Image file is too large ({len(data) / 1024 / 1024:.2f}MB > {MAX_FILE_SIZE / 1024 / 1024:.2f}MB)")
+    
+    try:
+        img = Image.open(io.BytesIO(data))
+    except UnidentifiedImageError:
+        raise ImageValidationError("File is not a valid image")
+    
+    with img:
+        width, height = img.size
+        if width < MIN_DIMENSION or height < MIN_DIMENSION:
+            raise ImageValidationError(f"Image dimensions too small ({width}x{height} < {MIN_DIMENSION}x{MIN_DIMENSION})")
+        if width > MAX_DIMENSION or height > MAX_DIMENSION:
+            raise ImageValidationError(f"Image dimensions too large ({width}x{height} > {MAX_DIMENSION}x{MAX_DIMENSION})")
+        
+        too_large = width > OPTIMIZED_MAX_SIZE[0] or height > OPTIMIZED_MAX_SIZE[1]
+        if too_large and img.format == 'JPEG':
+            # Let libjpeg scale down by up to 8x while decoding
+            img.draft('RGB', OPTIMIZED_MAX_SIZE)
+        
+        try:
+            img.load()
+        except Exception as e:
+            raise ImageValidationError(f"Error decoding image: {e}")
+        
+        base, ext = os.path.splitext(filepath)
+        ext = ext.lower()
+        if ext in CONVERT_TO_JPEG_EXTENSIONS or (ext == '.png' and img.mode != 'RGBA'):
+            output_path, output_format = base + '.jpg', 'JPEG'
+        else:
+            output_path = filepath
+            output_format = Image.registered_extensions().get(ext, img.format or 'JPEG')
+        
+        # Convert to RGB if necessary
+        if img.mode not in ('RGB', 'RGBA') or (output_format == 'JPEG' and img.mode != 'RGB'):
+            img = img.convert('RGB')
+        
+        if too_large:
+            img.thumbnail(OPTIMIZED_MAX_SIZE, Image.Resampling.LANCZOS)
+        
+        if min(img.size) < MIN_DIMENSION:
+            raise ImageValidationError(f"Optimized image dimensions too small ({img.size[0]}x{img.size[1]})")
+        
+        perceptual_hash = hash_to_hex(dhash(img))
+        
+        temp_path = f"{output_path}.tmp"
+        try:
+            img.save(temp_path, output_format, quality=JPEG_QUALITY, optimize=True)
+            os.replace(temp_path, output_path)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+    
+    if output_path != filepath and os.path.exists(filepath):
+        os.remove(filepath)
+    
+    return output_path, perceptual_hash
+
 class ImageProcessor:
     """Handle image downloading and processing with persistent storage"""
     
@@ -42,6 +138,10 @@ class ImageProcessor:
         self.session = None
         self.storage_dir = config.storage.images_dir
         os.makedirs(self.storage_dir, exist_ok=True)
+        # Perceptual hashes of stored images, keyed by local path
+        self.perceptual_hashes = {}
+        # Reasons downloads failed in a way retrying cannot fix, by image URL
+        self.permanent_failures = {}
     
     async def __aenter__(self):
         self.session = httpx.AsyncClient(timeout=30.0)
@@ -102,9 +202,8 @@ class ImageProcessor:
             return False, f"Image file is empty: {image_path}"
             
         # Maximum file size (20MB)
-        max_file_size = 20 * 1024 * 1024
-        if file_size > max_file_size:
-            return False, f"Image file is too large ({file_size / 1024 / 1024:.2f}MB > {max_file_size / 1024 / 1024:.2f}MB): {image_path}"
+        if file_size > MAX_FILE_SIZE:
+            return False, f"Image file is too large ({file_size / 1024 / 1024:.2f}MB > {MAX_FILE_SIZE / 1024 / 1024:.2f}MB): {image_path}"
             
         # Try to open and validate the image
         try:
@@ -113,14 +212,12 @@ class ImageProcessor:
                 width, height = img.size
                 
                 # Minimum dimensions
-                min_dimension = 50
-                if width < min_dimension or height < min_dimension:
-                    return False, f"Image dimensions too small ({width}x{height} < {min_dimension}x{min_dimension}): {image_path}"
+                if width < MIN_DIMENSION or height < MIN_DIMENSION:
+                    return False, f"Image dimensions too small ({width}x{height} < {MIN_DIMENSION}x{MIN_DIMENSION}): {image_path}"
                     
                 # Maximum dimensions
-                max_dimension = 10000
-                if width > max_dimension or height > max_dimension:
-                    return False, f"Image dimensions too large ({width}x{height} > {max_dimension}x{max_dimension}): {image_path}"
+                if width > MAX_DIMENSION or height > MAX_DIMENSION:
+                    return False, f"Image dimensions too large ({width}x{height} > {MAX_DIMENSION}x{MAX_DIMENSION}): {image_path}"
                     
                 # Check if image data can be loaded
                 img.load()
@@ -146,55 +243,35 @@ class ImageProcessor:
             # Check if file already exists
             if os.path.exists(filepath):
                 logger.debug(f"Image already exists: {filepath}")
-                # Validate existing image
-                is_valid, error_message = self.validate_image(filepath)
+                # Validate and hash the existing image off the event loop
+                is_valid, error_message = await asyncio.to_thread(self._check_stored_image, filepath)
                 if not is_valid:
                     logger.warning(f"Existing image is invalid: {error_message}. Will re-download.")
                     # Continue with download to replace invalid image
                 else:
                     return filepath
             
-            # Download image with redirect following
-            response = await self.session.get(url, follow_redirects=True)
-            response.raise_for_status()
-            
-            # Check if we got an image
-            content_type = response.headers.get('content-type', '')
-            if not content_type.startswith('image/'):
-                logger.warning(f"Downloaded content is not an image: {content_type}")
-                # Continue anyway, we'll validate with PIL later
-            
-            # Create a temporary file first for validation
-            temp_filepath = f"{filepath}.tmp"
-            
-            # Save image to temporary file
-            async with aiofiles.open(temp_filepath, 'wb') as f:
-                await f.write(response.content)
-            
-            # Validate the downloaded image
-            is_valid, error_message = self.validate_image(temp_filepath)
-            if not is_valid:
-                # Remove the temporary file
-                if os.path.exists(temp_filepath):
-                    os.remove(temp_filepath)
-                logger.error(f"Downloaded image is invalid: {error_message}")
+            try:
+                data = await self._download(url)
+            except httpx.HTTPStatusError as e:
+                status_code = e.response.status_code
+                if 400 <= status_code < 500 and status_code not in RETRYABLE_STATUS_CODES:
+                    self.permanent_failures[url] = f"HTTP {status_code}"
+                raise
+            if data is None:
                 return None
-                
-            # Move the temporary file to the final location
-            if os.path.exists(filepath):
-                os.remove(filepath)
-            os.rename(temp_filepath, filepath)
             
-            # Verify and optimize image
-            optimized_path = self._optimize_image(filepath)
-            
-            # Final validation after optimization
-            is_valid, error_message = self.validate_image(optimized_path)
-            if not is_valid:
-                logger.error(f"Optimized image is invalid: {error_message}")
-                if os.path.exists(optimized_path):
-                    os.remove(optimized_path)
+            # Validate, resize, re-encode and hash in one decode, in the transcoding pool
+            try:
+                optimized_path, perceptual_hash = await get_image_transcoder().run(transcode_image, data, filepath)
+            except ImageValidationError as e:
+                logger.error(f"Downloaded image is invalid: {e}")
+                self.permanent_failures[url] = f"Invalid image: {e}"
+                return None
+            except TranscoderError as e:
+                logger.error(f"Failed to transcode image: {e}")
                 return None
+            self.perceptual_hashes[optimized_path] = perceptual_hash
             
             from app.core.security.core.security_utils import sanitize_for_log
             logger.info(f"Downloaded and stored image: {sanitize_for_log(url)} -> {sanitize_for_log(optimized_path)}")
@@ -205,69 +282,77 @@ class ImageProcessor:
             logger.error(f"Failed to download/store image {sanitize_for_log(url)}: {sanitize_for_log(str(e))}")
             return None
     
+    async def _download(self, url: str) -> Optional[bytes]:
+        """Stream an image into memory, giving up as soon as it exceeds the size limit"""
+        from app.core.security.core.security_utils import sanitize_for_log
+        
+        # Download image with redirect following
+        async with self.session.stream('GET', url, follow_redirects=True) as response:
+            response.raise_for_status()
+            
+            # Check if we got an image
+            content_type = response.headers.get('content-type', '')
+            if not content_type.startswith('image/'):
+                logger.warning(f"Downloaded content is not an image: {content_type}")
+                # Continue anyway, the image is validated when decoded
+            
+            declared_size = response.headers.get('content-length')
+            if declared_size and declared_size.isdigit() and int(declared_size) > MAX_FILE_SIZE:
+                logger.error(f"Image is too large ({int(declared_size) / 1024 / 1024:.2f}MB): {sanitize_for_log(url)}")
+                self.permanent_failures[url] = "Image too large"
+                return None
+            
+            data = bytearray()
+            async for chunk in response.aiter_bytes():
+                data.extend(chunk)
+                if len(data) > MAX_FILE_SIZE:
+                    logger.error(f"Image exceeded {MAX_FILE_SIZE / 1024 / 1024:.0f}MB while downloading: {sanitize_for_log(url)}")
+                    self.permanent_failures[url] = "Image too large"
+                    return None
+        
+        return bytes(data)
+    
+    def pop_permanent_failure(self, url: str) -> Optional[str]:
+        """
+        Get why the last download of an image failed for good, if it did
+        
+        Missing images, other client errors, oversize files and undecodable
+        images fail the same way every time; network errors, server errors
+        and rate limiting do not, and return None.
+        """
+        return self.permanent_failures.pop(url, None)
+    
+    def _check_stored_image(self, image_path: str) -> Tuple[bool, str]:
+        """Validate a previously stored image and cache its perceptual hash"""
+        is_valid, error_message = self.validate_image(image_path)
+        if is_valid:
+            self.get_perceptual_hash(image_path)
+        return is_valid, error_message
+    
     def _optimize_image(self, image_path: str) -> str:
         """Optimize image for storage and processing"""
         try:
-            # Handle special formats (HEIC/HEIF/AVIF) that might need conversion
-            lower_path = image_path.lower()
-            
-            # Convert HEIC/HEIF to JPEG if detected
-            if lower_path.endswith(('.heic', '.heif')):
-                if not HAS_HEIF_SUPPORT:
-                    logger.warning(f"HEIC/HEIF support not available. Attempting basic conversion for {image_path}")
-                # Always convert HEIC/HEIF to JPEG for better compatibility
-                new_path = image_path.rsplit('.', 1)[0] + '.jpg'
-                with Image.open(image_path) as img:
-                    # Convert to RGB (HEIC may have different color spaces)
-                    img = img.convert('RGB')
-                    img.save(new_path, 'JPEG', quality=85, optimize=True)
-                # Remove original HEIC/HEIF file after conversion
-                if os.path.exists(new_path) and os.path.exists(image_path):
-                    os.remove(image_path)
-                image_path = new_path
-                
-            # Convert AVIF to JPEG if detected
-            elif lower_path.endswith('.avif'):
-                if not HAS_AVIF_SUPPORT:
-                    logger.warning(f"AVIF support not available. Attempting basic conversion for {image_path}")
-                # Always convert AVIF to JPEG for better compatibility
-                new_path = image_path.rsplit('.', 1)[0] + '.jpg'
-                with Image.open(image_path) as img:
-                    # Convert to RGB (AVIF may have different color spaces)
-                    img = img.convert('RGB')
-                    img.save(new_path, 'JPEG', quality=85, optimize=True)
-                # Remove original AVIF file after conversion
-                if os.path.exists(new_path) and os.path.exists(image_path):
-                    os.remove(image_path)
-                image_path = new_path
-            
-            # Standard optimization for all image types
-            with Image.open(image_path) as img:
-                # Convert to RGB if necessary
-                if img.mode not in ('RGB', 'RGBA'):
-                    img = img.convert('RGB')
-                
-                # Resize if too large
-                max_size = (1024, 1024)
-                if img.size[0] > max_size[0] or img.size[1] > max_size[1]:
-                    img.thumbnail(max_size, Image.Resampling.LANCZOS)
-                
-                # Save optimized version
-                if image_path.lower().endswith('.png') and img.mode == 'RGB':
-                    # Convert PNG to JPEG if no transparency needed
-                    new_path = image_path.rsplit('.', 1)[0] + '.jpg'
-                    img.save(new_path, 'JPEG', quality=85, optimize=True)
-                    if new_path != image_path and os.path.exists(image_path):
-                        os.remove(image_path)
-                    return new_path
-                else:
-                    img.save(image_path, quality=85, optimize=True)
-                    return image_path
-                    
+            with open(image_path, 'rb') as f:
+                data = f.read()
+            optimized_path, perceptual_hash = transcode_image(data, image_path)
+            self.perceptual_hashes[optimized_path] = perceptual_hash
+            return optimized_path
         except Exception as e:
             logger.error(f"Failed to optimize image {image_path}: {e}")
             return image_path
     
+    def get_perceptual_hash(self, image_path: str) -> Optional[str]:
+        """Get the hex dHash of a stored image, computing it on first use"""
+        perceptual_hash = self.perceptual_hashes.get(image_path)
+        if perceptual_hash is None:
+            try:
+                perceptual_hash = hash_to_hex(dhash(image_path))
+            except Exception as e:
+                logger.warning(f"Failed to compute perceptual hash for {image_path}: {e}")
+                return None
+            self.perceptual_hashes[image_path] = perceptual_hash
+        return perceptual_hash
+    
     def get_image_info(self, image_path: str) -> dict:
         """Get image information"""
         try:
@@ -0,0 +1,285 @@
+# Copyright (C) 2025 iolaire mcfadden.
+# This program is free software: you can redistribute it and/or modify it under the terms of the GNU Affero General Public License as published by the Free Software Foundation, either version 3 of the License, or (at your option) any later version.
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+Image Transcoder
+
+Process pool for CPU-bound PIL work such as decoding, LANCZOS resizing and
+JPEG encoding. Running it in separate processes keeps a large HEIC from
+stalling the asyncio loops of the batch bot, the web caption service and
+the RQ workers, and sidesteps the GIL for the Python parts of the work.
+
+Each worker process runs one job at a time over a pipe of its own; up to
+queue_size further jobs wait for a free worker and anything beyond that is
+rejected. A job that exceeds its timeout has its worker killed, and a
+malformed file that crashes the decoder only takes its own worker down;
+either way the worker is replaced on demand and the other jobs carry on.
+
+The pool is shared by everything in a process through get_image_transcoder()
+and is re-created after a fork, so RQ work horses get their own.
+"""
+
+import asyncio
+import atexit
+import logging
+import multiprocessing
+import os
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Deque, Dict, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+class TranscoderError(Exception):
+    """Base class for transcoding failures not caused by the image itself"""
+
+class TranscoderBusyError(TranscoderError):
+    """Raised when the transcoding queue is full"""
+
+class TranscodeTimeoutError(TranscoderError):
+    """Raised when a job takes longer than its timeout"""
+
+class TranscoderCrashedError(TranscoderError):
+    """Raised when a job kills its worker process"""
+
+def _worker_main(connection):
+    """Run the jobs received over connection until it is closed"""
+    while True:
+        try:
+            fn, args = connection.recv()
+        except (EOFError, OSError):
+            return
+        try:
+            reply = (True, fn(*args))
+        except Exception as e:
+            reply = (False, e)
+        try:
+            connection.send(reply)
+        except Exception as e:
+            # The result or exception could not be pickled
+            connection.send((False, TranscoderError(f"Unpicklable transcoding result: {e}")))
+
+class _Worker:
+    """A worker process and the parent's end of its pipe"""
+
+    def __init__(self, context):
+        self.connection, child = context.Pipe()
+        self.process = context.Process(target=_worker_main, args=(child,), name="image-transcoder", daemon=True)
+        self.process.start()
+        child.close()
+
+    def stop(self, wait: bool = False):
+        if self.process.is_alive():
+            self.process.terminate()
+        if wait:
+            self.process.join()
+        self.connection.close()
+
+class ImageTranscoder:
+    """Bounded pool of worker processes with per-job timeouts and crash isolation"""
+
+    def __init__(self, max_workers: Optional[int] = None, queue_size: int = 32, timeout: float = 60.0):
+        """
+        Args:
+            max_workers: Worker processes, defaults to the number of CPU cores
+            queue_size: Jobs allowed to wait for a free worker
+            timeout: Default seconds a job may run before its worker is killed
+        """
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.queue_size = max(0, queue_size)
+        self.timeout = timeout
+        # Spawn rather than fork: the parent runs event loops and threads
+        self._context = multiprocessing.get_context('spawn')
+        self._lock = threading.Lock()
+        self._workers: Set[_Worker] = set()
+        self._idle: List[_Worker] = []
+        self._free_slots = self.max_workers
+        # Jobs waiting for a slot, with the event loop each one waits on
+        self._waiters: Deque[Tuple[asyncio.AbstractEventLoop, asyncio.Future]] = deque()
+        # One thread per worker waits on its pipe
+        self._threads: Optional[ThreadPoolExecutor] = None
+        self.stats = {
+            'completed': 0,
+            'failed': 0,
+            'rejected': 0,
+            'timeouts': 0,
+            'crashes': 0,
+            'workers_replaced': 0
+        }
+
+    async def run(self, fn: Callable, *args, timeout: Optional[float] = None) -> Any:
+        """
+        Run fn(*args) in a worker process
+
+        fn and its arguments must be picklable, so fn has to be a
+        module-level function. Exceptions raised by fn are re-raised here.
+
+        Raises:
+            TranscoderBusyError: If the queue is full
+            TranscodeTimeoutError: If the job exceeded its timeout
+            TranscoderCrashedError: If the job crashed its worker
+        """
+        timeout = self.timeout if timeout is None else timeout
+        await self._acquire_slot()
+        try:
+            job = self._get_threads().submit(self._call, fn, args, timeout)
+        except BaseException:
+            self._release_slot()
+            raise
+        # Released once the job is over, even if the caller stops waiting for it
+        job.add_done_callback(lambda _: self._release_slot())
+        return await asyncio.wrap_future(job)
+
+    def shutdown(self, wait: bool = True):
+        """Stop the worker processes"""
+        with self._lock:
+            workers, self._workers, self._idle = self._workers, set(), []
+            threads, self._threads = self._threads, None
+        for worker in workers:
+            worker.stop(wait)
+        if threads is not None:
+            threads.shutdown(wait=False)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self.stats)
+            stats['waiting'] = len(self._waiters)
+            stats['workers'] = len(self._workers)
+        stats['max_workers'] = self.max_workers
+        stats['queue_size'] = self.queue_size
+        return stats
+
+    async def _acquire_slot(self):
+        """Wait for a free worker slot, shared by every event loop in the process"""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if self._free_slots > 0:
+                self._free_slots -= 1
+                return
+            if len(self._waiters) >= self.queue_size:
+                self.stats['rejected'] += 1
+                raise TranscoderBusyError(f"Image transcoding queue is full ({self.queue_size} waiting)")
+            waiter = loop.create_future()
+            self._waiters.append((loop, waiter))
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            with self._lock:
+                if (loop, waiter) in self._waiters:
+                    self._waiters.remove((loop, waiter))
+                    raise
+            # Cancelled after being handed a slot, which must be passed on
+            if waiter.done() and not waiter.cancelled():
+                self._release_slot()
+            raise
+
+    def _release_slot(self):
+        """Hand a worker slot to the longest waiting job, whichever loop it is on"""
+        with self._lock:
+            while self._waiters:
+                loop, waiter = self._waiters.popleft()
+                try:
+                    loop.call_soon_threadsafe(self._hand_over, waiter)
+                    return
+                except RuntimeError:
+                    # The waiter's event loop is closed
+                    continue
+            self._free_slots += 1
+
+    def _hand_over(self, waiter: asyncio.Future):
+        if waiter.done():
+            # The job was cancelled while the slot was on its way
+            self._release_slot()
+        else:
+            waiter.set_result(None)
+
+    def _call(self, fn: Callable, args, timeout: float) -> Any:
+        """Run a job in an idle worker, blocking the calling thread until it is done"""
+        worker = self._checkout()
+        healthy = False
+        try:
+            try:
+                worker.connection.send((fn, args))
+                finished = worker.connection.poll(timeout)
+                if finished:
+                    succeeded, result = worker.connection.recv()
+            except (EOFError, OSError):
+                self._count('crashes')
+                raise TranscoderCrashedError("Image transcoding worker crashed") from None
+            if not finished:
+                self._count('timeouts')
+                raise TranscodeTimeoutError(f"Image transcoding took longer than {timeout:.0f}s")
+            healthy = True
+        finally:
+            self._checkin(worker, healthy)
+        if not succeeded:
+            self._count('failed')
+            raise result
+        self._count('completed')
+        return result
+
+    def _checkout(self) -> _Worker:
+        with self._lock:
+            while self._idle:
+                worker = self._idle.pop()
+                if worker.process.is_alive():
+                    return worker
+                self._workers.discard(worker)
+        worker = _Worker(self._context)
+        with self._lock:
+            self._workers.add(worker)
+        return worker
+
+    def _checkin(self, worker: _Worker, healthy: bool):
+        """Return a worker to the pool, or kill it if its job hung or crashed it"""
+        with self._lock:
+            if healthy and worker in self._workers:
+                self._idle.append(worker)
+                return
+            if worker in self._workers:
+                self._workers.discard(worker)
+                self.stats['workers_replaced'] += 1
+                logger.warning("Replacing image transcoding worker")
+        # A running job cannot be interrupted, so its process is killed
+        worker.stop()
+
+    def _get_threads(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._threads is None:
+                self._threads = ThreadPoolExecutor(max_workers=self.max_workers,
+                                                   thread_name_prefix="image-transcoder")
+            return self._threads
+
+    def _count(self, name: str):
+        with self._lock:
+            self.stats[name] += 1
+
+_transcoder: Optional[ImageTranscoder] = None
+_transcoder_pid: Optional[int] = None
+_transcoder_lock = threading.Lock()
+
+def get_image_transcoder() -> ImageTranscoder:
+    """Get the process-wide transcoder, configured from the environment"""
+    global _transcoder, _transcoder_pid
+    with _transcoder_lock:
+        if _transcoder is None or _transcoder_pid != os.getpid():
+            from config import ImageTranscodeConfig
+            config = ImageTranscodeConfig.from_env()
+            _transcoder = ImageTranscoder(
+                max_workers=config.workers or None,
+                queue_size=config.queue_size,
+                timeout=config.timeout
+            )
+            _transcoder_pid = os.getpid()
+        return _transcoder
+
+def shutdown_image_transcoder():
+    """Stop the process-wide transcoder's workers if it was started in this process"""
+    global _transcoder
+    with _transcoder_lock:
+        transcoder, _transcoder = _transcoder, None
+    if transcoder is not None and _transcoder_pid == os.getpid():
+        transcoder.shutdown()
+
+atexit.register(shutdown_image_transcoder)
@@ -0,0 +1,121 @@
+# Copyright (C) 2025 iolaire mcfadden.
+# This program is free software: you can redistribute it and/or modify it under the terms of the GNU Affero General Public License as published by the Free Software Foundation, either version 3 of the License, or (at your option) any later version.
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+Instance Scheduler
+
+Runs platform connection jobs from a multi-user batch concurrently while
+staying polite to each ActivityPub instance. Jobs for different instances
+never wait on each other; jobs for the same instance are limited to a
+per-instance concurrency cap and spaced by the per-instance delay.
+"""
+
+import asyncio
+import logging
+import time
+from collections import defaultdict
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+from urllib.parse import urlparse
+
+logger = logging.getLogger(__name__)
+
+@dataclass
+class ScheduledJob:
+    """A unit of work bound to one ActivityPub instance"""
+    host: str
+    run: Callable[[], Awaitable[Any]]
+    name: str = ''
+
+class InstanceScheduler:
+    """Concurrent job scheduler with per-instance concurrency caps and politeness delays"""
+
+    def __init__(self, max_concurrent: int = 10, per_instance_concurrency: int = 1,
+                 per_instance_delay: float = 0.0):
+        """
+        Args:
+            max_concurrent: Maximum number of jobs running at once across all instances
+            per_instance_concurrency: Maximum number of jobs running at once per instance
+            per_instance_delay: Seconds between consecutive jobs on the same instance
+        """
+        self.max_concurrent = max(1, max_concurrent)
+        self.per_instance_concurrency = max(1, per_instance_concurrency)
+        self.per_instance_delay = max(0.0, per_instance_delay)
+
+        self._global_semaphore: Optional[asyncio.Semaphore] = None
+        self._instance_semaphores: Dict[str, asyncio.Semaphore] = {}
+        self._instance_locks: Dict[str, asyncio.Lock] = {}
+        self._next_start: Dict[str, float] = {}
+        self.stats = {
+            'jobs_completed': 0,
+            'jobs_failed': 0,
+            'politeness_wait_time': 0.0,
+            'max_concurrent_seen': 0,
+            'jobs_by_instance': defaultdict(int)
+        }
+        self._running = 0
+
+    @staticmethod
+    def instance_host(instance_url: Optional[str]) -> str:
+        """Normalize an instance URL to the host used as scheduling key"""
+        if not instance_url:
+            return 'unknown'
+        parsed = urlparse(instance_url if '://' in instance_url else f"https://{instance_url}")
+        return (parsed.netloc or parsed.path).lower()
+
+    async def run(self, jobs: List[ScheduledJob]) -> List[Any]:
+        """
+        Run all jobs and wait for them to finish.
+
+        Returns:
+            Job results in submission order; a job that raised is represented
+            by its exception.
+        """
+        self._global_semaphore = asyncio.Semaphore(self.max_concurrent)
+        tasks = [asyncio.create_task(self._run_job(job)) for job in jobs]
+        return await asyncio.gather(*tasks, return_exceptions=True)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get scheduler statistics"""
+        stats = dict(self.stats)
+        stats['jobs_by_instance'] = dict(self.stats['jobs_by_instance'])
+        return stats
+
+    async def _run_job(self, job: ScheduledJob) -> Any:
+        # Take the instance slot before the global one so a job waiting for
+        # a busy instance never holds a slot another instance could use.
+        async with self._instance_semaphore(job.host):
+            await self._wait_for_turn(job.host)
+            async with self._global_semaphore:
+                self._running += 1
+                self.stats['max_concurrent_seen'] = max(self.stats['max_concurrent_seen'], self._running)
+                try:
+                    result = await job.run()
+                    self.stats['jobs_completed'] += 1
+                    return result
+                except Exception:
+                    self.stats['jobs_failed'] += 1
+                    raise
+                finally:
+                    self._running -= 1
+                    self.stats['jobs_by_instance'][job.host] += 1
+                    self._next_start[job.host] = max(self._next_start.get(job.host, 0.0),
+                                                     time.monotonic() + self.per_instance_delay)
+
+    def _instance_semaphore(self, host: str) -> asyncio.Semaphore:
+        if host not in self._instance_semaphores:
+            self._instance_semaphores[host] = asyncio.Semaphore(self.per_instance_concurrency)
+        return self._instance_semaphores[host]
+
+    async def _wait_for_turn(self, host: str):
+        """Apply the politeness delay between jobs on the same instance"""
+        if host not in self._instance_locks:
+            self._instance_locks[host] = asyncio.Lock()
+
+        async with self._instance_locks[host]:
+            wait_time = self._next_start.get(host, 0.0) - time.monotonic()
+            if wait_time > 0:
+                logger.info(f"Waiting {wait_time:.1f} seconds before next job on {host}")
+                self.stats['politeness_wait_time'] += wait_time
+                await asyncio.sleep(wait_time)
+            self._next_start[host] = time.monotonic() + self.per_instance_delay
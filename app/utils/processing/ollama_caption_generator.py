@@ -7,10 +7,14 @@ import os
 import httpx
 import base64
 import json
+import re
 import time
 from PIL import Image
-from typing import Optional, List, Dict, Tuple, Any
+from typing import Optional, List, Dict, Tuple, Any, Callable
 import asyncio
+from app.utils.processing.adaptive_concurrency import AdaptiveConcurrencyLimiter
+from app.utils.processing.caption_cache import CaptionCache, caption_cache_key
+from app.utils.processing.ollama_endpoint_pool import OllamaEndpointPool, OllamaEndpoint
 from app.utils.processing.caption_quality_assessment import SimpleCaptionQualityAssessor
 from app.utils.processing.caption_formatter import CaptionFormatter
 from app.utils.processing.caption_fallback import CaptionFallbackManager
@@ -18,6 +22,9 @@ from app.utils.helpers.utils import get_retry_stats_summary
 
 logger = logging.getLogger(__name__)
 
+# Appended to every caption by _clean_caption
+AI_SUFFIX = " (AI-generated)"
+
 class OllamaCaptionGenerator:
     """Generate image captions using Ollama with llava:7b model"""
     
@@ -33,6 +40,18 @@ class OllamaCaptionGenerator:
         self.fallback_manager = CaptionFallbackManager(config.fallback, config.caption)
         self.model_info = None
         self.connection_validated = False
+        self.stream = config.stream
+        self.max_connections = config.max_connections
+        self.max_concurrent_requests = config.max_concurrent_requests
+        self.caption_cache = (CaptionCache.from_config(config.cache)
+                              if config.cache is not None and config.cache.enabled else None)
+        self.endpoint_pool = OllamaEndpointPool(
+            config.urls or [self.ollama_url],
+            failure_threshold=config.endpoint_failure_threshold,
+            ejection_time=config.endpoint_ejection_time
+        )
+        self._client: Optional[httpx.AsyncClient] = None
+        self._client_loop = None
         self.retry_stats = {
             "attempts": 0,
             "successes": 0,
@@ -46,20 +65,81 @@ class OllamaCaptionGenerator:
             "simplified_prompt_used": 0,
             "backup_model_used": 0
         }
+        self.stream_stats = {
+            "streamed_requests": 0,
+            "early_stops": 0
+        }
+    
+    def _get_client(self) -> httpx.AsyncClient:
+        """
+        Get the shared HTTP client, creating it on first use
+        
+        The client keeps connections to Ollama alive between requests. It is
+        bound to the event loop it was created on, so callers that run each
+        request in a fresh loop (e.g. the web routes) get a new client, and
+        the previous one is closed on its own loop. Its connections cannot be
+        closed once that loop has been closed, so such callers call close()
+        before their loop ends.
+        """
+        loop = asyncio.get_running_loop()
+        if self._client is not None and self._client_loop is not loop:
+            self._close_on_own_loop(self._client, self._client_loop)
+            self._client = None
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                timeout=self.timeout,
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_connections
+                )
+            )
+            self._client_loop = loop
+        return self._client
+    
+    @staticmethod
+    def _close_on_own_loop(client: httpx.AsyncClient, loop):
+        """Close a client of another event loop, unless that loop is already closed"""
+        if client.is_closed or loop is None or loop.is_closed():
+            return
+        closing = client.aclose()
+        try:
+            asyncio.run_coroutine_threadsafe(closing, loop)
+        except RuntimeError as e:
+            # The loop was closed in the meantime
+            closing.close()
+            logger.debug(f"Could not close Ollama HTTP client cleanly: {e}")
+    
+    async def close(self):
+        """Close the shared HTTP client"""
+        client, self._client = self._client, None
+        if client is None or client.is_closed:
+            return
+        if self._client_loop is not asyncio.get_running_loop():
+            self._close_on_own_loop(client, self._client_loop)
+            return
+        await client.aclose()
     
     async def initialize(self):
         """Initialize connection to Ollama and validate model availability"""
         try:
-            logger.info(f"Connecting to Ollama at {self.ollama_url}")
+            logger.info(f"Connecting to Ollama at {', '.join(self.endpoint_pool.urls)}")
             logger.info(f"Using model: {self.model_name}")
             logger.info(f"Connection timeout: {self.timeout}s")
             logger.info(f"Model context size: {self.config.context_size}")
             
-            # Test connection to Ollama API
-            await self._validate_connection()
+            # Test connection and model availability on every endpoint; only
+            # fail if none of them can be reached
+            last_error = None
+            for endpoint in self.endpoint_pool.endpoints:
+                try:
+                    await self._check_endpoint(endpoint)
+                except Exception as e:
+                    last_error = e
+                    if len(self.endpoint_pool.endpoints) > 1:
+                        logger.warning(f"Ollama endpoint {endpoint.url} is unavailable: {e}")
             
-            # Check if the specified model is available
-            await self._validate_model()
+            if last_error is not None and self.endpoint_pool.healthy_count() == 0:
+                raise last_error
             
             self.connection_validated = True
             logger.info(f"Successfully connected to Ollama and validated model {self.model_name}")
@@ -76,56 +156,110 @@ class OllamaCaptionGenerator:
             logger.error(f"Failed to initialize Ollama caption generator: {e}")
             raise
     
-    async def _validate_connection(self):
+    async def _check_endpoint(self, endpoint: OllamaEndpoint) -> bool:
+        """
+        Health check one endpoint and eject or re-admit it accordingly
+        
+        Returns:
+            True if the endpoint is reachable and has the model
+        
+        Raises:
+            The connection error if the endpoint cannot be reached
+        """
+        try:
+            await self._validate_connection(endpoint.url)
+            model_available = await self._validate_model(endpoint.url)
+        except Exception as e:
+            self.endpoint_pool.mark_unhealthy(endpoint, str(e))
+            raise
+        
+        if model_available:
+            self.endpoint_pool.mark_healthy(endpoint)
+        else:
+            self.endpoint_pool.mark_unhealthy(endpoint, f"Model {self.model_name} not available")
+        return model_available
+    
+    async def check_endpoints(self) -> Dict[str, Any]:
+        """
+        Health check every endpoint
+        
+        Returns:
+            Endpoint pool statistics after the checks
+        """
+        async def check(endpoint: OllamaEndpoint):
+            try:
+                await self._check_endpoint(endpoint)
+            except Exception as e:
+                logger.debug(f"Health check failed for Ollama endpoint {endpoint.url}: {e}")
+        
+        await asyncio.gather(*(check(endpoint) for endpoint in self.endpoint_pool.endpoints))
+        return self.endpoint_pool.get_stats()
+    
+    async def _readmit_endpoints(self):
+        """Re-check ejected endpoints whose cool-down has passed"""
+        for endpoint in self.endpoint_pool.due_for_check():
+            try:
+                await self._check_endpoint(endpoint)
+            except Exception as e:
+                logger.debug(f"Ollama endpoint {endpoint.url} still unavailable: {e}")
+    
+    async def _validate_connection(self, url: Optional[str] = None):
         """Validate connection to Ollama API"""
+        url = url or self.ollama_url
         try:
-            async with httpx.AsyncClient(timeout=self.timeout) as client:
-                response = await client.get(f"{self.ollama_url}/api/tags")
-                response.raise_for_status()
-                
-                # Log available models
-                models = response.json().get("models", [])
-                if models:
-                    logger.info(f"Available models on Ollama server: {', '.join([m.get('name', 'unknown') for m in models])}")
-                else:
-                    logger.warning("No models found on Ollama server")
-                
+            response = await self._get_client().get(f"{url}/api/tags")
+            response.raise_for_status()
+            
+            # Log available models
+            models = response.json().get("models", [])
+            if models:
+                logger.info(f"Available models on Ollama server: {', '.join([m.get('name', 'unknown') for m in models])}")
+            else:
+                logger.warning("No models found on Ollama server")
+            
         except Exception as e:
             logger.error(f"Failed to validate connection to Ollama: {e}")
             raise
     
-    async def _validate_model(self):
-        """Validate that the specified model is available"""
+    async def _validate_model(self, url: Optional[str] = None) -> bool:
+        """
+        Validate that the specified model is available
+        
+        Returns:
+            True if the model is listed by the server
+        """
+        url = url or self.ollama_url
         try:
-            async with httpx.AsyncClient(timeout=self.timeout) as client:
-                # Check if model exists using the tags endpoint
-                response = await client.get(f"{self.ollama_url}/api/tags")
-                response.raise_for_status()
-                
-                models_data = response.json()
-                models = models_data.get("models", [])
-                
-                # Check if our model is in the list of available models
-                model_exists = any(m.get('name') == self.model_name for m in models)
-                
-                if not model_exists:
-                    logger.warning(f"Model {self.model_name} not found in available models")
-                    logger.info(f"You may need to pull the model using: ollama pull {self.model_name}")
+            # Check if model exists using the tags endpoint
+            response = await self._get_client().get(f"{url}/api/tags")
+            response.raise_for_status()
+            
+            models_data = response.json()
+            models = models_data.get("models", [])
+            
+            # Check if our model is in the list of available models
+            model_exists = any(m.get('name') == self.model_name for m in models)
+            
+            if not model_exists:
+                logger.warning(f"Model {self.model_name} not found in available models")
+                logger.info(f"You may need to pull the model using: ollama pull {self.model_name}")
+            else:
+                # Model exists, set basic info
+                matching_model = next((m for m in models if m.get('name') == self.model_name), None)
+                if matching_model:
+                    self.model_info = matching_model
+                    logger.info(f"Model {self.model_name} is available")
+                    
+                    # Log model details if available
+                    if self.model_info:
+                        model_size = self.model_info.get("size", "unknown")
+                        model_modified = self.model_info.get("modified_at", "unknown")
+                        logger.info(f"Model details - Size: {model_size}, Last modified: {model_modified}")
                 else:
-                    # Model exists, set basic info
-                    matching_model = next((m for m in models if m.get('name') == self.model_name), None)
-                    if matching_model:
-                        self.model_info = matching_model
-                        logger.info(f"Model {self.model_name} is available")
-                        
-                        # Log model details if available
-                        if self.model_info:
-                            model_size = self.model_info.get("size", "unknown")
-                            model_modified = self.model_info.get("modified_at", "unknown")
-                            logger.info(f"Model details - Size: {model_size}, Last modified: {model_modified}")
-                    else:
-                        logger.info(f"Model {self.model_name} is available but details could not be retrieved")
-                
+                    logger.info(f"Model {self.model_name} is available but details could not be retrieved")
+            
+            return model_exists
+            
         except Exception as e:
             logger.error(f"Failed to validate model {self.model_name}: {e}")
             raise
@@ -141,6 +275,17 @@ class OllamaCaptionGenerator:
         if self.fallback_stats["fallback_attempts"] > 0:
             logger.info("Fallback mechanism statistics:")
             logger.info(self.get_fallback_stats_summary())
+        
+        # Log streaming statistics
+        if self.stream_stats["streamed_requests"] > 0:
+            logger.info(f"Streamed caption requests: {self.stream_stats['streamed_requests']}, "
+                        f"stopped early: {self.stream_stats['early_stops']}")
+        
+        # Log caption cache statistics
+        cache_stats = self.get_cache_stats()
+        if cache_stats and cache_stats['hits'] + cache_stats['misses'] > 0:
+            logger.info(f"Caption cache: {cache_stats['hits']} hits, {cache_stats['misses']} misses "
+                        f"({cache_stats['hit_rate']:.1f}% hit rate), {cache_stats['evictions']} evictions")
             
         logger.info("Ollama caption generator cleanup completed")
         
@@ -180,20 +325,73 @@ class OllamaCaptionGenerator:
             
         return "\n".join(summary)
     
-    async def generate_caption(self, image_path: str, prompt: str = None) -> Optional[Tuple[str, Dict[str, Any]]]:
-        """Generate caption for an image using Ollama with retry and fallback logic"""
-        start_time = time.time()
-        original_model = self.model_name
+    async def generate_caption(self, image_path: str, prompt: str = None,
+                               on_token: Optional[Callable[[str], Any]] = None,
+                               use_cache: bool = True) -> Optional[Tuple[str, Dict[str, Any]]]:
+        """
+        Generate caption for an image using Ollama with retry and fallback logic
         
+        Args:
+            image_path: Path to the image file
+            prompt: Optional prompt, a general description prompt is used if None
+            on_token: Optional callback (sync or async) called with the partial
+                caption text as tokens arrive; passing it enables streaming
+            use_cache: Reuse a cached caption for identical image content; when
+                False a new caption is generated and replaces the cached one
+        """
         # Load and encode image once for all attempts
         try:
             with open(image_path, "rb") as image_file:
-                image_data = base64.b64encode(image_file.read()).decode('utf-8')
+                image_bytes = image_file.read()
+            image_data = base64.b64encode(image_bytes).decode('utf-8')
             logger.debug(f"Successfully loaded and encoded image: {image_path}")
         except Exception as e:
             logger.error(f"Failed to load image {image_path}: {e}")
             return None
         
+        # Use a general prompt if none provided
+        if prompt is None:
+            prompt = "Describe this image in detail for someone who cannot see it. Focus on the main subjects, their actions, the setting, colors, and any important details that would help someone understand what's happening in the image."
+            logger.info(f"Using general prompt for image {image_path}")
+        else:
+            logger.info(f"Using provided prompt for image {image_path}")
+        
+        # Reuse the caption of an identical image seen before
+        cache_key = None
+        if self.caption_cache is not None:
+            try:
+                cache_key = caption_cache_key(image_bytes, self.model_name, prompt, self.caption_formatter.VERSION)
+                cached = await asyncio.to_thread(self.caption_cache.get, cache_key) if use_cache else None
+            except Exception as e:
+                logger.warning(f"Caption cache unavailable for {image_path}: {e}")
+                cache_key = cached = None
+            
+            if cached is not None:
+                logger.info(f"Reusing cached caption for identical image content: {image_path}")
+                if on_token is not None:
+                    await self._notify_token(on_token, cached[0])
+                return cached
+        
+        result, model_name, used_prompt = await self._generate_uncached(image_path, image_data, prompt, on_token)
+        
+        if cache_key is not None and result is not None and result[0]:
+            # Fallback captions are stored under the model and prompt that produced them
+            if (model_name, used_prompt) != (self.model_name, prompt):
+                cache_key = caption_cache_key(image_bytes, model_name, used_prompt, self.caption_formatter.VERSION)
+            await asyncio.to_thread(self.caption_cache.set, cache_key, result[0], result[1])
+        
+        return result
+    
+    async def _generate_uncached(self, image_path: str, image_data: str, prompt: str,
+                                 on_token: Optional[Callable[[str], Any]] = None) -> Tuple[Optional[Tuple[str, Dict[str, Any]]], str, str]:
+        """
+        Generate a caption with the primary model and prompt, then the fallback mechanisms
+        
+        Returns:
+            The (caption, quality_metrics) result, or None, with the model and prompt that produced it
+        """
+        original_model = self.model_name
+        
         # Ensure connection is validated before proceeding
         if not self.connection_validated:
             try:
@@ -201,21 +399,15 @@ class OllamaCaptionGenerator:
                 await self.initialize()
             except Exception as e:
                 logger.error(f"Failed to initialize Ollama connection: {e}")
-                return None
-        
-        # Use a general prompt if none provided
-        if prompt is None:
-            prompt = "Describe this image in detail for someone who cannot see it. Focus on the main subjects, their actions, the setting, colors, and any important details that would help someone understand what's happening in the image."
-            logger.info(f"Using general prompt for image {image_path}")
-        else:
-            logger.info(f"Using provided prompt for image {image_path}")
+                return None, self.model_name, prompt
         
         # Try with primary model and prompt first
         result = await self._try_generate_caption(
             image_path=image_path,
             image_data=image_data,
             model_name=self.model_name,
-            prompt=prompt
+            prompt=prompt,
+            on_token=on_token
         )
         
         # If primary attempt succeeded, return the result
@@ -224,7 +416,7 @@ class OllamaCaptionGenerator:
             
             # Check if we should use fallback based on quality
             if not self.fallback_manager.should_use_fallback(quality_metrics=quality_metrics):
-                return result
+                return result, self.model_name, prompt
             
             logger.info(f"Primary caption generation succeeded but quality is low. Trying fallback mechanisms.")
         else:
@@ -271,24 +463,25 @@ class OllamaCaptionGenerator:
                     image_path=image_path,
                     image_data=image_data,
                     model_name=current_model,
-                    prompt=current_prompt
+                    prompt=current_prompt,
+                    on_token=on_token
                 )
                 
                 # If fallback succeeded, return the result
                 if fallback_result is not None and fallback_result[0] is not None:
                     self.fallback_stats["fallback_successes"] += 1
                     logger.info(f"Fallback caption generation succeeded on attempt {fallback_attempt}")
-                    return fallback_result
+                    return fallback_result, current_model, current_prompt
             
             # All fallback attempts failed
             self.fallback_stats["fallback_failures"] += 1
             logger.error(f"All fallback attempts failed for {image_path}")
         
         # If we got here, all attempts (primary and fallbacks) failed
-        return None
+        return None, self.model_name, prompt
     
     async def _try_generate_caption(self, image_path: str, image_data: str, model_name: str, 
-                                   prompt: str) -> Optional[Tuple[str, Dict[str, Any]]]:
+                                   prompt: str, on_token: Optional[Callable[[str], Any]] = None) -> Optional[Tuple[str, Dict[str, Any]]]:
         """
         Try to generate a caption with specific model and prompt
         
@@ -297,6 +490,7 @@ class OllamaCaptionGenerator:
             image_data: Base64-encoded image data
             model_name: Model name to use
             prompt: Prompt to use
+            on_token: Optional callback for partial captions, enables streaming
             
         Returns:
             Tuple of (caption, quality_metrics) or None if failed
@@ -327,6 +521,7 @@ class OllamaCaptionGenerator:
         jitter = self.retry_config.jitter if self.retry_config else True
         jitter_factor = self.retry_config.jitter_factor if self.retry_config else 0.1
         
+        stream = self.stream or on_token is not None
         attempt = 0
         last_error = None
         
@@ -337,47 +532,41 @@ class OllamaCaptionGenerator:
             try:
                 logger.debug(f"Caption generation attempt {attempt}/{max_attempts} for {image_path}")
                 
-                async with httpx.AsyncClient(timeout=self.timeout) as client:
-                    response = await client.post(
-                        f"{self.ollama_url}/api/generate",
-                        json=payload
-                    )
-                    response.raise_for_status()
-                    
-                    result = response.json()
-                    generated_text = result.get('response', '').strip()
-                    
-                    # Log model performance metrics if available
-                    if 'eval_count' in result:
-                        logger.debug(f"Model metrics - Eval count: {result.get('eval_count')}, " +
-                                    f"Eval duration: {result.get('eval_duration', 0)}ms")
-                    
-                    # Clean up the caption
-                    caption = self._clean_caption(generated_text)
-                    
-                    # Log the generated caption
-                    logger.info(f"Generated caption: {caption[:100]}...")
-                    
-                    # Assess caption quality
-                    quality_metrics = self.assess_caption_quality(
-                        caption=caption,
-                        prompt_used=prompt
-                    )
-                    
-                    logger.info(f"Caption quality score: {quality_metrics['overall_score']}/100 ({quality_metrics['quality_level']})")
-                    if quality_metrics['needs_review']:
-                        logger.warning(f"Caption flagged for special review: {quality_metrics['feedback']}")
-                    
-                    # Update retry stats
-                    self.retry_stats["successes"] += 1
-                    
-                    # Log performance
-                    duration = time.time() - start_time
-                    logger.debug(f"Caption generation for {image_path} completed in {duration:.2f}s")
-                    
-                    # Return caption with quality metrics
-                    return caption, quality_metrics
-                    
+                result = await self._send_generate(payload, stream, on_token)
+                
+                generated_text = result.get('response', '').strip()
+                
+                # Log model performance metrics if available
+                if 'eval_count' in result:
+                    logger.debug(f"Model metrics - Eval count: {result.get('eval_count')}, " +
+                                f"Eval duration: {result.get('eval_duration', 0)}ms")
+                
+                # Clean up the caption
+                caption = self._clean_caption(generated_text)
+                
+                # Log the generated caption
+                logger.info(f"Generated caption: {caption[:100]}...")
+                
+                # Assess caption quality
+                quality_metrics = self.assess_caption_quality(
+                    caption=caption,
+                    prompt_used=prompt
+                )
+                
+                logger.info(f"Caption quality score: {quality_metrics['overall_score']}/100 ({quality_metrics['quality_level']})")
+                if quality_metrics['needs_review']:
+                    logger.warning(f"Caption flagged for special review: {quality_metrics['feedback']}")
+                
+                # Update retry stats
+                self.retry_stats["successes"] += 1
+                
+                # Log performance
+                duration = time.time() - start_time
+                logger.debug(f"Caption generation for {image_path} completed in {duration:.2f}s")
+                
+                # Return caption with quality metrics
+                return caption, quality_metrics
+                
             except (httpx.ConnectError, httpx.TimeoutException) as e:
                 last_error = e
                 logger.warning(f"Connection error on attempt {attempt}/{max_attempts}: {e}")
@@ -434,6 +623,108 @@ class OllamaCaptionGenerator:
         
         return None
     
+    async def _send_generate(self, payload: Dict[str, Any], stream: bool,
+                             on_token: Optional[Callable[[str], Any]] = None) -> Dict[str, Any]:
+        """
+        Send a generate request to the least busy healthy endpoint
+        
+        Server errors and connection failures count against the endpoint and
+        can get it ejected; the retry loop then fails over to another one.
+        """
+        await self._readmit_endpoints()
+        endpoint = self.endpoint_pool.acquire()
+        start_time = time.monotonic()
+        try:
+            if stream:
+                result = await self._stream_generate(endpoint.url, payload, on_token)
+            else:
+                response = await self._get_client().post(
+                    f"{endpoint.url}/api/generate",
+                    json=payload
+                )
+                response.raise_for_status()
+                result = response.json()
+        except httpx.HTTPStatusError as e:
+            # Client errors are caused by the request, not the endpoint
+            self.endpoint_pool.release(endpoint, success=e.response.status_code < 500, error=str(e))
+            raise
+        except asyncio.CancelledError:
+            self.endpoint_pool.release(endpoint)
+            raise
+        except Exception as e:
+            self.endpoint_pool.release(endpoint, success=False, error=str(e) or type(e).__name__)
+            raise
+        
+        self.endpoint_pool.release(endpoint, latency=time.monotonic() - start_time)
+        return result
+    
+    async def _stream_generate(self, url: str, payload: Dict[str, Any],
+                               on_token: Optional[Callable[[str], Any]] = None) -> Dict[str, Any]:
+        """
+        Send a generate request to an endpoint in streaming mode
+        
+        Ollama streams newline-delimited JSON chunks. Generation is stopped as
+        soon as the text that _clean_caption would keep is complete: once the
+        first line ends, or once it is longer than the caption length limit
+        and would be truncated anyway. Closing the stream makes Ollama stop
+        generating, which saves the GPU time for the discarded tokens.
+        
+        Returns:
+            Dictionary shaped like a non-streaming /api/generate response
+        """
+        self.stream_stats["streamed_requests"] += 1
+        max_length = self._caption_length_limit()
+        text = ""
+        result: Dict[str, Any] = {}
+        
+        async with self._get_client().stream(
+            "POST",
+            f"{url}/api/generate",
+            json={**payload, "stream": True}
+        ) as response:
+            response.raise_for_status()
+            
+            async for line in response.aiter_lines():
+                if not line.strip():
+                    continue
+                chunk = json.loads(line)
+                if chunk.get('error'):
+                    raise RuntimeError(f"Ollama stream error: {chunk['error']}")
+                
+                text += chunk.get('response', '')
+                if on_token is not None:
+                    await self._notify_token(on_token, text)
+                
+                if chunk.get('done'):
+                    result = chunk
+                    break
+                
+                # Only the first line survives cleaning; stop once it is
+                # finished or already over the length limit
+                caption = text.lstrip()
+                first_line = caption.split('\n', 1)[0]
+                if re.search(r'\n\s*\S', caption) or len(first_line.rstrip()) > max_length:
+                    self.stream_stats["early_stops"] += 1
+                    logger.debug(f"Stopping caption stream early after {len(text)} characters")
+                    break
+        
+        result['response'] = text
+        return result
+    
+    async def _notify_token(self, on_token: Callable[[str], Any], text: str):
+        """Pass partial caption text to a token callback without failing generation"""
+        try:
+            callback_result = on_token(text)
+            if asyncio.iscoroutine(callback_result):
+                await callback_result
+        except Exception as e:
+            logger.debug(f"Caption token callback failed: {e}")
+    
+    def _caption_length_limit(self) -> int:
+        """Maximum caption length before the AI-generated suffix is appended"""
+        max_length = self.config.caption.max_length if self.config.caption else int(os.getenv("CAPTION_MAX_LENGTH", "500"))
+        return max_length - len(AI_SUFFIX)
+    
     def _clean_caption(self, caption: str) -> str:
         """Clean and format the generated caption"""
         # Remove common artifacts
@@ -443,12 +734,9 @@ class OllamaCaptionGenerator:
         lines = caption.split('\n')
         caption = lines[0] if lines else caption
         
-        # Basic cleaning before passing to formatter
-        max_length = self.config.caption.max_length if self.config.caption else int(os.getenv("CAPTION_MAX_LENGTH", "500"))
-        
-        # Reserve space for "(AI-generated)" suffix (15 characters)
-        ai_suffix = " (AI-generated)"
-        effective_max_length = max_length - len(ai_suffix)
+        # Basic cleaning before passing to formatter, reserving space for
+        # the "(AI-generated)" suffix (15 characters)
+        effective_max_length = self._caption_length_limit()
         
         if len(caption) > effective_max_length:
             # Try to cut at a sentence boundary
@@ -468,35 +756,75 @@ class OllamaCaptionGenerator:
         logger.debug(f"Caption after enhanced formatting: {formatted_caption}")
         
         # Append AI-generated suffix
-        final_caption = formatted_caption + ai_suffix
+        final_caption = formatted_caption + AI_SUFFIX
         logger.debug(f"Final caption with AI-generated suffix: {final_caption}")
         
         return final_caption
     
-    async def generate_multiple_captions(self, image_paths: List[str]) -> List[Tuple[Optional[str], Optional[Dict[str, Any]]]]:
-        """Generate captions for multiple images
+    async def generate_multiple_captions(self, image_paths: List[str], prompt: str = None,
+                                         max_concurrency: Optional[int] = None
+                                         ) -> Tuple[List[Tuple[Optional[str], Optional[Dict[str, Any]]]], Dict[str, Any]]:
+        """Generate captions for multiple images concurrently
+        
+        Up to max_concurrency requests (default: OLLAMA_MAX_CONCURRENT_REQUESTS)
+        run at once. The effective limit starts at one and adapts to observed
+        latency, so a server with OLLAMA_NUM_PARALLEL > 1 is kept busy while a
+        single-slot server is not flooded with queued requests. Failed
+        requests lower the limit.
         
         Returns:
-            List of tuples containing (caption, quality_metrics) for each image
+            The (caption, quality_metrics) tuple of each image, in input
+            order, with both None for images that failed; and the batch
+            statistics: the limiter statistics, and in 'items' the path,
+            duration and error of each image in input order
         """
-        results = []
+        items = [{'path': path, 'duration': 0.0, 'error': None} for path in image_paths]
+        if not image_paths:
+            return [], {'items': items}
         
-        for image_path in image_paths:
-            result = await self.generate_caption(image_path)
-            
-            # Handle both new format (caption, quality_metrics) and old format (just caption)
-            if isinstance(result, tuple) and len(result) == 2:
-                caption, quality_metrics = result
-            else:
-                caption = result
-                quality_metrics = None
-                
-            results.append((caption, quality_metrics))
+        if max_concurrency is None:
+            max_concurrency = self.max_concurrent_requests
+        limiter = AdaptiveConcurrencyLimiter(max_limit=min(max_concurrency, len(image_paths)))
+        
+        # Initialize once up front instead of racing from every request
+        if not self.connection_validated:
+            try:
+                await self.initialize()
+            except Exception as e:
+                logger.error(f"Failed to initialize Ollama connection: {e}")
+        
+        async def caption_one(index: int, image_path: str) -> Tuple[Optional[str], Optional[Dict[str, Any]]]:
+            await limiter.acquire()
+            # Timed from acquiring a request slot, so queueing in the limiter is not counted
+            start_time = time.monotonic()
+            caption, quality_metrics = None, None
+            try:
+                result = await self.generate_caption(image_path, prompt)
+                # Handle both new format (caption, quality_metrics) and old format (just caption)
+                if isinstance(result, tuple) and len(result) == 2:
+                    caption, quality_metrics = result
+                else:
+                    caption = result
+                if caption is None:
+                    items[index]['error'] = "No caption generated"
+            except Exception as e:
+                logger.error(f"Caption generation failed for {image_path}: {e}")
+                items[index]['error'] = str(e)
+            finally:
+                items[index]['duration'] = time.monotonic() - start_time
+                # A failed request counts as overload and lowers the limit
+                await limiter.release(items[index]['duration'], success=caption is not None)
             
-            # Small delay to prevent overwhelming Ollama
-            await asyncio.sleep(0.5)
+            return caption, quality_metrics
+        
+        batch_start = time.monotonic()
+        results = await asyncio.gather(*(caption_one(index, path) for index, path in enumerate(image_paths)))
+        
+        limiter_stats = limiter.get_stats()
+        logger.info(f"Generated {sum(1 for caption, _ in results if caption)}/{len(results)} captions in "
+                    f"{time.monotonic() - batch_start:.2f}s (concurrency reached {limiter_stats['max_limit_reached']})")
         
-        return results
+        return list(results), {**limiter_stats, 'items': items}
 
     def get_retry_stats(self) -> Dict[str, Any]:
         """
@@ -571,28 +899,29 @@ class OllamaCaptionGenerator:
         Test connection to Ollama service
         
         Returns:
-            bool: True if connection is successful
+            bool: True if any endpoint can be reached
         """
-        try:
-            async with httpx.AsyncClient(timeout=5.0) as client:
-                response = await client.get(f"{self.ollama_url}/api/tags")
-                return response.status_code == 200
-        except Exception as e:
-            logger.debug(f"Connection test failed: {e}")
-            return False
+        for url in self.endpoint_pool.urls:
+            try:
+                response = await self._get_client().get(f"{url}/api/tags", timeout=5.0)
+                if response.status_code == 200:
+                    return True
+            except Exception as e:
+                logger.debug(f"Connection test failed for {url}: {e}")
+        return False
     
     async def test_model_availability(self) -> bool:
         """
         Test if the configured model is available
         
         Returns:
-            bool: True if model is available
+            bool: True if any endpoint has the model
         """
-        try:
-            async with httpx.AsyncClient(timeout=10.0) as client:
-                response = await client.get(f"{self.ollama_url}/api/tags")
+        for url in self.endpoint_pool.urls:
+            try:
+                response = await self._get_client().get(f"{url}/api/tags", timeout=10.0)
                 if response.status_code != 200:
-                    return False
+                    continue
                 
                 data = response.json()
                 models = data.get('models', [])
@@ -602,8 +931,24 @@ class OllamaCaptionGenerator:
                     if model.get('name', '').startswith(self.model_name):
                         return True
                 
-                return False
-                
-        except Exception as e:
-            logger.debug(f"Model availability test failed: {e}")
-            return False
\ No newline at end of file
+            except Exception as e:
+                logger.debug(f"Model availability test failed for {url}: {e}")
+        return False
+    
+    def get_cache_stats(self) -> Optional[Dict[str, Any]]:
+        """
+        Get caption cache hit-rate statistics
+        
+        Returns:
+            Dictionary with cache statistics or None if the cache is disabled
+        """
+        return self.caption_cache.get_stats() if self.caption_cache is not None else None
+    
+    def get_endpoint_stats(self) -> Dict[str, Any]:
+        """
+        Get routing, health and latency statistics for each Ollama endpoint
+        
+        Returns:
+            Dictionary with per-endpoint statistics
+        """
+        return self.endpoint_pool.get_stats()
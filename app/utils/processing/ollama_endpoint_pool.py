@@ -0,0 +1,219 @@
+# Copyright (C) 2025 iolaire mcfadden.
+# This program is free software: you can redistribute it and/or modify it under the terms of the GNU Affero General Public License as published by the Free Software Foundation, either version 3 of the License, or (at your option) any later version.
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+Ollama Endpoint Pool
+
+Routes caption requests across several Ollama servers. Requests go to the
+healthy endpoint with the fewest outstanding requests. An endpoint that
+fails repeatedly is ejected for a cool-down period and re-admitted once a
+health check passes again. Per-endpoint latency histograms are kept for the
+AI service monitor.
+"""
+
+import bisect
+import logging
+import threading
+import time
+import weakref
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds in seconds; caption requests range from sub-second on a GPU
+# to minutes on a CPU-only box
+LATENCY_BUCKETS = (0.5, 1.0, 2.0, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0, float('inf'))
+
+class LatencyHistogram:
+    """Fixed-bucket latency histogram"""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * len(self.buckets)
+        self.count = 0
+        self.total = 0.0
+
+    def record(self, latency: float):
+        self.counts[bisect.bisect_left(self.buckets, latency)] += 1
+        self.count += 1
+        self.total += latency
+
+    def merge(self, other: "LatencyHistogram"):
+        """Add the samples of another histogram with the same buckets"""
+        for i, bucket_count in enumerate(other.counts):
+            self.counts[i] += bucket_count
+        self.count += other.count
+        self.total += other.total
+
+    def percentile(self, percentile: float) -> Optional[float]:
+        """Upper bound of the bucket containing the given percentile"""
+        if self.count == 0:
+            return None
+        target = self.count * percentile / 100.0
+        seen = 0
+        for bound, bucket_count in zip(self.buckets, self.counts):
+            seen += bucket_count
+            if seen >= target:
+                return bound
+        return self.buckets[-1]
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'count': self.count,
+            'mean': self.total / self.count if self.count else None,
+            'p50': self.percentile(50),
+            'p95': self.percentile(95),
+            'buckets': {('+Inf' if bound == float('inf') else str(bound)): bucket_count
+                        for bound, bucket_count in zip(self.buckets, self.counts)}
+        }
+
+@dataclass
+class OllamaEndpoint:
+    """State of a single Ollama server in the pool"""
+    url: str
+    healthy: bool = True
+    outstanding: int = 0
+    consecutive_failures: int = 0
+    ejected_until: float = 0.0
+    checking: bool = False
+    requests: int = 0
+    failures: int = 0
+    ejections: int = 0
+    last_error: Optional[str] = None
+    latency: LatencyHistogram = field(default_factory=LatencyHistogram)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'url': self.url,
+            'healthy': self.healthy,
+            'outstanding': self.outstanding,
+            'requests': self.requests,
+            'failures': self.failures,
+            'ejections': self.ejections,
+            'consecutive_failures': self.consecutive_failures,
+            'last_error': self.last_error,
+            'latency': self.latency.to_dict()
+        }
+
+# Pools created in this process, read by the AI service monitor
+_pools: "weakref.WeakSet[OllamaEndpointPool]" = weakref.WeakSet()
+
+def get_endpoint_pools() -> List["OllamaEndpointPool"]:
+    """Get all live endpoint pools in this process"""
+    return list(_pools)
+
+class OllamaEndpointPool:
+    """Least-outstanding-requests routing across Ollama endpoints with ejection"""
+
+    def __init__(self, urls: List[str], failure_threshold: int = 3, ejection_time: float = 30.0):
+        """
+        Args:
+            urls: Ollama base URLs
+            failure_threshold: Consecutive failures before an endpoint is ejected
+            ejection_time: Seconds an ejected endpoint waits before it is re-checked
+        """
+        if not urls:
+            raise ValueError("At least one Ollama endpoint URL is required")
+        self.endpoints = [OllamaEndpoint(url.rstrip('/')) for url in dict.fromkeys(urls)]
+        self.failure_threshold = max(1, failure_threshold)
+        self.ejection_time = max(0.0, ejection_time)
+        self._lock = threading.Lock()
+        self._next_index = 0
+        _pools.add(self)
+
+    @property
+    def urls(self) -> List[str]:
+        return [endpoint.url for endpoint in self.endpoints]
+
+    def acquire(self) -> OllamaEndpoint:
+        """
+        Pick the endpoint for the next request and count it as outstanding
+
+        Healthy endpoints are preferred, least outstanding requests first,
+        rotating between ties. If every endpoint is ejected the one whose
+        ejection ends first is used, so requests still fail over normally
+        instead of failing without being sent.
+        """
+        with self._lock:
+            candidates = [endpoint for endpoint in self.endpoints if endpoint.healthy]
+            if candidates:
+                count = len(self.endpoints)
+                order = {id(endpoint): (i - self._next_index) % count
+                         for i, endpoint in enumerate(self.endpoints)}
+                endpoint = min(candidates, key=lambda e: (e.outstanding, order[id(e)]))
+                self._next_index = (self.endpoints.index(endpoint) + 1) % count
+            else:
+                endpoint = min(self.endpoints, key=lambda e: e.ejected_until)
+            endpoint.outstanding += 1
+            endpoint.requests += 1
+            return endpoint
+
+    def release(self, endpoint: OllamaEndpoint, latency: Optional[float] = None,
+                success: bool = True, error: Optional[str] = None):
+        """Finish a request, recording its latency or failure"""
+        with self._lock:
+            endpoint.outstanding = max(0, endpoint.outstanding - 1)
+            if success:
+                endpoint.consecutive_failures = 0
+                if latency is not None:
+                    endpoint.latency.record(latency)
+                return
+
+            endpoint.failures += 1
+            endpoint.consecutive_failures += 1
+            endpoint.last_error = error
+            if endpoint.healthy and endpoint.consecutive_failures >= self.failure_threshold:
+                self._eject(endpoint, error)
+
+    def mark_healthy(self, endpoint: OllamaEndpoint):
+        """Re-admit an endpoint after a passing health check"""
+        with self._lock:
+            endpoint.checking = False
+            endpoint.consecutive_failures = 0
+            if not endpoint.healthy:
+                endpoint.healthy = True
+                endpoint.ejected_until = 0.0
+                logger.info(f"Re-admitted Ollama endpoint {endpoint.url}")
+
+    def mark_unhealthy(self, endpoint: OllamaEndpoint, error: Optional[str] = None):
+        """Eject an endpoint after a failing health check"""
+        with self._lock:
+            endpoint.checking = False
+            endpoint.last_error = error
+            self._eject(endpoint, error)
+
+    def due_for_check(self) -> List[OllamaEndpoint]:
+        """
+        Claim ejected endpoints whose cool-down has passed
+
+        Each returned endpoint is marked as being checked so concurrent
+        callers do not probe it twice; the caller must report the result via
+        mark_healthy or mark_unhealthy.
+        """
+        now = time.monotonic()
+        with self._lock:
+            due = [endpoint for endpoint in self.endpoints
+                   if not endpoint.healthy and not endpoint.checking and endpoint.ejected_until <= now]
+            for endpoint in due:
+                endpoint.checking = True
+            return due
+
+    def healthy_count(self) -> int:
+        return sum(1 for endpoint in self.endpoints if endpoint.healthy)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get per-endpoint routing, health and latency statistics"""
+        with self._lock:
+            return {
+                'endpoints': [endpoint.to_dict() for endpoint in self.endpoints],
+                'healthy_endpoints': self.healthy_count(),
+                'total_endpoints': len(self.endpoints)
+            }
+
+    def _eject(self, endpoint: OllamaEndpoint, error: Optional[str]):
+        if endpoint.healthy:
+            endpoint.ejections += 1
+            logger.warning(f"Ejecting Ollama endpoint {endpoint.url} for {self.ejection_time:.0f}s: {error}")
+        endpoint.healthy = False
+        endpoint.ejected_until = time.monotonic() + self.ejection_time
@@ -0,0 +1,125 @@
+# Copyright (C) 2025 iolaire mcfadden.
+# This program is free software: you can redistribute it and/or modify it under the terms of the GNU Affero General Public License as published by the Free Software Foundation, either version 3 of the License, or (at your option) any later version.
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+Perceptual Hashing
+
+64-bit difference hashes (dHash) of images and a Hamming-distance index
+over them. Unlike the exact content hash used by the caption cache, a
+dHash survives resizing and recompression, so reposts of an image that was
+already captioned can be found and their caption suggested for review.
+
+The index uses multi-index hashing: each hash is split into four 16-bit
+chunks with one lookup table per chunk. Two hashes within distance d have
+at least one chunk within distance d // 4, so a search only probes chunk
+values a few bit flips away and checks the full distance of the handful of
+hashes stored under them.
+"""
+
+import itertools
+import threading
+from typing import Any, Dict, List, Tuple, Union
+
+import numpy as np
+from PIL import Image
+
+HASH_BITS = 64
+HASH_SIZE = 8
+
+# dHash distance below which two images are treated as the same picture;
+# resized and recompressed copies typically differ by 0-4 bits
+DEFAULT_MAX_DISTANCE = 6
+
+def dhash(image: Union[str, Image.Image]) -> int:
+    """
+    Compute the 64-bit difference hash of an image
+
+    The image is reduced to a 9x8 grayscale thumbnail and each bit records
+    whether a pixel is brighter than its right-hand neighbour.
+
+    Args:
+        image: Path of an image file or an open PIL image
+    """
+    if isinstance(image, str):
+        with Image.open(image) as img:
+            return dhash(img)
+
+    thumbnail = image.convert('L').resize((HASH_SIZE + 1, HASH_SIZE), Image.Resampling.LANCZOS)
+    pixels = np.asarray(thumbnail, dtype=np.int16)
+    bits = pixels[:, 1:] > pixels[:, :-1]
+    return int.from_bytes(np.packbits(bits).tobytes(), 'big')
+
+def hamming_distance(first: int, second: int) -> int:
+    """Number of differing bits between two hashes"""
+    return (first ^ second).bit_count()
+
+def hash_to_hex(hash_value: int) -> str:
+    """Format a hash for storage in the images table"""
+    return f"{hash_value:016x}"
+
+def hash_from_hex(value: str) -> int:
+    return int(value, 16)
+
+class PerceptualHashIndex:
+    """Thread-safe multi-index Hamming search over 64-bit hashes"""
+
+    CHUNKS = 4
+
+    def __init__(self):
+        self.chunk_bits = HASH_BITS // self.CHUNKS
+        self._chunk_mask = (1 << self.chunk_bits) - 1
+        self._tables: List[Dict[int, List[int]]] = [{} for _ in range(self.CHUNKS)]
+        self._items: Dict[int, List[Any]] = {}
+        self._flip_masks: Dict[int, List[int]] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def add(self, hash_value: int, item: Any):
+        """Store an item (typically an image ID) under its hash"""
+        with self._lock:
+            items = self._items.get(hash_value)
+            if items is not None:
+                if item not in items:
+                    items.append(item)
+                return
+            self._items[hash_value] = [item]
+            for table, chunk in zip(self._tables, self._split(hash_value)):
+                table.setdefault(chunk, []).append(hash_value)
+
+    def search(self, hash_value: int, max_distance: int = DEFAULT_MAX_DISTANCE) -> List[Tuple[Any, int]]:
+        """
+        Find items whose hash is within max_distance bits
+
+        Returns:
+            List of (item, distance) tuples, closest first
+        """
+        masks = self._masks(max_distance // self.CHUNKS)
+        matches = []
+        seen = set()
+        with self._lock:
+            for table, chunk in zip(self._tables, self._split(hash_value)):
+                for mask in masks:
+                    for candidate in table.get(chunk ^ mask, ()):
+                        if candidate in seen:
+                            continue
+                        seen.add(candidate)
+                        distance = (candidate ^ hash_value).bit_count()
+                        if distance <= max_distance:
+                            matches.extend((item, distance) for item in self._items[candidate])
+        matches.sort(key=lambda match: match[1])
+        return matches
+
+    def _split(self, hash_value: int) -> List[int]:
+        return [(hash_value >> (i * self.chunk_bits)) & self._chunk_mask for i in range(self.CHUNKS)]
+
+    def _masks(self, radius: int) -> List[int]:
+        """XOR masks for every chunk value within radius bit flips"""
+        masks = self._flip_masks.get(radius)
+        if masks is None:
+            masks = [sum(1 << bit for bit in bits)
+                     for flips in range(radius + 1)
+                     for bits in itertools.combinations(range(self.chunk_bits), flips)]
+            self._flip_masks[radius] = masks
+        return masks
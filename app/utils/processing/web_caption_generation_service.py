@@ -17,6 +17,7 @@ from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy import and_
 
 from app.core.database.core.database_manager import DatabaseManager
+from config import TaskDispatchConfig
 from models import (
     CaptionGenerationTask, CaptionGenerationSettings, CaptionGenerationUserSettings,
     GenerationResults, TaskStatus, PlatformConnection, User, UserRole, JobPriority,
@@ -43,6 +44,8 @@ class WebCaptionGenerationService:
         # Background task management
         self._background_tasks = set()
         self._shutdown_event = None  # Lazy-initialized when needed
+        # Idle processors sleep until enqueue_task wakes them, checking the queue anyway this often
+        self._fallback_poll_interval = TaskDispatchConfig.from_env().fallback_poll_interval
         
     async def start_caption_generation(
         self, 
@@ -447,11 +450,14 @@ class WebCaptionGenerationService:
                     task = self.task_queue_manager.get_next_task()
                     
                     if task:
+                        self.task_queue_manager.dispatch_notifier.record_dispatch(task)
                         # Process the task
                         await self._process_task(task)
                     else:
-                        # No tasks available, wait a bit
-                        await asyncio.sleep(1.0)
+                        # No tasks available, sleep until one is enqueued or a slot frees up
+                        await self.task_queue_manager.dispatch_notifier.wait(
+                            self._fallback_poll_interval, self._shutdown_event
+                        )
                         
                 except Exception as e:
                     logger.error(f"Error in background processor: {sanitize_for_log(str(e))}")
@@ -635,6 +641,7 @@ class WebCaptionGenerationService:
                 'queue_stats': queue_stats,
                 'active_progress_sessions': len(active_sessions),
                 'background_processors': background_tasks_count,
+                'dispatch': self.task_queue_manager.dispatch_notifier.get_stats(),
                 'service_status': 'running' if self._shutdown_event is None or not self._shutdown_event.is_set() else 'shutting_down'
             }
             
@@ -70,6 +70,14 @@ class RateLimitConfig:
     # Platform-specific endpoint rate limits
     platform_endpoint_limits: Dict[str, Dict[str, Dict[str, int]]] = field(default_factory=dict)
     
+    # "memory" keeps buckets per process; "redis" shares them between processes
+    backend: str = "memory"
+    redis_url: Optional[str] = None
+    
+    # Spread each instance's remaining budget over its rate limit window
+    pacing_enabled: bool = True
+    pacing_reserve: int = 0  # Requests per window left for the account's other clients
+    
     @classmethod
     def from_env(cls):
         """Create a RateLimitConfig from environment variables"""
@@ -84,7 +92,11 @@ class RateLimitConfig:
             requests_per_minute=requests_per_minute,
             requests_per_hour=requests_per_hour,
             requests_per_day=requests_per_day,
-            max_burst=max_burst
+            max_burst=max_burst,
+            backend=os.getenv("RATE_LIMIT_BACKEND", "memory").lower(),
+            redis_url=os.getenv("RATE_LIMIT_REDIS_URL", RedisConfig.from_env().url),
+            pacing_enabled=os.getenv("RATE_LIMIT_PACING_ENABLED", "true").lower() == "true",
+            pacing_reserve=int(os.getenv("RATE_LIMIT_PACING_RESERVE", "0"))
         )
         
         # Look for endpoint-specific limits
@@ -120,7 +132,7 @@ class RateLimitConfig:
                     timeframe = parts[1].lower()
                     
                     # Skip global settings and endpoint settings
-                    if platform in ("requests", "max", "endpoint"):
+                    if platform in ("requests", "max", "endpoint", "redis", "pacing"):
                         continue
                     
                     if platform not in config.platform_limits:
@@ -292,6 +304,26 @@ class FallbackConfig:
             backup_model_name=os.getenv("FALLBACK_BACKUP_MODEL", "llava:13b-v1.6"),
         )
 
+@dataclass
+class CaptionCacheConfig:
+    """Configuration for the content-addressed caption cache"""
+    enabled: bool = True
+    backend: str = "redis"  # "redis" or "memory"; falls back to memory if Redis is unreachable
+    redis_url: str = "redis://localhost:6379/0"
+    ttl: int = 2592000  # 30 days
+    max_entries: int = 10000  # Least recently used entries are evicted beyond this
+    
+    @classmethod
+    def from_env(cls):
+        """Create a CaptionCacheConfig from environment variables"""
+        return cls(
+            enabled=os.getenv("CAPTION_CACHE_ENABLED", "true").lower() == "true",
+            backend=os.getenv("CAPTION_CACHE_BACKEND", "redis").lower(),
+            redis_url=os.getenv("CAPTION_CACHE_REDIS_URL", RedisConfig.from_env().url),
+            ttl=int(os.getenv("CAPTION_CACHE_TTL", "2592000")),
+            max_entries=int(os.getenv("CAPTION_CACHE_MAX_ENTRIES", "10000")),
+        )
+
 @dataclass
 class OllamaConfig:
     """Configuration for Ollama with llava model"""
@@ -299,9 +331,16 @@ class OllamaConfig:
     model_name: str = "llava:7b"
     timeout: float = 60.0
     context_size: int = 4096
+    stream: bool = False  # Stream tokens and stop once the caption is complete
+    max_connections: int = 4  # Size of the pooled HTTP client
+    max_concurrent_requests: int = 3  # Upper bound for batch caption requests
+    urls: List[str] = None  # All endpoints to balance across, defaults to [url]
+    endpoint_failure_threshold: int = 3  # Consecutive failures before ejecting an endpoint
+    endpoint_ejection_time: float = 30.0  # Seconds before an ejected endpoint is re-checked
     retry: RetryConfig = None
     fallback: FallbackConfig = None
     caption: CaptionConfig = None
+    cache: CaptionCacheConfig = None
     
     @classmethod
     def from_env(cls):
@@ -312,14 +351,24 @@ class OllamaConfig:
         if os.getenv("DOCKER_DEPLOYMENT", "false").lower() == "true":
             default_url = "http://host.docker.internal:11434"
         
+        url = os.getenv("OLLAMA_URL", default_url)
+        urls = [u.strip() for u in os.getenv("OLLAMA_URLS", "").split(",") if u.strip()]
+        
         return cls(
-            url=os.getenv("OLLAMA_URL", default_url),
+            url=urls[0] if urls else url,
             model_name=os.getenv("OLLAMA_MODEL", "llava:7b"),
             timeout=float(os.getenv("OLLAMA_TIMEOUT", "60.0")),
             context_size=int(os.getenv("OLLAMA_MODEL_CONTEXT", "4096")),
+            stream=os.getenv("OLLAMA_STREAM", "false").lower() == "true",
+            max_connections=int(os.getenv("OLLAMA_MAX_CONNECTIONS", "4")),
+            max_concurrent_requests=int(os.getenv("OLLAMA_MAX_CONCURRENT_REQUESTS", "3")),
+            urls=urls or [url],
+            endpoint_failure_threshold=int(os.getenv("OLLAMA_ENDPOINT_FAILURE_THRESHOLD", "3")),
+            endpoint_ejection_time=float(os.getenv("OLLAMA_ENDPOINT_EJECTION_SECONDS", "30")),
             retry=RetryConfig.from_env(),
             fallback=FallbackConfig.from_env(),
             caption=CaptionConfig.from_env(),
+            cache=CaptionCacheConfig.from_env(),
         )
 
 @dataclass
@@ -475,6 +524,121 @@ class BatchUpdateConfig:
             rollback_on_failure=os.getenv("BATCH_UPDATE_ROLLBACK_ON_FAILURE", "true").lower() == "true",
         )
 
+@dataclass
+class PipelineConfig:
+    """Configuration for the staged download/caption/database pipeline"""
+    download_concurrency: int = 4  # Concurrent image downloads
+    caption_concurrency: int = 1  # Concurrent Ollama requests
+    db_concurrency: int = 2  # Concurrent database operations
+    queue_size: int = 8  # Bounded hand-off between stages (backpressure)
+    
+    @classmethod
+    def from_env(cls):
+        return cls(
+            download_concurrency=int(os.getenv("PIPELINE_DOWNLOAD_CONCURRENCY", "4")),
+            caption_concurrency=int(os.getenv("PIPELINE_CAPTION_CONCURRENCY", "1")),
+            db_concurrency=int(os.getenv("PIPELINE_DB_CONCURRENCY", "2")),
+            queue_size=int(os.getenv("PIPELINE_QUEUE_SIZE", "8")),
+        )
+
+@dataclass
+class ImageTranscodeConfig:
+    """Configuration for the process pool that decodes and re-encodes images"""
+    workers: int = 0  # Worker processes; 0 uses the number of CPU cores
+    queue_size: int = 32  # Jobs allowed to wait for a worker before new ones are rejected
+    timeout: float = 60.0  # Seconds a single image may take before its worker is killed
+    
+    @classmethod
+    def from_env(cls):
+        return cls(
+            workers=int(os.getenv("IMAGE_TRANSCODE_WORKERS", "0")),
+            queue_size=int(os.getenv("IMAGE_TRANSCODE_QUEUE_SIZE", "32")),
+            timeout=float(os.getenv("IMAGE_TRANSCODE_TIMEOUT", "60")),
+        )
+
+@dataclass
+class HTTPPoolConfig:
+    """Configuration for the HTTP clients shared by all ActivityPub clients of an instance"""
+    http2: bool = True  # Needs the h2 package; HTTP/1.1 keep-alive is used without it
+    max_connections: int = 20  # Per instance
+    max_keepalive_connections: int = 10  # Idle connections kept open per instance
+    keepalive_expiry: float = 30.0  # Seconds an idle connection is kept open
+    idle_timeout: float = 300.0  # Seconds an unused instance client is kept before it is closed
+    
+    @classmethod
+    def from_env(cls):
+        return cls(
+            http2=os.getenv("HTTP_POOL_HTTP2", "true").lower() == "true",
+            max_connections=int(os.getenv("HTTP_POOL_MAX_CONNECTIONS", "20")),
+            max_keepalive_connections=int(os.getenv("HTTP_POOL_MAX_KEEPALIVE_CONNECTIONS", "10")),
+            keepalive_expiry=float(os.getenv("HTTP_POOL_KEEPALIVE_EXPIRY", "30")),
+            idle_timeout=float(os.getenv("HTTP_POOL_IDLE_TIMEOUT", "300")),
+        )
+
+@dataclass
+class InstanceMetadataCacheConfig:
+    """Configuration for the cache of instance platform types and account IDs"""
+    backend: str = "redis"  # "redis", "database" or "memory"; Redis falls back to the database
+    redis_url: str = "redis://localhost:6379/0"
+    platform_ttl: int = 604800  # Seconds a detected platform type is kept (7 days)
+    account_ttl: int = 604800  # Seconds a resolved account ID is kept (7 days)
+    
+    @classmethod
+    def from_env(cls):
+        return cls(
+            backend=os.getenv("INSTANCE_CACHE_BACKEND", "redis").lower(),
+            redis_url=os.getenv("INSTANCE_CACHE_REDIS_URL", RedisConfig.from_env().url),
+            platform_ttl=int(os.getenv("INSTANCE_CACHE_PLATFORM_TTL", "604800")),
+            account_ttl=int(os.getenv("INSTANCE_CACHE_ACCOUNT_TTL", "604800")),
+        )
+
+@dataclass
+class TaskDispatchConfig:
+    """Configuration for waking caption task processors when work arrives"""
+    backend: str = "redis"  # "redis" or "memory"; memory only wakes processors in the same process
+    redis_url: str = "redis://localhost:6379/0"
+    fallback_poll_interval: float = 30.0  # Seconds an idle processor waits before checking the queue anyway
+    
+    @classmethod
+    def from_env(cls):
+        return cls(
+            backend=os.getenv("TASK_DISPATCH_BACKEND", "redis").lower(),
+            redis_url=os.getenv("TASK_DISPATCH_REDIS_URL", RedisConfig.from_env().url),
+            fallback_poll_interval=float(os.getenv("TASK_DISPATCH_FALLBACK_POLL_INTERVAL", "30")),
+        )
+
+@dataclass
+class ConfigInvalidationConfig:
+    """Configuration for invalidating cached configuration values in every process"""
+    backend: str = "redis"  # "redis" or "memory"; memory only invalidates caches in the same process
+    redis_url: str = "redis://localhost:6379/0"
+    cache_ttl: int = 3600  # Seconds configuration values are cached while invalidations are broadcast
+    local_cache_ttl: int = 300  # Seconds they are cached when other processes' changes go unnoticed
+    
+    @classmethod
+    def from_env(cls):
+        return cls(
+            backend=os.getenv("CONFIG_INVALIDATION_BACKEND", "redis").lower(),
+            redis_url=os.getenv("CONFIG_INVALIDATION_REDIS_URL", RedisConfig.from_env().url),
+            cache_ttl=int(os.getenv("CONFIG_CACHE_TTL", "3600")),
+            local_cache_ttl=int(os.getenv("CONFIG_LOCAL_CACHE_TTL", "300")),
+        )
+
+@dataclass
+class ResourceSamplerConfig:
+    """Configuration for background resource sampling and metrics history rollups"""
+    interval: float = 5.0  # Seconds between resource samples
+    rollup_interval: float = 60.0  # Seconds of samples and metrics downsampled into one history entry
+    flush_interval: float = 300.0  # Seconds history entries are buffered before being written together
+    
+    @classmethod
+    def from_env(cls):
+        return cls(
+            interval=float(os.getenv("RESOURCE_SAMPLER_INTERVAL", "5")),
+            rollup_interval=float(os.getenv("METRICS_ROLLUP_INTERVAL", "60")),
+            flush_interval=float(os.getenv("METRICS_ROLLUP_FLUSH_INTERVAL", "300")),
+        )
+
 @dataclass
 class ResponsivenessConfig:
     """Configuration for responsiveness monitoring and automated cleanup"""
@@ -555,6 +719,7 @@ class Config:
         self.auth = AuthConfig.from_env()
         self.redis = RedisConfig.from_env()
         self.batch_update = BatchUpdateConfig.from_env()
+        self.pipeline = PipelineConfig.from_env()
         self.responsiveness = ResponsivenessConfig.from_env()
         
         # Initialize session configuration (lazy loading to avoid circular imports)
@@ -568,6 +733,8 @@ class Config:
         self.max_posts_per_run = int(os.getenv("MAX_POSTS_PER_RUN", "50"))
         self.max_users_per_run = int(os.getenv("MAX_USERS_PER_RUN", "10"))
         self.user_processing_delay = int(os.getenv("USER_PROCESSING_DELAY", "5"))  # Delay in seconds between processing users
+        self.max_concurrent_platforms = int(os.getenv("MAX_CONCURRENT_PLATFORMS", "10"))  # Platform connections processed at once
+        self.max_concurrent_per_instance = int(os.getenv("MAX_CONCURRENT_PER_INSTANCE", "1"))  # Per ActivityPub instance host
         self.dry_run = os.getenv("DRY_RUN", "false").lower() == "true"
         self.log_level = os.getenv("LOG_LEVEL", "INFO")
     
@@ -667,6 +834,7 @@ class Config:
         self.webapp = WebAppConfig.from_env()
         self.auth = AuthConfig.from_env()
         self.batch_update = BatchUpdateConfig.from_env()
+        self.pipeline = PipelineConfig.from_env()
         self.responsiveness = ResponsivenessConfig.from_env()
         
         # Update derived configuration
@@ -678,6 +846,8 @@ class Config:
         self.max_posts_per_run = int(os.getenv("MAX_POSTS_PER_RUN", "50"))
         self.max_users_per_run = int(os.getenv("MAX_USERS_PER_RUN", "10"))
         self.user_processing_delay = int(os.getenv("USER_PROCESSING_DELAY", "5"))
+        self.max_concurrent_platforms = int(os.getenv("MAX_CONCURRENT_PLATFORMS", "10"))  # Platform connections processed at once
+        self.max_concurrent_per_instance = int(os.getenv("MAX_CONCURRENT_PER_INSTANCE", "1"))  # Per ActivityPub instance host
         self.dry_run = os.getenv("DRY_RUN", "false").lower() == "true"
         self.log_level = os.getenv("LOG_LEVEL", "INFO")
         
@@ -2,19 +2,25 @@
 # This program is free software: you can redistribute it and/or modify it under the terms of the GNU Affero General Public License as published by the Free Software Foundation, either version 3 of the License, or (at your option) any later version.
 # THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 import asyncio
+import functools
 from logging import getLogger
 import sys
 import os
 import argparse
 import json
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 from datetime import datetime, timezone
 from config import Config
 from app.core.database.core.database_manager import DatabaseManager
 from app.services.activitypub.components.activitypub_client import ActivityPubClient
+from app.services.activitypub.components.http_client_pool import get_http_client_pool
+from app.services.activitypub.components.instance_metadata_cache import get_instance_metadata_cache
 from app.services.platform.core.platform_context import PlatformContextManager
 from app.utils.processing.image_processor import ImageProcessor
 from app.utils.processing.ollama_caption_generator import OllamaCaptionGenerator
+from app.utils.processing.caption_pipeline import CaptionPipeline
+from app.utils.processing.caption_review_integration import CaptionReviewIntegration
+from app.utils.processing.instance_scheduler import InstanceScheduler, ScheduledJob
 from models import ProcessingRun, ProcessingStatus, Image
 from app.utils.helpers.utils import get_retry_stats_summary, get_retry_stats_detailed
 from app.utils.logging.logger import (
@@ -33,18 +39,30 @@ class Vedfolnir:
         self.db = DatabaseManager(config)
         self.current_run = None
         self.reprocess_all = reprocess_all
-        self.stats = {
+        # Limits shared by all concurrent pipelines; created in run_multi_user
+        self._caption_limiter = None
+        self._db_limiter = None
+        self.stats = self._new_stats()
+    
+    @staticmethod
+    def _new_stats() -> Dict[str, int]:
+        return {
             'posts_processed': 0,
             'images_processed': 0,
             'captions_generated': 0,
             'errors': 0,
-            'skipped_existing': 0
+            'skipped_existing': 0,
+            'captions_reused': 0,
+            'images_failed_permanently': 0
         }
     
     async def run_multi_user(self, user_ids: List[str], skip_ollama=False):
         """Process multiple users in a single run"""
         logger.info("Starting Vedfolnir in multi-user mode")
         
+        # Keep platform types and account IDs between runs, in the database if Redis is unavailable
+        get_instance_metadata_cache(self.db)
+        
         # Enforce max users per run limit
         if len(user_ids) > self.config.max_users_per_run:
             logger.warning(f"Number of users ({len(user_ids)}) exceeds max_users_per_run ({self.config.max_users_per_run})")
@@ -78,14 +96,14 @@ class Vedfolnir:
                 else:
                     logger.info("Skipping Ollama initialization (--no-ollama flag set)")
                 
+                # Shared limits so concurrent platform runs don't multiply
+                # the load on Ollama and MySQL
+                self._caption_limiter = asyncio.Semaphore(max(1, self.config.pipeline.caption_concurrency))
+                self._db_limiter = asyncio.Semaphore(max(1, self.config.pipeline.db_concurrency))
+                
                 try:
-                    # Process each user sequentially
-                    for i, user_id in enumerate(user_ids):
-                        # Add delay between users (except for the first one)
-                        if i > 0 and self.config.user_processing_delay > 0:
-                            logger.info(f"Waiting {self.config.user_processing_delay} seconds before processing next user")
-                            await asyncio.sleep(self.config.user_processing_delay)
-                        
+                    jobs = []
+                    for user_id in user_ids:
                         # Get user from database
                         with db_manager.get_session() as session:
                             from models import User
@@ -105,21 +123,30 @@ class Vedfolnir:
                             
                             logger.info(f"Found {len(platform_connections)} platform connection(s) for user '{user_id}'")
                         
-                        # Process each platform connection for this user
                         for platform_conn in platform_connections:
-                            logger.info(f"Processing platform '{platform_conn.name}' ({platform_conn.platform_type}) for user '{user_id}'")
-                            
-                            try:
-                                # Create ActivityPub client for this specific platform connection
-                                async with ActivityPubClient(None, platform_connection=platform_conn) as ap_client:
-                                    await self._process_user(user_id, ap_client, image_processor, caption_generator, batch_id, platform_conn)
-                            except Exception as e:
-                                logger.error(f"Failed to process platform '{platform_conn.name}' for user '{user_id}': {e}")
-                                continue
+                            jobs.append(ScheduledJob(
+                                host=InstanceScheduler.instance_host(platform_conn.instance_url),
+                                run=functools.partial(self._process_platform_connection, user_id, platform_conn,
+                                                      image_processor, caption_generator, batch_id),
+                                name=f"{user_id}@{platform_conn.name}"
+                            ))
+                    
+                    # Platform connections on different instances run concurrently;
+                    # the politeness delay only applies between users on the same host
+                    scheduler = InstanceScheduler(
+                        max_concurrent=self.config.max_concurrent_platforms,
+                        per_instance_concurrency=self.config.max_concurrent_per_instance,
+                        per_instance_delay=self.config.user_processing_delay
+                    )
+                    logger.info(f"Scheduling {len(jobs)} platform connection(s) across "
+                                f"{len({job.host for job in jobs})} instance(s)")
+                    await scheduler.run(jobs)
+                    logger.debug(f"Scheduler statistics: {scheduler.get_stats()}")
                 finally:
                     # Clean up model resources
                     if caption_generator:
                         caption_generator.cleanup()
+                        await caption_generator.close()
             
             # Print overall statistics
             self._print_statistics()
@@ -151,6 +178,18 @@ class Vedfolnir:
         """Main execution method for a single user (for backward compatibility)"""
         await self.run_multi_user([user_id])
     
+    async def _process_platform_connection(self, user_id: str, platform_conn, image_processor: ImageProcessor,
+                                           caption_generator, batch_id: str):
+        """Process one platform connection of a user with its own ActivityPub client"""
+        logger.info(f"Processing platform '{platform_conn.name}' ({platform_conn.platform_type}) for user '{user_id}'")
+        
+        try:
+            # Create ActivityPub client for this specific platform connection
+            async with ActivityPubClient(None, platform_connection=platform_conn) as ap_client:
+                await self._process_user(user_id, ap_client, image_processor, caption_generator, batch_id, platform_conn)
+        except Exception as e:
+            logger.error(f"Failed to process platform '{platform_conn.name}' for user '{user_id}': {e}")
+    
     async def _process_user(self, user_id: str, ap_client: ActivityPubClient, 
                           image_processor: ImageProcessor, caption_generator,
                           batch_id: str = None, platform_connection=None):
@@ -167,22 +206,25 @@ class Vedfolnir:
         logger.info(f"Processing user: {user_id}")
         
         # Get user from database to get actual user ID (integer)
-        actual_user_id = None
-        with self.db.get_session() as session:
-            from models import User
-            user = session.query(User).filter_by(username=user_id).first()
-            if user:
-                actual_user_id = user.id
-                # Set platform context on the database manager
-                if platform_connection:
-                    self.db.set_platform_context(user.id, platform_connection.id)
-                    logger.info(f"Set platform context for user {user_id} on platform {platform_connection.name}")
-            else:
-                logger.error(f"User '{user_id}' not found in database")
-                return
+        actual_user_id = await self._run_db(self._get_user_id, user_id)
+        if actual_user_id is None:
+            logger.error(f"User '{user_id}' not found in database")
+            return
+        # Set platform context on the database manager. The worker thread only
+        # sets it in its copy of this task's context, so make it current here.
+        if platform_connection:
+            context = await self._run_db(self.db.set_platform_context, actual_user_id, platform_connection.id)
+            self.db.get_context_manager().use_context(context)
+            logger.info(f"Set platform context for user {user_id} on platform {platform_connection.name}")
         
-        # Create processing run record for this user using actual user ID
-        self.current_run = self._create_processing_run(actual_user_id, batch_id)
+        # Create processing run record for this user using actual user ID.
+        # Runs for different platforms may be in flight concurrently, so the
+        # run is tracked locally rather than only through self.current_run.
+        run = await self._run_db(self._create_processing_run, actual_user_id, batch_id)
+        self.current_run = run
+        # Counters for this run only; concurrent runs for other platforms
+        # keep their own and everything is added to self.stats at the end
+        stats = self._new_stats()
         
         try:
             # Determine which user's posts to fetch
@@ -190,32 +232,93 @@ class Vedfolnir:
             # Otherwise, use the user_id parameter
             posts_user_id = platform_connection.username if platform_connection and platform_connection.username else user_id
             
-            # Get user's posts
+            # Only fetch statuses newer than the previous run's, unless reprocessing everything
+            cursor = None
+            if platform_connection and not self.reprocess_all:
+                cursor = await self._run_db(self.db.get_timeline_cursor, platform_connection.id)
+            
+            # Images are handed to a staged pipeline so downloads, Ollama calls
+            # and database writes for different images overlap
+            pipeline = None
+            if caption_generator is not None:
+                # Near-duplicates of images the user already approved reuse
+                # that caption instead of another Ollama request
+                find_similar_caption = None
+                if not self.reprocess_all:
+                    find_similar_caption = functools.partial(
+                        CaptionReviewIntegration(self.db).find_similar_caption, user_id=actual_user_id
+                    )
+                pipeline = CaptionPipeline(self.db, image_processor, caption_generator,
+                                           self.config.pipeline, stats=stats,
+                                           reprocess_all=self.reprocess_all,
+                                           caption_limiter=self._caption_limiter,
+                                           db_limiter=self._db_limiter,
+                                           find_similar_caption=find_similar_caption)
+                pipeline.start()
+            
+            # Get user's posts a page at a time; the next page is fetched
+            # while this one's posts are saved and their images queued
             logger.info(f"Fetching posts for user: {posts_user_id}")
-            posts = await ap_client.get_user_posts(posts_user_id, self.config.max_posts_per_run)
-            
-            if not posts:
+            user_posts_count = 0
+            try:
+                async for posts in ap_client.iter_user_post_pages(posts_user_id, self.config.max_posts_per_run,
+                                                                  cursor=cursor):
+                    user_posts_count += await self._process_page(posts, ap_client, pipeline, actual_user_id, stats)
+                
+                # Wait for queued images to finish before completing the run
+                if pipeline:
+                    await pipeline.join()
+                    logger.debug(f"Pipeline stage statistics: {pipeline.get_stage_stats()}")
+            finally:
+                if pipeline:
+                    await pipeline.cancel()
+            
+            # Advance the timeline cursor only when every post made it through,
+            # so posts from a failed run, or from a run without a caption
+            # generator, are fetched and retried next time. Images that can
+            # never be processed are marked failed and do not hold it back.
+            advance_cursor = (cursor is not None and pipeline is not None
+                              and stats['errors'] == stats['images_failed_permanently'])
+            
+            if not user_posts_count:
                 logger.warning(f"No posts found for user {user_id}")
-                self._complete_processing_run()
+                if advance_cursor:
+                    await self._run_db(self.db.save_timeline_cursor, cursor)
+                await self._run_db(self._complete_processing_run, run=run, stats=stats)
                 return
             
-            # Process each post
-            user_posts_count = 0
-            for post in posts:
-                await self._process_post(post, ap_client, image_processor, caption_generator, actual_user_id)
-                self.stats['posts_processed'] += 1
-                user_posts_count += 1
-            
             logger.info(f"Processed {user_posts_count} posts for user {user_id}")
             
+            if advance_cursor:
+                await self._run_db(self.db.save_timeline_cursor, cursor)
+            elif cursor is not None:
+                logger.info(f"Not advancing timeline cursor for user {user_id} after skipped or failed posts")
+            
             # Update processing run for this user
-            self._complete_processing_run()
+            await self._run_db(self._complete_processing_run, run=run, stats=stats)
             
         except Exception as e:
             log_error(logger, "Processing", f"Error processing user {user_id}", "Vedfolnir", 
                      details={"user_id": user_id, "batch_id": batch_id}, exception=e)
-            self.stats['errors'] += 1
-            self._complete_processing_run(error=str(e))
+            stats['errors'] += 1
+            await self._run_db(self._complete_processing_run, error=str(e), run=run, stats=stats)
+        finally:
+            for key, value in stats.items():
+                self.stats[key] = self.stats.get(key, 0) + value
+    
+    async def _run_db(self, func, *args, **kwargs):
+        """Run a synchronous database call in a thread, so concurrent platform runs keep going"""
+        if self._db_limiter is None:
+            return await asyncio.to_thread(func, *args, **kwargs)
+        async with self._db_limiter:
+            return await asyncio.to_thread(func, *args, **kwargs)
+    
+    def _get_user_id(self, username: str) -> Optional[int]:
+        """Return the integer ID of the user with this username, or None"""
+        with self.db.get_session() as session:
+            from models import User
+            user = session.query(User).filter_by(username=username).first()
+            return user.id if user else None
     
     def _create_processing_run(self, user_id: int, batch_id: str = None) -> ProcessingRun:
         """Create a new processing run record
@@ -240,24 +343,31 @@ class Vedfolnir:
         finally:
             session.close()
     
-    def _complete_processing_run(self, error: str = None):
-        """Complete the processing run record"""
-        if not self.current_run:
+    def _complete_processing_run(self, error: str = None, run: ProcessingRun = None,
+                                 stats: Optional[Dict[str, int]] = None):
+        """Complete the processing run record
+        
+        Args:
+            stats: Counters for this run; defaults to the totals for all runs
+        """
+        current_run = run or self.current_run
+        stats = stats if stats is not None else self.stats
+        if not current_run:
             return
             
         session = self.db.get_session()
         try:
-            run = session.get(ProcessingRun, self.current_run.id)
+            run = session.get(ProcessingRun, current_run.id)
             if run:
                 # Get retry statistics
                 retry_stats_detailed = get_retry_stats_detailed()
                 
                 # Update processing run with basic stats
                 run.completed_at = datetime.now(timezone.utc)
-                run.posts_processed = self.stats['posts_processed']
-                run.images_processed = self.stats['images_processed']
-                run.captions_generated = self.stats['captions_generated']
-                run.errors_count = self.stats['errors']
+                run.posts_processed = stats['posts_processed']
+                run.images_processed = stats['images_processed']
+                run.captions_generated = stats['captions_generated']
+                run.errors_count = stats['errors']
                 run.status = "error" if error else "completed"
                 
                 # Add retry statistics to the processing run
@@ -273,32 +383,95 @@ class Vedfolnir:
                 logger.info(f"Completed processing run {run.id}")
                 
                 # Log retry statistics summary
-                self._log_retry_statistics()
+                self._log_retry_statistics(run.id)
         except Exception as e:
             session.rollback()
             log_error(logger, "Database", "Failed to complete processing run", "DatabaseManager", 
-                     details={"run_id": self.current_run.id}, exception=e)
+                     details={"run_id": current_run.id}, exception=e)
         finally:
             session.close()
     
+    async def _process_page(self, posts: List[Dict[str, Any]], ap_client: ActivityPubClient,
+                            pipeline: CaptionPipeline, actual_user_id: int,
+                            stats: Dict[str, int]) -> int:
+        """Save a page of posts and queue their images, returning the number of posts processed"""
+        # Save the page of posts and check which of its images are already
+        # processed with a few bulk queries rather than per post and image
+        images_by_post = {}
+        for post in posts:
+            try:
+                images_by_post[post.get('id')] = ap_client.extract_images_from_post(post)
+            except Exception as e:
+                # _process_post extracts again and reports the error for this post
+                logger.debug(f"Deferring image extraction for post {post.get('id')}: {e}")
+        db_posts = await self._save_posts(posts, actual_user_id, pipeline)
+        if pipeline:
+            try:
+                await pipeline.check_processed(
+                    image_info['url'] for images in images_by_post.values() for image_info in images
+                )
+            except Exception as e:
+                logger.warning(f"Bulk processed-image check failed, checking images individually: {e}")
+        
+        # Process each post
+        for post in posts:
+            await self._process_post(post, ap_client, pipeline, actual_user_id,
+                                     db_post=db_posts.get(post.get('id')),
+                                     images=images_by_post.get(post.get('id')), stats=stats)
+            stats['posts_processed'] += 1
+        return len(posts)
+    
+    async def _save_posts(self, posts: List[Dict[str, Any]], actual_user_id: int,
+                          pipeline: CaptionPipeline) -> Dict[str, Any]:
+        """Save a page of posts in bulk, returning database posts by post ID
+        
+        Posts missing from the result are saved one at a time by _process_post.
+        """
+        post_fields = [
+            dict(post_id=post.get('id'), post_url=post.get('id'), post_content=post.get('content', ''))
+            for post in posts
+        ]
+        try:
+            if pipeline:
+                return await pipeline.run_db(self.db.get_or_create_posts, actual_user_id, post_fields)
+            return await self._run_db(self.db.get_or_create_posts, actual_user_id, post_fields)
+        except Exception as e:
+            logger.warning(f"Bulk post save failed, saving posts individually: {e}")
+            return {}
+    
     async def _process_post(self, post: Dict[str, Any], ap_client: ActivityPubClient, 
-                          image_processor: ImageProcessor, caption_generator, actual_user_id: int):
-        """Process a single post for alt text generation"""
+                          pipeline: CaptionPipeline, actual_user_id: int,
+                          db_post=None, images: Optional[List[Dict[str, Any]]] = None,
+                          stats: Optional[Dict[str, int]] = None):
+        """Process a single post and queue its images for alt text generation
+        
+        Args:
+            db_post: The post's database record if it was already saved in bulk
+            images: The post's images without alt text if already extracted
+            stats: Counters for this run; defaults to the totals for all runs
+        """
+        stats = stats if stats is not None else self.stats
         try:
             post_id = post.get('id', 'unknown')
             
             logger.info(f"Processing post: {post_id}")
             
             # Save post to database using the actual user ID (integer)
-            db_post = self.db.get_or_create_post(
-                post_id=post_id,
-                user_id=actual_user_id,
-                post_url=post_id,
-                post_content=post.get('content', '')
-            )
+            if db_post is None:
+                post_kwargs = dict(
+                    post_id=post_id,
+                    user_id=actual_user_id,
+                    post_url=post_id,
+                    post_content=post.get('content', '')
+                )
+                if pipeline:
+                    db_post = await pipeline.run_db(self.db.get_or_create_post, **post_kwargs)
+                else:
+                    db_post = self.db.get_or_create_post(**post_kwargs)
             
             # Extract images without alt text
-            images = ap_client.extract_images_from_post(post)
+            if images is None:
+                images = ap_client.extract_images_from_post(post)
             
             if not images:
                 logger.debug(f"No images without alt text found in post {post_id}")
@@ -307,118 +480,22 @@ class Vedfolnir:
             logger.info(f"Found {len(images)} images without alt text in post {post_id}")
             
             # Check if caption generator is available
-            if caption_generator is None:
+            if pipeline is None:
                 from app.core.security.core.security_utils import sanitize_for_log
                 logger.warning(f"Skipping image processing for post {sanitize_for_log(post_id)} - no caption generator available")
                 return
             
-            # Process each image
+            # Queue each image; blocks while the pipeline is saturated
             for image_info in images:
-                await self._process_image(image_info, db_post, image_processor, caption_generator)
-                self.stats['images_processed'] += 1
+                await pipeline.submit(image_info, db_post.id)
             
         except Exception as e:
             post_id = post.get('id', 'unknown')
             log_error(logger, "Processing", f"Error processing post {post_id}", "PostProcessor", 
                      details={"post_id": post_id}, exception=e)
-            self.stats['errors'] += 1
-    
-    async def _process_image(self, image_info: Dict[str, Any], db_post, 
-                           image_processor: ImageProcessor, caption_generator: OllamaCaptionGenerator):
-        """Process a single image to generate alt text"""
-        try:
-            image_url = image_info['url']
-            
-            # Check if image was already processed (has POSTED or APPROVED status)
-            if not self.reprocess_all and self.db.is_image_processed(image_url):
-                logger.info(f"Image already successfully processed (POSTED or APPROVED), skipping: {image_url}")
-                self.stats['skipped_existing'] += 1
-                return
-            
-            logger.info(f"Processing image: {image_url}")
-            
-            # Download and store image
-            local_path = await image_processor.download_and_store_image(
-                image_url, 
-                image_info.get('mediaType')
-            )
-            
-            if not local_path:
-                log_error(logger, "Download", f"Failed to download/store image", "ImageProcessor", 
-                         details={"image_url": image_url})
-                return
-                
-            # Debug log for image_post_id
-            logger.info(f"ID from image_info: {image_info.get('image_post_id')}")
-            
-            # Parse the original post date if available
-            original_post_date = None
-            if image_info.get('post_published'):
-                try:
-                    from dateutil import parser
-                    original_post_date = parser.parse(image_info['post_published'])
-                except Exception as e:
-                    logger.warning(f"Failed to parse post_published date '{image_info['post_published']}': {e}")
-            
-            # Save image record to database and get the image ID directly
-            image_id = self.db.save_image(
-                post_id=db_post.id,
-                image_url=image_url,
-                local_path=local_path,
-                attachment_index=image_info['attachment_index'],
-                media_type=image_info.get('mediaType'),
-                original_filename=os.path.basename(local_path),
-                image_post_id=image_info.get('image_post_id'),  # Use image_post_id parameter
-                original_post_date=original_post_date
-            )
-            
-            if image_id is None:
-                log_error(logger, "Database", f"Failed to save image record: {image_url}", "ImageProcessor")
-                return
-            
-            # Generate caption using general prompt
-            result = await caption_generator.generate_caption(local_path)
-            
-            # The generate_caption method now returns a tuple of (caption, quality_metrics)
-            if isinstance(result, tuple) and len(result) == 2:
-                caption, quality_metrics = result
-            else:
-                # Handle backward compatibility with older versions
-                caption = result
-                quality_metrics = None
-            
-            if caption:
-                # Log quality metrics if available
-                if quality_metrics:
-                    logger.info(f"Caption quality score: {quality_metrics['overall_score']}/100 ({quality_metrics['quality_level']})")
-                    if quality_metrics['needs_review']:
-                        logger.warning(f"Caption flagged for special review: {quality_metrics['feedback']}")
-                
-                # Update the image in the database with caption and quality metrics
-                # Use the stored image_id instead of accessing db_image.id to avoid detached instance issues
-                success = self.db.update_image_caption(
-                    image_id=image_id,
-                    generated_caption=caption,
-                    quality_metrics=quality_metrics
-                )
-                
-                if success:
-                    self.stats['captions_generated'] += 1
-                    logger.info(f"Generated caption for {image_url}: {caption}")
-                else:
-                    log_error(logger, "Database", f"Failed to update caption for image {image_id}", "ImageProcessor", 
-                            details={"image_id": image_id, "image_url": image_url})
-                    self.stats['errors'] += 1
-            else:
-                log_error(logger, "Caption", f"Failed to generate caption for image", "CaptionGenerator", 
-                         details={"image_url": image_url, "local_path": local_path})
-                self.stats['errors'] += 1
-            
-        except Exception as e:
-            log_error(logger, "Processing", "Error processing image", "ImageProcessor", 
-                     details={"image_url": image_info.get('url', 'unknown')}, exception=e)
+            stats['errors'] += 1
     
-    def _log_retry_statistics(self):
+    def _log_retry_statistics(self, run_id: int = None):
         """Log retry statistics after processing run"""
         # Get retry statistics summary
         retry_summary = get_retry_stats_summary()
@@ -440,7 +517,9 @@ class Vedfolnir:
         
         # If there were any retries, add a note about checking the database for more details
         if retry_detailed['summary']['retry_attempts'] > 0:
-            logger.info(f"Detailed retry statistics stored in database for processing run {self.current_run.id}")
+            if run_id is None and self.current_run:
+                run_id = self.current_run.id
+            logger.info(f"Detailed retry statistics stored in database for processing run {run_id}")
 
     def _print_statistics(self):
         """Print execution statistics"""
@@ -549,7 +628,10 @@ async def main():
     
     # Run the bot
     bot = Vedfolnir(config, reprocess_all=args.reprocess_all)
-    await bot.run_multi_user(user_ids, skip_ollama=args.no_ollama)
+    try:
+        await bot.run_multi_user(user_ids, skip_ollama=args.no_ollama)
+    finally:
+        await get_http_client_pool().aclose()
 
 if __name__ == "__main__":
     asyncio.run(main())
\ No newline at end of file
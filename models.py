@@ -5,13 +5,14 @@ from datetime import datetime
 from enum import Enum
 from sqlalchemy import Column, Integer, String, Text, DateTime, Boolean, ForeignKey, Enum as SQLEnum, UniqueConstraint, Float, Index
 from sqlalchemy.orm import declarative_base
-from sqlalchemy.orm import relationship, backref
+from sqlalchemy.orm import relationship, backref, validates
 from sqlalchemy.ext.hybrid import hybrid_property
 from sqlalchemy.sql import func
 from sqlalchemy.orm.exc import DetachedInstanceError
 from werkzeug.security import generate_password_hash, check_password_hash
 from cryptography.fernet import Fernet
 import os
+import hashlib
 import logging
 import json
 import uuid
@@ -191,11 +192,13 @@ class Image(Base):
     id = Column(Integer, primary_key=True, autoincrement=True)
     post_id = Column(Integer, ForeignKey('posts.id', ondelete='CASCADE'), nullable=False)
     image_url = Column(Text, nullable=False)  # URLs can be very long, use TEXT
+    image_url_hash = Column(String(64))  # SHA-256 of image_url; TEXT cannot be indexed for lookups
     local_path = Column(String(500), nullable=False)
     original_filename = Column(String(200))
     media_type = Column(String(100))
     image_post_id = Column(String(100))  # Pixelfed ID for updating descriptions
     attachment_index = Column(Integer, nullable=False)
+    perceptual_hash = Column(String(16))  # Hex dHash for near-duplicate detection
     
     # Platform identification
     platform_connection_id = Column(Integer, ForeignKey('platform_connections.id', ondelete='CASCADE'), nullable=True)
@@ -241,6 +244,8 @@ class Image(Base):
         Index('ix_image_status_created', 'status', 'created_at'),
         Index('ix_image_category', 'image_category'),
         Index('ix_image_quality_score', 'caption_quality_score'),
+        Index('ix_image_perceptual_hash', 'perceptual_hash'),
+        Index('ix_image_platform_url_hash', 'platform_connection_id', 'image_url_hash'),
         {
             'mysql_engine': 'InnoDB',
             'mysql_charset': 'utf8mb4',
@@ -249,6 +254,16 @@ class Image(Base):
         }
     )
     
+    @staticmethod
+    def hash_url(image_url: str) -> str:
+        """Hex SHA-256 of an image URL, as stored in image_url_hash"""
+        return hashlib.sha256(image_url.encode('utf-8')).hexdigest()
+    
+    @validates('image_url')
+    def _update_image_url_hash(self, key, image_url):
+        self.image_url_hash = self.hash_url(image_url) if image_url is not None else None
+        return image_url
+    
     def validate_platform_consistency(self):
         """Validate that platform information is consistent with post"""
         if self.post:
@@ -804,6 +819,46 @@ class ProcessingRun(Base):
         except:
             return f"<ProcessingRun {self.id} - {self.user_id}>"
 
+class TimelineSyncCursor(Base):
+    """Where caption runs last stopped reading a platform connection's timeline"""
+    __tablename__ = 'timeline_sync_cursors'
+    __table_args__ = (
+        UniqueConstraint('platform_connection_id', name='uq_timeline_cursor_platform'),
+        {
+            'mysql_engine': 'InnoDB',
+            'mysql_charset': 'utf8mb4',
+            'mysql_collate': 'utf8mb4_unicode_ci',
+            'mysql_row_format': 'DYNAMIC',
+        }
+    )
+    
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    platform_connection_id = Column(Integer, ForeignKey('platform_connections.id', ondelete='CASCADE'), nullable=False)
+    last_status_id = Column(String(100))  # Newest status already fetched; next run asks for statuses after it
+    etag = Column(String(255))            # Validators of the last empty "anything new?" response
+    last_modified = Column(String(100))
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    def __repr__(self):
+        return f"<TimelineSyncCursor platform={self.platform_connection_id} last_status={self.last_status_id}>"
+
+class InstanceMetadata(Base):
+    """Cached facts about instances, such as platform types and account IDs"""
+    __tablename__ = 'instance_metadata_cache'
+    __table_args__ = {
+        'mysql_engine': 'InnoDB',
+        'mysql_charset': 'utf8mb4',
+        'mysql_collate': 'utf8mb4_unicode_ci',
+        'mysql_row_format': 'DYNAMIC',
+    }
+    
+    cache_key = Column(String(255), primary_key=True)
+    value = Column(Text, nullable=False)  # JSON
+    expires_at = Column(DateTime, nullable=False, index=True)
+    
+    def __repr__(self):
+        return f"<InstanceMetadata {self.cache_key} expires={self.expires_at}>"
+
 class PlatformConnection(Base):
     __tablename__ = 'platform_connections'
     __table_args__ = mysql_table_args
@@ -1308,6 +1363,7 @@ class CaptionGenerationTask(Base):
         Index('ix_caption_task_user_status', 'user_id', 'status'),
         Index('ix_caption_task_platform_status', 'platform_connection_id', 'status'),
         Index('ix_caption_task_status_created', 'status', 'created_at'),
+        Index('ix_caption_task_claim', 'status', 'priority', 'created_at'),  # Task claiming, see TaskQueueManager
         Index('ix_caption_task_created_at', 'created_at'),
         Index('ix_caption_task_priority', 'priority'),
         Index('ix_caption_task_admin_cancelled', 'cancelled_by_admin'),
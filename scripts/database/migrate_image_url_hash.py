@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+# Copyright (C) 2025 iolaire mcfadden.
+# This program is free software: you can redistribute it and/or modify it under the terms of the GNU Affero General Public License as published by the Free Software Foundation, either version 3 of the License, or (at your option) any later version.
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""Database migration adding indexed URL hashes to stored images"""
+
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from sqlalchemy import text, inspect
+from config import Config
+from models import Image
+
+BATCH_SIZE = 10000
+
+def add_image_url_hash_column(engine):
+    """Add the images.image_url_hash column if it is missing"""
+    column_names = [col['name'] for col in inspect(engine).get_columns('images')]
+    if 'image_url_hash' not in column_names:
+        print("Adding column: image_url_hash")
+        with engine.begin() as connection:
+            connection.execute(text("ALTER TABLE images ADD COLUMN image_url_hash VARCHAR(64)"))
+
+def add_image_url_hash_index(engine):
+    """Create the (platform_connection_id, image_url_hash) index if it is missing"""
+    index_names = [index['name'] for index in inspect(engine).get_indexes('images')]
+    if 'ix_image_platform_url_hash' not in index_names:
+        print("Adding index: ix_image_platform_url_hash")
+        with engine.begin() as connection:
+            connection.execute(text(
+                "CREATE INDEX ix_image_platform_url_hash ON images (platform_connection_id, image_url_hash)"
+            ))
+
+def backfill_image_url_hash(engine, batch_size: int = BATCH_SIZE) -> int:
+    """
+    Hash the URLs of existing images in primary key ranges of batch_size
+    
+    Each range is its own short transaction, so the backfill can run on a
+    live database and resume where it stopped. MySQL hashes server-side with
+    SHA2(), which matches Image.hash_url for utf8mb4 columns.
+    """
+    server_side = engine.dialect.name == 'mysql'
+    hashed = 0
+    start = 0
+    while True:
+        # Re-read the end of the table so rows inserted during the backfill are covered
+        with engine.connect() as connection:
+            max_id = connection.execute(text("SELECT MAX(id) FROM images")).scalar() or 0
+        if start >= max_id:
+            break
+        bounds = {'start': start, 'end': start + batch_size}
+        with engine.begin() as connection:
+            if server_side:
+                result = connection.execute(text(
+                    "UPDATE images SET image_url_hash = SHA2(image_url, 256) "
+                    "WHERE id > :start AND id <= :end AND image_url_hash IS NULL"
+                ), bounds)
+                hashed += result.rowcount
+            else:
+                rows = connection.execute(text(
+                    "SELECT id, image_url FROM images "
+                    "WHERE id > :start AND id <= :end AND image_url_hash IS NULL"
+                ), bounds).fetchall()
+                if rows:
+                    connection.execute(
+                        text("UPDATE images SET image_url_hash = :hash WHERE id = :id"),
+                        [{'hash': Image.hash_url(image_url), 'id': image_id} for image_id, image_url in rows]
+                    )
+                    hashed += len(rows)
+        start += batch_size
+        print(f"Hashed {hashed} image URLs so far (up to id {min(start, max_id)} of {max_id})")
+    return hashed
+
+def migrate_image_url_hash():
+    """Add images.image_url_hash, backfill it, then index it"""
+    from app.core.database.core.database_manager import DatabaseManager
+    config = Config()
+    db_manager = DatabaseManager(config)
+
+    print("Starting image URL hash migration...")
+    add_image_url_hash_column(db_manager.engine)
+    hashed = backfill_image_url_hash(db_manager.engine)
+    # Building the index once after the backfill is cheaper than maintaining it during
+    add_image_url_hash_index(db_manager.engine)
+    print(f"Image URL hash migration completed: {hashed} URLs hashed")
+
+if __name__ == '__main__':
+    migrate_image_url_hash()
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+# Copyright (C) 2025 iolaire mcfadden.
+# This program is free software: you can redistribute it and/or modify it under the terms of the GNU Affero General Public License as published by the Free Software Foundation, either version 3 of the License, or (at your option) any later version.
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""Database migration adding perceptual hashes to stored images"""
+
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from sqlalchemy import text, inspect
+from config import Config
+from app.core.database.core.database_manager import DatabaseManager
+from app.utils.processing.perceptual_hash import dhash, hash_to_hex
+
+BATCH_SIZE = 500
+
+def migrate_perceptual_hash():
+    """Add the images.perceptual_hash column and index, then hash existing images"""
+    config = Config()
+    db_manager = DatabaseManager(config)
+
+    print("Starting perceptual hash migration...")
+
+    inspector = inspect(db_manager.engine)
+    column_names = [col['name'] for col in inspector.get_columns('images')]
+    index_names = [index['name'] for index in inspector.get_indexes('images')]
+
+    with db_manager.engine.begin() as connection:
+        if 'perceptual_hash' not in column_names:
+            print("Adding column: perceptual_hash")
+            connection.execute(text("ALTER TABLE images ADD COLUMN perceptual_hash VARCHAR(16)"))
+        if 'ix_image_perceptual_hash' not in index_names:
+            print("Adding index: ix_image_perceptual_hash")
+            connection.execute(text("CREATE INDEX ix_image_perceptual_hash ON images (perceptual_hash)"))
+
+    hashed = 0
+    missing = 0
+    last_id = 0
+    while True:
+        with db_manager.engine.begin() as connection:
+            rows = connection.execute(text(
+                "SELECT id, local_path FROM images "
+                "WHERE perceptual_hash IS NULL AND id > :last_id ORDER BY id LIMIT :limit"
+            ), {'last_id': last_id, 'limit': BATCH_SIZE}).fetchall()
+            if not rows:
+                break
+
+            for image_id, local_path in rows:
+                try:
+                    perceptual_hash = hash_to_hex(dhash(local_path))
+                except Exception:
+                    missing += 1
+                    continue
+                connection.execute(
+                    text("UPDATE images SET perceptual_hash = :hash WHERE id = :id"),
+                    {'hash': perceptual_hash, 'id': image_id}
+                )
+                hashed += 1
+            last_id = rows[-1][0]
+        print(f"Hashed {hashed} images so far")
+
+    print(f"Perceptual hash migration completed: {hashed} hashed, {missing} without a readable file")
+
+if __name__ == '__main__':
+    migrate_perceptual_hash()
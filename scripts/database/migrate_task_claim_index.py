@@ -0,0 +1,35 @@
+#!/usr/bin/env python3
+# Copyright (C) 2025 iolaire mcfadden.
+# This program is free software: you can redistribute it and/or modify it under the terms of the GNU Affero General Public License as published by the Free Software Foundation, either version 3 of the License, or (at your option) any later version.
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""Database migration adding the index caption task claiming walks"""
+
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from sqlalchemy import text, inspect
+from config import Config
+
+def add_task_claim_index(engine):
+    """Create the (status, priority, created_at) index if it is missing"""
+    index_names = [index['name'] for index in inspect(engine).get_indexes('caption_generation_tasks')]
+    if 'ix_caption_task_claim' not in index_names:
+        print("Adding index: ix_caption_task_claim")
+        with engine.begin() as connection:
+            connection.execute(text(
+                "CREATE INDEX ix_caption_task_claim ON caption_generation_tasks (status, priority, created_at)"
+            ))
+
+def migrate_task_claim_index():
+    """Add the caption task claim index"""
+    from app.core.database.core.database_manager import DatabaseManager
+    config = Config()
+    db_manager = DatabaseManager(config)
+
+    print("Starting task claim index migration...")
+    add_task_claim_index(db_manager.engine)
+    print("Task claim index migration completed")
+
+if __name__ == '__main__':
+    migrate_task_claim_index()
@@ -104,6 +104,7 @@ class TestBatchUpdateService(unittest.TestCase):
         
         # Set up the client mock
         mock_client = AsyncMock()
+        mock_client.platform = MagicMock(status_id_from_post_id=lambda post_id: post_id)
         mock_client_class.return_value.__aenter__.return_value = mock_client
         
         # Mock get_post_by_id to return different posts
@@ -116,8 +117,11 @@ class TestBatchUpdateService(unittest.TestCase):
         
         mock_client.get_post_by_id.side_effect = mock_get_post_by_id
         
-        # Mock update_media_caption to succeed
-        mock_client.update_media_caption.return_value = True
+        # Mock update_status_media_captions to succeed
+        async def mock_update_status_media_captions(status_id, captions):
+            return {media_id: True for media_id in captions}
+        
+        mock_client.update_status_media_captions.side_effect = mock_update_status_media_captions
         
         # Mock update_post to succeed
         mock_client.update_post.return_value = True
@@ -133,8 +137,11 @@ class TestBatchUpdateService(unittest.TestCase):
         self.assertEqual(result['rollbacks'], 0)
         
         # Verify the API calls
-        # Should have 2 direct media updates for image1 and image2
-        self.assertEqual(mock_client.update_media_caption.call_count, 2)
+        # Should have 1 status update for the media of image1 and image2
+        mock_client.update_status_media_captions.assert_called_once_with(
+            "post1", {"media1": "Test caption 1", "media2": "Test caption 2"}
+        )
+        mock_client.update_media_caption.assert_not_called()
         
         # Should have 1 post update for post2 (images 3 and 4)
         self.assertEqual(mock_client.update_post.call_count, 1)
@@ -150,6 +157,7 @@ class TestBatchUpdateService(unittest.TestCase):
         
         # Set up the client mock
         mock_client = AsyncMock()
+        mock_client.platform = MagicMock(status_id_from_post_id=lambda post_id: post_id)
         mock_client_class.return_value.__aenter__.return_value = mock_client
         
         # Mock get_post_by_id to return different posts
@@ -162,11 +170,11 @@ class TestBatchUpdateService(unittest.TestCase):
         
         mock_client.get_post_by_id.side_effect = mock_get_post_by_id
         
-        # Mock update_media_caption to fail for image2
-        async def mock_update_media_caption(image_post_id, caption):
-            return image_post_id != "media2"
+        # Mock update_status_media_captions to fail for image2
+        async def mock_update_status_media_captions(status_id, captions):
+            return {media_id: media_id != "media2" for media_id in captions}
         
-        mock_client.update_media_caption.side_effect = mock_update_media_caption
+        mock_client.update_status_media_captions.side_effect = mock_update_status_media_captions
         
         # Mock update_post to succeed
         mock_client.update_post.return_value = True
@@ -180,7 +188,7 @@ class TestBatchUpdateService(unittest.TestCase):
         self.assertEqual(result['failed'], 3)  # image2 failed, image3 and image4 are not counted as successful
         
         # Verify the API calls
-        self.assertEqual(mock_client.update_media_caption.call_count, 2)
+        self.assertEqual(mock_client.update_status_media_captions.call_count, 1)
         self.assertEqual(mock_client.update_post.call_count, 1)
         
         # Verify the database was updated for successful images only
@@ -194,6 +202,7 @@ class TestBatchUpdateService(unittest.TestCase):
         
         # Set up the client mock
         mock_client = AsyncMock()
+        mock_client.platform = MagicMock(status_id_from_post_id=lambda post_id: post_id)
         mock_client_class.return_value.__aenter__.return_value = mock_client
         
         # Override the _verify_updates method to simulate verification failure
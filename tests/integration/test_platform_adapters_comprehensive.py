@@ -25,6 +25,9 @@ from app.services.activitypub.components.activitypub_platforms import (
     UnsupportedPlatformError,
     PlatformDetectionError
 )
+from app.services.activitypub.components.instance_metadata_cache import (
+    InstanceMetadataCache, MemoryInstanceMetadataBackend, set_instance_metadata_cache
+)
 
 @dataclass
 class MockConfig:
@@ -48,6 +51,9 @@ class TestPixelfedPlatformAdapter(unittest.TestCase):
         )
         self.platform = PixelfedPlatform(self.config)
         self.mock_client = Mock()
+        # Account IDs cached by other tests would skip the lookup requests
+        set_instance_metadata_cache(InstanceMetadataCache(MemoryInstanceMetadataBackend()))
+        self.addCleanup(set_instance_metadata_cache, None)
         self.mock_client._get_with_retry = AsyncMock()
         self.mock_client._put_with_retry = AsyncMock()
     
@@ -283,6 +289,9 @@ class TestMastodonPlatformAdapter(unittest.TestCase):
         )
         self.platform = MastodonPlatform(self.config)
         self.mock_client = Mock()
+        # Account IDs cached by other tests would skip the lookup requests
+        set_instance_metadata_cache(InstanceMetadataCache(MemoryInstanceMetadataBackend()))
+        self.addCleanup(set_instance_metadata_cache, None)
         self.mock_client._get_with_retry = AsyncMock()
         self.mock_client._put_with_retry = AsyncMock()
     
@@ -34,6 +34,7 @@ with patch('psutil.cpu_percent', return_value=25.0), \
         SystemMonitor, SystemHealth, PerformanceMetrics, 
         ErrorTrends, ResourceUsage
     )
+    from app.services.monitoring.system.resource_sampler import ResourceSampler
     from models import CaptionGenerationTask, TaskStatus, User, UserRole
     from app.core.database.core.database_manager import DatabaseManager
 
@@ -52,12 +53,13 @@ class TestSystemMonitor(unittest.TestCase):
         self.mock_redis.ping.return_value = True
         self.mock_redis.info.return_value = {'used_memory': 10485760}  # 10MB
         
-        # Create system monitor
+        # Create system monitor, with a sampler that samples on first read
         self.monitor = SystemMonitor(
             db_manager=self.mock_db_manager,
             redis_client=self.mock_redis,
             stuck_job_timeout=3600,
-            metrics_retention_hours=168
+            metrics_retention_hours=168,
+            resource_sampler=ResourceSampler(self.mock_db_manager, self.mock_redis)
         )
     
     def test_init_with_redis_client(self):
@@ -228,10 +230,11 @@ class TestSystemMonitor(unittest.TestCase):
         mock_disk.return_value = MockDisk(40.0, 120000000000, 300000000000)
         mock_net.return_value = MockNetworkIO(5000000, 10000000)
         
-        with patch.object(self.monitor, '_get_database_connection_count') as mock_db_conn:
+        sampler_module = 'app.services.monitoring.system.resource_sampler'
+        with patch(f'{sampler_module}.database_connection_count') as mock_db_conn:
             mock_db_conn.return_value = 15
             
-            with patch.object(self.monitor, '_get_redis_memory_usage') as mock_redis_mem:
+            with patch(f'{sampler_module}.redis_memory_mb') as mock_redis_mem:
                 mock_redis_mem.return_value = 25.5
                 
                 usage = self.monitor.check_resource_usage()
@@ -246,6 +249,7 @@ class TestSystemMonitor(unittest.TestCase):
                 self.assertEqual(usage.redis_memory_mb, 25.5)
                 self.assertIn('bytes_sent', usage.network_io)
                 self.assertIn('bytes_recv', usage.network_io)
+                self.assertEqual(usage.windows['1m']['cpu_percent'], {'p50': 35.0, 'p95': 35.0, 'max': 35.0})
     
     def test_detect_stuck_jobs(self):
         """Test detect_stuck_jobs"""
@@ -543,9 +547,11 @@ class TestSystemMonitor(unittest.TestCase):
         
         self.monitor._store_health_metrics(health)
         
-        # Verify Redis operations were called
+        # Current metrics are stored at once, history in the next batch
         self.mock_redis.hset.assert_called()
-        self.mock_redis.setex.assert_called()
+        self.assertEqual(self.monitor.resource_sampler.rollups.get_stats()['pending'], 1)
+        self.assertEqual(self.monitor.resource_sampler.rollups.flush(self.mock_redis, force=True), 1)
+        self.mock_redis.pipeline.return_value.set.assert_called_once()
     
     def test_store_health_metrics_no_redis(self):
         """Test _store_health_metrics without Redis client"""
@@ -0,0 +1,92 @@
+# Copyright (C) 2025 iolaire mcfadden.
+# This program is free software: you can redistribute it and/or modify it under the terms of the GNU Affero General Public License as published by the Free Software Foundation, either version 3 of the License, or (at your option) any later version.
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+"""
+Performance tests for saving a page of posts and checking its images.
+
+Counts database round trips for a 200-post page with two images per post,
+a quarter of the posts already saved, using get_or_create_post and
+is_image_processed per post and image versus get_or_create_posts and
+get_processed_image_urls for the whole page.
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+import unittest
+
+from sqlalchemy import event
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
+
+from models import Base, User, PlatformConnection
+from tests.unit.test_database_pool import make_manager
+
+POSTS = 200
+IMAGES_PER_POST = 2
+
+def post_fields(i):
+    url = f"https://pixelfed.test/p/{i}"
+    return dict(post_id=url, post_url=url, post_content=f"Post {i}")
+
+def image_urls(i):
+    return [f"https://pixelfed.test/storage/{i}/{n}.jpg" for n in range(IMAGES_PER_POST)]
+
+class TestBulkPageLookupPerformance(unittest.TestCase):
+    """Round trips per page, per-item queries vs bulk queries"""
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.db = make_manager(os.path.join(self.temp_dir, "page.db"))
+        Base.metadata.create_all(self.db.engine)
+        session = self.db.get_session()
+        session.add(User(id=1, username="user1", email="user1@test.com", password_hash="x"))
+        session.add(PlatformConnection(id=1, user_id=1, name="conn", platform_type="pixelfed",
+                                       instance_url="https://pixelfed.test", _access_token="token"))
+        session.commit()
+        self.db.close_session(session)
+        self.db.set_platform_context(1, 1)
+        self.db.get_or_create_posts(1, [post_fields(i) for i in range(0, POSTS * 2, 4)])
+
+        self.statements = 0
+        event.listen(self.db.engine, "before_cursor_execute", self.count_statement)
+
+    def tearDown(self):
+        self.db.engine.dispose()
+        shutil.rmtree(self.temp_dir)
+
+    def count_statement(self, *args):
+        self.statements += 1
+
+    def measure(self, save_page, posts):
+        self.statements = 0
+        start = time.perf_counter()
+        save_page(posts)
+        return self.statements, (time.perf_counter() - start) * 1000
+
+    def per_item(self, posts):
+        for i in posts:
+            self.db.get_or_create_post(user_id=1, **post_fields(i))
+            for url in image_urls(i):
+                self.db.is_image_processed(url)
+
+    def bulk(self, posts):
+        self.db.get_or_create_posts(1, [post_fields(i) for i in posts])
+        self.db.get_processed_image_urls(url for i in posts for url in image_urls(i))
+
+    def test_bulk_page_uses_a_handful_of_round_trips(self):
+        per_item = self.measure(self.per_item, range(0, POSTS))
+        bulk = self.measure(self.bulk, range(POSTS, POSTS * 2))
+
+        print(f"\n{POSTS} posts, {POSTS * IMAGES_PER_POST} images, a quarter of the posts already saved")
+        for name, (statements, elapsed) in (('per item', per_item), ('bulk', bulk)):
+            print(f"{name:>9}: {statements} statements, {elapsed:.1f}ms")
+
+        self.assertLessEqual(bulk[0], 5)
+        self.assertGreater(per_item[0], POSTS * (1 + IMAGES_PER_POST))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,76 @@
+# Copyright (C) 2025 iolaire mcfadden.
+# This program is free software: you can redistribute it and/or modify it under the terms of the GNU Affero General Public License as published by the Free Software Foundation, either version 3 of the License, or (at your option) any later version.
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+"""
+Performance tests for database connection pooling.
+
+Compares per-query latency of a session-per-query workload, the pattern
+used by the web app and RQ tasks, with NullPool (a new MySQL connection
+for every session) and with the QueuePool DatabaseManager now uses.
+Runs against DATABASE_URL and is skipped when MySQL is not reachable.
+"""
+
+import os
+import statistics
+import sys
+import time
+import unittest
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import NullPool, QueuePool
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
+
+QUERIES = 500
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+class TestDatabasePoolPerformance(unittest.TestCase):
+    """Per-query latency, NullPool vs QueuePool"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.database_url = os.getenv('DATABASE_URL', '')
+        if not cls.database_url.startswith('mysql'):
+            raise unittest.SkipTest("DATABASE_URL does not point at MySQL")
+        try:
+            probe = create_engine(cls.database_url, poolclass=NullPool)
+            with probe.connect() as connection:
+                connection.execute(text("SELECT 1"))
+            probe.dispose()
+        except Exception as e:
+            raise unittest.SkipTest(f"MySQL not reachable: {e}")
+
+    def measure(self, **engine_kwargs):
+        engine = create_engine(self.database_url, pool_pre_ping=True, **engine_kwargs)
+        Session = sessionmaker(bind=engine, expire_on_commit=False)
+        try:
+            with Session() as session:
+                session.execute(text("SELECT 1"))  # Warm up
+            samples = []
+            for _ in range(QUERIES):
+                start = time.perf_counter()
+                with Session() as session:
+                    session.execute(text("SELECT 1")).scalar()
+                samples.append((time.perf_counter() - start) * 1000)
+            return samples
+        finally:
+            engine.dispose()
+
+    def test_pooled_queries_are_faster(self):
+        unpooled = self.measure(poolclass=NullPool)
+        pooled = self.measure(poolclass=QueuePool, pool_size=5, max_overflow=10)
+
+        print(f"\n{QUERIES} session-per-query SELECT 1 round trips")
+        for name, samples in (('NullPool', unpooled), ('QueuePool', pooled)):
+            print(f"{name:>10}: p50 {statistics.median(samples):.2f}ms, "
+                  f"p95 {percentile(samples, 95):.2f}ms, mean {statistics.mean(samples):.2f}ms")
+
+        self.assertLess(statistics.median(pooled), statistics.median(unpooled))
+
+if __name__ == '__main__':
+    unittest.main()
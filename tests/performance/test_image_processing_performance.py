@@ -0,0 +1,129 @@
+# Copyright (C) 2025 iolaire mcfadden.
+# This program is free software: you can redistribute it and/or modify it under the terms of the GNU Affero General Public License as published by the Free Software Foundation, either version 3 of the License, or (at your option) any later version.
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+"""
+Performance tests for downloaded image processing.
+
+Compares CPU time and peak RSS per image of the single-decode
+transcode_image pass against the previous flow, which wrote a temporary
+file and then decoded it three times (validate, optimize, validate). Each
+variant runs in a freshly spawned child so peak RSS is measured in
+isolation from memory the test process has already touched.
+"""
+
+import io
+import multiprocessing
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import unittest
+
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
+
+from app.utils.processing.image_processor import transcode_image
+
+IMAGES = 10
+IMAGE_SIZE = (4000, 3000)
+
+def make_photo_bytes(seed):
+    """A camera-sized JPEG with photo-like detail"""
+    rng = np.random.default_rng(seed)
+    coarse = rng.integers(0, 256, size=(30, 40, 3), dtype=np.uint8)
+    img = Image.fromarray(coarse).resize(IMAGE_SIZE, Image.Resampling.BICUBIC)
+    noise = rng.integers(-12, 12, size=(IMAGE_SIZE[1], IMAGE_SIZE[0], 3))
+    pixels = np.clip(np.asarray(img, dtype=np.int16) + noise, 0, 255).astype(np.uint8)
+    buffer = io.BytesIO()
+    Image.fromarray(pixels).save(buffer, 'JPEG', quality=92)
+    return buffer.getvalue()
+
+def legacy_process(data, filepath):
+    """The previous flow: temp file, validate, optimize, validate"""
+    temp_filepath = f"{filepath}.tmp"
+    with open(temp_filepath, 'wb') as f:
+        f.write(data)
+    with Image.open(temp_filepath) as img:
+        img.load()
+    os.rename(temp_filepath, filepath)
+    with Image.open(filepath) as img:
+        if img.mode not in ('RGB', 'RGBA'):
+            img = img.convert('RGB')
+        if img.size[0] > 1024 or img.size[1] > 1024:
+            img.thumbnail((1024, 1024), Image.Resampling.LANCZOS)
+        img.save(filepath, quality=85, optimize=True)
+    with Image.open(filepath) as img:
+        img.load()
+    return filepath
+
+def single_pass_process(data, filepath):
+    return transcode_image(data, filepath)[0]
+
+def read_rss_kib(field):
+    """Read VmRSS or VmHWM (peak RSS) of this process from /proc"""
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith(field + ':'):
+                return int(line.split()[1])
+    raise RuntimeError(f"{field} not available")
+
+def run_variant(process, images, directory, results):
+    """Child process body: process every image and report resource usage"""
+    # Reset the peak RSS so it only covers image processing
+    with open('/proc/self/clear_refs', 'w') as f:
+        f.write('5')
+    baseline_rss = read_rss_kib('VmRSS')
+    start = resource.getrusage(resource.RUSAGE_SELF)
+    for i, data in enumerate(images):
+        process(data, os.path.join(directory, f"image_{i}.jpg"))
+    end = resource.getrusage(resource.RUSAGE_SELF)
+    results.put({
+        'cpu_ms_per_image': ((end.ru_utime + end.ru_stime) - (start.ru_utime + start.ru_stime)) * 1000 / len(images),
+        'peak_rss_growth_mb': (read_rss_kib('VmHWM') - baseline_rss) / 1024
+    })
+
+class TestImageProcessingPerformance(unittest.TestCase):
+    """CPU time and peak RSS per image, previous flow vs single decode"""
+
+    @classmethod
+    def setUpClass(cls):
+        if not os.path.exists('/proc/self/clear_refs'):
+            raise unittest.SkipTest("Peak RSS measurement requires Linux /proc")
+        cls.images = [make_photo_bytes(seed) for seed in range(IMAGES)]
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def measure(self, process):
+        context = multiprocessing.get_context('spawn')
+        results = context.Queue()
+        directory = tempfile.mkdtemp(dir=self.temp_dir)
+        child = context.Process(target=run_variant, args=(process, self.images, directory, results))
+        child.start()
+        stats = results.get(timeout=300)
+        child.join()
+        self.assertEqual(child.exitcode, 0)
+        return stats
+
+    def test_single_decode_uses_less_cpu_and_memory(self):
+        legacy = self.measure(legacy_process)
+        single_pass = self.measure(single_pass_process)
+
+        print(f"\n{IMAGES} images of {IMAGE_SIZE[0]}x{IMAGE_SIZE[1]} "
+              f"({sum(map(len, self.images)) / len(self.images) / 1024 / 1024:.1f}MB avg JPEG)")
+        for name, stats in (('previous flow', legacy), ('single decode', single_pass)):
+            print(f"{name:>14}: {stats['cpu_ms_per_image']:.1f}ms CPU/image, "
+                  f"peak RSS growth {stats['peak_rss_growth_mb']:.1f}MB")
+
+        self.assertLess(single_pass['cpu_ms_per_image'], legacy['cpu_ms_per_image'])
+        self.assertLessEqual(single_pass['peak_rss_growth_mb'], legacy['peak_rss_growth_mb'])
+
+if __name__ == '__main__':
+    unittest.main()
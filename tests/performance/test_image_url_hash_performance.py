@@ -0,0 +1,96 @@
+# Copyright (C) 2025 iolaire mcfadden.
+# This program is free software: you can redistribute it and/or modify it under the terms of the GNU Affero General Public License as published by the Free Software Foundation, either version 3 of the License, or (at your option) any later version.
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+"""
+Performance tests for image URL lookups.
+
+Compares the is_image_processed lookup filtering on the unindexed
+image_url TEXT column against the lookup through the indexed
+(platform_connection_id, image_url_hash) pair, on an images table of
+1M rows. Set URL_HASH_BENCHMARK_ROWS=1000000,10000000 to also run at 10M
+rows, which needs a few GB of free disk space in the temp directory.
+"""
+
+import os
+import random
+import shutil
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
+
+from models import Image
+
+ROW_COUNTS = [int(n) for n in os.getenv('URL_HASH_BENCHMARK_ROWS', '1000000').split(',')]
+INSERT_BATCH = 100000
+HASH_LOOKUPS = 1000
+SCAN_LOOKUPS = 5
+CONNECTIONS = 20
+
+def image_url(i):
+    return f"https://pixelfed.example/storage/m/_v2/{i % 997}/{i:012d}/photo_{i}.jpg"
+
+def build_images_table(path, rows):
+    connection = sqlite3.connect(path)
+    connection.execute(
+        "CREATE TABLE images (id INTEGER PRIMARY KEY, platform_connection_id INTEGER, "
+        "image_url TEXT NOT NULL, image_url_hash VARCHAR(64), status VARCHAR(20))"
+    )
+    for start in range(0, rows, INSERT_BATCH):
+        connection.executemany(
+            "INSERT INTO images VALUES (?, ?, ?, ?, 'posted')",
+            ((i, i % CONNECTIONS, image_url(i), Image.hash_url(image_url(i)))
+             for i in range(start, min(rows, start + INSERT_BATCH)))
+        )
+    connection.execute("CREATE INDEX ix_image_platform_url_hash ON images (platform_connection_id, image_url_hash)")
+    connection.commit()
+    return connection
+
+def time_lookups(connection, query, params_list):
+    samples = []
+    for params in params_list:
+        start = time.perf_counter()
+        connection.execute(query, params).fetchone()
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples)
+
+class TestImageUrlHashPerformance(unittest.TestCase):
+    """Lookup latency, URL scan vs indexed hash"""
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def test_hash_lookup_is_faster_than_url_scan(self):
+        for rows in ROW_COUNTS:
+            with self.subTest(rows=rows):
+                connection = build_images_table(os.path.join(self.temp_dir, f"images_{rows}.db"), rows)
+                try:
+                    ids = [random.randrange(rows) for _ in range(HASH_LOOKUPS)]
+                    scan = time_lookups(
+                        connection,
+                        "SELECT status FROM images WHERE image_url = ? AND platform_connection_id = ?",
+                        [(image_url(i), i % CONNECTIONS) for i in ids[:SCAN_LOOKUPS]]
+                    )
+                    hashed = time_lookups(
+                        connection,
+                        "SELECT status FROM images WHERE image_url_hash = ? AND image_url = ? "
+                        "AND platform_connection_id = ?",
+                        [(Image.hash_url(image_url(i)), image_url(i), i % CONNECTIONS) for i in ids]
+                    )
+                finally:
+                    connection.close()
+
+                print(f"\n{rows:,} rows: URL scan p50 {scan:.2f}ms, hash index p50 {hashed:.3f}ms "
+                      f"({scan / hashed:.0f}x)")
+                self.assertLess(hashed * 10, scan)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,81 @@
+# Copyright (C) 2025 iolaire mcfadden.
+# This program is free software: you can redistribute it and/or modify it under the terms of the GNU Affero General Public License as published by the Free Software Foundation, either version 3 of the License, or (at your option) any later version.
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+"""
+Performance tests for perceptual hash near-duplicate lookups.
+
+Measures lookup latency of the multi-index Hamming index with 1M stored
+hashes, for near-duplicate queries and for queries with no match.
+"""
+
+import os
+import random
+import statistics
+import sys
+import time
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
+
+from app.utils.processing.perceptual_hash import PerceptualHashIndex, DEFAULT_MAX_DISTANCE
+
+STORED_HASHES = 1_000_000
+QUERIES = 2000
+
+class TestPerceptualHashIndexPerformance(unittest.TestCase):
+    """Lookup latency of PerceptualHashIndex at 1M stored hashes"""
+
+    @classmethod
+    def setUpClass(cls):
+        rng = random.Random(42)
+        cls.hashes = [rng.getrandbits(64) for _ in range(STORED_HASHES)]
+        cls.index = PerceptualHashIndex()
+
+        start = time.perf_counter()
+        for image_id, value in enumerate(cls.hashes):
+            cls.index.add(value, image_id)
+        cls.build_time = time.perf_counter() - start
+        print(f"\nIndexed {STORED_HASHES:,} hashes in {cls.build_time:.1f}s")
+
+    def measure(self, queries):
+        latencies = []
+        for query in queries:
+            start = time.perf_counter()
+            self.index.search(query, DEFAULT_MAX_DISTANCE)
+            latencies.append((time.perf_counter() - start) * 1000)
+        latencies.sort()
+        return {
+            'mean_ms': statistics.mean(latencies),
+            'p50_ms': latencies[len(latencies) // 2],
+            'p99_ms': latencies[int(len(latencies) * 0.99)]
+        }
+
+    def test_near_duplicate_lookup_latency(self):
+        """Queries a few bits away from a stored hash, as for a resized repost"""
+        rng = random.Random(1)
+        queries = []
+        for _ in range(QUERIES):
+            value = self.hashes[rng.randrange(STORED_HASHES)]
+            for bit in rng.sample(range(64), rng.randint(0, 4)):
+                value ^= 1 << bit
+            queries.append(value)
+
+        stats = self.measure(queries)
+        print(f"Near-duplicate lookup: mean {stats['mean_ms']:.3f}ms, "
+              f"p50 {stats['p50_ms']:.3f}ms, p99 {stats['p99_ms']:.3f}ms")
+
+        self.assertTrue(all(self.index.search(query, DEFAULT_MAX_DISTANCE) for query in queries[:100]))
+        self.assertLess(stats['p50_ms'], 1.0)
+
+    def test_unmatched_lookup_latency(self):
+        """Queries for images that have never been seen"""
+        rng = random.Random(2)
+        stats = self.measure([rng.getrandbits(64) for _ in range(QUERIES)])
+        print(f"Unmatched lookup: mean {stats['mean_ms']:.3f}ms, "
+              f"p50 {stats['p50_ms']:.3f}ms, p99 {stats['p99_ms']:.3f}ms")
+
+        self.assertLess(stats['p50_ms'], 1.0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,99 @@
+# Copyright (C) 2025 iolaire mcfadden.
+# This program is free software: you can redistribute it and/or modify it under the terms of the GNU Affero General Public License as published by the Free Software Foundation, either version 3 of the License, or (at your option) any later version.
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+"""
+Performance tests for the Redis session indexes.
+
+Compares finding one user's sessions by scanning every session key, as
+RedisSessionBackend did before the indexes, with reading the user's index,
+at 100k sessions. Runs against fakeredis unless
+SESSION_INDEX_BENCHMARK_REDIS_URL points at a Redis database that may be
+flushed; the keyspace scan takes minutes on fakeredis.
+"""
+
+import json
+import os
+import statistics
+import sys
+import time
+import unittest
+from unittest.mock import patch
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
+
+import redis
+
+from app.core.session.redis.manager import RedisSessionBackend
+
+REDIS_URL = os.getenv('SESSION_INDEX_BENCHMARK_REDIS_URL')
+SESSIONS = int(os.getenv('SESSION_INDEX_BENCHMARK_SESSIONS', '100000'))
+SESSIONS_PER_USER = 5
+LOOKUPS = 100
+INSERT_BATCH = 10000
+TTL = 7200
+
+def make_backend():
+    if REDIS_URL:
+        client = redis.from_url(REDIS_URL, decode_responses=True)
+    else:
+        import fakeredis
+        client = fakeredis.FakeRedis(decode_responses=True)
+    client.flushdb()
+    with patch('redis.from_url', return_value=client):
+        return RedisSessionBackend(redis_url="redis://benchmark")
+
+def fill_sessions(backend):
+    """Write SESSIONS sessions and their index entries as RedisSessionBackend.set does"""
+    expires_at = time.time() + TTL
+    for start in range(0, SESSIONS, INSERT_BATCH):
+        pipeline = backend.redis.pipeline(transaction=False)
+        ids = range(start, min(SESSIONS, start + INSERT_BATCH))
+        for i in ids:
+            pipeline.set(backend._get_key(f"s{i}"), json.dumps({'user_id': i // SESSIONS_PER_USER}), ex=TTL)
+        pipeline.zadd(backend._all_index_key(), {f"s{i}": expires_at for i in ids})
+        for user_id in range(ids[0] // SESSIONS_PER_USER, (ids[-1] // SESSIONS_PER_USER) + 1):
+            pipeline.zadd(backend._user_index_key(user_id),
+                          {f"s{i}": expires_at for i in ids if i // SESSIONS_PER_USER == user_id})
+        pipeline.execute()
+
+def scan_sessions_by_user(backend, user_id):
+    """The lookup before the indexes: GET every session key"""
+    sessions = []
+    for key in backend.redis.scan_iter(match=f"{backend.key_prefix}*"):
+        data = backend.redis.get(key)
+        if data and json.loads(data).get('user_id') == user_id:
+            sessions.append(key[len(backend.key_prefix):])
+    return sessions
+
+def time_ms(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return (time.perf_counter() - start) * 1000, result
+
+class TestSessionIndexPerformance(unittest.TestCase):
+    """User session lookup, keyspace scan vs index"""
+
+    def test_index_lookup_is_faster_than_scan(self):
+        backend = make_backend()
+        fill_sessions(backend)
+        users = SESSIONS // SESSIONS_PER_USER
+
+        scan_ms, scanned = time_ms(scan_sessions_by_user, backend, 42)
+        samples = []
+        for user_id in range(0, users, max(1, users // LOOKUPS)):
+            elapsed, sessions = time_ms(backend.get_sessions_by_user, user_id)
+            samples.append(elapsed)
+            self.assertEqual(len(sessions), SESSIONS_PER_USER)
+        indexed_ms = statistics.median(samples)
+        count_ms, count = time_ms(backend.get_session_count)
+        logout_ms, logged_out = time_ms(backend.cleanup_user_sessions, 42)
+
+        print(f"\n{SESSIONS:,} sessions: scan lookup {scan_ms:.0f}ms, index lookup p50 {indexed_ms:.2f}ms "
+              f"({scan_ms / indexed_ms:.0f}x), count {count_ms:.2f}ms, logout-all {logout_ms:.2f}ms")
+        self.assertEqual(sorted(scanned), sorted(f"s{i}" for i in range(210, 215)))
+        self.assertEqual((count, logged_out), (SESSIONS, SESSIONS_PER_USER))
+        self.assertLess(indexed_ms * 100, scan_ms)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,113 @@
+# Copyright (C) 2025 iolaire mcfadden.
+# This program is free software: you can redistribute it and/or modify it under the terms of the GNU Affero General Public License as published by the Free Software Foundation, either version 3 of the License, or (at your option) any later version.
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+"""
+Contention benchmark for task claiming.
+
+Several workers, each with its own TaskQueueManager and engine as if on
+separate hosts, drain one queue. The process-local lock of the legacy
+path does nothing across managers, so two workers can pick the same task;
+claim_next_task must hand every task to exactly one worker. Runs on a
+SQLite file by default; set TASK_CLAIM_BENCHMARK_DATABASE_URL to an empty
+MySQL or MariaDB database to measure FOR UPDATE SKIP LOCKED.
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from collections import Counter
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from models import Base, CaptionGenerationTask, JobPriority, TaskStatus, User, UserRole
+from app.services.task.core.task_queue_manager import TaskQueueManager
+
+DATABASE_URL = os.getenv('TASK_CLAIM_BENCHMARK_DATABASE_URL')
+WORKERS = int(os.getenv('TASK_CLAIM_BENCHMARK_WORKERS', '8'))
+TASKS = int(os.getenv('TASK_CLAIM_BENCHMARK_TASKS', '400'))
+PRIORITIES = [JobPriority.URGENT, JobPriority.HIGH, JobPriority.NORMAL, JobPriority.LOW]
+
+def make_db_manager(url):
+    engine = create_engine(url, connect_args={'timeout': 30} if url.startswith('sqlite') else {})
+    return SimpleNamespace(engine=engine, get_session=sessionmaker(bind=engine, expire_on_commit=False))
+
+def fill_queue(db_manager):
+    session = db_manager.get_session()
+    session.query(CaptionGenerationTask).delete()
+    session.query(User).delete()
+    session.add_all([User(id=i, username=f"user{i}", email=f"user{i}@example.com", password_hash="x",
+                          role=UserRole.ADMIN if i == 1 else UserRole.REVIEWER) for i in range(1, 11)])
+    created = datetime(2025, 1, 1)
+    session.add_all([CaptionGenerationTask(user_id=i % 10 + 1, platform_connection_id=1,
+                                           priority=PRIORITIES[i % len(PRIORITIES)], status=TaskStatus.QUEUED,
+                                           created_at=created + timedelta(seconds=i)) for i in range(TASKS)])
+    session.commit()
+    session.close()
+
+def drain(url, claim):
+    """Drain the queue with WORKERS threads, returning the claim count per task and the elapsed seconds"""
+    claims = Counter()
+    lock = threading.Lock()
+    barrier = threading.Barrier(WORKERS)
+
+    def worker():
+        manager = TaskQueueManager(make_db_manager(url), max_concurrent_tasks=TASKS * 2)
+        barrier.wait()
+        idle = 0
+        while idle < 3:
+            task = claim(manager)
+            if task is None:
+                idle += 1
+                continue
+            idle = 0
+            with lock:
+                claims[task.id] += 1
+
+    threads = [threading.Thread(target=worker) for _ in range(WORKERS)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return claims, time.perf_counter() - start
+
+class TestTaskClaimContention(unittest.TestCase):
+    """Claims per second and double claims, legacy lock vs atomic claim"""
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.url = DATABASE_URL or f"sqlite:///{os.path.join(self.temp_dir, 'tasks.db')}"
+        self.db_manager = make_db_manager(self.url)
+        Base.metadata.create_all(self.db_manager.engine)
+
+    def tearDown(self):
+        self.db_manager.engine.dispose()
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def test_atomic_claim_never_double_claims(self):
+        results = {}
+        for name, claim in (('legacy', TaskQueueManager._get_next_task_locked),
+                            ('atomic', TaskQueueManager.claim_next_task)):
+            fill_queue(self.db_manager)
+            claims, elapsed = drain(self.url, claim)
+            doubles = sum(count - 1 for count in claims.values() if count > 1)
+            results[name] = (claims, doubles)
+            print(f"\n{name}: {sum(claims.values())} claims of {len(claims)} tasks by {WORKERS} workers in "
+                  f"{elapsed:.2f}s ({sum(claims.values()) / elapsed:.0f} claims/s), {doubles} double claims")
+
+        claims, doubles = results['atomic']
+        self.assertEqual(doubles, 0)
+        self.assertEqual(len(claims), TASKS)
+
+if __name__ == '__main__':
+    unittest.main()
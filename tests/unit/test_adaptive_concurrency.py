@@ -0,0 +1,152 @@
+# Copyright (C) 2025 iolaire mcfadden.
+# This program is free software: you can redistribute it and/or modify it under the terms of the GNU Affero General Public License as published by the Free Software Foundation, either version 3 of the License, or (at your option) any later version.
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+Unit tests for the adaptive concurrency limiter and batch caption generation
+"""
+
+import asyncio
+import unittest
+
+from config import OllamaConfig, RetryConfig, FallbackConfig, CaptionConfig
+from app.utils.processing.adaptive_concurrency import AdaptiveConcurrencyLimiter
+from app.utils.processing.ollama_caption_generator import OllamaCaptionGenerator
+
+class TestAdaptiveConcurrencyLimiter(unittest.IsolatedAsyncioTestCase):
+    """Test limit growth and back-off of AdaptiveConcurrencyLimiter"""
+
+    async def test_limit_grows_while_latency_is_flat(self):
+        limiter = AdaptiveConcurrencyLimiter(max_limit=4)
+        for _ in range(20):
+            await limiter.acquire()
+            await limiter.release(latency=1.0)
+        self.assertEqual(limiter.limit, 4)
+
+    async def test_limit_shrinks_when_latency_rises(self):
+        limiter = AdaptiveConcurrencyLimiter(max_limit=8, initial_limit=8)
+        await limiter.acquire()
+        await limiter.release(latency=1.0)
+        for _ in range(5):
+            await limiter.acquire()
+            await limiter.release(latency=5.0)
+        self.assertLess(limiter.limit, 8)
+        self.assertGreater(limiter.get_stats()['decreases'], 0)
+
+    async def test_failure_shrinks_limit(self):
+        limiter = AdaptiveConcurrencyLimiter(max_limit=4, initial_limit=4)
+        await limiter.acquire()
+        await limiter.release(success=False)
+        self.assertEqual(limiter.limit, 3)
+
+    async def test_in_flight_never_exceeds_limit(self):
+        limiter = AdaptiveConcurrencyLimiter(max_limit=3)
+        active = 0
+        max_active = 0
+
+        async def call():
+            nonlocal active, max_active
+            async with limiter.slot():
+                active += 1
+                max_active = max(max_active, active)
+                await asyncio.sleep(0.01)
+                active -= 1
+
+        await asyncio.gather(*(call() for _ in range(20)))
+        self.assertLessEqual(max_active, 3)
+        self.assertEqual(limiter.in_flight, 0)
+
+class FakeParallelOllama:
+    """Stand-in for generate_caption on a server with a fixed number of parallel slots"""
+
+    def __init__(self, parallel, service_time=0.02):
+        self.slots = asyncio.Semaphore(parallel)
+        self.service_time = service_time
+        self.active = 0
+        self.max_active = 0
+
+    async def generate_caption(self, image_path, prompt=None):
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        try:
+            async with self.slots:
+                await asyncio.sleep(self.service_time)
+        finally:
+            self.active -= 1
+        if image_path.endswith("broken.jpg"):
+            raise RuntimeError("unreadable image")
+        return f"Caption for {image_path}", {'overall_score': 80}
+
+class TestGenerateMultipleCaptions(unittest.IsolatedAsyncioTestCase):
+    """Test the concurrent batch API of OllamaCaptionGenerator"""
+
+    def make_generator(self, server, max_concurrent_requests=4):
+        config = OllamaConfig(
+            max_concurrent_requests=max_concurrent_requests,
+            retry=RetryConfig(max_attempts=1),
+            fallback=FallbackConfig(enabled=False),
+            caption=CaptionConfig()
+        )
+        generator = OllamaCaptionGenerator(config)
+        generator.connection_validated = True
+        generator.generate_caption = server.generate_caption
+        return generator
+
+    async def test_results_in_input_order(self):
+        server = FakeParallelOllama(parallel=4)
+        generator = self.make_generator(server)
+        paths = [f"/tmp/{i}.jpg" for i in range(8)]
+
+        results, _ = await generator.generate_multiple_captions(paths)
+
+        self.assertEqual(results, [(f"Caption for {path}", {'overall_score': 80}) for path in paths])
+
+    async def test_timings_are_recorded_per_item_in_order(self):
+        generator = self.make_generator(FakeParallelOllama(parallel=2, service_time=0.01))
+        paths = ["/tmp/a.jpg", "/tmp/broken.jpg", "/tmp/c.jpg"]
+
+        _, stats = await generator.generate_multiple_captions(paths)
+
+        items = stats['items']
+        self.assertEqual([item['path'] for item in items], paths)
+        self.assertTrue(all(item['duration'] > 0 for item in items))
+        self.assertEqual([item['error'] for item in items], [None, "unreadable image", None])
+
+    async def test_parallel_server_is_kept_busy(self):
+        server = FakeParallelOllama(parallel=4, service_time=0.02)
+        generator = self.make_generator(server, max_concurrent_requests=4)
+
+        _, stats = await generator.generate_multiple_captions([f"/tmp/{i}.jpg" for i in range(24)])
+
+        self.assertEqual(server.max_active, 4)
+        self.assertEqual(stats['max_limit_reached'], 4)
+
+    async def test_failed_item_does_not_fail_batch(self):
+        generator = self.make_generator(FakeParallelOllama(parallel=2))
+
+        results, _ = await generator.generate_multiple_captions(["/tmp/a.jpg", "/tmp/broken.jpg"])
+
+        self.assertEqual(results, [("Caption for /tmp/a.jpg", {'overall_score': 80}), (None, None)])
+
+    async def test_failures_lower_the_concurrency_limit(self):
+        server = FakeParallelOllama(parallel=4)
+        generator = self.make_generator(server)
+        generate_caption = server.generate_caption
+
+        async def fail_after_warm_up(image_path, prompt=None):
+            result = await generate_caption(image_path, prompt)
+            return None if int(image_path[5:-4]) >= 12 else result
+
+        generator.generate_caption = fail_after_warm_up
+
+        results, stats = await generator.generate_multiple_captions([f"/tmp/{i}.jpg" for i in range(24)])
+
+        self.assertEqual(sum(1 for caption, _ in results if caption is None), 12)
+        self.assertEqual(stats['items'][12]['error'], "No caption generated")
+        self.assertLess(stats['limit'], stats['max_limit_reached'])
+
+    async def test_empty_batch(self):
+        generator = self.make_generator(FakeParallelOllama(parallel=1))
+        self.assertEqual(await generator.generate_multiple_captions([]), ([], {'items': []}))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -14,13 +14,13 @@ from unittest.mock import Mock, patch
 sys.path.insert(0, os.path.abspath('.'))
 
 from app.utils.processing.ollama_caption_generator import OllamaCaptionGenerator
-from config import Config
+from config import Config, OllamaConfig
 
 def test_ai_generated_suffix():
     """Test that the AI-generated suffix is properly appended"""
     
-    # Create a mock config
-    config = Mock()
+    # Create a config with mock retry, fallback and caption settings
+    config = OllamaConfig()
     config.url = "http://localhost:11434"
     config.model_name = "llava:7b"
     config.timeout = 30.0
@@ -0,0 +1,223 @@
+# Copyright (C) 2025 iolaire mcfadden.
+# This program is free software: you can redistribute it and/or modify it under the terms of the GNU Affero General Public License as published by the Free Software Foundation, either version 3 of the License, or (at your option) any later version.
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+Unit tests for the content-addressed caption cache
+"""
+
+import asyncio
+import json
+import os
+import tempfile
+import time
+import unittest
+
+import fakeredis
+import httpx
+
+from config import OllamaConfig, RetryConfig, FallbackConfig, CaptionConfig, CaptionCacheConfig
+from app.utils.processing.caption_cache import (
+    CaptionCache, MemoryCaptionCacheBackend, RedisCaptionCacheBackend, caption_cache_key
+)
+from app.utils.processing.ollama_caption_generator import OllamaCaptionGenerator
+
+METRICS = {'overall_score': 80, 'quality_level': 'good', 'needs_review': False}
+
+class TestCaptionCacheKey(unittest.TestCase):
+    """Test which inputs change the cache key"""
+
+    def test_key_depends_on_content_and_settings(self):
+        key = caption_cache_key(b"image", "llava:7b", "describe", 1)
+        self.assertEqual(key, caption_cache_key(b"image", "llava:7b", "describe", 1))
+        self.assertNotEqual(key, caption_cache_key(b"other", "llava:7b", "describe", 1))
+        self.assertNotEqual(key, caption_cache_key(b"image", "llava:13b", "describe", 1))
+        self.assertNotEqual(key, caption_cache_key(b"image", "llava:7b", "summarize", 1))
+        self.assertNotEqual(key, caption_cache_key(b"image", "llava:7b", "describe", 2))
+
+class CaptionCacheBackendTests:
+    """Behaviour shared by every cache backend"""
+
+    def make_backend(self, max_entries=3, ttl=60):
+        raise NotImplementedError
+
+    def test_round_trip_and_hit_rate(self):
+        cache = CaptionCache(self.make_backend())
+        self.assertIsNone(cache.get("a"))
+        cache.set("a", "A dog (AI-generated)", METRICS)
+
+        self.assertEqual(cache.get("a"), ("A dog (AI-generated)", METRICS))
+        stats = cache.get_stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['stores']), (1, 1, 1))
+        self.assertEqual(stats['hit_rate'], 50.0)
+        self.assertEqual(stats['entries'], 1)
+
+    def test_least_recently_used_entry_is_evicted(self):
+        cache = CaptionCache(self.make_backend(max_entries=2))
+        cache.set("a", "A", None)
+        cache.set("b", "B", None)
+        cache.get("a")
+        cache.set("c", "C", None)
+
+        self.assertIsNone(cache.get("b"))
+        self.assertIsNotNone(cache.get("a"))
+        self.assertIsNotNone(cache.get("c"))
+        self.assertEqual(cache.get_stats()['evictions'], 1)
+
+    def test_corrupt_entry_is_a_miss(self):
+        backend = self.make_backend()
+        cache = CaptionCache(backend)
+        backend.set("a", "{not json")
+        backend.set("b", json.dumps({'quality_metrics': None}))
+
+        self.assertIsNone(cache.get("a"))
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get_stats()['misses'], 2)
+
+class TestMemoryCaptionCache(CaptionCacheBackendTests, unittest.TestCase):
+    def make_backend(self, max_entries=3, ttl=60):
+        return MemoryCaptionCacheBackend(max_entries, ttl)
+
+    def test_expired_entry_is_a_miss(self):
+        cache = CaptionCache(self.make_backend(ttl=0))
+        cache.set("a", "A", None)
+        self.assertIsNone(cache.get("a"))
+
+class TestRedisCaptionCache(CaptionCacheBackendTests, unittest.TestCase):
+    def make_backend(self, max_entries=3, ttl=60):
+        self.redis = fakeredis.FakeRedis()
+        return RedisCaptionCacheBackend(self.redis, max_entries, ttl)
+
+    def test_entries_have_ttl(self):
+        cache = CaptionCache(self.make_backend(ttl=120))
+        cache.set("a", "A", None)
+        ttl = self.redis.ttl(RedisCaptionCacheBackend.PREFIX + "a")
+        self.assertTrue(0 < ttl <= 120)
+
+    def test_expired_entries_leave_the_lru_index(self):
+        backend = self.make_backend(max_entries=2, ttl=60)
+        cache = CaptionCache(backend)
+        cache.set("a", "A", None)
+        cache.set("b", "B", None)
+        # "a" was last used over a TTL ago and Redis has expired it
+        self.redis.zadd(RedisCaptionCacheBackend.LRU_KEY, {"a": time.time() - 120})
+        self.redis.delete(RedisCaptionCacheBackend.PREFIX + "a")
+
+        cache.set("c", "C", None)
+
+        self.assertEqual(cache.get_stats()['evictions'], 0)
+        self.assertEqual(cache.get_stats()['entries'], 2)
+        self.assertIsNotNone(cache.get("b"))
+
+    def test_access_renews_ttl(self):
+        cache = CaptionCache(self.make_backend(ttl=120))
+        cache.set("a", "A", None)
+        self.redis.expire(RedisCaptionCacheBackend.PREFIX + "a", 5)
+
+        cache.get("a")
+
+        self.assertGreater(self.redis.ttl(RedisCaptionCacheBackend.PREFIX + "a"), 5)
+
+    def test_redis_errors_degrade_to_miss(self):
+        backend = self.make_backend()
+        backend.redis = None  # Every call now raises AttributeError
+        cache = CaptionCache(backend)
+
+        cache.set("a", "A", None)
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(cache.get_stats()['errors'], 2)
+
+    def test_unreachable_redis_falls_back_to_memory(self):
+        config = CaptionCacheConfig(backend="redis", redis_url="redis://127.0.0.1:1/0")
+        cache = CaptionCache.from_config(config)
+        self.assertIsInstance(cache.backend, MemoryCaptionCacheBackend)
+
+class TestGeneratorCaptionCache(unittest.IsolatedAsyncioTestCase):
+    """Test that OllamaCaptionGenerator reuses captions for identical images"""
+
+    async def asyncSetUp(self):
+        self.paths = []
+        self.generate_requests = 0
+        self.failing_models = set()
+
+    async def asyncTearDown(self):
+        for path in self.paths:
+            os.remove(path)
+
+    def write_image(self, content):
+        fd, path = tempfile.mkstemp(suffix=".jpg")
+        os.write(fd, content)
+        os.close(fd)
+        self.paths.append(path)
+        return path
+
+    def handler(self, request):
+        if request.url.path == "/api/tags":
+            return httpx.Response(200, json={"models": [{"name": "llava:7b"}]})
+        if json.loads(request.content)['model'] in self.failing_models:
+            return httpx.Response(500, json={"error": "model failed"})
+        self.generate_requests += 1
+        return httpx.Response(200, json={"response": f"Caption number {self.generate_requests}.", "done": True})
+
+    def make_generator(self, fallback=None):
+        config = OllamaConfig(
+            url="http://ollama.test",
+            retry=RetryConfig(max_attempts=1),
+            fallback=fallback or FallbackConfig(enabled=False),
+            caption=CaptionConfig(),
+            cache=CaptionCacheConfig(backend="memory")
+        )
+        generator = OllamaCaptionGenerator(config)
+        generator._client = httpx.AsyncClient(transport=httpx.MockTransport(self.handler))
+        generator._client_loop = asyncio.get_running_loop()
+        return generator
+
+    async def test_identical_content_reuses_caption(self):
+        generator = self.make_generator()
+        original = self.write_image(b"same pixels")
+        repost = self.write_image(b"same pixels")
+        different = self.write_image(b"other pixels")
+
+        first = await generator.generate_caption(original)
+        second = await generator.generate_caption(repost)
+        third = await generator.generate_caption(different)
+
+        self.assertEqual(second, first)
+        self.assertNotEqual(third[0], first[0])
+        self.assertEqual(self.generate_requests, 2)
+        self.assertEqual(generator.get_cache_stats()['hits'], 1)
+
+    async def test_use_cache_false_regenerates_and_refreshes(self):
+        generator = self.make_generator()
+        path = self.write_image(b"pixels")
+
+        first = await generator.generate_caption(path)
+        regenerated = await generator.generate_caption(path, use_cache=False)
+        cached = await generator.generate_caption(path)
+
+        self.assertNotEqual(regenerated[0], first[0])
+        self.assertEqual(cached[0], regenerated[0])
+        self.assertEqual(self.generate_requests, 2)
+
+    async def test_prompt_is_part_of_key(self):
+        generator = self.make_generator()
+        path = self.write_image(b"pixels")
+
+        await generator.generate_caption(path, prompt="Describe the colors.")
+        await generator.generate_caption(path, prompt="Describe the people.")
+
+        self.assertEqual(self.generate_requests, 2)
+
+    async def test_fallback_caption_is_keyed_by_its_model(self):
+        generator = self.make_generator(FallbackConfig(use_simplified_prompts=False, backup_model_name="llava:13b"))
+        path = self.write_image(b"pixels")
+        self.failing_models.add("llava:7b")
+
+        caption, _ = await generator.generate_caption(path, prompt="Describe.")
+
+        cache = generator.caption_cache
+        version = generator.caption_formatter.VERSION
+        self.assertIsNone(cache.get(caption_cache_key(b"pixels", "llava:7b", "Describe.", version)))
+        self.assertEqual(cache.get(caption_cache_key(b"pixels", "llava:13b", "Describe.", version))[0], caption)
+
+if __name__ == '__main__':
+    unittest.main()
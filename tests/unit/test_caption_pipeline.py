@@ -0,0 +1,265 @@
+# Copyright (C) 2025 iolaire mcfadden.
+# This program is free software: you can redistribute it and/or modify it under the terms of the GNU Affero General Public License as published by the Free Software Foundation, either version 3 of the License, or (at your option) any later version.
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+Unit tests for the staged caption pipeline
+"""
+
+import asyncio
+import time
+import unittest
+from unittest.mock import AsyncMock, MagicMock
+
+from config import PipelineConfig
+from app.utils.processing.caption_pipeline import CaptionPipeline
+
+class FakeImageProcessor:
+    """Image processor whose downloads take a fixed time"""
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.active = 0
+        self.max_active = 0
+        self.permanent_failures = {}
+
+    async def download_and_store_image(self, url, media_type=None):
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        try:
+            await asyncio.sleep(self.delay)
+        finally:
+            self.active -= 1
+        return f"/tmp/{url.rsplit('/', 1)[-1]}"
+
+    def get_perceptual_hash(self, image_path):
+        return None
+
+    def pop_permanent_failure(self, url):
+        return self.permanent_failures.pop(url, None)
+
+class FakeCaptionGenerator:
+    """Caption generator whose requests take a fixed time"""
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.active = 0
+        self.max_active = 0
+
+    async def generate_caption(self, image_path, prompt=None):
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        try:
+            await asyncio.sleep(self.delay)
+        finally:
+            self.active -= 1
+        return f"Caption for {image_path}", {
+            'overall_score': 80, 'quality_level': 'good', 'needs_review': False, 'feedback': ''
+        }
+
+def make_db(processed_urls=()):
+    db = MagicMock()
+    db.is_image_processed.side_effect = lambda url: url in processed_urls
+    db.save_image.side_effect = lambda **kwargs: hash(kwargs['image_url']) & 0xFFFF or 1
+    db.update_image_caption.return_value = True
+    return db
+
+def image_info(i):
+    return {'url': f'https://example.com/media/{i}.jpg', 'mediaType': 'image/jpeg', 'attachment_index': 0}
+
+class TestCaptionPipeline(unittest.IsolatedAsyncioTestCase):
+    """Test the download -> caption -> database pipeline"""
+
+    async def test_all_images_are_captioned(self):
+        db = make_db()
+        pipeline = CaptionPipeline(db, FakeImageProcessor(), FakeCaptionGenerator(),
+                                   PipelineConfig(download_concurrency=2, caption_concurrency=1,
+                                                  db_concurrency=1, queue_size=2))
+        async with pipeline:
+            for i in range(10):
+                await pipeline.submit(image_info(i), post_id=1)
+
+        self.assertEqual(pipeline.stats['images_processed'], 10)
+        self.assertEqual(pipeline.stats['captions_generated'], 10)
+        self.assertEqual(db.update_image_caption.call_count, 10)
+        self.assertEqual(pipeline.get_stage_stats()['caption']['count'], 10)
+
+    async def test_skips_already_processed_images(self):
+        db = make_db(processed_urls={image_info(0)['url']})
+        pipeline = CaptionPipeline(db, FakeImageProcessor(), FakeCaptionGenerator(), PipelineConfig())
+        async with pipeline:
+            for i in range(3):
+                await pipeline.submit(image_info(i), post_id=1)
+
+        self.assertEqual(pipeline.stats['skipped_existing'], 1)
+        self.assertEqual(pipeline.stats['captions_generated'], 2)
+        self.assertEqual(pipeline.stats['images_processed'], 3)
+
+    async def test_reprocess_all_ignores_processed_check(self):
+        db = make_db(processed_urls={image_info(0)['url']})
+        pipeline = CaptionPipeline(db, FakeImageProcessor(), FakeCaptionGenerator(), PipelineConfig(),
+                                   reprocess_all=True)
+        async with pipeline:
+            await pipeline.submit(image_info(0), post_id=1)
+
+        db.is_image_processed.assert_not_called()
+        self.assertEqual(pipeline.stats['captions_generated'], 1)
+
+    async def test_bulk_check_replaces_per_image_queries(self):
+        db = make_db()
+        db.get_processed_image_urls.return_value = {image_info(0)['url']}
+        pipeline = CaptionPipeline(db, FakeImageProcessor(), FakeCaptionGenerator(), PipelineConfig())
+        async with pipeline:
+            await pipeline.check_processed(image_info(i)['url'] for i in range(3))
+            for i in range(4):
+                await pipeline.submit(image_info(i), post_id=1)
+
+        db.get_processed_image_urls.assert_called_once()
+        # Only the image missing from the bulk check is looked up on its own
+        db.is_image_processed.assert_called_once_with(image_info(3)['url'])
+        self.assertEqual(pipeline.stats['skipped_existing'], 1)
+        self.assertEqual(pipeline.stats['captions_generated'], 3)
+
+    async def test_stage_concurrency_limits(self):
+        processor = FakeImageProcessor(delay=0.01)
+        generator = FakeCaptionGenerator(delay=0.02)
+        pipeline = CaptionPipeline(make_db(), processor, generator,
+                                   PipelineConfig(download_concurrency=3, caption_concurrency=2,
+                                                  db_concurrency=1, queue_size=4))
+        async with pipeline:
+            for i in range(20):
+                await pipeline.submit(image_info(i), post_id=1)
+
+        self.assertLessEqual(processor.max_active, 3)
+        self.assertLessEqual(generator.max_active, 2)
+        self.assertEqual(generator.max_active, 2)
+
+    async def test_downloads_overlap_with_captioning(self):
+        # Serial processing would take 10 * (0.02 + 0.05) = 0.7s; with the
+        # stages overlapping the total is bounded by caption throughput.
+        processor = FakeImageProcessor(delay=0.02)
+        generator = FakeCaptionGenerator(delay=0.05)
+        pipeline = CaptionPipeline(make_db(), processor, generator,
+                                   PipelineConfig(download_concurrency=2, caption_concurrency=1,
+                                                  db_concurrency=1, queue_size=2))
+        start = time.monotonic()
+        async with pipeline:
+            for i in range(10):
+                await pipeline.submit(image_info(i), post_id=1)
+        elapsed = time.monotonic() - start
+
+        self.assertLess(elapsed, 0.65)
+        self.assertEqual(pipeline.stats['captions_generated'], 10)
+
+    async def test_backpressure_bounds_downloaded_backlog(self):
+        processor = FakeImageProcessor()
+        generator = FakeCaptionGenerator(delay=0.05)
+        pipeline = CaptionPipeline(make_db(), processor, generator,
+                                   PipelineConfig(download_concurrency=2, caption_concurrency=1,
+                                                  db_concurrency=1, queue_size=1))
+        pipeline.start()
+        submitted = 0
+
+        async def producer():
+            nonlocal submitted
+            for i in range(20):
+                await pipeline.submit(image_info(i), post_id=1)
+                submitted += 1
+
+        task = asyncio.create_task(producer())
+        await asyncio.sleep(0.02)
+        # Only the queues plus one job per worker can be in flight
+        self.assertLess(submitted, 10)
+        await task
+        await pipeline.join()
+        self.assertEqual(pipeline.stats['images_processed'], 20)
+
+    async def test_failed_caption_counts_error(self):
+        generator = FakeCaptionGenerator()
+
+        async def no_caption(image_path, prompt=None):
+            return None
+
+        generator.generate_caption = no_caption
+        db = make_db()
+        pipeline = CaptionPipeline(db, FakeImageProcessor(), generator, PipelineConfig())
+        async with pipeline:
+            await pipeline.submit(image_info(0), post_id=1)
+
+        self.assertEqual(pipeline.stats['errors'], 1)
+        self.assertEqual(pipeline.stats['images_processed'], 1)
+        db.update_image_caption.assert_not_called()
+
+    async def test_worker_exception_does_not_stall_pipeline(self):
+        db = make_db()
+        db.save_image.side_effect = [RuntimeError("boom"), 2]
+        pipeline = CaptionPipeline(db, FakeImageProcessor(), FakeCaptionGenerator(), PipelineConfig())
+        async with pipeline:
+            await pipeline.submit(image_info(0), post_id=1)
+            await pipeline.submit(image_info(1), post_id=1)
+
+        self.assertEqual(pipeline.stats['images_processed'], 2)
+        self.assertEqual(pipeline.stats['captions_generated'], 1)
+        self.assertEqual(pipeline.stats['errors'], 1)
+
+    async def test_failed_download_and_save_count_errors(self):
+        processor = FakeImageProcessor()
+        download = processor.download_and_store_image
+
+        async def fail_first(url, media_type=None):
+            return None if url == image_info(0)['url'] else await download(url, media_type)
+
+        processor.download_and_store_image = fail_first
+        db = make_db()
+        db.save_image.side_effect = lambda **kwargs: None
+        pipeline = CaptionPipeline(db, processor, FakeCaptionGenerator(), PipelineConfig())
+        async with pipeline:
+            await pipeline.submit(image_info(0), post_id=1)
+            await pipeline.submit(image_info(1), post_id=1)
+
+        self.assertEqual(pipeline.stats['errors'], 2)
+        self.assertEqual(pipeline.stats['images_processed'], 2)
+        self.assertEqual(pipeline.stats['captions_generated'], 0)
+        self.assertEqual(pipeline.stats['images_failed_permanently'], 0)
+        db.mark_image_failed.assert_not_called()
+
+    async def test_permanently_failed_download_is_marked(self):
+        processor = FakeImageProcessor()
+        processor.download_and_store_image = AsyncMock(return_value=None)
+        processor.permanent_failures[image_info(0)['url']] = "HTTP 404"
+        db = make_db()
+        pipeline = CaptionPipeline(db, processor, FakeCaptionGenerator(), PipelineConfig())
+        async with pipeline:
+            await pipeline.submit(image_info(0), post_id=1)
+
+        db.mark_image_failed.assert_called_once_with(
+            post_id=1, image_url=image_info(0)['url'], attachment_index=0, error="HTTP 404",
+            media_type='image/jpeg', image_post_id=None
+        )
+        self.assertEqual((pipeline.stats['errors'], pipeline.stats['images_failed_permanently']), (1, 1))
+
+    async def test_near_duplicate_reuses_caption_without_inference(self):
+        processor = FakeImageProcessor()
+        processor.get_perceptual_hash = lambda path: "00000000000000ff" if path.endswith("0.jpg") else None
+        generator = FakeCaptionGenerator()
+        generator.generate_caption = MagicMock(side_effect=generator.generate_caption)
+        lookups = []
+
+        def find_similar_caption(perceptual_hash, exclude_image_id=None):
+            lookups.append((perceptual_hash, exclude_image_id))
+            return {'image_id': 99, 'caption': "A reviewed caption.", 'distance': 1}
+
+        db = make_db()
+        pipeline = CaptionPipeline(db, processor, generator, PipelineConfig(),
+                                   find_similar_caption=find_similar_caption)
+        async with pipeline:
+            await pipeline.submit(image_info(0), post_id=1)
+            await pipeline.submit(image_info(1), post_id=1)
+
+        self.assertEqual(len(lookups), 1)
+        generator.generate_caption.assert_called_once_with("/tmp/1.jpg")
+        db.update_image_caption.assert_any_call(image_id=lookups[0][1], generated_caption="A reviewed caption.",
+                                                quality_metrics=None)
+        self.assertEqual((pipeline.stats['captions_reused'], pipeline.stats['captions_generated']), (1, 1))
+
+if __name__ == '__main__':
+    unittest.main()
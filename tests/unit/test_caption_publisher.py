@@ -0,0 +1,192 @@
+# Copyright (C) 2025 iolaire mcfadden.
+# This program is free software: you can redistribute it and/or modify it under the terms of the GNU Affero General Public License as published by the Free Software Foundation, either version 3 of the License, or (at your option) any later version.
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+Unit tests for per-status, concurrent caption publishing
+"""
+
+import asyncio
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, MagicMock, Mock, patch
+
+import httpx
+
+from models import Base, Image, Post, ProcessingStatus
+from app.services.activitypub.components.activitypub_client import ActivityPubClient
+from app.services.activitypub.components.activitypub_platforms import MastodonPlatform, PixelfedPlatform
+from app.services.activitypub.posts.caption_publisher import CaptionPublisher, publish_image_caption
+from tests.unit.test_database_pool import make_manager
+
+INSTANCE = "https://social.test"
+
+class FakeInstance:
+    """Status and media endpoints that record every request"""
+
+    def __init__(self, platform, delay=0.0):
+        self.platform = platform
+        self.delay = delay
+        self.requests = []
+        self.statuses = {}
+        self.in_flight = self.max_in_flight = 0
+
+    async def _request(self, method, url, json=None):
+        self.requests.append((method, url, json))
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        await asyncio.sleep(self.delay)
+        self.in_flight -= 1
+        request = httpx.Request(method, url)
+        status_id = url.rsplit('/', 1)[-1]
+        if status_id == 'gone':
+            raise httpx.HTTPStatusError("Not Found", request=request, response=httpx.Response(404, request=request))
+        return httpx.Response(200, json=self.statuses.get(status_id, {}), request=request)
+
+    async def _get_with_retry(self, url, headers, params=None):
+        return await self._request('GET', url)
+
+    async def _put_with_retry(self, url, headers, json=None):
+        return await self._request('PUT', url, json)
+
+    update_status_media_captions = ActivityPubClient.update_status_media_captions
+
+def make_platform(platform_class):
+    platform = platform_class(SimpleNamespace(instance_url=INSTANCE, access_token="token"))
+    platform.authenticate = AsyncMock(return_value=True)
+    platform._get_auth_headers = lambda: {'Authorization': 'Bearer token'}
+    return platform
+
+class TestCaptionPublisher(unittest.IsolatedAsyncioTestCase):
+    """Test CaptionPublisher against a fake instance and a SQLite database"""
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.temp_dir)
+        self.db = make_manager(os.path.join(self.temp_dir, "publish.db"))
+        Base.metadata.create_all(self.db.engine)
+
+    def add_status(self, instance, status_id, media_count, extra_media=0):
+        """A status with approved images for media_count of its attachments"""
+        media_ids = [f"{status_id}-m{i}" for i in range(media_count + extra_media)]
+        instance.statuses[status_id] = {'text': f"Status {status_id}",
+                                        'media_attachments': [{'id': media_id} for media_id in media_ids]}
+        session = self.db.get_session()
+        post = Post(post_id=f"{INSTANCE}/users/alice/statuses/{status_id}", user_id=1,
+                    post_url=f"{INSTANCE}/@alice/{status_id}")
+        session.add(post)
+        session.flush()
+        for index, media_id in enumerate(media_ids[:media_count]):
+            session.add(Image(post_id=post.id, image_url=f"{INSTANCE}/{media_id}.jpg", local_path=f"{media_id}.jpg",
+                              attachment_index=index, image_post_id=media_id, final_caption=f"Caption {media_id}",
+                              status=ProcessingStatus.APPROVED))
+        session.commit()
+        session.close()
+
+    def statuses(self):
+        session = self.db.get_session()
+        try:
+            return {image.image_post_id: image.status for image in session.query(Image).all()}
+        finally:
+            session.close()
+
+    async def test_multi_image_status_is_one_edit_on_mastodon(self):
+        instance = FakeInstance(make_platform(MastodonPlatform))
+        self.add_status(instance, "101", 3, extra_media=1)
+        self.add_status(instance, "102", 1)
+
+        result = await CaptionPublisher(self.db).publish(instance, self.db.get_approved_images(50))
+
+        self.assertEqual((result['statuses'], result['posted'], result['failed']), (2, 4, 0))
+        edits = {url.rsplit('/', 1)[-1]: body for method, url, body in instance.requests if method == 'PUT'}
+        self.assertEqual(len(edits), 2)
+        # The attachment without a new caption is kept on the status
+        self.assertEqual(edits['101']['media_ids'], ["101-m0", "101-m1", "101-m2", "101-m3"])
+        self.assertEqual(len(edits['101']['media_attributes']), 3)
+        self.assertEqual(set(self.statuses().values()), {ProcessingStatus.POSTED})
+
+    async def test_pixelfed_updates_each_media(self):
+        instance = FakeInstance(make_platform(PixelfedPlatform))
+        self.add_status(instance, "201", 2)
+
+        result = await CaptionPublisher(self.db).publish(instance, self.db.get_approved_images(50))
+
+        self.assertEqual(result['posted'], 2)
+        self.assertEqual(sorted(url for _, url, _ in instance.requests),
+                         [f"{INSTANCE}/api/v1/media/201-m0", f"{INSTANCE}/api/v1/media/201-m1"])
+
+    async def test_failed_statuses_stay_approved(self):
+        instance = FakeInstance(make_platform(MastodonPlatform))
+        self.add_status(instance, "301", 1)
+        self.add_status(instance, "gone", 2)
+
+        result = await CaptionPublisher(self.db).publish(instance, self.db.get_approved_images(50))
+
+        self.assertEqual((result['posted'], result['failed'], len(result['errors'])), (1, 2, 2))
+        self.assertEqual(self.statuses(), {'301-m0': ProcessingStatus.POSTED,
+                                           'gone-m0': ProcessingStatus.APPROVED,
+                                           'gone-m1': ProcessingStatus.APPROVED})
+
+    async def test_statuses_are_published_concurrently(self):
+        instance = FakeInstance(make_platform(PixelfedPlatform), delay=0.05)
+        for status in range(8):
+            self.add_status(instance, str(400 + status), 1)
+        publisher = CaptionPublisher(self.db, max_concurrency=4)
+
+        start = time.monotonic()
+        await publisher.publish(instance, self.db.get_approved_images(50))
+
+        # Two rounds of four requests rather than eight one after another
+        self.assertLess(time.monotonic() - start, 0.3)
+        self.assertEqual(instance.max_in_flight, 4)
+        stats = publisher.get_stats()
+        self.assertEqual((stats['runs'], stats['posted']), (1, 8))
+        self.assertGreater(stats['images_per_second'], 0)
+
+    async def test_reviewed_caption_is_one_status_edit(self):
+        instance = FakeInstance(make_platform(MastodonPlatform))
+        self.add_status(instance, "501", 2)
+        image = self.db.get_approved_images(50)[1]
+        client_class = MagicMock()
+        client_class.return_value.__aenter__.return_value = instance
+
+        pool = Mock(aclose=AsyncMock())
+
+        with patch('app.services.activitypub.posts.caption_publisher.ActivityPubClient', client_class), \
+             patch('app.services.activitypub.posts.caption_publisher.get_http_client_pool', return_value=pool):
+            self.assertTrue(await publish_image_caption(Mock(), image, "Reviewed"))
+
+        edits = [body for method, _, body in instance.requests if method == 'PUT']
+        self.assertEqual(edits[0]['media_attributes'], [{'id': image.image_post_id, 'description': "Reviewed"}])
+        client_class.return_value.__aexit__.assert_awaited_once()
+        pool.aclose.assert_awaited_once()
+
+class TestMarkImagesPosted(unittest.TestCase):
+    """Test DatabaseManager.mark_images_posted"""
+
+    def test_marks_all_images_in_one_update(self):
+        temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, temp_dir)
+        db = make_manager(os.path.join(temp_dir, "posted.db"))
+        Base.metadata.create_all(db.engine)
+        session = db.get_session()
+        session.add(Post(id=1, post_id="p", user_id=1, post_url="u"))
+        session.add_all([Image(post_id=1, image_url=f"{i}", local_path=f"{i}", attachment_index=i,
+                               status=ProcessingStatus.APPROVED) for i in range(3)])
+        session.commit()
+        session.close()
+
+        self.assertEqual(db.mark_images_posted([1, 2]), 2)
+        self.assertEqual(db.mark_images_posted([]), 0)
+
+        session = db.get_session()
+        self.assertEqual(sorted((image.id, image.status) for image in session.query(Image).all()),
+                         [(1, ProcessingStatus.POSTED), (2, ProcessingStatus.POSTED), (3, ProcessingStatus.APPROVED)])
+        self.assertIsNotNone(session.get(Image, 1).posted_at)
+        session.close()
+
+if __name__ == '__main__':
+    unittest.main()
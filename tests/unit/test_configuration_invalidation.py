@@ -0,0 +1,164 @@
+# Copyright (C) 2025 iolaire mcfadden.
+# This program is free software: you can redistribute it and/or modify it under the terms of the GNU Affero General Public License as published by the Free Software Foundation, either version 3 of the License, or (at your option) any later version.
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+Unit tests for cluster-wide configuration cache invalidation
+"""
+
+import time
+import unittest
+from datetime import datetime, timezone
+from unittest.mock import Mock, patch
+
+from config import ConfigInvalidationConfig
+from app.core.configuration.core.configuration_service import ConfigurationService
+from app.core.configuration.core.system_configuration_manager import SystemConfigurationManager
+from app.core.configuration.events.configuration_event_bus import ConfigurationEventBus, EventType
+from app.core.configuration.events.configuration_invalidation import ConfigurationInvalidationChannel
+
+try:
+    import fakeredis
+except ImportError:
+    fakeredis = None
+
+KEY = "max_concurrent_jobs"
+
+def make_db_manager(read_value):
+    """Mock DatabaseManager whose SystemConfiguration rows hold read_value()"""
+    session = Mock()
+    row = Mock(data_type='integer', updated_at=datetime.now(timezone.utc))
+    row.get_typed_value.side_effect = read_value
+    session.query.return_value.filter_by.return_value.first.return_value = row
+    db_manager = Mock()
+    db_manager.get_session.return_value.__enter__ = Mock(return_value=session)
+    db_manager.get_session.return_value.__exit__ = Mock(return_value=None)
+    return db_manager
+
+def wait_for(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return False
+
+@unittest.skipUnless(fakeredis, "fakeredis not installed")
+class TestConfigurationInvalidationChannel(unittest.TestCase):
+    """Test invalidations between processes sharing a Redis server"""
+
+    def setUp(self):
+        self.server = fakeredis.FakeServer()
+
+    def make_channel(self, start=True):
+        channel = ConfigurationInvalidationChannel(fakeredis.FakeRedis(server=self.server))
+        if start:
+            channel.start()
+            self.addCleanup(channel.stop)
+            self.assertTrue(wait_for(lambda: channel.get_stats()['resyncs'] == 1))
+        return channel
+
+    def test_change_in_one_process_reaches_the_other_cache(self):
+        writer, reader = self.make_channel(), self.make_channel()
+        value = {'current': 10}
+        service = ConfigurationService(make_db_manager(lambda: value['current']), default_ttl=3600,
+                                       invalidation_channel=reader)
+        self.assertEqual(service.get_config(KEY), 10)
+
+        value['current'] = 20
+        start = time.monotonic()
+        writer.invalidate(KEY)
+
+        self.assertTrue(wait_for(lambda: KEY not in service._cache))
+        self.assertLess(time.monotonic() - start, 0.5)
+        self.assertEqual(service.get_config(KEY), 20)
+        self.assertEqual(service.get_cache_stats()['statistics']['database_reads'], 2)
+
+    def test_each_version_is_applied_once(self):
+        channel = self.make_channel()
+        calls = []
+        channel.add_listener(calls.append)
+
+        self.assertEqual(channel.invalidate(KEY), 1)
+        self.assertTrue(wait_for(lambda: channel.get_stats()['received'] == 1))
+
+        self.assertEqual(calls, [KEY])
+        self.assertEqual(channel.get_stats()['duplicates'], 1)
+
+    def test_missed_invalidations_are_applied_on_subscribe(self):
+        writer = self.make_channel()
+        reader = self.make_channel(start=False)
+        calls = []
+        reader.add_listener(calls.append)
+        writer.invalidate(KEY)
+        writer.invalidate()
+
+        reader.start()
+        self.addCleanup(reader.stop)
+
+        self.assertTrue(wait_for(lambda: len(calls) == 2))
+        self.assertEqual(sorted(calls, key=str), [None, KEY])
+
+    def test_invalidations_are_forwarded_to_the_event_bus(self):
+        channel = self.make_channel()
+        event_bus = ConfigurationEventBus(max_workers=1)
+        self.addCleanup(event_bus.shutdown)
+        events = []
+        event_bus.subscribe(EventType.CONFIGURATION_INVALIDATED, KEY, events.append)
+        channel.forward_to_event_bus(event_bus)
+
+        channel.invalidate(KEY)
+
+        self.assertTrue(wait_for(lambda: len(events) == 1))
+        self.assertEqual(events[0].key, KEY)
+
+    def test_broadcasts_use_a_client_with_a_socket_timeout(self):
+        options = []
+
+        def from_url(url, **kwargs):
+            options.append(kwargs)
+            return fakeredis.FakeRedis(server=self.server)
+
+        with patch('redis.Redis.from_url', side_effect=from_url):
+            channel = ConfigurationInvalidationChannel.from_config(ConfigInvalidationConfig(backend="redis"))
+        channel.start()
+        self.addCleanup(channel.stop)
+        self.assertTrue(wait_for(lambda: channel.get_stats()['resyncs'] == 1))
+
+        self.assertIsNot(channel.redis_client, channel.subscribe_client)
+        self.assertEqual([kwargs.get('socket_timeout') for kwargs in options], [2, None])
+        self.assertEqual(channel.invalidate(KEY), 1)
+        self.assertTrue(wait_for(lambda: channel.get_stats()['received'] == 1))
+
+    def test_cluster_wide_cache_lives_longer(self):
+        service = ConfigurationService(make_db_manager(lambda: 10), invalidation_channel=self.make_channel())
+
+        self.assertEqual(service.default_ttl, 3600)
+
+class TestConfigurationServiceInvalidation(unittest.TestCase):
+    """Test the configuration cache against invalidations in this process"""
+
+    def test_value_overtaken_by_an_invalidation_is_not_cached(self):
+        channel = ConfigurationInvalidationChannel()
+
+        def read_during_change():
+            channel.invalidate(KEY)
+            return 10
+
+        service = ConfigurationService(make_db_manager(read_during_change), default_ttl=3600,
+                                       invalidation_channel=channel)
+
+        self.assertEqual(service.get_config(KEY), 10)
+        self.assertNotIn(KEY, service._cache)
+
+    def test_set_configuration_invalidates_caches(self):
+        channel = Mock()
+        manager = SystemConfigurationManager(make_db_manager(lambda: 10), invalidation_channel=channel)
+
+        with patch.object(manager, '_verify_admin_authorization'), \
+             patch.object(manager, '_create_configuration_audit'):
+            self.assertTrue(manager.set_configuration(KEY, 20, admin_user_id=1))
+
+        channel.invalidate.assert_called_once_with(KEY)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,136 @@
+# Copyright (C) 2025 iolaire mcfadden.
+# This program is free software: you can redistribute it and/or modify it under the terms of the GNU Affero General Public License as published by the Free Software Foundation, either version 3 of the License, or (at your option) any later version.
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+Unit tests for DatabaseManager connection pooling and fork safety
+"""
+
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from unittest.mock import MagicMock, patch
+
+import sqlalchemy
+from sqlalchemy import text
+from sqlalchemy.pool import QueuePool
+
+from app.core.database.core.database_manager import DatabaseManager, remove_scoped_sessions
+
+def make_manager(database_path):
+    """DatabaseManager on a SQLite file, keeping the pool settings it passes to create_engine"""
+    config = MagicMock()
+    config.storage.database_url = f"sqlite:///{database_path}"
+    config.storage.db_config.pool_size = 3
+    config.storage.db_config.max_overflow = 2
+    config.storage.db_config.pool_timeout = 5
+    config.storage.db_config.pool_recycle = 3600
+    config.storage.db_config.query_logging = False
+
+    def create_sqlite_engine(url, connect_args=None, **kwargs):
+        # The MySQL connect_args are not understood by sqlite3
+        return sqlalchemy.create_engine(url, **kwargs)
+
+    with patch.object(DatabaseManager, '_validate_mysql_connection_params'), \
+         patch.object(DatabaseManager, 'create_tables'), \
+         patch('app.core.database.core.database_manager.create_engine', side_effect=create_sqlite_engine):
+        return DatabaseManager(config)
+
+class TestDatabasePool(unittest.TestCase):
+    """Test the pooled engine, scoped sessions and pool reset after fork"""
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.db = make_manager(os.path.join(self.temp_dir, "pool.db"))
+
+    def tearDown(self):
+        self.db.engine.dispose()
+        shutil.rmtree(self.temp_dir)
+
+    def test_engine_uses_configured_queue_pool(self):
+        pool = self.db.engine.pool
+        self.assertIsInstance(pool, QueuePool)
+        self.assertEqual((pool.size(), pool._max_overflow, pool._timeout), (3, 2, 5))
+
+    def test_connections_are_reused(self):
+        for _ in range(5):
+            session = self.db.get_session()
+            session.execute(text("SELECT 1"))
+            self.db.close_session(session)
+
+        self.assertEqual(self.db.engine.pool.checkedin(), 1)
+
+    def test_scoped_session_is_per_thread(self):
+        main_session = self.db.scoped_session()
+        self.assertIs(self.db.scoped_session(), main_session)
+
+        other = []
+        thread = threading.Thread(target=lambda: other.append(self.db.scoped_session()))
+        thread.start()
+        thread.join()
+
+        self.assertIsNot(other[0], main_session)
+        self.db.remove_scoped_session()
+        self.assertIsNot(self.db.scoped_session(), main_session)
+        self.db.remove_scoped_session()
+
+    def test_remove_scoped_sessions_clears_every_manager(self):
+        session = self.db.scoped_session()
+        remove_scoped_sessions()
+        self.assertIsNot(self.db.scoped_session(), session)
+        self.db.remove_scoped_session()
+
+    def test_connection_from_another_process_is_replaced(self):
+        with self.db.engine.connect() as connection:
+            parent_dbapi = connection.connection.dbapi_connection
+
+        with patch('app.core.database.core.database_manager.os.getpid', return_value=os.getpid() + 1):
+            with self.db.engine.connect() as connection:
+                self.assertEqual(connection.execute(text("SELECT 1")).scalar(), 1)
+                self.assertIsNot(connection.connection.dbapi_connection, parent_dbapi)
+
+    def test_managers_share_one_engine_per_url(self):
+        with patch('app.core.database.core.database_manager.os.register_at_fork') as register_at_fork:
+            other = make_manager(self.db.engine.url.database)
+            separate = make_manager(os.path.join(self.temp_dir, "other.db"))
+        self.addCleanup(separate.engine.dispose)
+
+        self.assertIs(other.engine, self.db.engine)
+        self.assertIsNot(separate.engine, self.db.engine)
+        register_at_fork.assert_not_called()
+
+        session = other.get_session()
+        session.execute(text("SELECT 1"))
+        self.assertEqual(self.db.engine.pool.checkedout(), 1)
+        other.close_session(session)
+
+    def test_forked_child_starts_with_empty_pool(self):
+        session = self.db.scoped_session()
+        session.execute(text("SELECT 1"))
+        self.assertEqual(self.db.engine.pool.checkedout(), 1)
+
+        read_fd, write_fd = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            try:
+                os.close(read_fd)
+                pool = self.db.engine.pool
+                fresh = self.db.scoped_session() is not session
+                empty = pool.checkedout() == 0 and pool.checkedin() == 0
+                works = self.db.scoped_session().execute(text("SELECT 1")).scalar() == 1
+                os.write(write_fd, b"ok" if fresh and empty and works else b"fail")
+            finally:
+                os._exit(0)
+
+        os.close(write_fd)
+        with os.fdopen(read_fd, 'rb') as result:
+            self.assertEqual(result.read(), b"ok")
+        os.waitpid(pid, 0)
+
+        # The parent's session and connection are untouched
+        self.assertEqual(session.execute(text("SELECT 1")).scalar(), 1)
+        self.db.remove_scoped_session()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,148 @@
+# Copyright (C) 2025 iolaire mcfadden.
+# This program is free software: you can redistribute it and/or modify it under the terms of the GNU Affero General Public License as published by the Free Software Foundation, either version 3 of the License, or (at your option) any later version.
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+Unit tests for the per-instance shared HTTP client pool
+"""
+
+import asyncio
+import unittest
+from unittest.mock import patch
+
+import httpx
+
+from config import ActivityPubConfig
+from app.services.activitypub.components.activitypub_client import ActivityPubClient
+from app.services.activitypub.components.http_client_pool import HTTPClientPool
+
+def echo(request):
+    return httpx.Response(200, json={'user_agent': request.headers.get('User-Agent')})
+
+class TestHTTPClientPool(unittest.IsolatedAsyncioTestCase):
+    """Test HTTPClientPool"""
+
+    def make_pool(self, **kwargs):
+        return HTTPClientPool(transport=httpx.MockTransport(echo), **kwargs)
+
+    async def test_same_instance_shares_one_client(self):
+        pool = self.make_pool()
+        self.addAsyncCleanup(pool.aclose)
+
+        first = pool.acquire("https://Mastodon.Test/")
+        second = pool.acquire("https://mastodon.test/api/v1/statuses")
+        other = pool.acquire("https://pixelfed.test")
+
+        self.assertIs(first, second)
+        self.assertIsNot(first, other)
+        stats = pool.get_stats()
+        self.assertEqual((stats['clients_created'], stats['reuses']), (2, 1))
+        self.assertEqual(stats['instances']['https://mastodon.test']['borrowers'], 2)
+
+    async def test_limits_are_applied(self):
+        pool = HTTPClientPool(max_connections=3, max_keepalive_connections=2, keepalive_expiry=5)
+        self.addAsyncCleanup(pool.aclose)
+
+        client = pool.acquire("https://mastodon.test")
+
+        pool_limits = client._transport._pool
+        self.assertEqual((pool_limits._max_connections, pool_limits._max_keepalive_connections), (3, 2))
+
+    async def test_idle_clients_are_closed(self):
+        pool = self.make_pool(idle_timeout=0.05)
+        async with pool.borrow("https://mastodon.test") as idle:
+            pass
+        busy = pool.acquire("https://pixelfed.test")
+        await asyncio.sleep(0.1)
+
+        pool.acquire("https://pleroma.test")
+        await asyncio.sleep(0)
+
+        self.assertTrue(idle.is_closed)
+        self.assertFalse(busy.is_closed)
+        self.assertEqual(pool.get_stats()['clients_evicted'], 1)
+        await pool.aclose()
+
+    async def test_requests_are_counted_per_instance(self):
+        pool = self.make_pool()
+        self.addAsyncCleanup(pool.aclose)
+
+        async with pool.borrow("https://mastodon.test") as client:
+            await client.get("https://mastodon.test/api/v1/instance")
+            await client.get("https://mastodon.test/api/v1/instance")
+
+        self.assertEqual(pool.get_stats()['instances']['https://mastodon.test']['requests'], 2)
+
+    async def test_cookies_are_not_shared_between_accounts(self):
+        cookies = []
+
+        def set_cookie(request):
+            cookies.append(request.headers.get('cookie'))
+            return httpx.Response(200, headers={'Set-Cookie': "session=userA; Path=/"})
+
+        pool = HTTPClientPool(transport=httpx.MockTransport(set_cookie))
+        self.addAsyncCleanup(pool.aclose)
+
+        async with pool.borrow("https://mastodon.test") as client:
+            await client.get("https://mastodon.test/api/v1/accounts/verify_credentials",
+                             headers={'Authorization': "Bearer account-a"})
+            await client.get("https://mastodon.test/api/v1/accounts/verify_credentials",
+                             headers={'Authorization': "Bearer account-b"})
+
+        self.assertEqual(cookies, [None, None])
+
+class TestEventLoops(unittest.TestCase):
+    """Test that each event loop gets its own clients"""
+
+    def borrow(self, pool):
+        async def borrow():
+            async with pool.borrow("https://mastodon.test") as client:
+                await client.get("https://mastodon.test/api/v1/instance")
+                return client
+        return borrow()
+
+    def test_clients_are_closed_before_their_loop_ends(self):
+        pool = HTTPClientPool(transport=httpx.MockTransport(echo))
+
+        async def run():
+            client = await self.borrow(pool)
+            await pool.aclose()
+            return client
+
+        first = asyncio.run(run())
+        second = asyncio.run(run())
+
+        self.assertIsNot(first, second)
+        self.assertTrue(first.is_closed and second.is_closed)
+        self.assertEqual(pool.get_stats()['instances'], {})
+
+    def test_clients_of_closed_loops_are_dropped(self):
+        pool = HTTPClientPool(transport=httpx.MockTransport(echo))
+
+        first = asyncio.run(self.borrow(pool))
+        second = asyncio.run(self.borrow(pool))
+
+        self.assertIsNot(first, second)
+        self.assertEqual(pool.get_stats()['clients_evicted'], 1)
+
+class TestClientBorrowing(unittest.IsolatedAsyncioTestCase):
+    """Test that ActivityPubClient borrows from the pool"""
+
+    async def test_clients_of_one_instance_share_a_session(self):
+        pool = HTTPClientPool(transport=httpx.MockTransport(echo))
+        self.addAsyncCleanup(pool.aclose)
+        config = ActivityPubConfig(instance_url="https://mastodon.test", access_token="token",
+                                   api_type="mastodon", user_agent="Vedfolnir/test")
+
+        with patch('app.services.activitypub.components.activitypub_client.get_http_client_pool',
+                   return_value=pool):
+            async with ActivityPubClient(config) as first, ActivityPubClient(config) as second:
+                self.assertIs(first.session, second.session)
+                response = await first._get_with_retry("https://mastodon.test/api/v1/instance", {})
+                self.assertEqual(response.json()['user_agent'], "Vedfolnir/test")
+
+            self.assertIsNone(first.session)
+            self.assertEqual(pool.get_stats()['instances']['https://mastodon.test']['borrowers'], 0)
+            self.assertFalse(pool.acquire("https://mastodon.test").is_closed)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,125 @@
+# Copyright (C) 2025 iolaire mcfadden.
+# This program is free software: you can redistribute it and/or modify it under the terms of the GNU Affero General Public License as published by the Free Software Foundation, either version 3 of the License, or (at your option) any later version.
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+Unit tests for the process-pool image transcoder
+"""
+
+import asyncio
+import os
+import time
+import unittest
+
+from app.utils.processing.image_processor import ImageValidationError, transcode_image
+from app.utils.processing.image_transcoder import (
+    ImageTranscoder, TranscoderBusyError, TranscodeTimeoutError, TranscoderCrashedError
+)
+
+# Jobs must be module-level functions so spawned workers can import them
+
+def worker_pid():
+    return os.getpid()
+
+def sleep_then_return(seconds, value):
+    time.sleep(seconds)
+    return value
+
+def busy_loop(seconds):
+    end = time.monotonic() + seconds
+    while time.monotonic() < end:
+        pass
+    return True
+
+def crash():
+    os._exit(1)
+
+class TestImageTranscoder(unittest.IsolatedAsyncioTestCase):
+    """Test ImageTranscoder with real worker processes"""
+
+    def make_transcoder(self, **kwargs):
+        kwargs.setdefault('max_workers', 2)
+        transcoder = ImageTranscoder(**kwargs)
+        self.addCleanup(transcoder.shutdown)
+        return transcoder
+
+    async def test_runs_in_worker_process(self):
+        transcoder = self.make_transcoder()
+        self.assertNotEqual(await transcoder.run(worker_pid), os.getpid())
+        self.assertEqual(transcoder.get_stats()['completed'], 1)
+
+    async def test_job_exceptions_are_reraised(self):
+        transcoder = self.make_transcoder()
+        with self.assertRaises(ImageValidationError):
+            await transcoder.run(transcode_image, b"not an image", "/tmp/never-written.jpg")
+        self.assertEqual(transcoder.get_stats()['failed'], 1)
+
+    async def test_event_loop_keeps_running_during_cpu_work(self):
+        transcoder = self.make_transcoder()
+        await transcoder.run(worker_pid)  # Start the pool
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                ticks += 1
+                await asyncio.sleep(0.01)
+
+        ticking = asyncio.create_task(ticker())
+        await transcoder.run(busy_loop, 0.5)
+        ticking.cancel()
+
+        self.assertGreater(ticks, 20)
+
+    async def test_timeout_kills_only_the_hung_worker(self):
+        transcoder = self.make_transcoder()
+        results = await asyncio.gather(
+            transcoder.run(sleep_then_return, 30, "late", timeout=0.5),
+            transcoder.run(sleep_then_return, 1.0, "survivor"),
+            return_exceptions=True
+        )
+
+        self.assertIsInstance(results[0], TranscodeTimeoutError)
+        self.assertEqual(results[1], "survivor")
+        self.assertEqual(await transcoder.run(sleep_then_return, 0, "next"), "next")
+        stats = transcoder.get_stats()
+        self.assertEqual((stats['timeouts'], stats['workers_replaced']), (1, 1))
+
+    async def test_crash_only_fails_its_own_job(self):
+        transcoder = self.make_transcoder()
+        results = await asyncio.gather(
+            transcoder.run(crash),
+            transcoder.run(sleep_then_return, 0.5, "survivor"),
+            return_exceptions=True
+        )
+
+        self.assertIsInstance(results[0], TranscoderCrashedError)
+        self.assertEqual(results[1], "survivor")
+        self.assertEqual(await transcoder.run(sleep_then_return, 0, "after"), "after")
+        self.assertEqual(transcoder.get_stats()['crashes'], 1)
+
+    async def test_queue_is_bounded(self):
+        transcoder = self.make_transcoder(max_workers=1, queue_size=1)
+        results = await asyncio.gather(
+            *(transcoder.run(sleep_then_return, 0.3, i) for i in range(3)),
+            return_exceptions=True
+        )
+
+        self.assertEqual(results[:2], [0, 1])
+        self.assertIsInstance(results[2], TranscoderBusyError)
+        self.assertEqual(transcoder.get_stats()['rejected'], 1)
+
+    async def test_cancelled_waiter_does_not_leak_its_slot(self):
+        transcoder = self.make_transcoder(max_workers=1, queue_size=2)
+        running = asyncio.create_task(transcoder.run(sleep_then_return, 0.3, "running"))
+        await asyncio.sleep(0)
+        waiting = asyncio.create_task(transcoder.run(sleep_then_return, 0, "cancelled"))
+        await asyncio.sleep(0)
+        self.assertEqual(transcoder.get_stats()['waiting'], 1)
+
+        waiting.cancel()
+        self.assertEqual(await running, "running")
+        self.assertEqual(await transcoder.run(sleep_then_return, 0, "next"), "next")
+        self.assertEqual(transcoder.get_stats()['waiting'], 0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,170 @@
+# Copyright (C) 2025 iolaire mcfadden.
+# This program is free software: you can redistribute it and/or modify it under the terms of the GNU Affero General Public License as published by the Free Software Foundation, either version 3 of the License, or (at your option) any later version.
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+Unit tests for streaming image downloads and single-decode transcoding
+"""
+
+import io
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from unittest.mock import MagicMock, patch
+
+import httpx
+from PIL import Image
+
+from config import StorageConfig
+from app.utils.processing.image_processor import ImageProcessor, ImageValidationError, transcode_image
+from app.utils.processing.perceptual_hash import dhash, hash_to_hex
+
+def encode(size, fmt='JPEG', mode='RGB'):
+    img = Image.new(mode, size, color=(200, 30, 30, 255)[:len(mode)] if mode != 'L' else 128)
+    buffer = io.BytesIO()
+    img.save(buffer, fmt)
+    return buffer.getvalue()
+
+class TestTranscodeImage(unittest.TestCase):
+    """Test the decode-validate-resize-encode pass"""
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def path(self, name):
+        return os.path.join(self.temp_dir, name)
+
+    def test_large_jpeg_is_downscaled(self):
+        path, perceptual_hash = transcode_image(encode((3000, 2000)), self.path("big.jpg"))
+
+        self.assertEqual(path, self.path("big.jpg"))
+        with Image.open(path) as img:
+            self.assertEqual(img.format, 'JPEG')
+            self.assertEqual(img.size, (1024, 683))
+            self.assertEqual(hash_to_hex(dhash(img)), perceptual_hash)
+        self.assertEqual(os.listdir(self.temp_dir), ["big.jpg"])
+
+    def test_opaque_png_is_stored_as_jpeg(self):
+        original = self.path("photo.png")
+        with open(original, 'wb') as f:
+            f.write(b"previous invalid download")
+
+        path, _ = transcode_image(encode((200, 200), 'PNG'), original)
+
+        self.assertEqual(path, self.path("photo.jpg"))
+        self.assertFalse(os.path.exists(original))
+
+    def test_transparent_png_stays_png(self):
+        path, _ = transcode_image(encode((200, 200), 'PNG', 'RGBA'), self.path("logo.png"))
+        with Image.open(path) as img:
+            self.assertEqual((img.format, img.mode), ('PNG', 'RGBA'))
+
+    def test_grayscale_is_converted_to_rgb(self):
+        path, _ = transcode_image(encode((200, 200), 'JPEG', 'L'), self.path("gray.jpg"))
+        with Image.open(path) as img:
+            self.assertEqual(img.mode, 'RGB')
+
+    def test_invalid_images_are_rejected(self):
+        for data in (b"", b"not an image", encode((20, 20)), encode((400, 10))):
+            with self.assertRaises(ImageValidationError):
+                transcode_image(data, self.path("bad.jpg"))
+        with patch('app.utils.processing.image_processor.MAX_FILE_SIZE', 100):
+            with self.assertRaises(ImageValidationError):
+                transcode_image(encode((200, 200)), self.path("bad.jpg"))
+        self.assertEqual(os.listdir(self.temp_dir), [])
+
+class TestStreamingDownload(unittest.IsolatedAsyncioTestCase):
+    """Test download_and_store_image against a mock HTTP transport"""
+
+    async def asyncSetUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        config = MagicMock()
+        config.storage = StorageConfig()
+        config.storage.images_dir = self.temp_dir
+        self.processor = ImageProcessor(config)
+        self.body = encode((1600, 1200))
+        self.headers = {"Content-Type": "image/jpeg"}
+        self.status_code = 200
+        self.processor.session = httpx.AsyncClient(transport=httpx.MockTransport(self.handler))
+
+    async def asyncTearDown(self):
+        await self.processor.close()
+        shutil.rmtree(self.temp_dir)
+
+    def handler(self, request):
+        async def chunks():
+            for start in range(0, len(self.body), 1024):
+                yield self.body[start:start + 1024]
+        return httpx.Response(self.status_code, headers=self.headers, content=chunks())
+
+    async def test_download_stores_optimized_image_and_hash(self):
+        path = await self.processor.download_and_store_image("https://pixelfed.test/photo.jpg")
+
+        self.assertIsNotNone(path)
+        with Image.open(path) as img:
+            self.assertEqual(img.size, (1024, 768))
+        self.assertEqual(self.processor.get_perceptual_hash(path), hash_to_hex(dhash(path)))
+
+    async def test_stored_image_is_checked_off_the_event_loop(self):
+        first = await self.processor.download_and_store_image("https://pixelfed.test/photo.jpg")
+        self.processor.perceptual_hashes.clear()
+        loop_thread = threading.get_ident()
+        checked_in = []
+        validate_image = self.processor.validate_image
+
+        def validate_in_thread(path):
+            checked_in.append(threading.get_ident())
+            return validate_image(path)
+
+        with patch.object(self.processor, 'validate_image', side_effect=validate_in_thread):
+            path = await self.processor.download_and_store_image("https://pixelfed.test/photo.jpg")
+
+        self.assertEqual(path, first)
+        self.assertEqual(len(checked_in), 1)
+        self.assertNotEqual(checked_in[0], loop_thread)
+        self.assertEqual(self.processor.perceptual_hashes[path], hash_to_hex(dhash(path)))
+
+    async def test_size_cap_enforced_while_streaming(self):
+        with patch('app.utils.processing.image_processor.MAX_FILE_SIZE', 4096):
+            path = await self.processor.download_and_store_image("https://pixelfed.test/photo.jpg")
+
+        self.assertIsNone(path)
+        self.assertEqual(os.listdir(self.temp_dir), [])
+
+    async def test_declared_size_over_cap_is_rejected(self):
+        self.headers["Content-Length"] = str(30 * 1024 * 1024)
+        self.body = b""
+
+        self.assertIsNone(await self.processor.download_and_store_image("https://pixelfed.test/photo.jpg"))
+
+    async def test_invalid_download_returns_none(self):
+        self.body = b"<html>not found</html>"
+
+        self.assertIsNone(await self.processor.download_and_store_image("https://pixelfed.test/photo.jpg"))
+        self.assertEqual(os.listdir(self.temp_dir), [])
+
+    async def test_permanent_failures_are_reported(self):
+        url = "https://pixelfed.test/photo.jpg"
+        for status_code, body, reason in [(404, b"", "HTTP 404"), (200, b"<html></html>", "Invalid image")]:
+            with self.subTest(status_code=status_code):
+                self.status_code, self.body = status_code, body
+
+                self.assertIsNone(await self.processor.download_and_store_image(url))
+                self.assertTrue(self.processor.pop_permanent_failure(url).startswith(reason))
+                self.assertIsNone(self.processor.pop_permanent_failure(url))
+
+    async def test_transient_failures_are_not_reported(self):
+        url = "https://pixelfed.test/photo.jpg"
+        for status_code in (429, 503):
+            with self.subTest(status_code=status_code):
+                self.status_code, self.body = status_code, b""
+
+                self.assertIsNone(await self.processor.download_and_store_image(url))
+                self.assertIsNone(self.processor.pop_permanent_failure(url))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,127 @@
+# Copyright (C) 2025 iolaire mcfadden.
+# This program is free software: you can redistribute it and/or modify it under the terms of the GNU Affero General Public License as published by the Free Software Foundation, either version 3 of the License, or (at your option) any later version.
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+Unit tests for hashed image URL lookups and the URL hash backfill
+"""
+
+import hashlib
+import os
+import shutil
+import tempfile
+import unittest
+
+from sqlalchemy import event, text
+
+from models import Base, Image, Post, User, PlatformConnection, ProcessingStatus
+from scripts.database.migrate_image_url_hash import backfill_image_url_hash
+from tests.unit.test_database_pool import make_manager
+
+URL = "https://pixelfed.test/storage/m/photo.jpg"
+
+class ImageDatabaseTestCase(unittest.TestCase):
+    """DatabaseManager on SQLite with one user, platform connection and post"""
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.db = make_manager(os.path.join(self.temp_dir, "images.db"))
+        Base.metadata.create_all(self.db.engine)
+        session = self.db.get_session()
+        session.add(User(id=1, username="user1", email="user1@test.com", password_hash="x"))
+        session.add(PlatformConnection(id=1, user_id=1, name="conn", platform_type="pixelfed",
+                                       instance_url="https://pixelfed.test", _access_token="token"))
+        session.add(Post(id=1, post_id="post1", user_id=1, post_url="https://pixelfed.test/p/1",
+                         platform_connection_id=1))
+        session.commit()
+        self.db.close_session(session)
+
+    def tearDown(self):
+        self.db.engine.dispose()
+        shutil.rmtree(self.temp_dir)
+
+    def set_status(self, image_id, status):
+        with self.db.engine.begin() as connection:
+            connection.execute(text("UPDATE images SET status = :status WHERE id = :id"),
+                               {'status': status.name, 'id': image_id})
+
+class TestImageUrlHash(ImageDatabaseTestCase):
+    """Test that image lookups go through image_url_hash"""
+
+    def test_hash_is_kept_in_sync_with_url(self):
+        image = Image(image_url=URL)
+        self.assertEqual(image.image_url_hash, hashlib.sha256(URL.encode()).hexdigest())
+        image.image_url = URL + "?v=2"
+        self.assertEqual(image.image_url_hash, Image.hash_url(URL + "?v=2"))
+
+    def test_save_image_stores_hash_and_deduplicates(self):
+        image_id = self.db.save_image(1, URL, "/tmp/photo.jpg", 0)
+
+        self.assertEqual(self.db.save_image(1, URL, "/tmp/photo.jpg", 0), image_id)
+        session = self.db.get_session()
+        self.assertEqual(session.get(Image, image_id).image_url_hash, Image.hash_url(URL))
+        self.db.close_session(session)
+
+    def test_is_image_processed_uses_hash(self):
+        image_id = self.db.save_image(1, URL, "/tmp/photo.jpg", 0)
+        self.assertFalse(self.db.is_image_processed(URL))
+
+        self.set_status(image_id, ProcessingStatus.POSTED)
+        self.assertTrue(self.db.is_image_processed(URL))
+        self.assertFalse(self.db.is_image_processed(URL + "?other"))
+
+    def test_hash_collision_is_ruled_out_by_url(self):
+        image_id = self.db.save_image(1, "https://pixelfed.test/other.jpg", "/tmp/other.jpg", 0)
+        self.set_status(image_id, ProcessingStatus.POSTED)
+        with self.db.engine.begin() as connection:
+            connection.execute(text("UPDATE images SET image_url_hash = :hash"), {'hash': Image.hash_url(URL)})
+
+        self.assertFalse(self.db.is_image_processed(URL))
+
+    def test_backfill_hashes_existing_rows_in_batches(self):
+        for i in range(5):
+            self.db.save_image(1, f"{URL}?{i}", f"/tmp/{i}.jpg", i)
+        with self.db.engine.begin() as connection:
+            connection.execute(text("UPDATE images SET image_url_hash = NULL WHERE id != 3"))
+
+        self.assertEqual(backfill_image_url_hash(self.db.engine, batch_size=2), 4)
+        with self.db.engine.connect() as connection:
+            rows = connection.execute(text("SELECT image_url, image_url_hash FROM images")).fetchall()
+        self.assertEqual([row[1] for row in rows], [Image.hash_url(row[0]) for row in rows])
+
+class TestBulkLookups(ImageDatabaseTestCase):
+    """Test the page-at-a-time post upsert and processed-image lookup"""
+
+    def count_queries(self):
+        statements = []
+        event.listen(self.db.engine, "before_cursor_execute",
+                     lambda conn, cursor, statement, *args: statements.append(statement))
+        return statements
+
+    def test_processed_urls_found_in_one_query(self):
+        posted = self.db.save_image(1, URL, "/tmp/photo.jpg", 0)
+        self.set_status(posted, ProcessingStatus.APPROVED)
+        self.db.save_image(1, URL + "?pending", "/tmp/pending.jpg", 1)
+        urls = [URL, URL + "?pending", URL + "?new"] + [f"{URL}?{i}" for i in range(200)]
+
+        statements = self.count_queries()
+        processed = self.db.get_processed_image_urls(urls)
+
+        self.assertEqual(processed, {URL})
+        self.assertEqual(len([s for s in statements if s.lstrip().startswith("SELECT")]), 1)
+
+    def test_get_or_create_posts_inserts_only_missing_posts(self):
+        self.db.set_platform_context(1, 1)
+        pages = [dict(post_id=f"https://pixelfed.test/p/{i}", post_url=f"https://pixelfed.test/p/{i}",
+                      post_content=f"Post {i}") for i in range(3)]
+
+        first = self.db.get_or_create_posts(1, pages[:2])
+        statements = self.count_queries()
+        second = self.db.get_or_create_posts(1, pages + [dict(post_id="", post_url="bad")])
+
+        self.assertEqual(set(second), {page['post_id'] for page in pages})
+        self.assertEqual({k: v.id for k, v in first.items()}, {k: second[k].id for k in first})
+        self.assertEqual(second[pages[2]['post_id']].platform_connection_id, 1)
+        self.assertEqual(len([s for s in statements if s.lstrip().startswith("INSERT")]), 1)
+
+if __name__ == '__main__':
+    unittest.main()
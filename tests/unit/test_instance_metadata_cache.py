@@ -0,0 +1,211 @@
+# Copyright (C) 2025 iolaire mcfadden.
+# This program is free software: you can redistribute it and/or modify it under the terms of the GNU Affero General Public License as published by the Free Software Foundation, either version 3 of the License, or (at your option) any later version.
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+Unit tests for the cache of instance platform types and account IDs
+"""
+
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, patch
+
+import httpx
+
+from models import Base
+from app.services.activitypub.components.activitypub_platforms import (
+    MastodonPlatform, PixelfedPlatform, detect_platform_type
+)
+from app.services.activitypub.components.http_client_pool import HTTPClientPool
+from app.services.activitypub.components.instance_metadata_cache import (
+    DatabaseInstanceMetadataBackend, FallbackInstanceMetadataBackend, InstanceMetadataCache, MemoryInstanceMetadataBackend,
+    RedisInstanceMetadataBackend, credentials_subject, get_instance_metadata_cache, set_instance_metadata_cache
+)
+from tests.unit.test_database_pool import make_manager
+from tests.unit.test_timeline_cursor import INSTANCE, FakeTimeline
+
+try:
+    import fakeredis
+except ImportError:
+    fakeredis = None
+
+PLATFORMS = 'app.services.activitypub.components.activitypub_platforms'
+
+class TestBackends(unittest.TestCase):
+    """Test the stores behind InstanceMetadataCache"""
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.temp_dir)
+
+    def check_backend(self, backend):
+        cache = InstanceMetadataCache(backend, account_ttl=1)
+
+        cache.set_account_id("https://Social.Test/", "Alice", "7")
+        self.assertEqual(cache.get_account_id(INSTANCE, "alice"), "7")
+        cache.invalidate_account_id(INSTANCE, "alice")
+        self.assertIsNone(cache.get_account_id(INSTANCE, "alice"))
+
+        cache.set_platform(INSTANCE, "mastodon", {'name': 'mastodon', 'version': '4.3.0'})
+        self.assertEqual(cache.get_platform(INSTANCE)['nodeinfo']['version'], '4.3.0')
+        self.assertEqual(cache.get_stats()['hits'], 2)
+
+    def test_memory_backend(self):
+        self.check_backend(MemoryInstanceMetadataBackend())
+
+    def test_database_backend(self):
+        db = make_manager(os.path.join(self.temp_dir, "instances.db"))
+        Base.metadata.create_all(db.engine)
+
+        self.check_backend(DatabaseInstanceMetadataBackend(db))
+
+    @unittest.skipUnless(fakeredis, "fakeredis not installed")
+    def test_redis_backend_is_shared(self):
+        server = fakeredis.FakeServer()
+        self.check_backend(RedisInstanceMetadataBackend(fakeredis.FakeRedis(server=server)))
+
+        other = InstanceMetadataCache(RedisInstanceMetadataBackend(fakeredis.FakeRedis(server=server)))
+        self.assertEqual(other.get_platform(INSTANCE)['platform_type'], "mastodon")
+
+    def test_entries_expire(self):
+        db = make_manager(os.path.join(self.temp_dir, "instances.db"))
+        Base.metadata.create_all(db.engine)
+
+        for backend in (MemoryInstanceMetadataBackend(), DatabaseInstanceMetadataBackend(db)):
+            with self.subTest(backend=type(backend).__name__):
+                cache = InstanceMetadataCache(backend, account_ttl=1)
+                cache.set_account_id(INSTANCE, "alice", "7")
+                time.sleep(1.1)
+                self.assertIsNone(cache.get_account_id(INSTANCE, "alice"))
+
+    def test_database_is_used_when_redis_is_unreachable(self):
+        config = SimpleNamespace(backend="redis", redis_url="redis://localhost:1/0",
+                                 platform_ttl=60, account_ttl=60)
+
+        with self.assertLogs('app.services.activitypub.components.instance_metadata_cache', 'WARNING'):
+            cache = InstanceMetadataCache.from_config(config, db_manager=object())
+
+        self.assertEqual(cache.get_stats()['backend'], 'database')
+        self.assertEqual(InstanceMetadataCache.from_config(config).get_stats()['backend'], 'memory')
+
+    @unittest.skipUnless(fakeredis, "fakeredis not installed")
+    def test_database_is_used_while_redis_is_down(self):
+        db = make_manager(os.path.join(self.temp_dir, "instances.db"))
+        Base.metadata.create_all(db.engine)
+        server = fakeredis.FakeServer()
+        backend = FallbackInstanceMetadataBackend(
+            RedisInstanceMetadataBackend(fakeredis.FakeRedis(server=server)), DatabaseInstanceMetadataBackend(db))
+        cache = InstanceMetadataCache(backend)
+
+        server.connected = False
+        with self.assertLogs('app.services.activitypub.components.instance_metadata_cache', 'WARNING'):
+            cache.set_account_id(INSTANCE, "alice", "7")
+        self.assertEqual(cache.get_account_id(INSTANCE, "alice"), "7")
+        self.assertEqual(cache.get_stats()['backend'], 'database')
+        self.assertEqual(cache.get_stats()['errors'], 0)
+
+        server.connected = True
+        backend._redis_retry_at = 0.0
+        self.assertIsNone(cache.get_account_id(INSTANCE, "alice"))
+        cache.set_account_id(INSTANCE, "alice", "8")
+        self.assertEqual(cache.get_stats()['backend'], 'redis')
+        other = InstanceMetadataCache(RedisInstanceMetadataBackend(fakeredis.FakeRedis(server=server)))
+        self.assertEqual(other.get_account_id(INSTANCE, "alice"), "8")
+
+    def test_process_cache_can_be_replaced(self):
+        cache = InstanceMetadataCache(MemoryInstanceMetadataBackend())
+        set_instance_metadata_cache(cache)
+        self.addCleanup(set_instance_metadata_cache, None)
+
+        self.assertIs(get_instance_metadata_cache(), cache)
+        self.assertIs(get_instance_metadata_cache(db_manager=object()), cache)
+        set_instance_metadata_cache(None)
+        self.assertIsNot(get_instance_metadata_cache(), cache)
+
+class TestAccountIdCaching(unittest.IsolatedAsyncioTestCase):
+    """Test that adapters resolve account IDs once"""
+
+    def setUp(self):
+        self.cache = InstanceMetadataCache(MemoryInstanceMetadataBackend())
+        set_instance_metadata_cache(self.cache)
+        self.addCleanup(set_instance_metadata_cache, None)
+
+    def make_mastodon(self):
+        mastodon = MastodonPlatform(SimpleNamespace(instance_url=INSTANCE, access_token="token"))
+        mastodon.authenticate = AsyncMock(return_value=True)
+        mastodon._get_auth_headers = lambda: {'Authorization': 'Bearer token'}
+        mastodon._lookup_account_id = AsyncMock(return_value='7')
+        return mastodon
+
+    async def test_later_runs_skip_the_lookup(self):
+        timeline = FakeTimeline(5)
+        first, second = self.make_mastodon(), self.make_mastodon()
+
+        await first.get_user_posts(timeline, "alice", 5)
+        posts = await second.get_user_posts(timeline, "alice", 5)
+
+        self.assertEqual(len(posts), 5)
+        first._lookup_account_id.assert_awaited_once()
+        second._lookup_account_id.assert_not_awaited()
+
+    async def test_pixelfed_caches_the_token_account(self):
+        timeline = FakeTimeline(5)
+        timeline._get_with_retry = AsyncMock(wraps=timeline._get_with_retry)
+        config = SimpleNamespace(instance_url=INSTANCE, access_token="token")
+
+        for _ in range(2):
+            await PixelfedPlatform(config).get_user_posts(timeline, "alice", 5)
+
+        verified = [call for call in timeline._get_with_retry.await_args_list
+                    if call.args[0].endswith('/verify_credentials')]
+        self.assertEqual(len(verified), 1)
+        self.assertEqual(self.cache.get_account_id(INSTANCE, credentials_subject("token")), '7')
+
+    async def test_missing_account_is_forgotten(self):
+        self.cache.set_account_id(INSTANCE, "alice", "99")
+        mastodon = self.make_mastodon()
+
+        async def not_found(url, headers, params=None):
+            request = httpx.Request('GET', url)
+            raise httpx.HTTPStatusError("Not Found", request=request,
+                                        response=httpx.Response(404, request=request))
+
+        self.assertEqual(await mastodon.get_user_posts(SimpleNamespace(_get_with_retry=not_found), "alice", 5), [])
+
+        self.assertIsNone(self.cache.get_account_id(INSTANCE, "alice"))
+        await mastodon.get_user_posts(FakeTimeline(1), "alice", 5)
+        mastodon._lookup_account_id.assert_awaited_once()
+
+class TestPlatformDetectionCaching(unittest.IsolatedAsyncioTestCase):
+    """Test that detect_platform_type probes nodeinfo once"""
+
+    async def test_detected_platform_is_cached(self):
+        requests = []
+
+        def nodeinfo(request):
+            requests.append(request.url.path)
+            if request.url.path == '/.well-known/nodeinfo':
+                return httpx.Response(200, json={'links': [{
+                    'rel': 'http://nodeinfo.diaspora.software/ns/schema/2.0',
+                    'href': f"{INSTANCE}/nodeinfo/2.0"
+                }]})
+            return httpx.Response(200, json={'software': {'name': 'pleroma', 'version': '2.7.0'}})
+
+        pool = HTTPClientPool(transport=httpx.MockTransport(nodeinfo))
+        self.addAsyncCleanup(pool.aclose)
+        cache = InstanceMetadataCache(MemoryInstanceMetadataBackend())
+
+        with patch('app.services.activitypub.components.http_client_pool.get_http_client_pool',
+                   return_value=pool), \
+             patch(f'{PLATFORMS}.get_instance_metadata_cache', return_value=cache):
+            self.assertEqual(await detect_platform_type(INSTANCE), 'pleroma')
+            self.assertEqual(await detect_platform_type(INSTANCE), 'pleroma')
+
+        self.assertEqual(len(requests), 2)
+        self.assertEqual(cache.get_platform(INSTANCE)['nodeinfo']['version'], '2.7.0')
+
+if __name__ == '__main__':
+    unittest.main()
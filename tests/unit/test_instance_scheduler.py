@@ -0,0 +1,95 @@
+# Copyright (C) 2025 iolaire mcfadden.
+# This program is free software: you can redistribute it and/or modify it under the terms of the GNU Affero General Public License as published by the Free Software Foundation, either version 3 of the License, or (at your option) any later version.
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+Unit tests for the per-instance platform job scheduler
+"""
+
+import asyncio
+import time
+import unittest
+from collections import defaultdict
+
+from app.utils.processing.instance_scheduler import InstanceScheduler, ScheduledJob
+
+class TestInstanceScheduler(unittest.IsolatedAsyncioTestCase):
+    """Test concurrency caps and politeness delays of InstanceScheduler"""
+
+    def setUp(self):
+        self.active = defaultdict(int)
+        self.max_active = defaultdict(int)
+        self.starts = defaultdict(list)
+
+    def make_job(self, host, duration=0.01, result=None):
+        async def run():
+            self.starts[host].append(time.monotonic())
+            self.active[host] += 1
+            self.max_active[host] = max(self.max_active[host], self.active[host])
+            try:
+                await asyncio.sleep(duration)
+            finally:
+                self.active[host] -= 1
+            return result
+        return ScheduledJob(host=host, run=run)
+
+    def test_instance_host_normalization(self):
+        self.assertEqual(InstanceScheduler.instance_host("https://Mastodon.Social/"), "mastodon.social")
+        self.assertEqual(InstanceScheduler.instance_host("pixelfed.example:8443"), "pixelfed.example:8443")
+        self.assertEqual(InstanceScheduler.instance_host(None), "unknown")
+
+    async def test_results_in_submission_order(self):
+        scheduler = InstanceScheduler(max_concurrent=4)
+        jobs = [self.make_job(f"host{i % 2}", duration=0.01 * (3 - i % 3), result=i) for i in range(6)]
+        results = await scheduler.run(jobs)
+        self.assertEqual(results, list(range(6)))
+
+    async def test_different_instances_run_concurrently(self):
+        # 50 users spread over 10 instances: one job per instance at a time
+        scheduler = InstanceScheduler(max_concurrent=10, per_instance_concurrency=1)
+        jobs = [self.make_job(f"instance{i % 10}.example", duration=0.02) for i in range(50)]
+
+        await scheduler.run(jobs)
+
+        self.assertEqual(scheduler.get_stats()['jobs_completed'], 50)
+        self.assertEqual(scheduler.get_stats()['max_concurrent_seen'], 10)
+        for host in self.max_active:
+            self.assertEqual(self.max_active[host], 1)
+
+    async def test_per_instance_concurrency_cap(self):
+        scheduler = InstanceScheduler(max_concurrent=10, per_instance_concurrency=2)
+        await scheduler.run([self.make_job("busy.example", duration=0.01) for _ in range(8)])
+        self.assertEqual(self.max_active["busy.example"], 2)
+
+    async def test_global_concurrency_cap(self):
+        scheduler = InstanceScheduler(max_concurrent=3)
+        await scheduler.run([self.make_job(f"host{i}", duration=0.01) for i in range(9)])
+        self.assertEqual(scheduler.get_stats()['max_concurrent_seen'], 3)
+
+    async def test_politeness_delay_only_on_same_instance(self):
+        scheduler = InstanceScheduler(max_concurrent=10, per_instance_delay=0.05)
+        jobs = [self.make_job("same.example", duration=0.0) for _ in range(3)]
+        jobs += [self.make_job(f"other{i}.example", duration=0.0) for i in range(3)]
+
+        await scheduler.run(jobs)
+
+        same = self.starts["same.example"]
+        self.assertGreaterEqual(same[1] - same[0], 0.045)
+        self.assertGreaterEqual(same[2] - same[1], 0.045)
+        # Other instances are not held back by the delay between same-instance jobs
+        for i in range(3):
+            self.assertLess(self.starts[f"other{i}.example"][0], same[1])
+
+    async def test_failed_job_does_not_stop_others(self):
+        async def boom():
+            raise RuntimeError("instance down")
+
+        scheduler = InstanceScheduler()
+        results = await scheduler.run([ScheduledJob(host="down.example", run=boom),
+                                       self.make_job("up.example", result="ok")])
+
+        self.assertIsInstance(results[0], RuntimeError)
+        self.assertEqual(results[1], "ok")
+        self.assertEqual(scheduler.get_stats()['jobs_failed'], 1)
+
+if __name__ == '__main__':
+    unittest.main()
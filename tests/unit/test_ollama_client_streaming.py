@@ -0,0 +1,165 @@
+# Copyright (C) 2025 iolaire mcfadden.
+# This program is free software: you can redistribute it and/or modify it under the terms of the GNU Affero General Public License as published by the Free Software Foundation, either version 3 of the License, or (at your option) any later version.
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+Unit tests for the pooled HTTP client and streaming mode of OllamaCaptionGenerator
+"""
+
+import asyncio
+import json
+import os
+import tempfile
+import unittest
+
+import httpx
+
+from config import OllamaConfig, RetryConfig, FallbackConfig, CaptionConfig
+from app.utils.processing.ollama_caption_generator import OllamaCaptionGenerator
+
+MODEL = "llava:7b"
+
+class FakeOllama:
+    """Records requests and answers them like an Ollama server"""
+
+    def __init__(self, tokens):
+        self.tokens = tokens
+        self.requests = []
+        self.chunks_sent = 0
+
+    def handler(self, request: httpx.Request) -> httpx.Response:
+        self.requests.append(request)
+        if request.url.path == "/api/tags":
+            return httpx.Response(200, json={"models": [{"name": MODEL, "size": 1}]})
+
+        payload = json.loads(request.content)
+        if not payload["stream"]:
+            return httpx.Response(200, json={"response": "".join(self.tokens), "done": True, "eval_count": len(self.tokens)})
+        return httpx.Response(200, content=self._stream())
+
+    async def _stream(self):
+        for token in self.tokens:
+            self.chunks_sent += 1
+            yield (json.dumps({"response": token, "done": False}) + "\n").encode()
+            await asyncio.sleep(0)
+        yield (json.dumps({"response": "", "done": True, "eval_count": len(self.tokens)}) + "\n").encode()
+
+class TestOllamaClientStreaming(unittest.IsolatedAsyncioTestCase):
+    """Test connection reuse and early-stopping streamed generation"""
+
+    async def asyncSetUp(self):
+        fd, self.image_path = tempfile.mkstemp(suffix=".jpg")
+        os.write(fd, b"fake image bytes")
+        os.close(fd)
+
+    async def asyncTearDown(self):
+        os.remove(self.image_path)
+
+    def make_generator(self, tokens, stream=False, max_length=500):
+        config = OllamaConfig(
+            url="http://ollama.test",
+            model_name=MODEL,
+            stream=stream,
+            retry=RetryConfig(max_attempts=1),
+            fallback=FallbackConfig(enabled=False),
+            caption=CaptionConfig(max_length=max_length)
+        )
+        generator = OllamaCaptionGenerator(config)
+        server = FakeOllama(tokens)
+        generator._client = httpx.AsyncClient(transport=httpx.MockTransport(server.handler))
+        generator._client_loop = asyncio.get_running_loop()
+        return generator, server
+
+    async def test_client_is_shared_between_calls(self):
+        generator, server = self.make_generator(["A cat on a sofa."])
+        client = generator._client
+
+        await generator.initialize()
+        await generator.generate_caption(self.image_path)
+        await generator.generate_caption(self.image_path)
+        self.assertTrue(await generator.test_connection())
+        self.assertTrue(await generator.test_model_availability())
+
+        self.assertIs(generator._get_client(), client)
+        self.assertEqual(len(server.requests), 6)
+
+    async def test_streamed_caption_matches_buffered_caption(self):
+        tokens = ["A small ", "dog runs ", "across a ", "green field."]
+        buffered, _ = self.make_generator(tokens)
+        streamed, _ = self.make_generator(tokens, stream=True)
+
+        buffered_caption, _ = await buffered.generate_caption(self.image_path)
+        streamed_caption, _ = await streamed.generate_caption(self.image_path)
+
+        self.assertEqual(streamed_caption, buffered_caption)
+        self.assertEqual(streamed.stream_stats["streamed_requests"], 1)
+        self.assertEqual(streamed.stream_stats["early_stops"], 0)
+
+    async def test_stream_stops_after_first_line(self):
+        tokens = ["A red ", "bicycle.", "\n", "Extra ", "text ", "that ", "is ", "discarded."]
+        buffered, _ = self.make_generator(tokens)
+        streamed, server = self.make_generator(tokens, stream=True)
+
+        buffered_caption, _ = await buffered.generate_caption(self.image_path)
+        streamed_caption, _ = await streamed.generate_caption(self.image_path)
+
+        self.assertEqual(streamed_caption, buffered_caption)
+        self.assertEqual(streamed.stream_stats["early_stops"], 1)
+        self.assertLess(server.chunks_sent, len(tokens))
+
+    async def test_stream_stops_once_over_max_length(self):
+        tokens = ["word "] * 200
+        buffered, _ = self.make_generator(tokens, max_length=100)
+        streamed, server = self.make_generator(tokens, stream=True, max_length=100)
+
+        buffered_caption, _ = await buffered.generate_caption(self.image_path)
+        streamed_caption, _ = await streamed.generate_caption(self.image_path)
+
+        self.assertEqual(streamed_caption, buffered_caption)
+        self.assertLess(server.chunks_sent, 30)
+
+    async def test_on_token_receives_partial_captions(self):
+        generator, _ = self.make_generator(["A tall ", "tree."])
+        partials = []
+
+        async def on_token(text):
+            partials.append(text)
+
+        await generator.generate_caption(self.image_path, on_token=on_token)
+
+        self.assertEqual(partials[:2], ["A tall ", "A tall tree."])
+        self.assertEqual(generator.stream_stats["streamed_requests"], 1)
+
+    async def test_failing_token_callback_does_not_fail_generation(self):
+        generator, _ = self.make_generator(["A lake."])
+
+        def on_token(text):
+            raise ValueError("websocket closed")
+
+        caption, _ = await generator.generate_caption(self.image_path, on_token=on_token)
+        self.assertTrue(caption.startswith("A lake"))
+
+    async def test_close_releases_client(self):
+        generator, _ = self.make_generator(["A boat."])
+        client = generator._client
+
+        await generator.close()
+
+        self.assertTrue(client.is_closed)
+        self.assertIsNone(generator._client)
+
+    async def test_client_of_previous_loop_is_closed_on_that_loop(self):
+        generator, _ = self.make_generator(["A boat."])
+        previous_loop = asyncio.new_event_loop()
+        self.addCleanup(previous_loop.close)
+        previous = generator._client
+        generator._client_loop = previous_loop
+
+        client = generator._get_client()
+        await asyncio.to_thread(previous_loop.run_until_complete, asyncio.sleep(0.01))
+
+        self.assertIsNot(client, previous)
+        self.assertTrue(previous.is_closed)
+        await generator.close()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,220 @@
+# Copyright (C) 2025 iolaire mcfadden.
+# This program is free software: you can redistribute it and/or modify it under the terms of the GNU Affero General Public License as published by the Free Software Foundation, either version 3 of the License, or (at your option) any later version.
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+Unit tests for multi-endpoint Ollama routing, run against local stub HTTP servers
+"""
+
+import asyncio
+import json
+import os
+import socket
+import tempfile
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest.mock import Mock
+
+import httpx
+
+from config import OllamaConfig, RetryConfig, FallbackConfig, CaptionConfig
+from app.utils.processing.ollama_caption_generator import OllamaCaptionGenerator
+from app.utils.processing.ollama_endpoint_pool import OllamaEndpointPool, LatencyHistogram
+
+MODEL = "llava:7b"
+
+class StubOllamaServer:
+    """Minimal Ollama API served from a background thread"""
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.healthy = True
+        self.generate_requests = 0
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def _send(self, status, body):
+                data = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                if not stub.healthy:
+                    return self._send(503, {"error": "unavailable"})
+                self._send(200, {"models": [{"name": MODEL}]})
+
+            def do_POST(self):
+                self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                if not stub.healthy:
+                    return self._send(500, {"error": "model crashed"})
+                stub.generate_requests += 1
+                time.sleep(stub.delay)
+                self._send(200, {"response": f"A photo served by port {stub.port}.", "done": True})
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.port = self.server.server_address[1]
+        self.url = f"http://127.0.0.1:{self.port}"
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+def unused_url():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return f"http://127.0.0.1:{sock.getsockname()[1]}"
+
+class TestOllamaEndpointPool(unittest.TestCase):
+    """Test routing decisions of OllamaEndpointPool without a network"""
+
+    def test_least_outstanding_routing(self):
+        pool = OllamaEndpointPool(["http://a", "http://b", "http://c"])
+        first, second, third = pool.acquire(), pool.acquire(), pool.acquire()
+        self.assertEqual({first.url, second.url, third.url}, {"http://a", "http://b", "http://c"})
+
+        pool.release(second, latency=0.1)
+        self.assertIs(pool.acquire(), second)
+
+    def test_ejection_after_consecutive_failures(self):
+        pool = OllamaEndpointPool(["http://a", "http://b"], failure_threshold=2, ejection_time=60)
+        bad = pool.endpoints[0]
+        for _ in range(2):
+            pool.acquire()
+            pool.release(bad, success=False, error="boom")
+
+        self.assertFalse(bad.healthy)
+        self.assertEqual([pool.acquire().url for _ in range(3)], ["http://b"] * 3)
+        self.assertEqual(pool.due_for_check(), [])
+
+    def test_all_ejected_still_routes(self):
+        pool = OllamaEndpointPool(["http://a"], failure_threshold=1)
+        endpoint = pool.acquire()
+        pool.release(endpoint, success=False, error="boom")
+        self.assertIs(pool.acquire(), endpoint)
+
+    def test_latency_histogram(self):
+        histogram = LatencyHistogram()
+        for latency in (0.2, 0.4, 1.5, 7.0):
+            histogram.record(latency)
+        stats = histogram.to_dict()
+        self.assertEqual(stats['count'], 4)
+        self.assertEqual(stats['p50'], 0.5)
+        self.assertEqual(stats['p95'], 10.0)
+        self.assertEqual(stats['buckets']['0.5'], 2)
+
+class TestMultiEndpointCaptionGenerator(unittest.IsolatedAsyncioTestCase):
+    """Test OllamaCaptionGenerator routing against stub Ollama servers"""
+
+    async def asyncSetUp(self):
+        self.servers = []
+        fd, self.image_path = tempfile.mkstemp(suffix=".jpg")
+        os.write(fd, b"fake image bytes")
+        os.close(fd)
+
+    async def asyncTearDown(self):
+        for server in self.servers:
+            server.stop()
+        os.remove(self.image_path)
+
+    def start_server(self, delay=0.0):
+        server = StubOllamaServer(delay=delay)
+        self.servers.append(server)
+        return server
+
+    def make_generator(self, urls, ejection_time=30.0):
+        config = OllamaConfig(
+            url=urls[0],
+            urls=urls,
+            model_name=MODEL,
+            timeout=5.0,
+            endpoint_failure_threshold=1,
+            endpoint_ejection_time=ejection_time,
+            retry=RetryConfig(max_attempts=3, base_delay=0.01, jitter=False),
+            fallback=FallbackConfig(enabled=False),
+            caption=CaptionConfig()
+        )
+        return OllamaCaptionGenerator(config)
+
+    async def test_concurrent_requests_spread_across_endpoints(self):
+        first, second = self.start_server(delay=0.05), self.start_server(delay=0.05)
+        generator = self.make_generator([first.url, second.url])
+        self.addAsyncCleanup(generator.close)
+        await generator.initialize()
+
+        results = await asyncio.gather(*(generator.generate_caption(self.image_path) for _ in range(6)))
+
+        self.assertTrue(all(caption for caption, _ in results))
+        self.assertEqual(first.generate_requests, 3)
+        self.assertEqual(second.generate_requests, 3)
+        stats = generator.get_endpoint_stats()
+        self.assertEqual([e['latency']['count'] for e in stats['endpoints']], [3, 3])
+
+    async def test_failing_endpoint_is_ejected(self):
+        broken, working = self.start_server(), self.start_server()
+        broken.healthy = False
+        generator = self.make_generator([broken.url, working.url])
+        self.addAsyncCleanup(generator.close)
+        generator.connection_validated = True
+
+        for _ in range(4):
+            caption, _ = await generator.generate_caption(self.image_path)
+            self.assertIn(str(working.port), caption)
+
+        broken_stats = generator.get_endpoint_stats()['endpoints'][0]
+        self.assertFalse(broken_stats['healthy'])
+        self.assertEqual(broken_stats['ejections'], 1)
+        self.assertEqual(working.generate_requests, 4)
+
+    async def test_ejected_endpoint_is_readmitted(self):
+        flaky, working = self.start_server(), self.start_server()
+        generator = self.make_generator([flaky.url, working.url], ejection_time=0.05)
+        self.addAsyncCleanup(generator.close)
+        flaky.healthy = False
+        await generator.initialize()
+        self.assertEqual(generator.endpoint_pool.healthy_count(), 1)
+
+        flaky.healthy = True
+        await asyncio.sleep(0.1)
+        await asyncio.gather(*(generator.generate_caption(self.image_path) for _ in range(4)))
+
+        self.assertEqual(generator.endpoint_pool.healthy_count(), 2)
+        self.assertGreater(flaky.generate_requests, 0)
+
+    async def test_initialize_fails_only_when_all_endpoints_are_down(self):
+        working = self.start_server()
+        generator = self.make_generator([unused_url(), working.url])
+        self.addAsyncCleanup(generator.close)
+        await generator.initialize()
+        self.assertTrue(generator.connection_validated)
+
+        down = self.make_generator([unused_url(), unused_url()])
+        self.addAsyncCleanup(down.close)
+        with self.assertRaises(httpx.ConnectError):
+            await down.initialize()
+
+    async def test_metrics_exposed_through_ai_service_monitor(self):
+        from app.services.performance.monitoring.ai_service_monitor import AIServiceMonitor
+
+        server = self.start_server()
+        generator = self.make_generator([server.url])
+        self.addAsyncCleanup(generator.close)
+        await generator.generate_caption(self.image_path)
+
+        monitor = AIServiceMonitor(Mock(), Mock(), Mock())
+        metrics = {e['url']: e for e in monitor.get_endpoint_metrics()}
+
+        self.assertIn(server.url, metrics)
+        self.assertEqual(metrics[server.url]['latency']['count'], 1)
+        self.assertIn('endpoints', monitor.get_service_status())
+
+if __name__ == '__main__':
+    unittest.main()
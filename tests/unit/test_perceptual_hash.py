@@ -0,0 +1,208 @@
+# Copyright (C) 2025 iolaire mcfadden.
+# This program is free software: you can redistribute it and/or modify it under the terms of the GNU Affero General Public License as published by the Free Software Foundation, either version 3 of the License, or (at your option) any later version.
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+Unit tests for perceptual hashing and near-duplicate caption suggestions
+"""
+
+import os
+import random
+import shutil
+import tempfile
+import threading
+import unittest
+from unittest.mock import MagicMock, Mock
+
+import numpy as np
+from PIL import Image as PILImage
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from config import StorageConfig
+from models import Base, User, PlatformConnection, Post, Image, ProcessingStatus
+from app.utils.processing.caption_review_integration import CaptionReviewIntegration
+from app.utils.processing.image_processor import ImageProcessor
+from app.utils.processing.perceptual_hash import (
+    PerceptualHashIndex, dhash, hamming_distance, hash_to_hex, hash_from_hex
+)
+
+def make_picture(seed, size=(400, 300)):
+    """Smooth random picture, so downscaling keeps its structure"""
+    rng = np.random.default_rng(seed)
+    coarse = rng.integers(0, 256, size=(6, 8, 3), dtype=np.uint8)
+    return PILImage.fromarray(coarse).resize(size, PILImage.Resampling.BICUBIC)
+
+class TestDHash(unittest.TestCase):
+    """Test that dHash tolerates resizing and recompression"""
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_resized_recompressed_copy_is_close(self):
+        original = make_picture(1)
+        copy_path = os.path.join(self.temp_dir, "copy.jpg")
+        original.resize((200, 150)).save(copy_path, "JPEG", quality=40)
+
+        self.assertLessEqual(hamming_distance(dhash(original), dhash(copy_path)), 4)
+        self.assertGreater(hamming_distance(dhash(original), dhash(make_picture(2))), 12)
+
+    def test_hex_round_trip(self):
+        value = dhash(make_picture(3))
+        self.assertEqual(len(hash_to_hex(value)), 16)
+        self.assertEqual(hash_from_hex(hash_to_hex(value)), value)
+
+    def test_image_processor_hashes_stored_image(self):
+        config = MagicMock()
+        config.storage = StorageConfig()
+        config.storage.images_dir = self.temp_dir
+        processor = ImageProcessor(config)
+        path = os.path.join(self.temp_dir, "stored.jpg")
+        make_picture(4).save(path, "JPEG")
+
+        self.assertEqual(processor.get_perceptual_hash(path), hash_to_hex(dhash(path)))
+        self.assertIsNone(processor.get_perceptual_hash(os.path.join(self.temp_dir, "missing.jpg")))
+
+class TestPerceptualHashIndex(unittest.TestCase):
+    """Test the multi-index Hamming search"""
+
+    def test_search_matches_brute_force(self):
+        rng = random.Random(7)
+        hashes = [rng.getrandbits(64) for _ in range(2000)]
+        # Near copies of some stored hashes at varying distances
+        for i in range(200):
+            value = hashes[i]
+            for bit in rng.sample(range(64), i % 9):
+                value ^= 1 << bit
+            hashes.append(value)
+
+        index = PerceptualHashIndex()
+        for item, value in enumerate(hashes):
+            index.add(value, item)
+
+        for query in hashes[:50] + [rng.getrandbits(64) for _ in range(20)]:
+            for max_distance in (0, 3, 6, 8):
+                expected = sorted(item for item, value in enumerate(hashes)
+                                  if hamming_distance(value, query) <= max_distance)
+                found = index.search(query, max_distance)
+                self.assertEqual(sorted(item for item, _ in found), expected)
+                self.assertEqual([d for _, d in found], sorted(d for _, d in found))
+
+    def test_items_sharing_a_hash(self):
+        index = PerceptualHashIndex()
+        index.add(0xABC, 1)
+        index.add(0xABC, 2)
+        index.add(0xABC, 2)
+        self.assertEqual(len(index), 1)
+        self.assertEqual(index.search(0xABD, 1), [(1, 1), (2, 1)])
+
+class TestSimilarCaptionSuggestions(unittest.TestCase):
+    """Test caption suggestions from near-duplicate images in the review integration"""
+
+    def setUp(self):
+        CaptionReviewIntegration._hash_indexes.clear()
+
+        engine = create_engine("sqlite://")
+        Base.metadata.create_all(engine)
+        self.Session = sessionmaker(bind=engine)
+        db_manager = Mock()
+        db_manager.get_session.side_effect = self.Session
+        self.integration = CaptionReviewIntegration(db_manager)
+
+        session = self.Session()
+        for user_id in (1, 2):
+            session.add(User(id=user_id, username=f"user{user_id}", email=f"user{user_id}@test.com",
+                             password_hash="x"))
+            session.add(PlatformConnection(id=user_id, user_id=user_id, name=f"conn{user_id}",
+                                           platform_type="pixelfed", instance_url="https://pixelfed.test",
+                                           _access_token="token"))
+            session.add(Post(id=user_id, post_id=f"post{user_id}", user_id=user_id,
+                             post_url=f"https://pixelfed.test/p/{user_id}", platform_connection_id=user_id))
+        session.commit()
+        self.session = session
+        self.next_index = 0
+
+    def tearDown(self):
+        self.session.close()
+
+    def add_image(self, perceptual_hash, user_id=1, status=ProcessingStatus.PENDING, caption=None):
+        self.next_index += 1
+        image = Image(post_id=user_id, platform_connection_id=user_id, image_url=f"https://img/{self.next_index}",
+                      local_path=f"/tmp/{self.next_index}.jpg", attachment_index=self.next_index,
+                      perceptual_hash=hash_to_hex(perceptual_hash), status=status, final_caption=caption)
+        self.session.add(image)
+        self.session.commit()
+        return image.id
+
+    def test_suggests_caption_of_approved_near_duplicate(self):
+        approved = self.add_image(0xF0F0, status=ProcessingStatus.APPROVED, caption="A red barn in snow.")
+        pending = self.add_image(0xF0F1)
+
+        suggestion = self.integration.get_similar_caption_suggestion(pending, user_id=1)
+
+        self.assertEqual(suggestion, {'image_id': approved, 'caption': "A red barn in snow.", 'distance': 1})
+
+    def test_ignores_distant_unapproved_and_other_users_images(self):
+        self.add_image(0xFFFF_FFFF, status=ProcessingStatus.APPROVED, caption="Far away.")
+        self.add_image(0x0001, status=ProcessingStatus.PENDING, caption="Not reviewed yet.")
+        self.add_image(0x0002, user_id=2, status=ProcessingStatus.POSTED, caption="Someone else's.")
+        pending = self.add_image(0x0000)
+
+        self.assertIsNone(self.integration.get_similar_caption_suggestion(pending, user_id=1))
+        self.assertIsNone(self.integration.get_similar_caption_suggestion(pending, user_id=2))
+
+    def test_index_picks_up_newly_stored_images(self):
+        pending = self.add_image(0x1234)
+        self.assertIsNone(self.integration.get_similar_caption_suggestion(pending, user_id=1))
+
+        self.add_image(0x1236, status=ProcessingStatus.POSTED, caption="A cat on a windowsill.")
+        suggestion = self.integration.get_similar_caption_suggestion(pending, user_id=1)
+        self.assertEqual(suggestion['caption'], "A cat on a windowsill.")
+
+    def test_closer_unreviewed_images_do_not_hide_a_match(self):
+        for bit in range(30):
+            self.add_image(0x0F00 ^ (1 << bit), user_id=2, status=ProcessingStatus.POSTED, caption="Someone else's.")
+            self.add_image(0x0F00 ^ (1 << bit))
+        approved = self.add_image(0x0F00 ^ 0b11, status=ProcessingStatus.APPROVED, caption="A foggy pier.")
+
+        suggestion = self.integration.find_similar_caption(hash_to_hex(0x0F00), user_id=1)
+
+        self.assertEqual(suggestion, {'image_id': approved, 'caption': "A foggy pier.", 'distance': 2})
+
+    def test_only_recent_users_are_indexed(self):
+        self.add_image(0x1234, status=ProcessingStatus.APPROVED, caption="A cat.")
+        self.add_image(0x1234, user_id=2, status=ProcessingStatus.APPROVED, caption="A dog.")
+        CaptionReviewIntegration.MAX_INDEXED_USERS = 1
+        self.addCleanup(setattr, CaptionReviewIntegration, 'MAX_INDEXED_USERS', 32)
+
+        self.assertEqual(self.integration.find_similar_caption(hash_to_hex(0x1234), user_id=1)['caption'], "A cat.")
+        self.assertEqual(self.integration.find_similar_caption(hash_to_hex(0x1234), user_id=2)['caption'], "A dog.")
+        self.assertEqual(list(CaptionReviewIntegration._hash_indexes), [2])
+        self.assertEqual(len(CaptionReviewIntegration._hash_indexes[2].index), 1)
+
+    def test_loading_one_users_index_does_not_block_others(self):
+        self.add_image(0x1234, user_id=2, status=ProcessingStatus.APPROVED, caption="A dog.")
+        loading, release = threading.Event(), threading.Event()
+        released = []
+
+        def slow_query(*args):
+            # The in-memory database is not shared with other threads, so answer with no hashes
+            loading.set()
+            released.append(release.wait(2))
+            return Mock(**{'join.return_value.filter.return_value.order_by.return_value.all.return_value': []})
+
+        thread = threading.Thread(target=CaptionReviewIntegration._user_hash_index, args=(Mock(query=slow_query), 1))
+        thread.start()
+        self.assertTrue(loading.wait(2))
+
+        index = CaptionReviewIntegration._user_hash_index(self.session, 2)
+        release.set()
+        thread.join()
+
+        self.assertEqual(len(index), 1)
+        self.assertEqual(released, [True])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,113 @@
+# Copyright (C) 2025 iolaire mcfadden.
+# This program is free software: you can redistribute it and/or modify it under the terms of the GNU Affero General Public License as published by the Free Software Foundation, either version 3 of the License, or (at your option) any later version.
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+Unit tests for paged timeline fetching with one page prefetched
+"""
+
+import asyncio
+import time
+import unittest
+from types import SimpleNamespace
+
+import httpx
+
+from app.services.activitypub.components.activitypub_client import ActivityPubClient
+from app.services.activitypub.components.activitypub_platforms import (
+    PixelfedPlatform, PlatformAdapterError, PleromaPlatform
+)
+from tests.unit.test_timeline_cursor import INSTANCE, FakeTimeline, status_ids
+
+PAGE_DELAY = 0.05
+
+class SlowTimeline(FakeTimeline):
+    """FakeTimeline whose statuses requests take PAGE_DELAY seconds"""
+
+    def __init__(self, count, fail_after=None):
+        super().__init__(count)
+        self.fail_after = fail_after
+
+    async def _get_with_retry(self, url, headers, params=None):
+        if url.endswith('/accounts/lookup'):
+            return httpx.Response(200, json={'id': '7'}, request=httpx.Request('GET', url))
+        if not url.endswith('/verify_credentials'):
+            await asyncio.sleep(PAGE_DELAY)
+            if self.fail_after is not None and len(self.requests) >= self.fail_after:
+                raise httpx.ConnectError("connection reset")
+        return await super()._get_with_retry(url, headers, params)
+
+def make_client(platform, timeline):
+    """An ActivityPubClient whose requests are answered by the fake timeline"""
+    client = ActivityPubClient.__new__(ActivityPubClient)
+    client.platform = platform
+    client._get_with_retry = timeline._get_with_retry
+    return client
+
+class TestPostPagePrefetch(unittest.IsolatedAsyncioTestCase):
+    """Test ActivityPubClient.iter_user_post_pages"""
+
+    def setUp(self):
+        self.config = SimpleNamespace(instance_url=INSTANCE, access_token="token")
+
+    async def test_pages_arrive_in_order_up_to_limit(self):
+        timeline = SlowTimeline(100)
+        client = make_client(PixelfedPlatform(self.config), timeline)
+
+        pages = [page async for page in client.iter_user_post_pages("alice", 90)]
+
+        self.assertEqual([len(page) for page in pages], [40, 40, 10])
+        self.assertEqual(status_ids(sum(pages, [])), [str(i) for i in range(1099, 1009, -1)])
+
+    async def test_next_page_is_fetched_while_current_one_is_processed(self):
+        timeline = SlowTimeline(200)
+        client = make_client(PixelfedPlatform(self.config), timeline)
+
+        start = time.monotonic()
+        first_page_at = None
+        async for page in client.iter_user_post_pages("alice", 200):
+            first_page_at = first_page_at or time.monotonic() - start
+            await asyncio.sleep(PAGE_DELAY)  # Process the page
+        elapsed = time.monotonic() - start
+
+        # Serially: 5 fetches + 5 pages of processing = 10 delays
+        self.assertLess(first_page_at, 2 * PAGE_DELAY)
+        self.assertLess(elapsed, 8 * PAGE_DELAY)
+
+    async def test_breaking_early_stops_fetching(self):
+        timeline = SlowTimeline(200)
+        client = make_client(PixelfedPlatform(self.config), timeline)
+
+        async for page in client.iter_user_post_pages("alice", 200):
+            break
+        await asyncio.sleep(3 * PAGE_DELAY)
+
+        # The prefetch of the second page was cancelled before it completed
+        self.assertEqual(len(timeline.requests), 1)
+
+    async def test_platform_errors_are_wrapped(self):
+        client = make_client(PixelfedPlatform(self.config), SlowTimeline(10))
+
+        async def failing_pages(client, user_id, limit):
+            yield [{'id': 'first'}]
+            raise ValueError("bad page")
+
+        client.platform.iter_user_post_pages = failing_pages
+        pages = []
+        with self.assertRaises(PlatformAdapterError):
+            async for page in client.iter_user_post_pages("alice", 10):
+                pages.append(page)
+        self.assertEqual(pages, [[{'id': 'first'}]])
+
+    async def test_pleroma_pages_with_max_id(self):
+        timeline = SlowTimeline(100, fail_after=2)
+        platform = PleromaPlatform(self.config)
+
+        posts = await platform.get_user_posts(timeline, "alice", 100)
+
+        # Two full pages, then the failed request ends the walk
+        self.assertEqual(len(posts), 80)
+        self.assertEqual(timeline.requests[1]['max_id'], '1060')
+        self.assertTrue(all(request['limit'] == 40 for request in timeline.requests))
+
+if __name__ == '__main__':
+    unittest.main()
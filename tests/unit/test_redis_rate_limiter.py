@@ -0,0 +1,125 @@
+# Copyright (C) 2025 iolaire mcfadden.
+# This program is free software: you can redistribute it and/or modify it under the terms of the GNU Affero General Public License as published by the Free Software Foundation, either version 3 of the License, or (at your option) any later version.
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+Unit tests for the Redis-backed rate limiter shared between processes
+"""
+
+import importlib.util
+import time
+import unittest
+from datetime import datetime, timezone
+
+import redis
+
+from app.core.security.core.rate_limiter import RateLimitConfig, RedisRateLimiter, rate_limit_scope
+
+try:
+    import fakeredis
+except ImportError:
+    fakeredis = None
+
+SCOPE = rate_limit_scope("https://mastodon.test", "token-a")
+
+@unittest.skipUnless(fakeredis and importlib.util.find_spec('lupa'), "fakeredis with Lua support not installed")
+class TestRedisRateLimiter(unittest.TestCase):
+    """Test RedisRateLimiter against fakeredis"""
+
+    def setUp(self):
+        self.server = fakeredis.FakeServer()
+
+    def make_limiter(self, **kwargs):
+        """A limiter as another process would create it, sharing the fake Redis server"""
+        kwargs.setdefault('max_burst', 5)
+        kwargs.setdefault('requests_per_minute', 60)
+        # Keep the hour and day buckets out of the way
+        kwargs.setdefault('requests_per_hour', 10 ** 6)
+        kwargs.setdefault('requests_per_day', 10 ** 7)
+        config = RateLimitConfig(backend="redis", **kwargs)
+        return RedisRateLimiter(config, fakeredis.FakeRedis(server=self.server))
+
+    def take(self, limiter, count, scope=SCOPE, **kwargs):
+        """Request count tokens, returning how many were granted without waiting"""
+        return sum(limiter.check_rate_limit(scope=scope, **kwargs)[0] for _ in range(count))
+
+    def test_processes_share_one_budget(self):
+        first, second = self.make_limiter(), self.make_limiter()
+
+        self.assertEqual(self.take(first, 3), 3)
+        self.assertEqual(self.take(second, 3), 2)
+        allowed, wait_time = first.check_rate_limit(scope=SCOPE)
+        self.assertFalse(allowed)
+        # Two tokens short at one token per second
+        self.assertAlmostEqual(wait_time, 2.0, delta=0.1)
+
+    def test_tokens_refill_over_time(self):
+        limiter = self.make_limiter(requests_per_minute=600, max_burst=2)
+
+        self.assertEqual(self.take(limiter, 3), 2)
+        time.sleep(0.25)
+        self.assertEqual(self.take(limiter, 1), 1)
+
+    def test_scopes_have_separate_buckets(self):
+        limiter = self.make_limiter()
+        other_token = rate_limit_scope("https://mastodon.test", "token-b")
+
+        self.assertEqual(self.take(limiter, 5), 5)
+        self.assertEqual(self.take(limiter, 5, scope=other_token), 5)
+        self.assertNotIn("token-a", SCOPE)
+
+    def test_endpoint_limits_apply_within_scope(self):
+        limiter = self.make_limiter(requests_per_minute=6000, max_burst=5,
+                                    endpoint_limits={"media": {"minute": 60}},
+                                    platform_endpoint_limits={"mastodon": {"media": {"minute": 6}}})
+
+        self.assertEqual(self.take(limiter, 5, endpoint="MEDIA", platform="mastodon"), 5)
+        allowed, wait_time = limiter.check_rate_limit("MEDIA", "mastodon", SCOPE)
+        self.assertFalse(allowed)
+        # The platform-endpoint bucket refills slowest
+        self.assertAlmostEqual(wait_time, 10.0, delta=0.5)
+        # Other endpoints only wait for the fast global bucket
+        self.assertLess(limiter.check_rate_limit("STATUSES", "mastodon", SCOPE)[1], 0.1)
+
+    def test_exhausted_server_budget_is_shared(self):
+        first, second = self.make_limiter(max_burst=100), self.make_limiter(max_burst=100)
+        reset = datetime.fromtimestamp(time.time() + 30, timezone.utc).isoformat().replace('+00:00', 'Z')
+
+        first.update_from_response_headers(
+            {'X-RateLimit-Limit': '300', 'X-RateLimit-Remaining': '1', 'X-RateLimit-Reset': reset},
+            'mastodon', SCOPE
+        )
+        # A stale response from before cannot raise the remaining budget again
+        second.update_from_response_headers(
+            {'x-ratelimit-remaining': '50', 'x-ratelimit-reset': reset}, 'mastodon', SCOPE
+        )
+
+        self.assertEqual(self.take(second, 1), 1)
+        allowed, wait_time = first.check_rate_limit(scope=SCOPE)
+        self.assertFalse(allowed)
+        self.assertAlmostEqual(wait_time, 30.0, delta=1.0)
+        self.assertEqual(self.take(second, 1, scope=rate_limit_scope("https://other.test")), 1)
+
+    def test_falls_back_to_local_buckets_without_redis(self):
+        config = RateLimitConfig(backend="redis", max_burst=5)
+        limiter = RedisRateLimiter(config, redis.Redis(port=1, socket_connect_timeout=0.1))
+
+        with self.assertLogs('app.core.security.core.rate_limiter', 'WARNING'):
+            self.assertTrue(limiter.check_rate_limit(scope=SCOPE)[0])
+        self.assertGreater(limiter._redis_retry_at, time.monotonic())
+        # Later requests skip Redis until the retry interval has passed
+        start = time.monotonic()
+        self.assertTrue(limiter.check_rate_limit(scope=SCOPE)[0])
+        self.assertLess(time.monotonic() - start, 0.05)
+
+class TestRateLimitScope(unittest.TestCase):
+    """Test rate_limit_scope"""
+
+    def test_scope_uses_host_and_token_digest(self):
+        scope = rate_limit_scope("https://Mastodon.Test/", "secret")
+
+        self.assertTrue(scope.startswith("mastodon.test:"))
+        self.assertNotIn("secret", scope)
+        self.assertEqual(rate_limit_scope("https://mastodon.test", None), "mastodon.test")
+
+if __name__ == '__main__':
+    unittest.main()
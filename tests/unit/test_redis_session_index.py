@@ -0,0 +1,84 @@
+# Copyright (C) 2025 iolaire mcfadden.
+# This program is free software: you can redistribute it and/or modify it under the terms of the GNU Affero General Public License as published by the Free Software Foundation, either version 3 of the License, or (at your option) any later version.
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+Unit tests for the session indexes of RedisSessionBackend
+"""
+
+import json
+import time
+import unittest
+from unittest.mock import patch
+
+from app.core.session.redis.manager import RedisSessionBackend
+
+try:
+    import fakeredis
+except ImportError:
+    fakeredis = None
+
+def make_backend(client):
+    with patch('redis.from_url', return_value=client):
+        return RedisSessionBackend(redis_url="redis://localhost:6379/0")
+
+@unittest.skipUnless(fakeredis, "fakeredis not installed")
+class TestRedisSessionIndex(unittest.TestCase):
+    """Test that user lookups, counts and logout-all use the indexes"""
+
+    def setUp(self):
+        self.redis = fakeredis.FakeRedis(decode_responses=True)
+        self.backend = make_backend(self.redis)
+
+    def test_sessions_are_found_through_the_user_index(self):
+        for number in range(3):
+            self.backend.set(f"a{number}", {'user_id': 1})
+        self.backend.set("b0", {'user_id': 2})
+        self.backend.set("anonymous", {'csrf': 'x'})
+
+        with patch.object(self.redis, 'scan_iter', side_effect=AssertionError("scanned the keyspace")):
+            self.assertEqual(sorted(self.backend.get_sessions_by_user(1)), ["a0", "a1", "a2"])
+            self.assertEqual(self.backend.get_session_count(), 5)
+            self.assertEqual(self.backend.cleanup_user_sessions(1), 3)
+            self.assertEqual(self.backend.get_sessions_by_user(1), [])
+            self.assertEqual(sorted(self.backend.get_all_sessions()), ["anonymous", "b0"])
+
+        self.assertFalse(self.redis.exists("vedfolnir:session_index:user:1"))
+
+    def test_expired_and_stale_entries_are_dropped(self):
+        self.backend.set("short", {'user_id': 1}, ttl=1)
+        self.backend.set("long", {'user_id': 1}, ttl=60)
+        # Deleted without going through the backend
+        self.backend.set("gone", {'user_id': 1})
+        self.redis.delete("vedfolnir:session:gone")
+        time.sleep(1.1)
+
+        self.assertEqual(self.backend.get_sessions_by_user(1), ["long"])
+        self.assertEqual(self.redis.zrange("vedfolnir:session_index:user:1", 0, -1), ["long"])
+        self.assertEqual(self.backend.get_session_count(), 2)
+
+    def test_user_index_lives_as_long_as_the_longest_session(self):
+        self.backend.set("remembered", {'user_id': 1}, ttl=3600)
+        self.backend.set("browser", {'user_id': 1}, ttl=60)
+
+        self.assertGreater(self.redis.ttl("vedfolnir:session_index:user:1"), 3500)
+        self.backend.update_ttl("browser", 7200)
+        self.assertGreater(self.redis.ttl("vedfolnir:session_index:user:1"), 7100)
+
+    def test_existing_sessions_are_indexed_on_startup(self):
+        client = fakeredis.FakeRedis(server=fakeredis.FakeServer(), decode_responses=True)
+        client.set("vedfolnir:session:old", json.dumps({'user_id': 3}), ex=60)
+
+        backend = make_backend(client)
+
+        self.assertEqual(backend.get_sessions_by_user(3), ["old"])
+
+    def test_index_is_not_rebuilt_on_restart_without_sessions(self):
+        self.backend.set("short", {'user_id': 1}, ttl=1)
+        self.backend.delete("short")
+        self.assertFalse(self.redis.exists("vedfolnir:session_index:all"))
+
+        with patch.object(self.redis, 'scan_iter', side_effect=AssertionError("scanned the keyspace")):
+            make_backend(self.redis)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,113 @@
+# Copyright (C) 2025 iolaire mcfadden.
+# This program is free software: you can redistribute it and/or modify it under the terms of the GNU Affero General Public License as published by the Free Software Foundation, either version 3 of the License, or (at your option) any later version.
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+Unit tests for header-driven request pacing
+"""
+
+import asyncio
+import time
+import unittest
+from types import SimpleNamespace
+
+import httpx
+
+from app.services.activitypub.components.activitypub_client import ActivityPubClient
+from app.services.activitypub.components.request_pacer import RequestPacer
+
+def budget(remaining, reset_in):
+    return {'X-RateLimit-Limit': '300', 'X-RateLimit-Remaining': str(remaining),
+            'X-RateLimit-Reset': str(time.time() + reset_in)}
+
+class TestRequestPacer(unittest.IsolatedAsyncioTestCase):
+    """Test RequestPacer"""
+
+    async def timed(self, pacer, count, priority=RequestPacer.BULK):
+        start = time.monotonic()
+        for _ in range(count):
+            await pacer.acquire(priority)
+        return time.monotonic() - start
+
+    async def test_requests_are_not_paced_without_headers(self):
+        pacer = RequestPacer()
+
+        self.assertLess(await self.timed(pacer, 20), 0.05)
+        self.assertEqual(pacer.get_stats()['paced'], 0)
+
+    async def test_remaining_budget_is_spread_to_the_reset(self):
+        pacer = RequestPacer()
+        pacer.update_from_headers(budget(10, 1.0))
+
+        elapsed = await self.timed(pacer, 5)
+
+        # One request every 0.1s; the first goes straight away
+        self.assertAlmostEqual(elapsed, 0.4, delta=0.1)
+        stats = pacer.get_stats()
+        self.assertEqual((stats['requests'], stats['requests_per_minute'], stats['remaining']), (5, 5, 5))
+
+    async def test_reserve_is_left_unused(self):
+        pacer = RequestPacer(reserve=5)
+        pacer.update_from_headers(budget(10, 1.0))
+
+        self.assertAlmostEqual(pacer.get_stats()['interval'], 0.2, delta=0.02)
+
+    async def test_spent_budget_waits_for_reset(self):
+        pacer = RequestPacer()
+        await pacer.acquire()
+        pacer.update_from_headers(budget(0, 0.3))
+
+        self.assertAlmostEqual(await self.timed(pacer, 1), 0.3, delta=0.1)
+
+    async def test_retry_after_pauses_requests(self):
+        pacer = RequestPacer()
+        await pacer.acquire()
+        pacer.update_from_headers({'Retry-After': '0.3'}, status_code=429)
+
+        self.assertAlmostEqual(await self.timed(pacer, 1), 0.3, delta=0.1)
+
+    async def test_stale_response_does_not_raise_budget(self):
+        pacer = RequestPacer()
+        reset = str(time.time() + 60)
+        pacer.update_from_headers({'X-RateLimit-Remaining': '10', 'X-RateLimit-Reset': reset})
+        pacer.update_from_headers({'X-RateLimit-Remaining': '50', 'X-RateLimit-Reset': reset})
+
+        self.assertEqual(pacer.get_stats()['remaining'], 10)
+
+    async def test_urgent_requests_go_before_waiting_bulk_requests(self):
+        pacer = RequestPacer()
+        pacer.update_from_headers(budget(20, 1.0))
+        order = []
+
+        async def request(name, priority):
+            await pacer.acquire(priority)
+            order.append(name)
+
+        bulk = [asyncio.create_task(request(f"bulk{i}", RequestPacer.BULK)) for i in range(4)]
+        await asyncio.sleep(0.01)
+        await request("urgent", RequestPacer.URGENT)
+        await asyncio.gather(*bulk)
+
+        # Only the bulk request already let through goes first
+        self.assertEqual(order[:2], ["bulk0", "urgent"])
+        self.assertEqual(len(order), 5)
+
+class TestClientPacing(unittest.IsolatedAsyncioTestCase):
+    """Test that ActivityPubClient feeds responses to its pacer"""
+
+    async def test_send_updates_pacer_from_response(self):
+        client = ActivityPubClient.__new__(ActivityPubClient)
+        client.config = SimpleNamespace(user_agent="test")
+        client.pacer = RequestPacer()
+        client.session = httpx.AsyncClient(transport=httpx.MockTransport(
+            lambda request: httpx.Response(200, headers=budget(100, 300), json={})
+        ))
+        self.addAsyncCleanup(client.session.aclose)
+
+        await client._send('put', "https://mastodon.test/api/v1/media/1", RequestPacer.URGENT, json={})
+
+        stats = client.get_pacing_stats()
+        self.assertEqual((stats['requests'], stats['remaining']), (1, 100))
+        self.assertAlmostEqual(stats['interval'], 3.0, delta=0.1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,134 @@
+# Copyright (C) 2025 iolaire mcfadden.
+# This program is free software: you can redistribute it and/or modify it under the terms of the GNU Affero General Public License as published by the Free Software Foundation, either version 3 of the License, or (at your option) any later version.
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+Unit tests for background resource sampling and batched metrics rollups
+"""
+
+import time
+import unittest
+from datetime import datetime, timezone
+from unittest.mock import Mock, patch
+
+import psutil
+
+from app.services.monitoring.system.resource_sampler import (
+    MetricsRollupBuffer, ResourceSampler, SampleRingBuffer
+)
+from app.services.monitoring.system.system_monitor import SystemHealth, SystemMonitor
+
+try:
+    import fakeredis
+except ImportError:
+    fakeredis = None
+
+class TestSampleRingBuffer(unittest.TestCase):
+    """Test the array-backed ring buffer and its window aggregates"""
+
+    def test_oldest_samples_are_overwritten(self):
+        buffer = SampleRingBuffer(['cpu_percent'], capacity=3)
+        for second in range(5):
+            buffer.append(1000.0 + second, {'cpu_percent': second * 10})
+
+        self.assertEqual(len(buffer), 3)
+        self.assertEqual(buffer.values_since('cpu_percent', 0), [40.0, 30.0, 20.0])
+
+    def test_windows_only_cover_recent_samples(self):
+        buffer = SampleRingBuffer(['cpu_percent'], capacity=200)
+        for second in range(100):
+            buffer.append(float(second), {'cpu_percent': second + 1})
+
+        self.assertEqual(buffer.summarize_since(0)['cpu_percent'], {'p50': 50.0, 'p95': 95.0, 'max': 100.0})
+        self.assertEqual(buffer.summarize_since(90)['cpu_percent'], {'p50': 95.0, 'p95': 100.0, 'max': 100.0})
+        self.assertEqual(buffer.summarize_since(1000)['cpu_percent'], {'p50': 0.0, 'p95': 0.0, 'max': 0.0})
+
+class TestResourceSampler(unittest.TestCase):
+    """Test that health requests read background samples instead of blocking"""
+
+    def make_sampler(self, **kwargs):
+        sampler = ResourceSampler(Mock(), None, **kwargs)
+        self.addCleanup(sampler.stop)
+        return sampler
+
+    def test_health_reads_the_latest_sample_without_blocking(self):
+        sampler = self.make_sampler(interval=0.05)
+        sampler.start()
+        time.sleep(1.3)
+        monitor = SystemMonitor(Mock(), redis_client=Mock(), resource_sampler=sampler)
+
+        with patch('psutil.cpu_percent', side_effect=AssertionError("sampled in the request")):
+            start = time.perf_counter()
+            usage = monitor.check_resource_usage()
+            elapsed = time.perf_counter() - start
+
+        self.assertLess(elapsed, 0.2)
+        self.assertGreater(usage.memory_total_mb, 0)
+        self.assertEqual(set(usage.windows), {'1m', '5m', '15m'})
+        self.assertGreaterEqual(usage.windows['1m']['cpu_percent']['max'], usage.windows['1m']['cpu_percent']['p50'])
+        self.assertGreater(sampler.get_stats()['samples'], 1)
+
+    def test_failed_first_sample_reports_critical_health(self):
+        monitor = SystemMonitor(Mock(), redis_client=Mock(), resource_sampler=self.make_sampler())
+
+        with patch.object(psutil, 'virtual_memory', side_effect=OSError("no /proc")):
+            health = monitor.get_system_health()
+
+        self.assertEqual((health.status, health.cpu_usage), ('critical', 0.0))
+
+@unittest.skipUnless(fakeredis, "fakeredis not installed")
+class TestMetricsRollups(unittest.TestCase):
+    """Test that metrics history is downsampled and written in batches"""
+
+    def setUp(self):
+        self.redis = fakeredis.FakeRedis(decode_responses=True)
+
+    def health(self):
+        return SystemHealth(status='healthy', cpu_usage=10.0, memory_usage=20.0, disk_usage=30.0,
+                            database_status='healthy', redis_status='healthy', active_tasks=0,
+                            queued_tasks=0, failed_tasks_last_hour=0, avg_processing_time=0.0,
+                            timestamp=datetime.now(timezone.utc))
+
+    def test_history_is_downsampled_and_batched(self):
+        sampler = ResourceSampler(Mock(), self.redis, flush_interval=60)
+        monitor = SystemMonitor(Mock(), redis_client=self.redis, resource_sampler=sampler)
+
+        for _ in range(20):
+            monitor._store_health_metrics(self.health())
+
+        self.assertEqual(self.redis.hget(monitor.health_key, 'status'), 'healthy')
+        self.assertEqual(self.redis.keys(f"{monitor.health_key}:history:*"), [])
+        self.assertLessEqual(sampler.rollups.get_stats()['pending'], 2)
+
+        sampler.stop()
+
+        history = monitor.get_historical_metrics('health', hours=1)
+        self.assertIn(len(history), (1, 2))
+        self.assertEqual(history[-1]['cpu_usage'], 10.0)
+        self.assertEqual(sampler.rollups.get_stats()['batches'], 1)
+
+    def test_sampler_rolls_up_resource_samples(self):
+        sampler = ResourceSampler(Mock(), self.redis, rollup_interval=0.2, flush_interval=0)
+        sampler.sample()
+        time.sleep(0.25)
+        sampler.sample()
+        sampler.rollups.flush(self.redis)
+
+        monitor = SystemMonitor(Mock(), redis_client=self.redis, resource_sampler=sampler)
+        history = monitor.get_historical_metrics('resources', hours=1)
+        self.assertEqual(len(history), 1)
+        self.assertIn('cpu_percent', history[0]['aggregates'])
+        self.assertGreater(history[0]['memory_total_mb'], 0)
+
+    def test_failed_write_keeps_the_buffer_usable(self):
+        rollups = MetricsRollupBuffer(flush_interval=0)
+        rollups.add("vedfolnir:metrics:health", time.time(), {'status': 'healthy'}, 60)
+        broken = Mock()
+        broken.pipeline.return_value.execute.side_effect = ConnectionError("down")
+
+        self.assertEqual(rollups.flush(broken), 0)
+        self.assertEqual(rollups.get_stats()['errors'], 1)
+        rollups.add("vedfolnir:metrics:health", time.time(), {'status': 'healthy'}, 60)
+        self.assertEqual(rollups.flush(self.redis), 1)
+
+if __name__ == '__main__':
+    unittest.main()
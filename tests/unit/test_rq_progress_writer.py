@@ -0,0 +1,139 @@
+# Copyright (C) 2025 iolaire mcfadden.
+# This program is free software: you can redistribute it and/or modify it under the terms of the GNU Affero General Public License as published by the Free Software Foundation, either version 3 of the License, or (at your option) any later version.
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+Unit tests for write-behind RQ progress tracking
+"""
+
+import json
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from types import SimpleNamespace
+from unittest.mock import Mock, patch
+
+from models import Base, CaptionGenerationTask, TaskStatus
+from app.services.task.rq.rq_data_retention_manager import RQDataRetentionManager
+from app.services.task.rq.rq_progress_tracker import RQProgressTracker
+from tests.unit.test_database_pool import make_manager
+
+try:
+    import fakeredis
+except ImportError:
+    fakeredis = None
+
+@unittest.skipUnless(fakeredis, "fakeredis not installed")
+class TestCoalescedProgress(unittest.TestCase):
+    """Test RQProgressTracker with CoalescingProgressWriter against fakeredis and SQLite"""
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.temp_dir)
+        self.db = make_manager(os.path.join(self.temp_dir, "progress.db"))
+        Base.metadata.create_all(self.db.engine)
+        session = self.db.get_session()
+        session.add(CaptionGenerationTask(id="task-1", user_id=7, platform_connection_id=1,
+                                          status=TaskStatus.RUNNING))
+        session.commit()
+        session.close()
+        self.redis = fakeredis.FakeRedis()
+
+    def make_tracker(self, db_write_interval=60):
+        tracker = RQProgressTracker(self.db, self.redis, db_write_interval=db_write_interval)
+        tracker._send_websocket_notification = Mock()
+        tracker.progress_tracker = Mock()
+        return tracker
+
+    def stored(self):
+        session = self.db.get_session()
+        try:
+            task = session.get(CaptionGenerationTask, "task-1")
+            return task.current_step, task.progress_percent
+        finally:
+            session.close()
+
+    def test_ticks_go_to_redis_and_are_coalesced_in_the_database(self):
+        tracker = self.make_tracker()
+        pubsub = self.redis.pubsub()
+        pubsub.subscribe(tracker.progress_channel)
+        pubsub.get_message(timeout=1)
+
+        with patch.object(tracker, '_get_task_info', wraps=tracker._get_task_info) as lookups:
+            for percent in range(1, 51):
+                self.assertTrue(tracker.update_rq_progress("task-1", f"Image {percent}", percent))
+
+        lookups.assert_called_once_with("task-1")
+        self.assertEqual(self.stored(), ("Image 1", 1))
+        progress = tracker.get_rq_progress("task-1", 7)
+        self.assertEqual((progress.current_step, progress.progress_percent, progress.user_id), ("Image 50", 50, 7))
+        messages = [pubsub.get_message(timeout=1) for _ in range(50)]
+        self.assertEqual(json.loads(messages[-1]['data'])['progress_percent'], 50)
+
+        stats = tracker.get_stats()
+        self.assertEqual((stats['updates'], stats['redis_writes'], stats['db_writes'], stats['db_writes_coalesced']),
+                         (50, 50, 1, 49))
+
+        tracker.complete_rq_progress("task-1", SimpleNamespace(captions_generated=3, images_processed=3, success_rate=100))
+
+        self.assertEqual(self.stored(), ("Completed", 100))
+        self.assertEqual(tracker.get_stats()['cached_tasks'], 0)
+
+    def test_pending_progress_is_written_after_the_interval(self):
+        tracker = self.make_tracker(db_write_interval=0.2)
+        tracker.update_rq_progress("task-1", "Image 1", 10)
+        tracker.update_rq_progress("task-1", "Image 2", 20)
+        self.assertEqual(self.stored(), ("Image 1", 10))
+
+        time.sleep(0.25)
+        tracker.update_rq_progress("task-1", "Image 3", 30)
+
+        self.assertEqual(self.stored(), ("Image 3", 30))
+
+    def test_failure_writes_pending_progress(self):
+        tracker = self.make_tracker()
+        tracker.update_rq_progress("task-1", "Image 1", 10)
+
+        tracker.fail_rq_progress("task-1", "Ollama unavailable")
+
+        self.assertEqual(self.stored(), ("Failed: Ollama unavailable", 0))
+        self.assertEqual(tracker.writer.get_stats()['pending'], 0)
+
+    def test_reads_progress_stored_as_json(self):
+        tracker = self.make_tracker()
+        self.redis.set("rq:progress:task-1", json.dumps({
+            'task_id': "task-1", 'job_id': "job", 'worker_id': "worker", 'user_id': 7,
+            'current_step': "Image 4", 'progress_percent': 40, 'details': {}
+        }))
+
+        self.assertEqual(tracker.get_rq_progress("task-1", 7).progress_percent, 40)
+
+    def test_cleanup_walks_the_progress_index(self):
+        tracker = self.make_tracker()
+        tracker.update_rq_progress("task-1", "Image 1", 10)
+        tracker.writer.publish("done", {'task_id': "done"}, {})
+        tracker.writer.expire("done", 1)
+        tracker.writer.publish("orphan", {'task_id': "orphan"}, {})
+        self.redis.persist("rq:progress:orphan")
+        time.sleep(1.1)
+
+        with patch.object(self.redis, 'keys', side_effect=AssertionError("scanned the keyspace")):
+            self.assertEqual(tracker.cleanup_expired_progress(), 2)
+
+        self.assertFalse(self.redis.exists("rq:progress:orphan"))
+        self.assertEqual(self.redis.zrange(tracker.writer.index_key, 0, -1), [b"task-1"])
+
+    def test_retention_ttls_keep_the_progress_index_in_step(self):
+        tracker = self.make_tracker()
+        tracker.update_rq_progress("task-1", "Image 1", 10)
+        retention = RQDataRetentionManager(self.db, self.redis, Mock(), {})
+
+        retention.set_task_ttl("task-1", TaskStatus.COMPLETED)
+
+        ttl = retention.active_policy.completed_tasks_ttl
+        self.assertEqual(self.redis.ttl("rq:progress:task-1"), ttl)
+        self.assertAlmostEqual(self.redis.zscore(tracker.writer.index_key, "task-1"), time.time() + ttl, delta=5)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,157 @@
+# Copyright (C) 2025 iolaire mcfadden.
+# This program is free software: you can redistribute it and/or modify it under the terms of the GNU Affero General Public License as published by the Free Software Foundation, either version 3 of the License, or (at your option) any later version.
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+Unit tests for atomic task claiming in TaskQueueManager
+"""
+
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.dialects import mysql, postgresql
+from sqlalchemy.orm import sessionmaker
+
+from models import Base, CaptionGenerationTask, JobPriority, TaskStatus
+from app.services.task.core.task_queue_manager import TaskQueueManager
+
+def make_db_manager(path):
+    """A minimal DatabaseManager on a SQLite file, one per simulated worker host"""
+    engine = create_engine(f"sqlite:///{path}", connect_args={'timeout': 30})
+    return SimpleNamespace(engine=engine, get_session=sessionmaker(bind=engine, expire_on_commit=False))
+
+class TestClaimNextTask(unittest.TestCase):
+    """Test claim_next_task against SQLite"""
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.temp_dir)
+        self.path = os.path.join(self.temp_dir, "tasks.db")
+        self.db = make_db_manager(self.path)
+        Base.metadata.create_all(self.db.engine)
+        self.created = datetime(2025, 1, 1)
+
+    def add_tasks(self, *priorities):
+        session = self.db.get_session()
+        ids = []
+        for priority in priorities:
+            self.created += timedelta(seconds=1)
+            task = CaptionGenerationTask(user_id=len(ids) + 1, platform_connection_id=1, priority=priority,
+                                         status=TaskStatus.QUEUED, created_at=self.created)
+            session.add(task)
+            session.flush()
+            ids.append(task.id)
+        session.commit()
+        session.close()
+        return ids
+
+    def test_claims_by_priority_then_age(self):
+        low, normal_old, urgent, normal_new = self.add_tasks(
+            JobPriority.LOW, JobPriority.NORMAL, JobPriority.URGENT, JobPriority.NORMAL
+        )
+        manager = TaskQueueManager(self.db, max_concurrent_tasks=10)
+
+        claimed = [manager.get_next_task() for _ in range(5)]
+
+        self.assertEqual([task.id for task in claimed[:4]], [urgent, normal_old, normal_new, low])
+        self.assertIsNone(claimed[4])
+        self.assertTrue(all(task.status == TaskStatus.RUNNING and task.started_at for task in claimed[:4]))
+
+    def test_respects_max_concurrent_tasks(self):
+        self.add_tasks(JobPriority.NORMAL, JobPriority.NORMAL)
+        manager = TaskQueueManager(self.db, max_concurrent_tasks=1)
+
+        self.assertIsNotNone(manager.claim_next_task())
+        self.assertIsNone(manager.claim_next_task())
+
+    def test_task_taken_by_another_worker_is_skipped(self):
+        first, second = self.add_tasks(JobPriority.NORMAL, JobPriority.NORMAL)
+        manager = TaskQueueManager(self.db, max_concurrent_tasks=10)
+        other_worker = make_db_manager(self.path)
+
+        claimed_elsewhere = []
+
+        # Another host claims the first task between this worker's read and its update
+        def claim_first(conn, clauseelement, multiparams, params, execution_options):
+            if clauseelement.is_dml and not claimed_elsewhere:
+                claimed_elsewhere.append(first)
+                with other_worker.engine.begin() as connection:
+                    connection.exec_driver_sql(
+                        "UPDATE caption_generation_tasks SET status = 'RUNNING' WHERE id = ?", (first,)
+                    )
+        event.listen(self.db.engine, 'before_execute', claim_first)
+        self.addCleanup(event.remove, self.db.engine, 'before_execute', claim_first)
+
+        self.assertEqual(manager.claim_next_task().id, second)
+        self.assertEqual(claimed_elsewhere, [first])
+
+    def test_queries_per_claim(self):
+        statements = []
+
+        def record(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+        event.listen(self.db.engine, 'before_cursor_execute', record)
+        self.addCleanup(event.remove, self.db.engine, 'before_cursor_execute', record)
+        manager = TaskQueueManager(self.db, max_concurrent_tasks=10)
+
+        self.assertIsNone(manager.claim_next_task())
+        self.assertEqual(len(statements), 1)
+
+        # Empty priority levels are not read: one probe, the running count, one read and the claim
+        self.add_tasks(JobPriority.LOW)
+        statements.clear()
+        self.assertIsNotNone(manager.claim_next_task())
+        self.assertEqual(len(statements), 4)
+
+    def test_concurrent_workers_never_share_a_task(self):
+        task_ids = self.add_tasks(*[JobPriority.NORMAL] * 40)
+        claimed = []
+        lock = threading.Lock()
+
+        def worker():
+            manager = TaskQueueManager(make_db_manager(self.path), max_concurrent_tasks=1000)
+            while True:
+                task = manager.claim_next_task()
+                if task is None:
+                    return
+                with lock:
+                    claimed.append(task.id)
+
+        threads = [threading.Thread(target=worker) for _ in range(6)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(sorted(claimed), sorted(task_ids))
+
+class TestSkipLocked(unittest.TestCase):
+    """Test where FOR UPDATE SKIP LOCKED is used"""
+
+    def dialect(self, dialect, version):
+        dialect.server_version_info = version
+        return SimpleNamespace(dialect=dialect)
+
+    def test_supported_databases(self):
+        supports = TaskQueueManager._supports_skip_locked
+        self.assertTrue(supports(self.dialect(mysql.dialect(), (8, 0, 36))))
+        self.assertFalse(supports(self.dialect(mysql.dialect(), (5, 7, 44))))
+        self.assertTrue(supports(self.dialect(mysql.dialect(is_mariadb=True), (10, 11, 6))))
+        self.assertTrue(supports(self.dialect(postgresql.dialect(), (16, 1))))
+        self.assertFalse(supports(SimpleNamespace(dialect=create_engine("sqlite://").dialect)))
+
+    def test_claim_query_skips_locked_rows_on_mysql(self):
+        session = sessionmaker()()
+        query = session.query(CaptionGenerationTask).filter(
+            CaptionGenerationTask.status == TaskStatus.QUEUED
+        ).with_for_update(skip_locked=True).limit(1)
+
+        self.assertIn("FOR UPDATE SKIP LOCKED", str(query.statement.compile(dialect=mysql.dialect())))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,133 @@
+# Copyright (C) 2025 iolaire mcfadden.
+# This program is free software: you can redistribute it and/or modify it under the terms of the GNU Affero General Public License as published by the Free Software Foundation, either version 3 of the License, or (at your option) any later version.
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+Unit tests for waking caption task processors on enqueue
+"""
+
+import asyncio
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, patch
+
+from config import TaskDispatchConfig
+from models import Base, CaptionGenerationTask, TaskStatus
+from app.services.task.core.task_dispatch_notifier import (
+    MemoryTaskDispatchBackend, RedisTaskDispatchBackend, TaskDispatchNotifier
+)
+from app.utils.processing.web_caption_generation_service import WebCaptionGenerationService
+from tests.unit.test_database_pool import make_manager
+
+try:
+    import fakeredis
+except ImportError:
+    fakeredis = None
+
+def notify_later(notifier, delay, task_id="task"):
+    threading.Timer(delay, notifier.notify, args=(task_id,)).start()
+
+class TestTaskDispatchNotifier(unittest.IsolatedAsyncioTestCase):
+    """Test wake-ups and dispatch statistics"""
+
+    async def test_wait_returns_when_notified(self):
+        notifier = TaskDispatchNotifier(MemoryTaskDispatchBackend())
+        notify_later(notifier, 0.1)
+
+        start = time.monotonic()
+        self.assertTrue(await notifier.wait(10))
+
+        self.assertLess(time.monotonic() - start, 1.0)
+        self.assertEqual((notifier.get_stats()['notifications'], notifier.get_stats()['wakeups']), (1, 1))
+
+    async def test_wait_times_out_and_stops_on_shutdown(self):
+        notifier = TaskDispatchNotifier(MemoryTaskDispatchBackend())
+
+        self.assertFalse(await notifier.wait(0.2))
+        stop_event = asyncio.Event()
+        stop_event.set()
+        self.assertFalse(await notifier.wait(10, stop_event))
+        self.assertEqual(notifier.get_stats()['timeouts'], 2)
+
+    @unittest.skipUnless(fakeredis, "fakeredis not installed")
+    async def test_redis_wakes_one_waiter_per_notification(self):
+        server = fakeredis.FakeServer()
+        waiters = [TaskDispatchNotifier(RedisTaskDispatchBackend(fakeredis.FakeRedis(server=server)))
+                   for _ in range(2)]
+        enqueuer = TaskDispatchNotifier(RedisTaskDispatchBackend(fakeredis.FakeRedis(server=server)))
+        notify_later(enqueuer, 0.2)
+
+        woken = await asyncio.gather(*(waiter.wait(1.5) for waiter in waiters))
+
+        self.assertEqual(sorted(woken), [False, True])
+
+    @unittest.skipUnless(fakeredis, "fakeredis not installed")
+    def test_pushes_use_a_client_with_a_socket_timeout(self):
+        server = fakeredis.FakeServer()
+        options = []
+
+        def from_url(url, **kwargs):
+            options.append(kwargs)
+            return fakeredis.FakeRedis(server=server)
+
+        with patch('redis.Redis.from_url', side_effect=from_url):
+            notifier = TaskDispatchNotifier.from_config(TaskDispatchConfig(backend="redis"))
+
+        backend = notifier.backend
+        self.assertIsNot(backend.redis, backend.wait_redis)
+        self.assertEqual([kwargs.get('socket_timeout') for kwargs in options], [2, None])
+        notifier.notify("task")
+        self.assertEqual(backend.pop(1), "task")
+
+    def test_dispatch_latency(self):
+        notifier = TaskDispatchNotifier(MemoryTaskDispatchBackend())
+        created = datetime(2025, 1, 1, 12, 0, 0)
+        for seconds in (1, 2, 3, 4):
+            notifier.record_dispatch(SimpleNamespace(
+                created_at=created, started_at=(created + timedelta(seconds=seconds)).replace(tzinfo=timezone.utc)
+            ))
+        notifier.record_dispatch(SimpleNamespace(created_at=created, started_at=None))
+
+        stats = notifier.get_stats()
+        self.assertEqual(stats['dispatched'], 4)
+        self.assertEqual((stats['latency_avg'], stats['latency_max']), (2.5, 4.0))
+
+class TestBackgroundProcessorDispatch(unittest.IsolatedAsyncioTestCase):
+    """Test that an idle processor picks up an enqueued task without polling"""
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.temp_dir)
+        self.db = make_manager(os.path.join(self.temp_dir, "dispatch.db"))
+        Base.metadata.create_all(self.db.engine)
+
+    async def test_enqueued_task_is_processed_promptly(self):
+        service = WebCaptionGenerationService(self.db)
+        notifier = TaskDispatchNotifier(MemoryTaskDispatchBackend())
+        # Keeps the waiting thread from outliving the test by long
+        notifier.MAX_BLOCK = 0.5
+        service.task_queue_manager.dispatch_notifier = notifier
+        service._fallback_poll_interval = 60
+        processed = asyncio.Event()
+        service._process_task = AsyncMock(side_effect=lambda task: processed.set())
+        service._ensure_background_processor()
+        self.addAsyncCleanup(service.shutdown)
+        await asyncio.sleep(0.2)
+
+        start = time.monotonic()
+        service.task_queue_manager.enqueue_task(CaptionGenerationTask(
+            id="task-1", user_id=1, platform_connection_id=1, status=TaskStatus.QUEUED
+        ))
+        await asyncio.wait_for(processed.wait(), 5)
+
+        self.assertLess(time.monotonic() - start, 1.0)
+        stats = service.get_service_stats()['dispatch']
+        self.assertEqual((stats['wakeups'], stats['dispatched']), (1, 1))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,264 @@
+# Copyright (C) 2025 iolaire mcfadden.
+# This program is free software: you can redistribute it and/or modify it under the terms of the GNU Affero General Public License as published by the Free Software Foundation, either version 3 of the License, or (at your option) any later version.
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+Unit tests for incremental timeline sync with TimelineSyncCursor
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, Mock
+
+import httpx
+
+from config import PipelineConfig
+from models import Base, Image, PlatformConnection, ProcessingStatus, TimelineSyncCursor, User
+from app.services.activitypub.components.activitypub_client import ActivityPubClient
+from app.services.activitypub.components.activitypub_platforms import MastodonPlatform, PixelfedPlatform
+from main import Vedfolnir
+from tests.unit.test_database_pool import make_manager
+
+INSTANCE = "https://social.test"
+
+class FakeTimeline:
+    """Account statuses endpoint with max_id/min_id paging and ETags"""
+
+    def __init__(self, count):
+        self.statuses = []
+        self.requests = []
+        self.post(count)
+
+    def post(self, count):
+        for _ in range(count):
+            status_id = str(1000 + len(self.statuses))
+            self.statuses.append({
+                'id': status_id, 'url': f"{INSTANCE}/p/{status_id}", 'uri': f"{INSTANCE}/s/{status_id}",
+                'content': f"Status {status_id}",
+                'media_attachments': [{'id': f"m{status_id}", 'type': 'image', 'url': f"{INSTANCE}/{status_id}.jpg"}]
+            })
+
+    async def _get_with_retry(self, url, headers, params=None):
+        request = httpx.Request('GET', url, headers=headers, params=params)
+        if url.endswith('/verify_credentials'):
+            return httpx.Response(200, json={'id': '7'}, request=request)
+        self.requests.append(params)
+
+        params = params or {}
+        limit = int(params.get('limit', 20))
+        newest_first = sorted(self.statuses, key=lambda status: int(status['id']), reverse=True)
+        if 'max_id' in params:
+            page = [s for s in newest_first if int(s['id']) < int(params['max_id'])][:limit]
+        elif 'min_id' in params:
+            # The statuses immediately after min_id, returned newest first
+            page = [s for s in reversed(newest_first) if int(s['id']) > int(params['min_id'])][:limit][::-1]
+        else:
+            page = newest_first[:limit]
+
+        etag = f'W/"{len(page)}-{params.get("min_id")}-{len(self.statuses)}"'
+        if headers.get('If-None-Match') == etag:
+            return httpx.Response(304, request=request)
+        return httpx.Response(200, json=page, headers={'ETag': etag}, request=request)
+
+def status_ids(posts):
+    return [post['id'].rsplit('/', 1)[-1] for post in posts]
+
+class TestTimelineCursor(unittest.IsolatedAsyncioTestCase):
+    """Test fetching only new statuses on Mastodon and Pixelfed"""
+
+    def make_platforms(self):
+        config = SimpleNamespace(instance_url=INSTANCE, access_token="token")
+        mastodon = MastodonPlatform(config)
+        mastodon.authenticate = AsyncMock(return_value=True)
+        mastodon._get_auth_headers = lambda: {'Authorization': 'Bearer token'}
+        mastodon._resolve_user_to_account_id = AsyncMock(return_value='7')
+        return [mastodon, PixelfedPlatform(config)]
+
+    async def test_first_run_reads_newest_posts_and_sets_cursor(self):
+        for platform in self.make_platforms():
+            with self.subTest(platform=platform.platform_name):
+                timeline = FakeTimeline(100)
+                cursor = TimelineSyncCursor()
+
+                posts = await platform.get_user_posts(timeline, "alice", 10, cursor=cursor)
+
+                self.assertEqual(len(posts), 10)
+                self.assertEqual(cursor.last_status_id, '1099')
+
+    async def test_only_new_statuses_are_fetched(self):
+        for platform in self.make_platforms():
+            with self.subTest(platform=platform.platform_name):
+                timeline = FakeTimeline(100)
+                cursor = TimelineSyncCursor(last_status_id='1099')
+                timeline.post(3)
+
+                posts = await platform.get_user_posts(timeline, "alice", 50, cursor=cursor)
+
+                self.assertEqual(status_ids(posts), ['1100', '1101', '1102'])
+                self.assertEqual(cursor.last_status_id, '1102')
+                self.assertEqual(len(timeline.requests), 1)
+
+    async def test_backlog_beyond_limit_is_left_for_next_run(self):
+        for platform in self.make_platforms():
+            with self.subTest(platform=platform.platform_name):
+                timeline = FakeTimeline(10)
+                cursor = TimelineSyncCursor(last_status_id='1009')
+                timeline.post(60)
+
+                first = await platform.get_user_posts(timeline, "alice", 50, cursor=cursor)
+                second = await platform.get_user_posts(timeline, "alice", 50, cursor=cursor)
+
+                self.assertEqual(status_ids(first + second), [str(i) for i in range(1010, 1070)])
+                self.assertEqual(cursor.last_status_id, '1069')
+
+    async def test_unchanged_timeline_is_answered_with_304(self):
+        for platform in self.make_platforms():
+            with self.subTest(platform=platform.platform_name):
+                timeline = FakeTimeline(5)
+                cursor = TimelineSyncCursor(last_status_id='1004')
+
+                self.assertEqual(await platform.get_user_posts(timeline, "alice", 50, cursor=cursor), [])
+                self.assertIsNotNone(cursor.etag)
+                self.assertEqual(await platform.get_user_posts(timeline, "alice", 50, cursor=cursor), [])
+                self.assertEqual(cursor.last_status_id, '1004')
+
+                timeline.post(1)
+                self.assertEqual(status_ids(await platform.get_user_posts(timeline, "alice", 50, cursor=cursor)),
+                                 ['1005'])
+                self.assertIsNone(cursor.etag)
+
+    async def test_failed_page_is_raised_when_setting_cursor(self):
+        for platform in self.make_platforms():
+            with self.subTest(platform=platform.platform_name):
+                timeline = FakeTimeline(100)
+                get_page = timeline._get_with_retry
+
+                async def fail_second_page(url, headers, params=None):
+                    if params and 'max_id' in params:
+                        raise httpx.ConnectError("connection reset")
+                    return await get_page(url, headers, params=params)
+
+                timeline._get_with_retry = fail_second_page
+
+                with self.assertRaises(Exception):
+                    await platform.get_user_posts(timeline, "alice", 50, cursor=TimelineSyncCursor())
+
+    async def test_cursor_only_passed_to_platforms_that_support_it(self):
+        client = ActivityPubClient.__new__(ActivityPubClient)
+        client.platform = SimpleNamespace(platform_name="legacy", get_user_posts=AsyncMock(return_value=[]))
+
+        await client.get_user_posts("alice", 10, cursor=TimelineSyncCursor())
+
+        client.platform.get_user_posts.assert_awaited_once_with(client, "alice", 10)
+
+class TestTimelineCursorStorage(unittest.TestCase):
+    """Test storing cursors through DatabaseManager"""
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.db = make_manager(os.path.join(self.temp_dir, "cursor.db"))
+        Base.metadata.create_all(self.db.engine)
+        session = self.db.get_session()
+        session.add(User(id=1, username="user1", email="user1@test.com", password_hash="x"))
+        session.add(PlatformConnection(id=1, user_id=1, name="conn", platform_type="mastodon",
+                                       instance_url=INSTANCE, _access_token="token"))
+        session.commit()
+        self.db.close_session(session)
+
+    def tearDown(self):
+        self.db.engine.dispose()
+        shutil.rmtree(self.temp_dir)
+
+    def test_cursor_round_trip(self):
+        cursor = self.db.get_timeline_cursor(1)
+        self.assertIsNone(cursor.last_status_id)
+
+        cursor.last_status_id = '1099'
+        self.assertTrue(self.db.save_timeline_cursor(cursor))
+        cursor = self.db.get_timeline_cursor(1)
+        cursor.last_status_id, cursor.etag = '1102', 'W/"0"'
+        self.assertTrue(self.db.save_timeline_cursor(cursor))
+
+        stored = self.db.get_timeline_cursor(1)
+        self.assertEqual((stored.last_status_id, stored.etag), ('1102', 'W/"0"'))
+        session = self.db.get_session()
+        self.assertEqual(session.query(TimelineSyncCursor).count(), 1)
+        self.db.close_session(session)
+
+class TestRunCursor(unittest.IsolatedAsyncioTestCase):
+    """Test when a processing run advances the timeline cursor"""
+
+    def setUp(self):
+        TestTimelineCursorStorage.setUp(self)
+        self.bot = Vedfolnir.__new__(Vedfolnir)
+        self.bot.db = self.db
+        self.bot.config = SimpleNamespace(max_posts_per_run=50)
+        self.bot.reprocess_all = False
+        self.bot.current_run = None
+        self.bot._caption_limiter = self.bot._db_limiter = None
+        self.bot.stats = Vedfolnir._new_stats()
+
+    def tearDown(self):
+        TestTimelineCursorStorage.tearDown(self)
+
+    async def test_cursor_is_kept_without_caption_generator(self):
+        async def iter_user_post_pages(user_id, limit, cursor=None):
+            cursor.last_status_id = '1099'
+            yield [{'id': f"{INSTANCE}/p/1099", 'content': "Status 1099"}]
+
+        ap_client = Mock(iter_user_post_pages=iter_user_post_pages)
+        ap_client.extract_images_from_post.return_value = [{'url': f"{INSTANCE}/1099.jpg"}]
+        platform_connection = SimpleNamespace(id=1, name="conn", username="alice")
+
+        await self.bot._process_user("user1", ap_client, Mock(), None, platform_connection=platform_connection)
+
+        self.assertEqual(self.bot.stats['posts_processed'], 1)
+        self.assertIsNone(self.db.get_timeline_cursor(1).last_status_id)
+
+    async def test_platform_context_is_kept_in_the_calling_task(self):
+        async def iter_user_post_pages(user_id, limit, cursor=None):
+            return
+            yield
+
+        ap_client = Mock(iter_user_post_pages=iter_user_post_pages)
+        platform_connection = SimpleNamespace(id=1, name="conn", username="alice")
+
+        await self.bot._process_user("user1", ap_client, Mock(), None, platform_connection=platform_connection)
+
+        context = self.db.get_context_manager().current_context
+        self.assertEqual((context.user_id, context.platform_connection_id), (1, 1))
+
+    async def run_with_failed_download(self, permanent_failure):
+        async def iter_user_post_pages(user_id, limit, cursor=None):
+            cursor.last_status_id = '1099'
+            yield [{'id': f"{INSTANCE}/p/1099", 'content': "Status 1099"}]
+
+        ap_client = Mock(iter_user_post_pages=iter_user_post_pages)
+        ap_client.extract_images_from_post.return_value = [
+            {'url': f"{INSTANCE}/1099.jpg", 'attachment_index': 0, 'image_post_id': "m1099"}
+        ]
+        image_processor = Mock(download_and_store_image=AsyncMock(return_value=None))
+        image_processor.pop_permanent_failure.return_value = permanent_failure
+        self.bot.config.pipeline = PipelineConfig()
+        platform_connection = SimpleNamespace(id=1, name="conn", username="alice")
+
+        await self.bot._process_user("user1", ap_client, image_processor, Mock(),
+                                     platform_connection=platform_connection)
+        return self.db.get_timeline_cursor(1).last_status_id
+
+    async def test_cursor_advances_past_permanently_failed_images(self):
+        self.assertEqual(await self.run_with_failed_download("HTTP 404"), '1099')
+
+        session = self.db.get_session()
+        image = session.query(Image).one()
+        self.assertEqual((image.status, image.processing_error), (ProcessingStatus.ERROR, "HTTP 404"))
+        self.db.close_session(session)
+        self.assertEqual(self.bot.stats['images_failed_permanently'], 1)
+
+    async def test_cursor_is_kept_after_transient_failures(self):
+        self.assertIsNone(await self.run_with_failed_download(None))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -51,10 +51,15 @@ app.config['SQLALCHEMY_DATABASE_URI'] = config.storage.database_url
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
 # Initialize database
-from app.core.database.core.database_manager import DatabaseManager
+from app.core.database.core.database_manager import DatabaseManager, remove_scoped_sessions
 db_manager = DatabaseManager(config)
 app.config['db_manager'] = db_manager
 
+@app.teardown_appcontext
+def remove_database_scoped_sessions(exception=None):
+    """Return the request thread's scoped database sessions to the pool"""
+    remove_scoped_sessions()
+
 # Initialize consolidated session manager
 from app.core.session.manager import UnifiedSessionManager
 unified_session_manager = UnifiedSessionManager(db_manager)